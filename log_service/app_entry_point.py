@@ -1,24 +1,69 @@
-import threading
+import asyncio
+import dataclasses
+import logging
+import signal
+import sqlite3
+from typing import Literal
 
-from fastapi import FastAPI, Query, Request
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import Response, StreamingResponse
 
+from log_service.controllers.analytics_controller import AnalyticsController
 from log_service.controllers.auth_controller import AuthController
 
-from log_service.config import LogServiceConfig
+from log_service.compression import (
+    RequestDecompressionMiddleware,
+    ResponseCompressionMiddleware,
+)
+from log_service.config import RELOADABLE_SETTINGS, LogServiceConfig
 
 from log_service.controllers.event_controller import EventController
+from log_service.controllers.sketch_controller import SketchController
+from log_service.data.analytics_dto import AnalyticsRequestDTO
 from log_service.data.event_dto import EventRequestDTO
-from log_service.processors.queue_consumer import QueueConsumer
-from log_service.data.request_models import CreateEventModel
+from log_service.db_accessors.db_schema import create_schema
+from log_service.db_accessors.read_executor import DatabaseReadExecutor
+from log_service.ingest_listener import IngestListener
+from log_service.monitoring import metrics
+from log_service.monitoring.profiler import ProfilerBusyError, StackSampler
+from log_service.monitoring.tracing import (
+    SERVER_TIMING_SAMPLE_RATE,
+    ServerTimingMiddleware,
+)
+from log_service.processors.change_feed import ChangeFeedHub
+from log_service.processors.event_integrity import (
+    VERIFY_BATCHES_PER_RUN,
+    IntegrityVerifier,
+)
+from log_service.processors.queue_producer import QueueProducer
+from log_service.processors.queue_worker import QueueConsumerWorker
+from log_service.data.request_models import CreateEventModel, EventQueryModel
+
+logger = logging.getLogger(__name__)
+
+# invalid settings fail the start of the service, not the first request reading them
+LogServiceConfig.load_settings()
 
 app = FastAPI()
-
-consume_queue = True
+compression_level, compression_min_bytes = LogServiceConfig.get_response_compression()
+app.add_middleware(
+    ResponseCompressionMiddleware,
+    level=compression_level,
+    minimum_bytes=compression_min_bytes,
+)
+app.add_middleware(
+    RequestDecompressionMiddleware,
+    max_body_bytes=LogServiceConfig.get_max_decompressed_request_bytes(),
+)
+app.add_middleware(ServerTimingMiddleware, sample_rate=SERVER_TIMING_SAMPLE_RATE)
 
 event_controller = EventController()
+analytics_controller = AnalyticsController()
+sketch_controller = SketchController()
+integrity_verifier = IntegrityVerifier.get_instance()
+read_executor = DatabaseReadExecutor.get_instance()
 
 config = LogServiceConfig.get_instance()
-queue_consumer_thread: threading.Thread | None = None
 
 
 ########################### ENDPOINTS START ##########################################
@@ -30,14 +75,15 @@ def generate_access_token(valid_minutes: int = Query(default=1800, gt=0)) -> dic
 @app.get("/event")
 async def get_events(
     request: Request,
-    event_id: int | None = None,
-    event_type: str | None = None,
-    customer_id: int | None = None,
+    event_id: list[int] | None = Query(default=None),
+    event_type: list[str] | None = Query(default=None),
+    customer_id: list[int] | None = Query(default=None),
     timestamp_start_utc: int | None = None,
     timestamp_end_utc: int | None = None,
     offset: int | None = None,
     limit: int | None = None,
-) -> dict:
+    fields: str | None = Query(default=None, description="e.g. id,timestamp_utc"),
+) -> Response:
     # validate authentication
     AuthController.validate_access_token(request=request)
     request_dto = EventRequestDTO(
@@ -47,23 +93,331 @@ async def get_events(
         timestamp_start_utc=timestamp_start_utc,
         timestamp_end_utc=timestamp_end_utc,
         offset=offset or 0,
-        limit=limit or 100,
+        limit=limit,
+        fields=(
+            tuple(field.strip() for field in fields.split(",") if field.strip())
+            if fields is not None
+            else None
+        ),
     )
 
-    return event_controller.get_event(request_dto=request_dto)
+    # blocking sqlite reads run on the bounded read executor, never on the event loop
+    body = await read_executor.run(
+        event_controller.get_event_json, request_dto=request_dto
+    )
+    # the body is encoded already, returning it as is skips FastAPI's response serialization
+    return Response(content=body, media_type="application/json")
+
+
+@app.post("/event/query")
+async def query_events(request: Request, queries: list[EventQueryModel]) -> Response:
+    AuthController.validate_access_token(request=request)
+    request_dtos = [
+        EventRequestDTO(
+            **query.model_dump(exclude={"fields"}),
+            fields=tuple(query.fields) if query.fields is not None else None,
+        )
+        for query in queries
+    ]
+    # one admission and one pooled connection for the whole batch
+    body = await read_executor.run(
+        event_controller.get_events_batch_json, request_dtos=request_dtos
+    )
+    return Response(content=body, media_type="application/json")
 
 
 @app.post("/event")
-async def post_event(request: Request, event: CreateEventModel) -> str:
+async def post_event(
+    request: Request,
+    event: CreateEventModel,
+    durability: Literal["queued", "committed"] = Query(default="queued"),
+) -> str | dict:
     AuthController.validate_access_token(request=request)
+    event_uuid = str(event.event_uuid) if event.event_uuid else None
+    if durability == "committed":
+        return await event_controller.create_event_committed(
+            event_type=event.event_type,
+            timestamp_utc=event.timestamp_utc,
+            customer_id=event.customer_id,
+            event_data=event.event_data,
+            event_uuid=event_uuid,
+        )
     return event_controller.create_event(
         event_type=event.event_type,
         timestamp_utc=event.timestamp_utc,
         customer_id=event.customer_id,
         event_data=event.event_data,
+        event_uuid=event_uuid,
+    )
+
+
+@app.post("/event/batch")
+async def post_events(
+    request: Request,
+    events: list[CreateEventModel],
+    durability: Literal["queued", "committed"] = Query(default="queued"),
+) -> str | dict:
+    AuthController.validate_access_token(request=request)
+    if durability == "committed":
+        return await event_controller.create_events_committed(events=events)
+    return event_controller.create_events(events=events)
+
+
+@app.get("/event/export")
+async def export_events(
+    request: Request,
+    event_id: list[int] | None = Query(default=None),
+    event_type: list[str] | None = Query(default=None),
+    customer_id: list[int] | None = Query(default=None),
+    timestamp_start_utc: int | None = None,
+    timestamp_end_utc: int | None = None,
+    gzip: bool = False,
+) -> StreamingResponse:
+    AuthController.validate_access_token(request=request)
+    request_dto = EventRequestDTO(
+        event_id=event_id,
+        event_type=event_type,
+        customer_id=customer_id,
+        timestamp_start_utc=timestamp_start_utc,
+        timestamp_end_utc=timestamp_end_utc,
+    )
+    headers = {"Content-Disposition": "attachment; filename=events.ndjson"}
+    if gzip:
+        headers["Content-Encoding"] = "gzip"
+
+    # every page of the export is read on the read executor
+    chunks = await read_executor.iterate(
+        event_controller.export_events(request_dto=request_dto, gzip=gzip)
+    )
+    return StreamingResponse(
+        chunks,
+        media_type="application/x-ndjson",
+        headers=headers,
+    )
+
+
+@app.get("/event/stream")
+async def stream_events(
+    request: Request,
+    event_type: str | None = None,
+    customer_id: int | None = None,
+    after_id: int | None = Query(default=None, ge=0),
+) -> StreamingResponse:
+    AuthController.validate_access_token(request=request)
+    # set by browsers and SSE clients reconnecting after a dropped stream
+    last_event_id = request.headers.get("last-event-id")
+    if after_id is None and last_event_id:
+        if not last_event_id.isdigit():
+            raise HTTPException(status_code=400, detail="Invalid Last-Event-ID.")
+        after_id = int(last_event_id)
+
+    messages = await event_controller.stream_events(
+        EventRequestDTO(event_type=event_type, customer_id=customer_id),
+        after_id=after_id,
+    )
+    return StreamingResponse(
+        messages,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
 
 
+@app.get("/event/analytics")
+async def get_event_analytics(
+    request: Request,
+    timestamp_start_utc: int,
+    timestamp_end_utc: int,
+    event_type: str | None = None,
+    customer_id: int | None = None,
+    group_by: str | None = None,
+    value_field: str | None = None,
+    quantiles: str | None = Query(default=None, description="e.g. 0.5,0.9,0.99"),
+    histogram_bins: int | None = None,
+    histogram_edges: str | None = Query(default=None, description="e.g. 0,10,100"),
+) -> dict:
+    AuthController.validate_access_token(request=request)
+    try:
+        parsed_quantiles = [float(q) for q in quantiles.split(",")] if quantiles else []
+        parsed_edges = (
+            [float(edge) for edge in histogram_edges.split(",")]
+            if histogram_edges
+            else []
+        )
+    except ValueError:
+        raise HTTPException(
+            status_code=400,
+            detail="quantiles and histogram_edges must be comma separated numbers.",
+        )
+
+    request_dto = AnalyticsRequestDTO(
+        timestamp_start_utc=timestamp_start_utc,
+        timestamp_end_utc=timestamp_end_utc,
+        event_type=event_type,
+        customer_id=customer_id,
+        group_by=group_by,
+        value_field=value_field,
+        quantiles=parsed_quantiles,
+        histogram_bins=histogram_bins,
+        histogram_edges=parsed_edges,
+    )
+    return await read_executor.run(
+        analytics_controller.get_analytics, request_dto=request_dto
+    )
+
+
+@app.get("/event/sketches/distinct-customers")
+async def get_distinct_customers(
+    request: Request,
+    event_type: str,
+    timestamp_start_utc: int,
+    timestamp_end_utc: int,
+) -> dict:
+    AuthController.validate_access_token(request=request)
+    return await read_executor.run(
+        sketch_controller.get_distinct_customers,
+        event_type=event_type,
+        timestamp_start_utc=timestamp_start_utc,
+        timestamp_end_utc=timestamp_end_utc,
+    )
+
+
+@app.get("/event/sketches/top-event-types")
+async def get_top_event_types(
+    request: Request,
+    timestamp_start_utc: int,
+    timestamp_end_utc: int,
+    k: int = 20,
+) -> dict:
+    AuthController.validate_access_token(request=request)
+    return await read_executor.run(
+        sketch_controller.get_top_event_types,
+        timestamp_start_utc=timestamp_start_utc,
+        timestamp_end_utc=timestamp_end_utc,
+        k=k,
+    )
+
+
+@app.get("/event/{event_id}/proof")
+async def get_event_proof(request: Request, event_id: int) -> dict:
+    AuthController.validate_access_token(request=request)
+    proof = await read_executor.run(
+        integrity_verifier.get_inclusion_proof, event_id=event_id
+    )
+    if proof is None:
+        raise HTTPException(status_code=404, detail="Event not found or not sealed.")
+    return proof
+
+
+@app.get("/integrity/head")
+async def get_integrity_head(request: Request) -> dict:
+    AuthController.validate_access_token(request=request)
+    head = await read_executor.run(integrity_verifier.get_head)
+    if head is None:
+        raise HTTPException(status_code=404, detail="No batch was sealed yet.")
+    return head
+
+
+@app.post("/integrity/verify")
+async def verify_integrity(
+    request: Request,
+    start_event_id: int | None = None,
+    end_event_id: int | None = None,
+    after_batch_id: int | None = Query(default=None, ge=0),
+    chain_hash: str | None = None,
+    max_batches: int = Query(default=VERIFY_BATCHES_PER_RUN, ge=1),
+) -> dict:
+    AuthController.validate_access_token(request=request)
+    max_batches = min(max_batches, VERIFY_BATCHES_PER_RUN)
+    if (start_event_id is None) != (end_event_id is None):
+        raise HTTPException(
+            status_code=400,
+            detail="start_event_id and end_event_id must be given together.",
+        )
+    if start_event_id is not None:
+        if start_event_id > end_event_id:
+            raise HTTPException(
+                status_code=400, detail="start_event_id is after end_event_id."
+            )
+        return await read_executor.run(
+            integrity_verifier.verify_range,
+            start_event_id=start_event_id,
+            end_event_id=end_event_id,
+            max_batches=max_batches,
+        )
+    if chain_hash is not None:
+        if after_batch_id is None:
+            raise HTTPException(
+                status_code=400, detail="chain_hash requires after_batch_id."
+            )
+        try:
+            if len(bytes.fromhex(chain_hash)) != 32:
+                raise ValueError
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid chain_hash.")
+    return await read_executor.run(
+        integrity_verifier.verify,
+        after_batch_id=after_batch_id,
+        chain_hash_hex=chain_hash,
+        max_batches=max_batches,
+    )
+
+
+@app.get("/stats/read-executor")
+def get_read_executor_stats(request: Request) -> dict:
+    AuthController.validate_access_token(request=request)
+    return read_executor.stats()
+
+
+@app.get("/stats/queue")
+def get_queue_stats(request: Request) -> dict:
+    AuthController.validate_access_token(request=request)
+    return {"lanes": QueueProducer.get_instance().event_queue.lane_stats()}
+
+
+@app.get("/metrics")
+def get_metrics() -> Response:
+    # unauthenticated like the access token endpoint, so Prometheus can scrape it without a short-lived token
+    return Response(
+        content=metrics.MetricsRegistry.get_instance().render(),
+        media_type=metrics.CONTENT_TYPE,
+    )
+
+
+@app.get("/admin/profile")
+async def get_profile(
+    request: Request,
+    seconds: float = Query(default=5, gt=0),
+    interval_ms: float = Query(default=10, gt=0),
+) -> dict:
+    AuthController.validate_access_token(request=request)
+    sampler = StackSampler(
+        duration_seconds=seconds, interval_seconds=interval_ms / 1000
+    )
+    try:
+        # sampled on a thread so the event loop keeps serving the traffic being profiled
+        return await asyncio.to_thread(sampler.run)
+    except ProfilerBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@app.get("/admin/config")
+def get_config(request: Request) -> dict:
+    AuthController.validate_access_token(request=request)
+    return {
+        "settings": dataclasses.asdict(LogServiceConfig.get_settings()),
+        "reloadable": sorted(RELOADABLE_SETTINGS),
+    }
+
+
+@app.post("/admin/config/reload")
+def reload_config(request: Request) -> dict:
+    AuthController.validate_access_token(request=request)
+    try:
+        return LogServiceConfig.reload_settings()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 # ##################################################### ENDPOINTS  END ##########################################
 
 
@@ -72,75 +426,81 @@ async def post_event(request: Request, event: CreateEventModel) -> str:
 def start_background_thread() -> None:
     """Start background thread to run queue consumer task.
 
-    This function starts a background thread that runs the
-    background_task() function at startup.
-
-    background_task() handles continuously consuming events
-    from the queue. Starting it in a background thread allows
-    the queue consumption to run asynchronously in parallel.
-
-    The background thread is stored globally so it remains alive.
+    This function creates any missing database tables, then starts
+    the QueueConsumerWorker, which first re-ingests the events spilled
+    by the previous shutdown and then continuously consumes events
+    from the queue in a background thread.
 
     No return value as it just starts the background thread.
     """
 
-    global queue_consumer_thread
-    queue_consumer_thread = threading.Thread(target=background_task)
-    queue_consumer_thread.start()
+    conn = sqlite3.connect(config.get_db_url())
+    try:
+        create_schema(conn)
+    finally:
+        conn.close()
 
+    QueueConsumerWorker.get_instance().start()
 
-@app.on_event("shutdown")
-def stop_background_thread() -> None:
-    """Stop the background thread that runs the queue consumer task.
 
-    This function handles shutting down the background thread that was
-    started at application startup to run the queue consumer task.
+@app.on_event("startup")
+async def start_ingest_listener() -> None:
+    """Start the framed ingest listener, if a socket path or port is configured.
 
-    It sets a flag to signal the consumer to stop fetching new events,
-    and then joins the background thread to stop it from running.
+    Started after the queue consumer, so its events are consumed from
+    the first frame on.
+    """
 
-    remaining events in the queue will be consumed once this
-    shutdown event is triggered.
+    await IngestListener.get_instance().start()
 
-    No return value as it just stops the background thread.
-    """
 
-    global consume_queue
-    global queue_consumer_thread
+@app.on_event("startup")
+async def install_reload_signal_handler() -> None:
+    """Reload the runtime settings on SIGHUP, like POST /admin/config/reload.
 
-    consume_queue = False
+    Skipped where the event loop cannot handle signals, e.g. on Windows
+    or when the app does not run on the main thread.
+    """
 
-    if queue_consumer_thread is not None:
-        queue_consumer_thread.join()
+    def reload_settings() -> None:
+        try:
+            LogServiceConfig.reload_settings()
+        except ValueError as e:
+            logger.error(f"Settings not reloaded: {e}")
 
+    if not hasattr(signal, "SIGHUP"):
+        return
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, reload_settings)
+    except (NotImplementedError, RuntimeError, ValueError):
+        logger.warning("Settings cannot be reloaded on SIGHUP in this process")
 
-def background_task() -> None:  # todo move into its own module
 
-    """Run continuous background task to consume events from queue.
+@app.on_event("shutdown")
+async def stop_ingest_listener() -> None:
+    """Stop the framed ingest listener before the queue is drained,
+    so no events are queued after the drain started.
+    """
 
-    This function initializes a QueueConsumer instance and starts an
-    infinite loop to continuously monitor and consume events from the
-    event queue. Uses the consume queue flag to stop the loop when the
-    application is shutting down.
+    await IngestListener.get_instance().stop()
 
-    Any exceptions during consuming events will be caught and printed.
 
-    This allows events to be asynchronously consumed from the queue
-    by a background thread.
+@app.on_event("shutdown")
+def stop_background_thread() -> None:
+    """Stop the background thread that runs the queue consumer task.
 
-    Returns:
-        None
+    The queue is drained for at most the configured drain deadline,
+    events still queued after it are spilled to disk and re-ingested
+    on the next startup, so a shutdown never waits on a large backlog.
+    Change feed streams still open are ended once the drained events are
+    published, and the database read executor is shut down as well.
+
+    No return value as it just stops the background thread.
     """
 
-    queue_consumer = QueueConsumer.get_instance()
-    while True:
-        # monitor and consume events
-        try:
-            if not consume_queue and len(queue_consumer.event_queue) == 0:
-                break
-            queue_consumer.consume_events()
-        except Exception as e:
-            print("consuming events failed", e)
+    QueueConsumerWorker.get_instance().stop()
+    ChangeFeedHub.get_instance().close()
+    read_executor.shutdown()
 
 
 # ################################# END BACKGROUND TASK ##########################################
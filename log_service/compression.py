@@ -0,0 +1,246 @@
+import zlib
+
+import orjson
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from log_service.monitoring.metrics import MetricsRegistry
+from log_service.monitoring.tracing import span
+
+# zlib window bits of every supported content coding
+CONTENT_CODING_WBITS = {"gzip": 16 + zlib.MAX_WBITS, "deflate": zlib.MAX_WBITS}
+# the coding picked when a client accepts several, gzip first as every HTTP client supports it
+RESPONSE_CODING_PREFERENCE = ("gzip", "deflate")
+# responses of these types are left alone: event streams must not be held back in a compressor
+UNCOMPRESSED_MEDIA_TYPES = ("text/event-stream",)
+
+metrics = MetricsRegistry.get_instance()
+COMPRESSED_BYTES = metrics.counter(
+    "log_service_compressed_body_bytes_total",
+    "Request bytes received and response bytes sent compressed, by direction.",
+    label_names=("direction",),
+)
+UNCOMPRESSED_BYTES = metrics.counter(
+    "log_service_uncompressed_body_bytes_total",
+    "The same bodies decompressed, by direction.",
+    label_names=("direction",),
+)
+
+
+class RequestDecompressionMiddleware:
+    """
+    ASGI middleware decompressing request bodies sent with `Content-Encoding: gzip` or `deflate`, so batch
+    uploads can be sent compressed.
+
+    The body is decompressed chunk by chunk as it is received, and the request is answered with a 413 as soon as
+    the decompressed body exceeds `max_body_bytes`, so a small zip bomb never inflates into memory. A body that is
+    not valid for its coding is answered with a 400, an unsupported coding with a 415. The application receives
+    the decompressed body without the Content-Encoding header.
+
+    Attributes:
+        app (ASGIApp): The wrapped application.
+        max_body_bytes (int): The largest decompressed body accepted.
+    """
+
+    def __init__(self, app: ASGIApp, max_body_bytes: int):
+        self.app = app
+        self.max_body_bytes = max_body_bytes
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        coding = Headers(scope=scope).get("content-encoding", "identity").lower()
+        if coding == "identity":
+            await self.app(scope, receive, send)
+            return
+        if coding not in CONTENT_CODING_WBITS:
+            await self._reject(send, 415, f"Unsupported Content-Encoding {coding!r}.")
+            return
+
+        decompressor = zlib.decompressobj(CONTENT_CODING_WBITS[coding])
+        chunks = []
+        received = size = 0
+        more_body = True
+        with span("decompress"):
+            while more_body:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    return
+                more_body = message.get("more_body", False)
+                data = message.get("body", b"")
+                received += len(data)
+                try:
+                    # bounded, so the output never grows past the limit however well the input compresses
+                    chunk = decompressor.decompress(
+                        data, self.max_body_bytes - size + 1
+                    )
+                except zlib.error:
+                    await self._reject(send, 400, f"The body is not valid {coding}.")
+                    return
+                size += len(chunk)
+                if size > self.max_body_bytes:
+                    await self._reject(
+                        send,
+                        413,
+                        f"The decompressed body exceeds {self.max_body_bytes} bytes.",
+                    )
+                    return
+                chunks.append(chunk)
+            if not decompressor.eof and received:
+                await self._reject(send, 400, f"The {coding} body is truncated.")
+                return
+        COMPRESSED_BYTES.labels("request").inc(received)
+        UNCOMPRESSED_BYTES.labels("request").inc(size)
+
+        headers = MutableHeaders(scope=scope)
+        del headers["content-encoding"]
+        headers["content-length"] = str(size)
+        body = b"".join(chunks)
+        body_sent = False
+
+        async def receive_decompressed() -> Message:
+            nonlocal body_sent
+            if body_sent:
+                return await receive()
+            body_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        await self.app(scope, receive_decompressed, send)
+
+    @staticmethod
+    async def _reject(send: Send, status_code: int, detail: str) -> None:
+        body = orjson.dumps({"detail": detail})
+        await send(
+            {
+                "type": "http.response.start",
+                "status": status_code,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
+
+
+class ResponseCompressionMiddleware:
+    """
+    ASGI middleware compressing response bodies with the coding the client prefers in its `Accept-Encoding`
+    header, gzip or deflate.
+
+    Bodies sent in one piece are compressed if they hold at least `minimum_bytes`, smaller ones would hardly
+    shrink. Streamed bodies, e.g. exports, are compressed as they are sent. Responses that already have a
+    Content-Encoding (e.g. `GET /event/export?gzip=true`) and event streams are sent as they are.
+
+    Attributes:
+        app (ASGIApp): The wrapped application.
+        level (int): The zlib compression level, 1 (fastest) to 9 (smallest).
+        minimum_bytes (int): The smallest body sent in one piece that is compressed.
+    """
+
+    def __init__(self, app: ASGIApp, level: int, minimum_bytes: int):
+        self.app = app
+        self.level = level
+        self.minimum_bytes = minimum_bytes
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        coding = (
+            negotiate_coding(Headers(scope=scope).get("accept-encoding", ""))
+            if scope["type"] == "http"
+            else None
+        )
+        if coding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message: Message | None = None
+        compressor = None
+        compressed = uncompressed = 0
+
+        async def send_compressed(message: Message) -> None:
+            nonlocal start_message, compressor, compressed, uncompressed
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message.get("headers", []))
+                if "content-encoding" in headers or headers.get(
+                    "content-type", ""
+                ).startswith(UNCOMPRESSED_MEDIA_TYPES):
+                    await send(message)
+                else:
+                    # held back until the first body chunk tells whether the body is worth compressing
+                    start_message = message
+                return
+            if message["type"] != "http.response.body" or (
+                start_message is None and compressor is None
+            ):
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if start_message is not None:
+                start = start_message
+                start_message = None
+                if not more_body and len(body) < self.minimum_bytes:
+                    await send(start)
+                    await send(message)
+                    return
+                compressor = zlib.compressobj(
+                    self.level, zlib.DEFLATED, CONTENT_CODING_WBITS[coding]
+                )
+                headers = MutableHeaders(raw=list(start.get("headers", [])))
+                headers["content-encoding"] = coding
+                headers.add_vary_header("Accept-Encoding")
+                if "content-length" in headers:
+                    del headers["content-length"]
+                if not more_body:
+                    body = compressor.compress(body) + compressor.flush()
+                    headers["content-length"] = str(len(body))
+                    self._count(len(message.get("body", b"")), len(body))
+                    await send({**start, "headers": headers.raw})
+                    await send({**message, "body": body})
+                    return
+                await send({**start, "headers": headers.raw})
+
+            chunk = compressor.compress(body)
+            if not more_body:
+                chunk += compressor.flush()
+            uncompressed += len(body)
+            compressed += len(chunk)
+            if not more_body:
+                self._count(uncompressed, compressed)
+            await send({**message, "body": chunk})
+
+        await self.app(scope, receive, send_compressed)
+
+    @staticmethod
+    def _count(uncompressed: int, compressed: int) -> None:
+        UNCOMPRESSED_BYTES.labels("response").inc(uncompressed)
+        COMPRESSED_BYTES.labels("response").inc(compressed)
+
+
+def negotiate_coding(accept_encoding: str) -> str | None:
+    """
+    Returns the response coding to use for an Accept-Encoding header value, None for an uncompressed response.
+    Codings with a quality of 0 are refused, and `*` accepts any coding not listed.
+    """
+    qualities = {}
+    for item in accept_encoding.lower().split(","):
+        coding, _, params = item.partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                continue
+        qualities[coding.strip()] = quality
+    default = qualities.get("*", 0.0)
+    accepted = [
+        coding
+        for coding in RESPONSE_CODING_PREFERENCE
+        if qualities.get(coding, default) > 0
+    ]
+    if not accepted:
+        return None
+    return max(accepted, key=lambda coding: qualities.get(coding, default))
@@ -1,8 +1,205 @@
+import dataclasses
+import logging
 import os
+import types
+from dataclasses import dataclass, field
 from threading import Lock
+from typing import Any, get_args, get_origin
 
-DB_DIRECTORY_PATH = "databases"  # todo should be an env var
-DB_NAME = "SQLite-main.db"  # todo should be an env var
+import orjson
+
+logger = logging.getLogger(__name__)
+
+# settings are read from this JSON file if set, environment variables LOG_SERVICE_<SETTING NAME> override it
+CONFIG_FILE_ENV = "LOG_SERVICE_CONFIG_FILE"
+SETTINGS_ENV_PREFIX = "LOG_SERVICE_"
+
+DB_DIRECTORY_PATH = "databases"
+DB_NAME = "SQLite-main.db"
+# events per transaction of the queue consumer, how long it waits for events when idle and how often it logs stats
+CONSUMER_CHUNK_SIZE = 30
+CONSUMER_IDLE_WAIT_SECONDS = 0.1
+STATS_LOG_INTERVAL_SECONDS = 5.0
+# the most events returned per page by event queries
+MAX_PAGE_SIZE = 100
+# how long a shutdown drains the ingest queue before spilling the rest to disk, orchestrators usually kill after 30s
+SHUTDOWN_DRAIN_DEADLINE_SECONDS = 20.0
+# sustained events per second and burst size allowed per customer at ingest, a rate of 0 disables the limit
+CUSTOMER_RATE_LIMIT_PER_SECOND = 1000.0
+CUSTOMER_RATE_LIMIT_BURST = 10000.0
+# priority lanes of the ingest queue, by scheduling weight; event types not mapped to a lane use the default lane
+PRIORITY_LANE_WEIGHTS = {"critical": 6, "default": 3, "bulk": 1}
+DEFAULT_PRIORITY_LANE = "default"
+DEFAULT_EVENT_TYPE_PRIORITIES = {
+    "login": "critical",
+    "logout": "critical",
+    "permission_change": "critical",
+}
+# the most recent events kept in memory to answer recent event queries, bounded by count and by age
+HOT_TAIL_MAX_EVENTS = 100_000
+HOT_TAIL_WINDOW_SECONDS = 300.0
+# compressed request bodies are rejected beyond this size decompressed, responses are compressed from this size on
+MAX_DECOMPRESSED_REQUEST_BYTES = 32 * 1024 * 1024
+RESPONSE_COMPRESSION_LEVEL = 6
+RESPONSE_COMPRESSION_MIN_BYTES = 1024
+
+
+@dataclass(frozen=True)
+class ServiceSettings:
+    """
+    The typed, validated settings of the service. Every setting defaults to the constant above, can be set in the
+    JSON file named by CONFIG_FILE_ENV, and overridden by the environment variable `LOG_SERVICE_<NAME>`, e.g.
+    `LOG_SERVICE_CONSUMER_CHUNK_SIZE=200`. Mappings are set as `key=value` pairs in environment variables, e.g.
+    `LOG_SERVICE_EVENT_TYPE_SAMPLE_RATES=debug_trace=0.01,heartbeat=0.1`, and as objects in the file.
+
+    Settings in RELOADABLE_SETTINGS take effect at runtime when the settings are reloaded, the others are read
+    when the service starts.
+
+    Attributes:
+        db_directory_path (str): The directory of the database, relative to the working directory.
+        db_name (str): The file name of the database.
+        consumer_chunk_size (int): Events committed per transaction by the queue consumer. Reloadable.
+        consumer_idle_wait_seconds (float): How long an idle consumer waits for events before checking again.
+            Reloadable.
+        stats_log_interval_seconds (float): How often the consumer logs the queue stats. Reloadable.
+        max_page_size (int): The most events returned per page by event queries. Reloadable.
+        shutdown_drain_deadline_seconds (float): How long a shutdown drains the ingest queue. Reloadable.
+        customer_rate_limit_per_second (float): Events per second per customer, 0 for no limit. Reloadable.
+        customer_rate_limit_burst (float): Events a customer may send at once. Reloadable.
+        event_type_sample_rates (dict[str, float]): The fraction of events stored, by sampled event type.
+            Reloadable.
+        event_type_priorities (dict[str, str]): The priority lane of event types, see PRIORITY_LANE_WEIGHTS.
+        hot_tail_max_events (int): The most recent events kept in memory, 0 to keep none.
+        hot_tail_window_seconds (float): How long recent events are kept in memory.
+        ingest_socket_path (str | None): The Unix socket of the framed ingest listener.
+        ingest_port (int | None): The local TCP port of the framed ingest listener.
+        max_decompressed_request_bytes (int): The largest body a compressed request may decompress to.
+        response_compression_level (int): The zlib level responses are compressed with, 1 to 9.
+        response_compression_min_bytes (int): The smallest response body compressed.
+
+    Raises:
+        ValueError: If a setting is out of range.
+    """
+
+    db_directory_path: str = DB_DIRECTORY_PATH
+    db_name: str = DB_NAME
+    consumer_chunk_size: int = CONSUMER_CHUNK_SIZE
+    consumer_idle_wait_seconds: float = CONSUMER_IDLE_WAIT_SECONDS
+    stats_log_interval_seconds: float = STATS_LOG_INTERVAL_SECONDS
+    max_page_size: int = MAX_PAGE_SIZE
+    shutdown_drain_deadline_seconds: float = SHUTDOWN_DRAIN_DEADLINE_SECONDS
+    customer_rate_limit_per_second: float = CUSTOMER_RATE_LIMIT_PER_SECOND
+    customer_rate_limit_burst: float = CUSTOMER_RATE_LIMIT_BURST
+    event_type_sample_rates: dict[str, float] = field(default_factory=dict)
+    event_type_priorities: dict[str, str] = field(
+        default_factory=lambda: dict(DEFAULT_EVENT_TYPE_PRIORITIES)
+    )
+    hot_tail_max_events: int = HOT_TAIL_MAX_EVENTS
+    hot_tail_window_seconds: float = HOT_TAIL_WINDOW_SECONDS
+    ingest_socket_path: str | None = None
+    ingest_port: int | None = None
+    max_decompressed_request_bytes: int = MAX_DECOMPRESSED_REQUEST_BYTES
+    response_compression_level: int = RESPONSE_COMPRESSION_LEVEL
+    response_compression_min_bytes: int = RESPONSE_COMPRESSION_MIN_BYTES
+
+    def __post_init__(self) -> None:
+        errors = []
+        for name in (
+            "consumer_chunk_size",
+            "max_page_size",
+            "max_decompressed_request_bytes",
+        ):
+            if getattr(self, name) < 1:
+                errors.append(f"{name} must be at least 1")
+        for name in (
+            "stats_log_interval_seconds",
+            "shutdown_drain_deadline_seconds",
+            "customer_rate_limit_per_second",
+            "hot_tail_max_events",
+            "response_compression_min_bytes",
+        ):
+            if getattr(self, name) < 0:
+                errors.append(f"{name} must not be negative")
+        for name in (
+            "consumer_idle_wait_seconds",
+            "customer_rate_limit_burst",
+            "hot_tail_window_seconds",
+        ):
+            if getattr(self, name) <= 0:
+                errors.append(f"{name} must be positive")
+        if not self.db_name:
+            errors.append("db_name must not be empty")
+        for event_type, sample_rate in self.event_type_sample_rates.items():
+            if not 0 <= sample_rate <= 1:
+                errors.append(f"Sample rate of {event_type} must be between 0 and 1")
+        for event_type, lane in self.event_type_priorities.items():
+            if lane not in PRIORITY_LANE_WEIGHTS:
+                errors.append(f"Unknown priority lane {lane!r} of {event_type}")
+        if self.ingest_port is not None and not 0 < self.ingest_port < 65536:
+            errors.append("ingest_port must be between 1 and 65535")
+        if not 1 <= self.response_compression_level <= 9:
+            errors.append("response_compression_level must be between 1 and 9")
+        if errors:
+            raise ValueError(f"Invalid settings: {'; '.join(errors)}")
+
+    @classmethod
+    def load(cls, environ: dict[str, str] | None = None) -> "ServiceSettings":
+        """
+        Reads the settings from the config file and the environment.
+
+        Parameters:
+            environ (dict[str, str] | None): The environment variables, os.environ if None.
+
+        Returns:
+            ServiceSettings: The validated settings.
+
+        Raises:
+            ValueError: If the config file cannot be read, names an unknown setting, or a setting is invalid.
+        """
+        environ = os.environ if environ is None else environ
+        settings_fields = {
+            settings_field.name: settings_field
+            for settings_field in dataclasses.fields(cls)
+        }
+        values = {}
+
+        config_file = environ.get(CONFIG_FILE_ENV)
+        if config_file:
+            try:
+                with open(config_file, "rb") as f:
+                    file_values = orjson.loads(f.read())
+            except (OSError, orjson.JSONDecodeError) as e:
+                raise ValueError(f"Cannot read config file {config_file}: {e}")
+            if not isinstance(file_values, dict):
+                raise ValueError(f"Config file {config_file} must hold a JSON object")
+            unknown = set(file_values) - set(settings_fields)
+            if unknown:
+                raise ValueError(
+                    f"Unknown settings in {config_file}: {sorted(unknown)}"
+                )
+            for name, value in file_values.items():
+                values[name] = _convert(name, settings_fields[name].type, value)
+
+        for name, settings_field in settings_fields.items():
+            value = environ.get(SETTINGS_ENV_PREFIX + name.upper())
+            if value is not None:
+                values[name] = _convert(name, settings_field.type, value)
+        return cls(**values)
+
+
+# settings that take effect when reloaded at runtime, the others size structures built at startup
+RELOADABLE_SETTINGS = frozenset(
+    {
+        "consumer_chunk_size",
+        "consumer_idle_wait_seconds",
+        "stats_log_interval_seconds",
+        "max_page_size",
+        "shutdown_drain_deadline_seconds",
+        "customer_rate_limit_per_second",
+        "customer_rate_limit_burst",
+        "event_type_sample_rates",
+    }
+)
 
 
 class LogServiceConfig:
@@ -14,16 +211,34 @@ class LogServiceConfig:
     is created and used across the application. It guarantees that the instance is thread-safe
     by utilizing a lock during the instance creation process.
 
+    The settings themselves are a ServiceSettings object, loaded and validated on first use (the app loads them
+    before it starts anything) and swapped as a whole by `reload_settings`, so a reader always sees one consistent
+    version. Components read the knobs they may retune at runtime from `get_settings()` every time they use them.
+
     Attributes:
         _instance (LogServiceConfig, optional): A class-level attribute that holds the single instance
             of LogServiceConfig. Direct access to this attribute is not recommended.
         _lock (Lock): A threading lock used to synchronize the thread-safe creation of the singleton instance.
+        _settings (ServiceSettings, optional): The current settings, None until loaded.
+        _settings_lock (Lock): A lock serializing loads and reloads of the settings.
 
     Methods:
         __init__(): The constructor is private to prevent external instantiation. Use `LogServiceConfig.get_instance()`.
         get_instance(): A class method to retrieve or create the singleton instance of LogServiceConfig.
+        get_settings(): A class method returning the current settings, loading them on first use.
+        load_settings(): A class method loading all settings anew, e.g. at startup.
+        reload_settings(): A class method applying the changed RELOADABLE_SETTINGS of the config file and environment.
         get_db_url(): A static method that computes and returns the database URL using the current working directory
-            and predefined database directory and name.
+            and the configured database directory and name.
+        get_shutdown_drain_deadline_seconds(): A static method returning how long a shutdown drains the ingest queue.
+        get_customer_rate_limit(): A static method returning the per customer ingest rate and burst.
+        get_event_type_sample_rates(): A static method returning the sampled event types and their sample rates.
+        get_event_type_priorities(): A static method returning the priority lane of event types.
+        get_hot_tail_limits(): A static method returning how many recent events are kept in memory, and how long.
+        get_ingest_listener_address(): A static method returning where the framed ingest listener listens, if at all.
+        get_max_decompressed_request_bytes(): A static method returning the largest decompressed request body.
+        get_response_compression(): A static method returning the level and the size threshold of compressed
+            responses.
 
     Usage:
         Obtain the configuration instance and the database URL as follows:
@@ -31,12 +246,18 @@ class LogServiceConfig:
             config = LogServiceConfig.get_instance()
             db_url = config.get_db_url()
 
+        Read a setting that may be retuned at runtime as follows:
+
+            chunk_size = LogServiceConfig.get_settings().consumer_chunk_size
+
     Raises:
         Exception: If there's an attempt to instantiate the class directly, instead of using the `get_instance` method.
     """
 
     _instance = None
     _lock: Lock = Lock()
+    _settings: ServiceSettings | None = None
+    _settings_lock: Lock = Lock()
 
     def __init__(self) -> None:
         """Private constructor to enforce the singleton pattern."""
@@ -59,6 +280,67 @@ class LogServiceConfig:
                     cls._instance = LogServiceConfig()
         return cls._instance
 
+    @classmethod
+    def get_settings(cls) -> ServiceSettings:
+        """
+        Returns the current settings, loading them on first use.
+
+        Raises:
+            ValueError: If the settings are loaded and invalid.
+        """
+        settings = cls._settings
+        if settings is None:
+            with cls._settings_lock:
+                if cls._settings is None:
+                    cls._settings = ServiceSettings.load()
+                settings = cls._settings
+        return settings
+
+    @classmethod
+    def load_settings(cls) -> ServiceSettings:
+        """
+        Loads all settings anew from the config file and the environment, e.g. at startup.
+
+        Raises:
+            ValueError: If the settings are invalid, the current ones are kept.
+        """
+        with cls._settings_lock:
+            cls._settings = ServiceSettings.load()
+            return cls._settings
+
+    @classmethod
+    def reload_settings(cls) -> dict:
+        """
+        Reads the config file and the environment again and applies the changed settings that are in
+        RELOADABLE_SETTINGS. Changes of other settings are reported and wait for a restart.
+
+        Returns:
+            dict: The applied settings by name, and the names of the changed settings that need a restart.
+
+        Raises:
+            ValueError: If the new settings are invalid, nothing is applied.
+        """
+        with cls._settings_lock:
+            current = cls._settings or ServiceSettings.load()
+            loaded = ServiceSettings.load()
+            changed = [
+                settings_field.name
+                for settings_field in dataclasses.fields(ServiceSettings)
+                if getattr(loaded, settings_field.name)
+                != getattr(current, settings_field.name)
+            ]
+            applied = {
+                name: getattr(loaded, name)
+                for name in changed
+                if name in RELOADABLE_SETTINGS
+            }
+            cls._settings = dataclasses.replace(current, **applied)
+        restart_required = [name for name in changed if name not in applied]
+        logger.warning(
+            f"Settings reloaded, applied: {applied}, changed but needing a restart: {restart_required}"
+        )
+        return {"applied": applied, "restart_required": restart_required}
+
     @staticmethod
     def get_db_url() -> str:
         """
@@ -68,4 +350,147 @@ class LogServiceConfig:
         Returns:
             str: The path to the database file.
         """
-        return os.path.join(os.getcwd(), DB_DIRECTORY_PATH, DB_NAME)
+        settings = LogServiceConfig.get_settings()
+        return os.path.join(os.getcwd(), settings.db_directory_path, settings.db_name)
+
+    @staticmethod
+    def get_shutdown_drain_deadline_seconds() -> float:
+        """
+        Returns how long a shutdown drains the ingest queue before spilling the remaining events to disk.
+
+        Returns:
+            float: The drain deadline in seconds.
+        """
+        return LogServiceConfig.get_settings().shutdown_drain_deadline_seconds
+
+    @staticmethod
+    def get_customer_rate_limit() -> tuple[float, float]:
+        """
+        Returns the events per second and the burst each customer may send.
+
+        Returns:
+            tuple[float, float]: The rate, 0 if customers are not limited, and the burst.
+        """
+        settings = LogServiceConfig.get_settings()
+        return (
+            settings.customer_rate_limit_per_second,
+            settings.customer_rate_limit_burst,
+        )
+
+    @staticmethod
+    def get_event_type_sample_rates() -> dict[str, float]:
+        """
+        Returns the event types of which only a sample is stored. Event types not listed are all stored.
+
+        Returns:
+            dict[str, float]: The fraction of events stored, by event type.
+        """
+        return dict(LogServiceConfig.get_settings().event_type_sample_rates)
+
+    @staticmethod
+    def get_event_type_priorities() -> dict[str, str]:
+        """
+        Returns the priority lane (see PRIORITY_LANE_WEIGHTS) of event types. Event types not listed go to
+        DEFAULT_PRIORITY_LANE.
+
+        Returns:
+            dict[str, str]: The lane name, by event type.
+        """
+        return dict(LogServiceConfig.get_settings().event_type_priorities)
+
+    @staticmethod
+    def get_hot_tail_limits() -> tuple[int, float]:
+        """
+        Returns how many of the most recent events are kept in memory to answer recent event queries, and for how
+        long.
+
+        Returns:
+            tuple[int, float]: The number of events, 0 if no events are kept, and the seconds.
+        """
+        settings = LogServiceConfig.get_settings()
+        return settings.hot_tail_max_events, settings.hot_tail_window_seconds
+
+    @staticmethod
+    def get_ingest_listener_address() -> tuple[str | None, int | None]:
+        """
+        Returns where the framed ingest listener accepts connections. The TCP port is bound on the loopback
+        interface only.
+
+        Returns:
+            tuple[str | None, int | None]: The Unix socket path and the TCP port, None if not set.
+        """
+        settings = LogServiceConfig.get_settings()
+        return settings.ingest_socket_path, settings.ingest_port
+
+    @staticmethod
+    def get_max_decompressed_request_bytes() -> int:
+        """
+        Returns the largest body a compressed request may decompress to.
+
+        Returns:
+            int: The size in bytes.
+        """
+        return LogServiceConfig.get_settings().max_decompressed_request_bytes
+
+    @staticmethod
+    def get_response_compression() -> tuple[int, int]:
+        """
+        Returns the zlib level responses are compressed with and the smallest response body compressed.
+
+        Returns:
+            tuple[int, int]: The level, 1 to 9, and the size in bytes.
+        """
+        settings = LogServiceConfig.get_settings()
+        return (
+            settings.response_compression_level,
+            settings.response_compression_min_bytes,
+        )
+
+
+def _convert(name: str, annotation: Any, value: Any) -> Any:
+    """
+    Converts a setting read from the environment (a string) or the config file (a JSON value) to the type of its
+    field.
+
+    Raises:
+        ValueError: If the value does not fit the type.
+    """
+    if isinstance(annotation, types.UnionType):
+        # `X | None`, unset by an empty variable or null
+        if value is None or value == "":
+            return None
+        (annotation,) = [arg for arg in get_args(annotation) if arg is not type(None)]
+    if get_origin(annotation) is dict:
+        _, value_type = get_args(annotation)
+        if isinstance(value, str):
+            value = _parse_event_type_pairs(value)
+        if not isinstance(value, dict):
+            raise ValueError(f"Invalid setting {name}: expected a mapping")
+        return {
+            key: _convert(f"{name}.{key}", value_type, item)
+            for key, item in value.items()
+        }
+    try:
+        if isinstance(value, str):
+            return annotation(value.strip())
+        if isinstance(value, bool) or not isinstance(
+            value, (float, int) if annotation is float else annotation
+        ):
+            raise TypeError()
+        return annotation(value)
+    except (TypeError, ValueError):
+        raise ValueError(
+            f"Invalid setting {name}: {value!r} is not a {annotation.__name__}"
+        )
+
+
+def _parse_event_type_pairs(setting: str) -> dict[str, str]:
+    """Parses a comma separated list of `event_type=value` pairs."""
+    pairs = {}
+    for pair in filter(None, setting.split(",")):
+        event_type, separator, value = pair.rpartition("=")
+        event_type = event_type.strip()
+        if not separator or not event_type:
+            raise ValueError(f"Invalid event type setting: {pair!r}")
+        pairs[event_type] = value
+    return pairs
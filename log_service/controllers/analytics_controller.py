@@ -0,0 +1,182 @@
+import numpy as np
+from fastapi import HTTPException
+
+from log_service.data.analytics_dto import AnalyticsRequestDTO
+from log_service.db_accessors.analytics_db_accessor import (
+    EventAnalyticsAccessor,
+    EventColumns,
+)
+from log_service.monitoring.tracing import span
+
+
+class AnalyticsController:
+    """
+    AnalyticsController answers ad-hoc analytics questions over a time window, such as percentiles of a numeric
+    `event_data` field or histograms by arbitrary buckets, optionally grouped by event type or customer.
+
+    The columns of the window are loaded once into NumPy arrays by the EventAnalyticsAccessor, and filters,
+    group-bys, quantiles and histograms are all computed with vectorized operations over those arrays.
+
+    Attributes:
+        analytics_accessor (EventAnalyticsAccessor): Accessor loading (and caching) the columns of a time window.
+
+    Methods:
+        get_analytics(request_dto: AnalyticsRequestDTO): Computes the requested aggregates for the window.
+    """
+
+    def __init__(self) -> None:
+        self.analytics_accessor = EventAnalyticsAccessor()
+
+    def get_analytics(self, request_dto: AnalyticsRequestDTO) -> dict:
+        """
+        Computes counts and, when a value_field is requested, min/max/mean, quantiles and histograms
+        per group for the events in the requested window.
+
+        Parameters:
+            request_dto (AnalyticsRequestDTO): The analytics request.
+
+        Returns:
+            dict: The aggregates, with one entry per group in "groups".
+
+        Raises:
+            HTTPException: 400 error if the value_field is not a valid field path or the window holds too many events.
+        """
+        try:
+            with span("load_columns"):
+                columns = self.analytics_accessor.load_columns(
+                    request_dto.timestamp_start_utc,
+                    request_dto.timestamp_end_utc,
+                    request_dto.value_field,
+                )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        with span("aggregate"):
+            return self.aggregate(columns, request_dto)
+
+    @staticmethod
+    def aggregate(columns: EventColumns, request_dto: AnalyticsRequestDTO) -> dict:
+        """
+        Applies the request filters to the loaded columns and computes the per group aggregates.
+
+        Parameters:
+            columns (EventColumns): The columns of the window.
+            request_dto (AnalyticsRequestDTO): The analytics request.
+
+        Returns:
+            dict: The aggregates, with one entry per group in "groups".
+        """
+        mask = np.ones(len(columns), dtype=bool)
+        if request_dto.event_type is not None:
+            type_code = np.searchsorted(columns.event_types, request_dto.event_type)
+            if (
+                type_code < len(columns.event_types)
+                and columns.event_types[type_code] == request_dto.event_type
+            ):
+                mask &= columns.event_type_codes == type_code
+            else:
+                mask[:] = False
+        if request_dto.customer_id is not None:
+            mask &= columns.customer_ids == request_dto.customer_id
+
+        if request_dto.group_by == "event_type":
+            group_codes, group_index = np.unique(
+                columns.event_type_codes[mask], return_inverse=True
+            )
+            group_labels = columns.event_types[group_codes].tolist()
+        elif request_dto.group_by == "customer_id":
+            group_codes, group_index = np.unique(
+                columns.customer_ids[mask], return_inverse=True
+            )
+            group_labels = group_codes.tolist()
+        else:
+            group_index = np.zeros(int(mask.sum()), dtype=np.int64)
+            group_labels = [None]
+
+        group_count = len(group_labels)
+        counts = np.bincount(group_index, minlength=group_count)
+        groups: list[dict] = [
+            {"group": label, "count": int(count)}
+            for label, count in zip(group_labels, counts.tolist())
+        ]
+
+        response: dict = {
+            "timestamp_start_utc": request_dto.timestamp_start_utc,
+            "timestamp_end_utc": request_dto.timestamp_end_utc,
+            "group_by": request_dto.group_by,
+            "value_field": request_dto.value_field,
+            "event_count": int(counts.sum()),
+            "groups": groups,
+        }
+
+        if columns.values is None:
+            return response
+
+        values = columns.values[mask]
+        is_valid = ~np.isnan(values)
+        values = values[is_valid]
+        value_groups = group_index[is_valid]
+
+        # sorting by (group, value) makes every group a contiguous sorted slice, the trailing NaN
+        # sentinel is what empty groups index into
+        order = np.lexsort((values, value_groups))
+        sorted_values = np.append(values[order], np.nan)
+        value_counts = np.bincount(value_groups, minlength=group_count)
+        offsets = np.cumsum(value_counts) - value_counts
+        has_values = value_counts > 0
+        sums = np.bincount(value_groups, weights=values, minlength=group_count)
+
+        stats = {
+            "min": sorted_values[np.where(has_values, offsets, -1)],
+            "max": sorted_values[np.where(has_values, offsets + value_counts - 1, -1)],
+            "mean": np.divide(
+                sums, value_counts, out=np.full(group_count, np.nan), where=has_values
+            ),
+        }
+
+        quantiles = {}
+        for q in request_dto.quantiles:
+            # linear interpolation between the closest ranks, as numpy.quantile does by default
+            position = q * np.maximum(value_counts - 1, 0)
+            lower = np.floor(position).astype(np.int64)
+            upper = np.minimum(lower + 1, np.maximum(value_counts - 1, 0))
+            lower_values = sorted_values[np.where(has_values, offsets + lower, -1)]
+            upper_values = sorted_values[np.where(has_values, offsets + upper, -1)]
+            quantiles[str(q)] = lower_values + (upper_values - lower_values) * (
+                position - lower
+            )
+
+        histogram = None
+        if request_dto.histogram_edges or request_dto.histogram_bins:
+            if request_dto.histogram_edges:
+                edges = np.asarray(request_dto.histogram_edges, dtype=np.float64)
+            else:
+                edges = np.histogram_bin_edges(values, bins=request_dto.histogram_bins)
+            bin_count = len(edges) - 1
+            bins = np.searchsorted(edges, values, side="right") - 1
+            # the last bucket is closed on the right, as with numpy.histogram
+            bins[values == edges[-1]] = bin_count - 1
+            in_range = (bins >= 0) & (bins < bin_count)
+            histogram = np.bincount(
+                value_groups[in_range] * bin_count + bins[in_range],
+                minlength=group_count * bin_count,
+            ).reshape(group_count, bin_count)
+            response["histogram_edges"] = edges.tolist()
+
+        for index, group in enumerate(groups):
+            group["value_count"] = int(value_counts[index])
+            for name in ("min", "max", "mean"):
+                group[name] = _to_json_number(stats[name][index])
+            if request_dto.quantiles:
+                group["quantiles"] = {
+                    name: _to_json_number(group_quantiles[index])
+                    for name, group_quantiles in quantiles.items()
+                }
+            if histogram is not None:
+                group["histogram"] = histogram[index].tolist()
+
+        return response
+
+
+def _to_json_number(value: float) -> float | None:
+    return None if np.isnan(value) else float(value)
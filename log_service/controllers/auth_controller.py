@@ -1,9 +1,15 @@
+import hashlib
 import logging
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
+from threading import Lock, RLock
 
 from fastapi import Request, HTTPException
 import jwt
 
+from log_service.monitoring.tracing import traced
+
 
 JWT_SECRET_KEY = (
     "canonical_audit_log_service"  # todo add to service config : ENV variable
@@ -12,10 +18,83 @@ JWT_ALGORITHM = "HS256"  # todo add to service config : ENV variable
 AllOWED_ACCESS_KEY = (
     "canonical_audit_log_service_all_access"  # todo add to service config: ENV variable
 )
+VERIFIED_TOKEN_CACHE_SIZE = 1024
 
 logger = logging.getLogger(__name__)
 
 
+class VerifiedTokenCache:
+    """
+    Implements a thread-safe singleton LRU cache of access tokens that already passed signature and claim
+    verification, so a reused token pays for `jwt.decode` only once.
+
+    Entries are keyed by the SHA-256 digest of the raw token, so no usable token is kept in memory, and expire at
+    the token's `exp` claim. The whole cache is flushed when the secret key, algorithm or allowed access key change.
+
+    Attributes:
+        _instance (VerifiedTokenCache, optional): Class variable to hold the singleton instance.
+        _lock (RLock): A reentrant lock to ensure thread-safe creation of the singleton instance.
+
+    Raises:
+        Exception: If an attempt is made to directly instantiate the class instead of using the `get_instance` method.
+    """
+
+    _instance = None
+    _lock: RLock = RLock()
+
+    def __init__(self) -> None:
+        if VerifiedTokenCache._instance:
+            raise Exception("This class is a singleton!")
+        self._expirations: OrderedDict[bytes, float] = OrderedDict()
+        self._key_fingerprint = (JWT_SECRET_KEY, JWT_ALGORITHM, AllOWED_ACCESS_KEY)
+        self._cache_lock = Lock()
+        VerifiedTokenCache._instance = self
+
+    @classmethod
+    def get_instance(cls) -> "VerifiedTokenCache":
+        """
+        Retrieves the singleton instance of the VerifiedTokenCache class, creating it if it does not already exist.
+
+        Returns:
+            VerifiedTokenCache: The singleton instance of the class.
+        """
+        if not cls._instance:
+            with cls._lock:
+                if not cls._instance:
+                    cls._instance = VerifiedTokenCache()
+        return cls._instance
+
+    def get_expiration(self, token_digest: bytes) -> float | None:
+        """
+        Returns the expiration of a verified token, or None if the token is not cached.
+        Expired tokens are returned as well, so the caller can reject them without verifying them again.
+        """
+        with self._cache_lock:
+            self._flush_on_key_change()
+            expiration = self._expirations.get(token_digest)
+            if expiration is not None:
+                self._expirations.move_to_end(token_digest)
+            return expiration
+
+    def add(self, token_digest: bytes, expiration: float) -> None:
+        with self._cache_lock:
+            self._flush_on_key_change()
+            self._expirations[token_digest] = expiration
+            self._expirations.move_to_end(token_digest)
+            if len(self._expirations) > VERIFIED_TOKEN_CACHE_SIZE:
+                self._expirations.popitem(last=False)
+
+    def discard(self, token_digest: bytes) -> None:
+        with self._cache_lock:
+            self._expirations.pop(token_digest, None)
+
+    def _flush_on_key_change(self) -> None:
+        key_fingerprint = (JWT_SECRET_KEY, JWT_ALGORITHM, AllOWED_ACCESS_KEY)
+        if key_fingerprint != self._key_fingerprint:
+            self._expirations.clear()
+            self._key_fingerprint = key_fingerprint
+
+
 class AuthController:
     """
     AuthController provides authentication services for the audit log service,
@@ -26,13 +105,16 @@ class AuthController:
 
     Methods:
         validate_access_token(request: Request): Validates the JWT access token from the request's authorization header.
+        validate_token(token: str): Validates a JWT access token.
         generate_access_token(valid_minutes: int): Generates a new JWT access token with a specified validity period.
     """
 
     @staticmethod
+    @traced("auth")
     def validate_access_token(request: Request) -> None:
         """
         Validates the JWT access token provided in the 'Authorization' header of the request.
+        Tokens verified before are looked up in the VerifiedTokenCache instead of being decoded again.
 
         Parameters:
             request (Request): The FastAPI request object containing the HTTP request details.
@@ -47,11 +129,40 @@ class AuthController:
         auth_header = request.headers.get("authorization")
         if not auth_header:
             raise HTTPException(status_code=401, detail="Access token is missing.")
+        token = auth_header.split(" ")[1] if " " in auth_header else ""
+        AuthController.validate_token(token)
+
+    @staticmethod
+    def validate_token(token: str) -> None:
+        """
+        Validates a JWT access token, e.g. the one of an Authorization header or of an ingest listener handshake.
+
+        Parameters:
+            token (str): The encoded token.
+
+        Returns:
+            None. The method returns early if the token is valid.
+
+        Raises:
+            HTTPException: 401 error if the token is expired or invalid.
+            HTTPException: 500 error if any other exception occurs during validation.
+        """
         try:
-            token = auth_header.split(" ")[1]
+            token_cache = VerifiedTokenCache.get_instance()
+            token_digest = hashlib.sha256(token.encode()).digest()
+            expiration = token_cache.get_expiration(token_digest)
+            if expiration is not None:
+                if time.time() < expiration:
+                    return
+                token_cache.discard(token_digest)
+                raise jwt.ExpiredSignatureError()
+
             payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=[JWT_ALGORITHM])
             if payload.get("key") != AllOWED_ACCESS_KEY:
                 raise jwt.InvalidTokenError()
+            # tokens without an expiration are not cached, they would never leave the cache on their own
+            if isinstance(payload.get("exp"), (int, float)):
+                token_cache.add(token_digest, payload["exp"])
         except jwt.ExpiredSignatureError:
             logger.debug("Access token is expired.")
             raise HTTPException(status_code=401, detail="Token expired.")
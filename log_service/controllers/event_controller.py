@@ -1,10 +1,46 @@
+import asyncio
+import math
+import zlib
+from concurrent.futures import Future
+from typing import AsyncIterator, Iterator
+
+import orjson
+
 from log_service.config import LogServiceConfig
 from log_service.data.event_dto import EventQueueDTO, EventRequestDTO, EventResponseDTO
+from log_service.data.event_serializers import (
+    decode_event_row,
+    encode_event_row,
+    encode_events_page,
+    encode_query_results,
+    encode_sse_events,
+)
+from log_service.data.request_models import CreateEventModel
 
 from log_service.db_accessors.event_db_accessor import EventDatabaseAccessor
+from log_service.db_accessors.read_executor import DatabaseReadExecutor
+from log_service.monitoring.tracing import span
+from log_service.processors.change_feed import (
+    ChangeFeedHub,
+    ChangeFeedSubscription,
+)
+from log_service.processors.event_dedup import EventDeduplicator
+from log_service.processors.hot_tail import HotTailBuffer
+from log_service.processors.ingest_limiter import IngestRateLimiter
+from log_service.processors.queue_consumer import EventNotCommittedError
 from log_service.processors.queue_producer import QueueProducer
 from fastapi import HTTPException
 
+EXPORT_GZIP_LEVEL = 6
+MAX_BATCH_EVENTS = 1000
+MAX_BATCH_QUERIES = 50
+# how long a request in committed durability mode waits for its events to be committed
+COMMIT_WAIT_TIMEOUT_SECONDS = 30.0
+# events read per query while a change feed subscriber catches up from the database
+CHANGE_FEED_BACKFILL_PAGE_SIZE = 500
+# an idle change feed stream sends a comment this often, so proxies do not time it out
+CHANGE_FEED_KEEPALIVE_SECONDS = 15.0
+
 
 class EventController:
     """
@@ -18,11 +54,27 @@ class EventController:
         queue_processor (QueueProducer): An instance of QueueProducer for event queuing operations.
         config (LogServiceConfig): Configuration instance for accessing global settings.
         database_accessor (EventDatabaseAccessor): Database accessor for event data retrieval and manipulation.
+        deduplicator (EventDeduplicator): Drops events whose event_uuid was received before.
+        rate_limiter (IngestRateLimiter): Limits the ingest rate of every customer and samples high volume event types.
+        hot_tail (HotTailBuffer): The recent events, queries of recent events are answered from it.
+        change_feed (ChangeFeedHub): Fans out committed events to the change feed streams.
+        read_executor (DatabaseReadExecutor): Runs the blocking reads of the change feed streams.
 
     Methods:
         __init__(): Initializes the EventController with necessary components.
-        create_event(event_type, timestamp, customer_id, event_data): Enqueues a new event for processing.
+        create_event(event_type, timestamp, customer_id, event_data, event_uuid): Enqueues a new event for
+            processing, unless its event_uuid was received before.
+        create_events(events: list[CreateEventModel]): Enqueues a batch of events for processing, all or none of them.
+        create_event_committed(event_type, timestamp, customer_id, event_data, event_uuid): Enqueues a new event and
+            waits until it is committed, returning its id.
+        create_events_committed(events: list[CreateEventModel]): Enqueues a batch of events and waits until they are
+            committed, returning their ids.
         get_event(request_dto: EventRequestDTO): Retrieves events based on criteria defined in an EventRequestDTO.
+        get_event_json(request_dto: EventRequestDTO): Retrieves the same events as an encoded JSON body.
+        get_events_batch_json(request_dtos: list[EventRequestDTO]): Runs a batch of queries, encoded as one body.
+        export_events(request_dto: EventRequestDTO, gzip: bool): Streams all matching events as NDJSON.
+        stream_events(request_dto: EventRequestDTO, after_id: int | None): Streams newly committed events as
+            server-sent events.
 
     """
 
@@ -33,6 +85,11 @@ class EventController:
         self.queue_processor = QueueProducer.get_instance()
         self.config = LogServiceConfig.get_instance()
         self.database_accessor = EventDatabaseAccessor()
+        self.deduplicator = EventDeduplicator.get_instance()
+        self.rate_limiter = IngestRateLimiter.get_instance()
+        self.hot_tail = HotTailBuffer.get_instance()
+        self.change_feed = ChangeFeedHub.get_instance()
+        self.read_executor = DatabaseReadExecutor.get_instance()
 
     def create_event(
         self,
@@ -40,24 +97,38 @@ class EventController:
         timestamp_utc: int | None,
         customer_id: int,
         event_data: dict,
+        event_uuid: str | None = None,
     ) -> str:
         """
-        Creates and enqueues an event for processing.
+        Creates and enqueues an event for processing. An event with an event_uuid that was received before is
+        acknowledged without being enqueued again, so a client can safely retry it. So is an event of a sampled event
+        type that is not part of the sample.
 
         Parameters:
             event_type (str): The type of the event.
             timestamp_utc (int): The Unix timestamp (in UTC) when the event occurred
             customer_id (int): Identifier of the customer associated with the event.
             event_data (dict): Additional data related to the event.
+            event_uuid (str | None): The client generated id of the event.
 
         Returns:
             str: A message indicating successful receipt and queuing of the event.
 
         Raises:
+            HTTPException: An exception with status code 400 if the event data cannot be encoded as JSON.
+            HTTPException: An exception with status code 429 if the customer exceeded its ingest rate.
             HTTPException: An exception with status code 500 if the event fails to be enqueued.
         """
-        event = EventQueueDTO(event_type, timestamp_utc, customer_id, event_data)
-        is_queued = self.queue_processor.enqueue_event(event)
+        event = self._queue_event(
+            event_type, timestamp_utc, customer_id, event_data, event_uuid
+        )
+        if not self._admit([event]):
+            return "Event received and sampled out"
+        with span("dedup"):
+            if not self.deduplicator.drop_duplicates([event]):
+                return "Event already received"
+        with span("queue"):
+            is_queued = self.queue_processor.enqueue_event(event)
         if not is_queued:
             raise HTTPException(
                 status_code=500,
@@ -65,9 +136,211 @@ class EventController:
             )
         return "Event received and queued successfully"
 
+    def create_events(self, events: list[CreateEventModel]) -> str:
+        """
+        Creates and enqueues a batch of events for processing. The whole batch is validated before anything is
+        enqueued, so a rejected batch can be retried as is without duplicating its valid events. Events with an
+        event_uuid that was received before are skipped, as are the events of sampled event types not part of the
+        sample.
+
+        Parameters:
+            events (list[CreateEventModel]): The validated events.
+
+        Returns:
+            str: A message indicating successful receipt and queuing of the events.
+
+        Raises:
+            HTTPException: An exception with status code 400 if the batch is empty, larger than MAX_BATCH_EVENTS, or
+                an event's data cannot be encoded as JSON.
+            HTTPException: An exception with status code 429 if a customer of the batch exceeded its ingest rate.
+            HTTPException: An exception with status code 500 if the events fail to be enqueued.
+        """
+        queue_events = self._queue_events(events)
+        sampled_events = self._admit(queue_events)
+        with span("dedup"):
+            new_events = self.deduplicator.drop_duplicates(sampled_events)
+        if new_events:
+            with span("queue"):
+                is_queued = self.queue_processor.enqueue_events(new_events)
+            if not is_queued:
+                raise HTTPException(
+                    status_code=500,
+                    detail="Failed to process events, Something went wrong. Please try again",
+                )
+        message = f"{len(new_events)} events received and queued successfully"
+        if len(new_events) < len(sampled_events):
+            message += f", {len(sampled_events) - len(new_events)} already received"
+        if len(sampled_events) < len(queue_events):
+            message += f", {len(queue_events) - len(sampled_events)} sampled out"
+        return message
+
+    async def create_event_committed(
+        self,
+        event_type: str,
+        timestamp_utc: int | None,
+        customer_id: int,
+        event_data: dict,
+        event_uuid: str | None = None,
+    ) -> dict:
+        """
+        Creates and enqueues an event like `create_event`, then waits until the consumer committed the batch holding
+        it, so the event is readable once the response is sent. Waiting requests share the transactions the
+        consumer commits anyway, instead of committing one each.
+
+        The event is not dropped as a duplicate at ingest: a retried event is stored once by the insert, which
+        returns the id of the stored event.
+
+        Parameters:
+            event_type (str): The type of the event.
+            timestamp_utc (int): The Unix timestamp (in UTC) when the event occurred
+            customer_id (int): Identifier of the customer associated with the event.
+            event_data (dict): Additional data related to the event.
+            event_uuid (str | None): The client generated id of the event.
+
+        Returns:
+            dict: A message and the id of the stored event, None if the event was sampled out.
+
+        Raises:
+            HTTPException: An exception with status code 400 if the event data cannot be encoded as JSON.
+            HTTPException: An exception with status code 429 if the customer exceeded its ingest rate.
+            HTTPException: An exception with status code 503 if the event cannot be committed.
+            HTTPException: An exception with status code 504 if the event is not committed within
+                COMMIT_WAIT_TIMEOUT_SECONDS, it stays queued.
+        """
+        event = self._queue_event(
+            event_type, timestamp_utc, customer_id, event_data, event_uuid
+        )
+        (event_id,) = await self._commit([event])
+        if event_id is None:
+            return {"detail": "Event received and sampled out", "id": None}
+        return {"detail": "Event committed", "id": event_id}
+
+    async def create_events_committed(self, events: list[CreateEventModel]) -> dict:
+        """
+        Creates and enqueues a batch of events like `create_events`, then waits until all of them are committed, see
+        `create_event_committed`.
+
+        Parameters:
+            events (list[CreateEventModel]): The validated events.
+
+        Returns:
+            dict: A message and the ids of the stored events, in the order of `events`, None for events sampled out.
+
+        Raises:
+            HTTPException: The exceptions of `create_events`, or of `create_event_committed` while waiting.
+        """
+        event_ids = await self._commit(self._queue_events(events))
+        committed = sum(event_id is not None for event_id in event_ids)
+        message = f"{committed} events committed"
+        if committed < len(event_ids):
+            message += f", {len(event_ids) - committed} sampled out"
+        return {"detail": message, "ids": event_ids}
+
+    async def _commit(self, queue_events: list[EventQueueDTO]) -> list[int | None]:
+        admitted = self._admit(queue_events)
+        admitted_ids = {id(event) for event in admitted}
+        futures = []
+        for event in queue_events:
+            future: Future[int | None] = Future()
+            futures.append(future)
+            if id(event) in admitted_ids:
+                event.commit_future = future
+            else:
+                future.set_result(None)
+        if admitted:
+            with span("queue"):
+                is_queued = self.queue_processor.enqueue_events(admitted)
+            if not is_queued:
+                raise HTTPException(
+                    status_code=500,
+                    detail="Failed to process events, Something went wrong. Please try again",
+                )
+
+        try:
+            with span("commit_wait"):
+                return await asyncio.wait_for(
+                    asyncio.gather(*map(asyncio.wrap_future, futures)),
+                    timeout=COMMIT_WAIT_TIMEOUT_SECONDS,
+                )
+        except asyncio.TimeoutError:
+            raise HTTPException(
+                status_code=504,
+                detail="Events are queued but were not committed in time",
+            )
+        except EventNotCommittedError as e:
+            raise HTTPException(status_code=503, detail=str(e))
+
+    def _queue_event(
+        self,
+        event_type: str,
+        timestamp_utc: int | None,
+        customer_id: int,
+        event_data: dict,
+        event_uuid: str | None,
+    ) -> EventQueueDTO:
+        try:
+            return EventQueueDTO(
+                event_type, timestamp_utc, customer_id, event_data, event_uuid
+            )
+        except orjson.JSONEncodeError as e:
+            # e.g. integers beyond 64 bits, rejected here instead of failing the whole batch in the consumer
+            raise HTTPException(
+                status_code=400, detail=f"event_data cannot be stored: {e}"
+            )
+
+    @staticmethod
+    def _queue_events(events: list[CreateEventModel]) -> list[EventQueueDTO]:
+        if not 0 < len(events) <= MAX_BATCH_EVENTS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"A batch must hold between 1 and {MAX_BATCH_EVENTS} events.",
+            )
+        queue_events = []
+        for index, event in enumerate(events):
+            try:
+                queue_events.append(
+                    EventQueueDTO(
+                        event.event_type,
+                        event.timestamp_utc,
+                        event.customer_id,
+                        event.event_data,
+                        str(event.event_uuid) if event.event_uuid else None,
+                    )
+                )
+            except orjson.JSONEncodeError as e:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"event_data of event {index} cannot be stored: {e}",
+                )
+        return queue_events
+
+    def _admit(self, events: list[EventQueueDTO]) -> list[EventQueueDTO]:
+        """
+        Applies the event type sampling to the events, then takes the tokens of the remaining events from the
+        rate limits of their customers.
+
+        Returns:
+            list[EventQueueDTO]: The events kept by the sampling.
+
+        Raises:
+            HTTPException: An exception with status code 429 and a Retry-After header if a customer exceeded its
+                ingest rate, in which case none of the events are admitted.
+        """
+        with span("rate_limit"):
+            events = self.rate_limiter.sample(events)
+            retry_after_seconds = self.rate_limiter.acquire(events)
+        if retry_after_seconds:
+            raise HTTPException(
+                status_code=429,
+                detail="Ingest rate limit exceeded, please retry later",
+                headers={"Retry-After": str(math.ceil(retry_after_seconds))},
+            )
+        return events
+
     def get_event(self, request_dto: EventRequestDTO) -> dict:
         """
-        Retrieves events based on criteria specified in the EventRequestDTO.
+        Retrieves events based on criteria specified in the EventRequestDTO. Queries of recent events are answered
+        from the HotTailBuffer, including events still queued, which are marked as pending.
 
         Parameters:
             request_dto (EventRequestDTO): Data transfer object containing query criteria.
@@ -75,7 +348,24 @@ class EventController:
         Returns:
             dict: A dictionary representing the response, including the events, total count, and pagination details.
         """
-        events, count = self.database_accessor.get_events(request_dto)
+        with span("hot_tail"):
+            page = self.hot_tail.query(request_dto)
+        if page is None:
+            events, count = self.database_accessor.get_events(request_dto)
+        else:
+            rows, count = page
+            events = [decode_event_row(row) for row in rows]
+            if request_dto.fields is not None:
+                # pending is part of the id, like in `encode_projected_event_row`
+                kept = (
+                    (*request_dto.fields, "pending")
+                    if "id" in request_dto.fields
+                    else request_dto.fields
+                )
+                events = [
+                    {field: value for field, value in event.items() if field in kept}
+                    for event in events
+                ]
         events_response_dto = EventResponseDTO(
             events=events,
             total_count=count,
@@ -83,3 +373,170 @@ class EventController:
             count=len(events),
         )
         return events_response_dto.to_dict()
+
+    def get_event_json(self, request_dto: EventRequestDTO) -> bytes:
+        """
+        Retrieves events like `get_event`, encoded as the JSON response body. The stored `event_data` is spliced
+        into the body verbatim, so payloads are never parsed or re-encoded.
+
+        Parameters:
+            request_dto (EventRequestDTO): Data transfer object containing query criteria.
+
+        Returns:
+            bytes: The JSON encoded response, including the events, total count, and pagination details.
+        """
+        with span("hot_tail"):
+            page = self.hot_tail.query(request_dto)
+        rows, count = (
+            self.database_accessor.get_event_rows(request_dto) if page is None else page
+        )
+        with span("serialize"):
+            return encode_events_page(
+                rows,
+                total_count=count,
+                offset=request_dto.offset,
+                fields=request_dto.fields,
+            )
+
+    def get_events_batch_json(self, request_dtos: list[EventRequestDTO]) -> bytes:
+        """
+        Runs a batch of event queries, e.g. the panels of a dashboard, and encodes their pages as one JSON body
+        `{"results": [page, ...]}`, each page as returned by `get_event_json`.
+
+        The queries run one after the other on the pooled connection of the calling read executor thread, in one
+        read transaction, so all pages show the same committed events; recent queries are answered from the
+        HotTailBuffer as usual.
+
+        Parameters:
+            request_dtos (list[EventRequestDTO]): The queries, at most MAX_BATCH_QUERIES.
+
+        Returns:
+            bytes: The JSON encoded pages, in query order.
+
+        Raises:
+            HTTPException: An exception with status code 400 if the batch is empty or larger than MAX_BATCH_QUERIES.
+        """
+        if not 0 < len(request_dtos) <= MAX_BATCH_QUERIES:
+            raise HTTPException(
+                status_code=400,
+                detail=f"A batch must hold between 1 and {MAX_BATCH_QUERIES} queries.",
+            )
+        with self.database_accessor.read_snapshot():
+            pages = [self.get_event_json(request_dto) for request_dto in request_dtos]
+        return encode_query_results(pages)
+
+    def export_events(
+        self, request_dto: EventRequestDTO, gzip: bool = False
+    ) -> Iterator[bytes]:
+        """
+        Streams all events matching the criteria of the EventRequestDTO as NDJSON, one event per line, ordered by
+        timestamp. Offset and limit are ignored, and memory use is bounded by the fetch size of one batch.
+
+        Parameters:
+            request_dto (EventRequestDTO): Data transfer object containing query criteria.
+            gzip (bool): Whether to gzip the stream.
+
+        Yields:
+            bytes: Chunks of the (optionally gzipped) NDJSON body.
+        """
+        compressor = (
+            zlib.compressobj(EXPORT_GZIP_LEVEL, zlib.DEFLATED, 31) if gzip else None
+        )
+        for rows in self.database_accessor.iter_event_rows(request_dto):
+            chunk = b"\n".join(map(encode_event_row, rows)) + b"\n"
+            if compressor is None:
+                yield chunk
+            else:
+                compressed = compressor.compress(chunk)
+                if compressed:
+                    yield compressed
+
+        if compressor is not None:
+            yield compressor.flush()
+
+    async def stream_events(
+        self, request_dto: EventRequestDTO, after_id: int | None = None
+    ) -> AsyncIterator[bytes]:
+        """
+        Subscribes to the committed events matching the event_type and customer_id of the EventRequestDTO, and
+        returns them as a stream of server-sent events (see `encode_sse_events`), in commit order.
+
+        The subscription is opened before anything is read, so no event committed meanwhile is missed. With an
+        `after_id`, the events stored after it are read from the database first, page by page, then the stream
+        goes on with the events pushed by the ChangeFeedHub; events read from both are sent once. Without one, the
+        stream starts with the events committed after the subscription.
+
+        A subscriber falling more than SUBSCRIBER_BUFFER_SIZE events behind while catching up reads the missed
+        events from the database again. Once caught up, it is disconnected instead: the stream ends with an
+        `error` event holding the id of the last event sent, to resume from.
+
+        Parameters:
+            request_dto (EventRequestDTO): The event_type and customer_id to filter by, other criteria are ignored.
+            after_id (int | None): The id of the last event the subscriber received.
+
+        Returns:
+            AsyncIterator[bytes]: The server-sent event messages.
+
+        Raises:
+            HTTPException: 503 error if the read executor is saturated.
+        """
+        subscription = self.change_feed.subscribe(
+            request_dto.event_type, request_dto.customer_id
+        )
+        try:
+            if after_id is None:
+                after_id = await self.read_executor.run(
+                    self.database_accessor.get_last_event_id
+                )
+        except BaseException:
+            self.change_feed.unsubscribe(subscription)
+            raise
+        return self._stream_subscription(subscription, request_dto, after_id)
+
+    async def _stream_subscription(
+        self,
+        subscription: ChangeFeedSubscription,
+        request_dto: EventRequestDTO,
+        last_id: int,
+    ) -> AsyncIterator[bytes]:
+        try:
+            while True:
+                rows = await self.read_executor.run(
+                    self.database_accessor.get_event_rows_after,
+                    request_dto,
+                    last_id,
+                    CHANGE_FEED_BACKFILL_PAGE_SIZE,
+                )
+                if rows:
+                    last_id = rows[-1][0]
+                    yield encode_sse_events(rows)
+                if len(rows) < CHANGE_FEED_BACKFILL_PAGE_SIZE:
+                    if not subscription.overflowed:
+                        break
+                    subscription.resume()
+
+            while not subscription.closed:
+                rows = await subscription.next_rows(CHANGE_FEED_KEEPALIVE_SECONDS)
+                if subscription.overflowed:
+                    yield self._stream_error(
+                        "Subscriber fell too far behind, resume from last_event_id",
+                        last_id,
+                    )
+                    return
+                new_rows = []
+                for row in rows:
+                    # rows read from the database already, or retried events stored before
+                    if row[0] > last_id:
+                        new_rows.append(row)
+                        last_id = row[0]
+                yield encode_sse_events(new_rows) if new_rows else b": keepalive\n\n"
+
+        except HTTPException as e:
+            yield self._stream_error(e.detail, last_id)
+        finally:
+            self.change_feed.unsubscribe(subscription)
+
+    @staticmethod
+    def _stream_error(detail: str, last_id: int) -> bytes:
+        data = orjson.dumps({"detail": detail, "last_event_id": last_id})
+        return b"event: error\ndata: %s\n\n" % data
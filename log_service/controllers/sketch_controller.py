@@ -0,0 +1,147 @@
+import math
+
+import numpy as np
+from fastapi import HTTPException
+
+from log_service.processors.event_sketches import (
+    HEAVY_HITTER_CAPACITY,
+    EventSketchStore,
+    HyperLogLog,
+    SketchBucket,
+)
+
+Z_SCORE_95 = 1.96
+
+
+class SketchController:
+    """
+    SketchController answers approximate distinct count and top-k questions from the per time bucket sketches
+    maintained by the QueueConsumer, instead of exact COUNT(DISTINCT) / GROUP BY scans over the events table.
+
+    Answers apply to whole sketch buckets: the returned bucket_start_utc / bucket_end_utc give the time range
+    actually covered, which contains the requested range. A range may span at most MAX_SKETCH_QUERY_BUCKETS buckets.
+
+    Attributes:
+        sketch_store (EventSketchStore): The store holding the sketches.
+
+    Methods:
+        get_distinct_customers(event_type, timestamp_start_utc, timestamp_end_utc): Approximate distinct customers.
+        get_top_event_types(timestamp_start_utc, timestamp_end_utc, k): Approximate most frequent event types.
+    """
+
+    def __init__(self) -> None:
+        self.sketch_store = EventSketchStore.get_instance()
+
+    def get_distinct_customers(
+        self, event_type: str, timestamp_start_utc: int, timestamp_end_utc: int
+    ) -> dict:
+        """
+        Estimates how many distinct customers triggered event_type within the time range.
+
+        Only heavy hitter event types are tracked with their own sketch. If event_type occurred in some bucket
+        without being tracked there, fully_tracked is false: the estimate then only counts the tracked buckets.
+        The upper bound also includes the customers of all untracked event types of the buckets event_type
+        occurred in.
+
+        Returns:
+            dict: The estimate with its relative standard error and 95% confidence bounds.
+
+        Raises:
+            HTTPException: 400 error if the time range is invalid.
+        """
+        self._validate_time_range(timestamp_start_utc, timestamp_end_utc)
+        merged, bucket_start_utc, bucket_end_utc = self._merged_bucket(
+            timestamp_start_utc, timestamp_end_utc, event_type
+        )
+        sketch = merged.customer_sketches.get(event_type)
+        estimate = sketch.estimate() if sketch else 0.0
+        standard_error = merged.overflow_customers.relative_standard_error
+
+        fully_tracked = not merged.event_type_untracked
+        upper_estimate = estimate
+        if np.any(merged.overflow_customers.registers):
+            upper_sketch = HyperLogLog(
+                registers=merged.overflow_customers.registers.copy()
+            )
+            if sketch:
+                upper_sketch.merge(sketch)
+            upper_estimate = upper_sketch.estimate()
+
+        return {
+            "event_type": event_type,
+            "bucket_start_utc": bucket_start_utc,
+            "bucket_end_utc": bucket_end_utc,
+            "distinct_customers": round(estimate),
+            "fully_tracked": fully_tracked,
+            "relative_standard_error": standard_error,
+            "lower_bound_95": math.floor(estimate * (1 - Z_SCORE_95 * standard_error)),
+            "upper_bound_95": math.ceil(
+                upper_estimate * (1 + Z_SCORE_95 * standard_error)
+            ),
+        }
+
+    def get_top_event_types(
+        self, timestamp_start_utc: int, timestamp_end_utc: int, k: int
+    ) -> dict:
+        """
+        Estimates the k most frequent event types within the time range.
+
+        Count estimates never undercount; they overcount by at most max_overcount with the returned confidence.
+
+        Returns:
+            dict: The top event types with their estimated counts and error bounds.
+
+        Raises:
+            HTTPException: 400 error if the time range or k is invalid.
+        """
+        self._validate_time_range(timestamp_start_utc, timestamp_end_utc)
+        if not 0 < k <= HEAVY_HITTER_CAPACITY:
+            raise HTTPException(
+                status_code=400,
+                detail=f"k must be between 1 and {HEAVY_HITTER_CAPACITY}.",
+            )
+
+        merged, bucket_start_utc, bucket_end_utc = self._merged_bucket(
+            timestamp_start_utc, timestamp_end_utc
+        )
+        counts = merged.event_type_counts
+        max_overcount = math.ceil(counts.epsilon * counts.total)
+        top = sorted(
+            merged.heavy_hitters.items(), key=lambda item: item[1], reverse=True
+        )[:k]
+
+        return {
+            "bucket_start_utc": bucket_start_utc,
+            "bucket_end_utc": bucket_end_utc,
+            "total_events": counts.total,
+            "max_overcount": max_overcount,
+            "confidence": 1 - counts.delta,
+            "event_types": [
+                {
+                    "event_type": event_type,
+                    "count_estimate": estimate,
+                    "count_lower_bound": max(estimate - max_overcount, 0),
+                }
+                for event_type, estimate in top
+            ],
+        }
+
+    def _merged_bucket(
+        self,
+        timestamp_start_utc: int,
+        timestamp_end_utc: int,
+        event_type: str | None = None,
+    ) -> tuple[SketchBucket, int, int]:
+        try:
+            return self.sketch_store.merged_bucket(
+                timestamp_start_utc, timestamp_end_utc, event_type
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    @staticmethod
+    def _validate_time_range(timestamp_start_utc: int, timestamp_end_utc: int) -> None:
+        if timestamp_start_utc > timestamp_end_utc:
+            raise HTTPException(
+                status_code=400, detail="Start time must be before End time."
+            )
@@ -0,0 +1,93 @@
+from dataclasses import dataclass, field
+
+from fastapi import HTTPException
+
+ANALYTICS_GROUP_BY_COLUMNS = ("event_type", "customer_id")
+MAX_HISTOGRAM_BINS = 1000
+MAX_ANALYTICS_WINDOW_SECONDS = 31 * 24 * 3600
+
+
+@dataclass
+class AnalyticsRequestDTO:
+    """
+    Data transfer object for ad-hoc analytics over a time window.
+
+    Attributes:
+        timestamp_start_utc (int): Inclusive start of the window.
+        timestamp_end_utc (int): Inclusive end of the window.
+        event_type (str | None): Optional event type filter.
+        customer_id (int | None): Optional customer id filter.
+        group_by (str | None): Optional column to group by, one of ANALYTICS_GROUP_BY_COLUMNS.
+        value_field (str | None): Dotted path of a numeric `event_data` field to aggregate.
+        quantiles (list[float]): Quantiles of value_field to compute, each within [0, 1].
+        histogram_bins (int | None): Number of equal width histogram bins over the value range.
+        histogram_edges (list[float]): Explicit histogram bucket edges, takes precedence over histogram_bins.
+    """
+
+    timestamp_start_utc: int
+    timestamp_end_utc: int
+    event_type: str | None = None
+    customer_id: int | None = None
+    group_by: str | None = None
+    value_field: str | None = None
+    quantiles: list[float] = field(default_factory=list)
+    histogram_bins: int | None = None
+    histogram_edges: list[float] = field(default_factory=list)
+
+    def __post_init__(self) -> None:
+        """
+        Validates the request, raising a 400 HTTPException for invalid combinations.
+        """
+        if self.timestamp_start_utc > self.timestamp_end_utc:
+            raise HTTPException(
+                status_code=400, detail="Start time must be before End time."
+            )
+
+        if (
+            self.timestamp_end_utc - self.timestamp_start_utc
+            > MAX_ANALYTICS_WINDOW_SECONDS
+        ):
+            raise HTTPException(
+                status_code=400,
+                detail=f"The window must not exceed {MAX_ANALYTICS_WINDOW_SECONDS} seconds.",
+            )
+
+        if (
+            self.group_by is not None
+            and self.group_by not in ANALYTICS_GROUP_BY_COLUMNS
+        ):
+            raise HTTPException(
+                status_code=400,
+                detail=f"group_by must be one of {', '.join(ANALYTICS_GROUP_BY_COLUMNS)}.",
+            )
+
+        if (
+            self.quantiles or self.histogram_bins or self.histogram_edges
+        ) and not self.value_field:
+            raise HTTPException(
+                status_code=400,
+                detail="value_field is required for quantiles and histograms.",
+            )
+
+        if any(q < 0 or q > 1 for q in self.quantiles):
+            raise HTTPException(
+                status_code=400, detail="quantiles must be between 0 and 1."
+            )
+
+        if self.histogram_bins is not None and not (
+            0 < self.histogram_bins <= MAX_HISTOGRAM_BINS
+        ):
+            raise HTTPException(
+                status_code=400,
+                detail=f"histogram_bins must be between 1 and {MAX_HISTOGRAM_BINS}.",
+            )
+
+        if self.histogram_edges and (
+            len(self.histogram_edges) < 2
+            or len(self.histogram_edges) > MAX_HISTOGRAM_BINS + 1
+            or sorted(self.histogram_edges) != self.histogram_edges
+        ):
+            raise HTTPException(
+                status_code=400,
+                detail="histogram_edges must be an increasing list of at least two edges.",
+            )
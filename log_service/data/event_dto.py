@@ -1,7 +1,19 @@
+from concurrent.futures import Future
 from dataclasses import dataclass
 from datetime import datetime
+
+import orjson
 from fastapi import HTTPException
 
+from log_service.config import LogServiceConfig
+
+# the fields of an event in responses, in response order, a query may project a subset of them
+EVENT_FIELDS = ("id", "event_type", "timestamp_utc", "customer_id", "event_data")
+# the filters that accept several values, matched with IN, and the most values one of them may hold; all three at
+# their maximum stay below SQLite's default limit of 999 bound parameters
+MULTI_VALUE_FILTERS = ("event_id", "event_type", "customer_id")
+MAX_FILTER_VALUES = 250
+
 
 class EventQueueDTO:
     """
@@ -13,13 +25,27 @@ class EventQueueDTO:
         timestamp_utc (int): The Unix timestamp (in UTC) when the event occurred.
         customer_id (int): The identifier for the customer associated with the event.
         event_data (dict): A dictionary containing additional data about the event.
+        serialized_event_data (bytes): event_data encoded once at enqueue time, it is stored as is and its size
+            is accounted in the queue bytes metric.
+        save_attempts (int): How often saving the event failed so far.
+        event_uuid (str | None): The client supplied id of the event, a retried event with the same id is stored
+            only once.
+        enqueued_at (float | None): Monotonic time the event was first queued, to report the lag of the queue.
+        commit_future (Future[int] | None): Set if the sender waits for the event to be committed, resolved by the
+            QueueConsumer with the id of the stored event, or failed if the event cannot be committed.
+        hot_tail_entry (HotTailEntry | None): The event's entry in the HotTailBuffer, to mark it committed.
 
     Methods:
-        __init__(event_type, timestamp_utc, customer_id, event_data): Initializes a new instance of EventQueueDTO.
+        __init__(event_type, timestamp_utc, customer_id, event_data, event_uuid): Initializes a new instance of
+            EventQueueDTO.
+        from_serialized(event_type, timestamp_utc, customer_id, serialized_event_data): Recreates a queued event
+            from its already encoded event_data, e.g. when re-ingesting spilled events.
+
+    Raises:
+        orjson.JSONEncodeError: If event_data cannot be encoded as JSON.
 
     TODO:
-        - Consider adding fields like event_source, event_version, and event_id(uuid4 generated).
-        - Generate event_id using uuid4 to provide a unique identifier for referencing the event.
+        - Consider adding fields like event_source and event_version.
     """
 
     def __init__(
@@ -28,41 +54,84 @@ class EventQueueDTO:
         timestamp_utc: int | None,
         customer_id: int,
         event_data: dict,
+        event_uuid: str | None = None,
     ):
         self.event_type = event_type
         self.customer_id = customer_id
         self.event_data = event_data
+        self.serialized_event_data = orjson.dumps(event_data)
+        self.save_attempts = 0
+        self.event_uuid = event_uuid
+        self.enqueued_at = None
+        self.commit_future: Future[int] | None = None
+        self.hot_tail_entry = None
         if timestamp_utc is None:
             self.timestamp_utc = int(datetime.utcnow().timestamp())
         else:
             self.timestamp_utc = int(timestamp_utc)
 
+    @classmethod
+    def from_serialized(
+        cls,
+        event_type: str,
+        timestamp_utc: int,
+        customer_id: int,
+        serialized_event_data: bytes,
+        save_attempts: int = 0,
+        event_uuid: str | None = None,
+    ) -> "EventQueueDTO":
+        event = cls.__new__(cls)
+        event.event_type = event_type
+        event.timestamp_utc = timestamp_utc
+        event.customer_id = customer_id
+        event.event_data = orjson.loads(serialized_event_data)
+        # stored as is, so a re-ingested event is byte for byte the event that was queued
+        event.serialized_event_data = serialized_event_data
+        event.save_attempts = save_attempts
+        event.event_uuid = event_uuid
+        event.enqueued_at = None
+        event.commit_future = None
+        event.hot_tail_entry = None
+        return event
+
 
 @dataclass
 class EventRequestDTO:
     """
     Data transfer object for requesting events, supporting filtering by various criteria.
 
+    `event_id`, `event_type` and `customer_id` take one value or a sequence of up to MAX_FILTER_VALUES values, of
+    which an event must match one. A sequence is kept as a tuple of its distinct values, a single value as is, so
+    use `filter_values` to read these filters.
+
+    `fields` projects the events to a subset of EVENT_FIELDS, None returns all of them. A projection without
+    `event_data` is answered from the covering indexes without reading the stored payloads.
+
     """
 
-    event_id: int | None = None
-    event_type: str | None = None
-    customer_id: int | None = None
+    event_id: int | tuple[int, ...] | None = None
+    event_type: str | tuple[str, ...] | None = None
+    customer_id: int | tuple[int, ...] | None = None
     timestamp_start_utc: int | None = None
     timestamp_end_utc: int | None = None
     offset: int = 0
-    limit: int = 100
+    limit: int | None = None
+    fields: tuple[str, ...] | None = None
 
     def __post_init__(self) -> None:
         """
-        Post-initialization to validate timestamps and set default values for offset and limit.
+        Post-initialization to validate timestamps and fields and set default values for offset and limit.
+        A missing or out of range limit becomes the `max_page_size` setting.
         Raises ValueError if the start timestamp is greater than the end timestamp.
         """
 
         self.validate_timestamps()
+        self.validate_filter_values()
+        self.validate_fields()
 
-        if self.limit > 100:
-            self.limit = 100
+        max_page_size = LogServiceConfig.get_settings().max_page_size
+        if not self.limit or not 0 < self.limit <= max_page_size:
+            self.limit = max_page_size
 
     def validate_timestamps(self) -> None:
         if self.timestamp_start_utc and self.timestamp_end_utc:
@@ -71,6 +140,47 @@ class EventRequestDTO:
                     status_code=401, detail="Start time must be before End time."
                 )
 
+    def validate_filter_values(self) -> None:
+        for name in MULTI_VALUE_FILTERS:
+            value = getattr(self, name)
+            if not isinstance(value, (list, tuple, set)):
+                continue
+            values = tuple(dict.fromkeys(value))
+            if not 0 < len(values) <= MAX_FILTER_VALUES:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"{name} takes between 1 and {MAX_FILTER_VALUES} values.",
+                )
+            setattr(self, name, values[0] if len(values) == 1 else values)
+
+    def filter_values(self, name: str) -> tuple | None:
+        """
+        Returns the values of a filter in MULTI_VALUE_FILTERS, or None if it is not set.
+
+        Parameters:
+            name (str): The filter, e.g. "customer_id".
+
+        Returns:
+            tuple | None: The values an event may match.
+        """
+        value = getattr(self, name)
+        if isinstance(value, tuple):
+            return value
+        return (value,) if value else None
+
+    def validate_fields(self) -> None:
+        if self.fields is None:
+            return
+        unknown = set(self.fields) - set(EVENT_FIELDS)
+        if unknown or not self.fields:
+            raise HTTPException(
+                status_code=400,
+                detail=f"fields must be a comma separated list of {', '.join(EVENT_FIELDS)}.",
+            )
+        # in response order, and None when every field is asked for so the full row path is used
+        fields = tuple(field for field in EVENT_FIELDS if field in self.fields)
+        self.fields = None if fields == EVENT_FIELDS else fields
+
 
 class EventResponseDTO:
     """
@@ -0,0 +1,136 @@
+import orjson
+
+from log_service.data.event_dto import EVENT_FIELDS
+
+EMPTY_EVENT_DATA = b"{}"
+
+
+def encode_event_row(row: tuple) -> bytes:
+    """
+    Encodes an (id, event_type, timestamp_utc, customer_id, event_data) row as a JSON object.
+
+    The stored `event_data` is already JSON encoded, so it is spliced into the object verbatim instead of
+    being decoded and encoded again. Missing event data is encoded as an empty object, as in get_events. An event
+    without an id is still queued (see HotTailBuffer), it is marked `"pending": true`.
+
+    Parameters:
+        row (tuple): The event row, with event_data as stored (bytes, str or None).
+
+    Returns:
+        bytes: The JSON encoded event.
+    """
+    event_id, event_type, timestamp_utc, customer_id, event_data = row
+    envelope = orjson.dumps(
+        {
+            "id": event_id,
+            "event_type": event_type,
+            "timestamp_utc": timestamp_utc,
+            "customer_id": customer_id,
+        }
+        if event_id is not None
+        else {
+            "id": None,
+            "event_type": event_type,
+            "timestamp_utc": timestamp_utc,
+            "customer_id": customer_id,
+            "pending": True,
+        }
+    )
+    if not event_data:
+        event_data = EMPTY_EVENT_DATA
+    elif isinstance(event_data, str):
+        event_data = event_data.encode()
+    return envelope[:-1] + b',"event_data":' + event_data + b"}"
+
+
+def decode_event_row(row: tuple) -> dict:
+    """Decodes an event row like `encode_event_row`, into a dict with event_data parsed."""
+    event_id, event_type, timestamp_utc, customer_id, event_data = row
+    event = {
+        "id": event_id,
+        "event_type": event_type,
+        "timestamp_utc": timestamp_utc,
+        "customer_id": customer_id,
+        "event_data": orjson.loads(event_data) if event_data else {},
+    }
+    if event_id is None:
+        event["pending"] = True
+    return event
+
+
+def encode_projected_event_row(row: tuple, fields: tuple[str, ...]) -> bytes:
+    """
+    Encodes an event row like `encode_event_row`, with only the given fields (see `EventRequestDTO.fields`).
+    An event without an id is marked pending if its id is one of the fields.
+    """
+    event = {
+        field: value
+        for field, value in zip(EVENT_FIELDS, row)
+        if field in fields and field != "event_data"
+    }
+    if "id" in fields and row[0] is None:
+        event["pending"] = True
+    envelope = orjson.dumps(event)
+    if "event_data" not in fields:
+        return envelope
+    event_data = row[4]
+    if not event_data:
+        event_data = EMPTY_EVENT_DATA
+    elif isinstance(event_data, str):
+        event_data = event_data.encode()
+    separator = b"," if event else b""
+    return envelope[:-1] + separator + b'"event_data":' + event_data + b"}"
+
+
+def encode_events_page(
+    rows: list[tuple],
+    total_count: int,
+    offset: int,
+    fields: tuple[str, ...] | None = None,
+) -> bytes:
+    """
+    Encodes a page of event rows as the JSON body of an event query, the same document as
+    `EventResponseDTO.to_dict` but without decoding and re-encoding any `event_data`.
+
+    Parameters:
+        rows (list[tuple]): The event rows, see `encode_event_row`.
+        total_count (int): The total number of events matching the query.
+        offset (int): The offset of the page.
+        fields (tuple[str, ...] | None): The fields of every event, None for all of them.
+
+    Returns:
+        bytes: The JSON encoded response body.
+    """
+    envelope = orjson.dumps(
+        {"total_count": total_count, "returned_item_count": len(rows), "offset": offset}
+    )
+    if fields is None:
+        events = map(encode_event_row, rows)
+    else:
+        events = (encode_projected_event_row(row, fields) for row in rows)
+    return envelope[:-1] + b',"events":[' + b",".join(events) + b"]}"
+
+
+def encode_query_results(pages: list[bytes]) -> bytes:
+    """
+    Encodes the pages of a batch of event queries, each encoded by `encode_events_page`, as one JSON body
+    `{"results": [page, ...]}` in query order.
+    """
+    return b'{"results":[' + b",".join(pages) + b"]}"
+
+
+def encode_sse_events(rows: list[tuple]) -> bytes:
+    """
+    Encodes event rows as server-sent events, one `event` message per row with the event id as its SSE id, so a
+    reconnecting client resumes after the last event it received (`Last-Event-ID`).
+
+    Parameters:
+        rows (list[tuple]): The event rows, see `encode_event_row`.
+
+    Returns:
+        bytes: The messages.
+    """
+    return b"".join(
+        b"id: %d\nevent: event\ndata: %s\n\n" % (row[0], encode_event_row(row))
+        for row in rows
+    )
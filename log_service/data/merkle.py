@@ -0,0 +1,176 @@
+import hashlib
+import struct
+
+import orjson
+
+# domain separation of leaves, inner nodes and chain links (RFC 6962), so no hash can be passed off as another kind
+LEAF_PREFIX = b"\x00"
+NODE_PREFIX = b"\x01"
+CHAIN_PREFIX = b"\x02"
+# the previous chain hash of the first batch
+GENESIS_CHAIN_HASH = bytes(32)
+BATCH_HEADER = struct.Struct(">qqqq")
+
+
+def canonical_event_bytes(row: tuple) -> bytes:
+    """
+    Encodes a stored (id, event_type, timestamp_utc, customer_id, event_data, event_uuid) row as the bytes its leaf
+    hash is computed over: a JSON header of the columns, a newline, then `event_data` byte for byte as stored. The
+    header never holds a raw newline, so the encoding is unambiguous.
+    """
+    event_id, event_type, timestamp_utc, customer_id, event_data, event_uuid = row
+    header = orjson.dumps(
+        [
+            event_id,
+            event_type,
+            timestamp_utc,
+            customer_id,
+            event_uuid,
+            event_data is None,
+        ]
+    )
+    if event_data is None:
+        event_data = b""
+    elif isinstance(event_data, str):
+        event_data = event_data.encode()
+    return header + b"\n" + event_data
+
+
+def leaf_hash(row: tuple) -> bytes:
+    """Returns the Merkle leaf hash of a stored event row, see `canonical_event_bytes`."""
+    return hashlib.sha256(LEAF_PREFIX + canonical_event_bytes(row)).digest()
+
+
+def _node_hash(left: bytes, right: bytes) -> bytes:
+    return hashlib.sha256(NODE_PREFIX + left + right).digest()
+
+
+def _split(size: int) -> int:
+    # the largest power of two smaller than size, RFC 6962 splits every tree there
+    return 1 << (size - 1).bit_length() - 1
+
+
+def merkle_root(leaf_hashes: list[bytes]) -> bytes:
+    """
+    Returns the Merkle tree hash of leaf hashes, as defined by RFC 6962.
+
+    Parameters:
+        leaf_hashes (list[bytes]): The leaf hashes, in event id order.
+
+    Returns:
+        bytes: The root hash.
+    """
+    if not leaf_hashes:
+        return hashlib.sha256(b"").digest()
+    if len(leaf_hashes) == 1:
+        return leaf_hashes[0]
+    k = _split(len(leaf_hashes))
+    return _node_hash(merkle_root(leaf_hashes[:k]), merkle_root(leaf_hashes[k:]))
+
+
+def inclusion_path(leaf_hashes: list[bytes], index: int) -> list[bytes]:
+    """
+    Returns the audit path of a leaf, the log2(n) sibling hashes from the leaf up to the root (RFC 6962).
+
+    Parameters:
+        leaf_hashes (list[bytes]): The leaf hashes of the tree.
+        index (int): The position of the leaf.
+
+    Returns:
+        list[bytes]: The sibling hashes, the leaf's first.
+    """
+    if len(leaf_hashes) <= 1:
+        return []
+    k = _split(len(leaf_hashes))
+    if index < k:
+        return inclusion_path(leaf_hashes[:k], index) + [merkle_root(leaf_hashes[k:])]
+    return inclusion_path(leaf_hashes[k:], index - k) + [merkle_root(leaf_hashes[:k])]
+
+
+def root_from_inclusion_path(
+    leaf: bytes, index: int, size: int, path: list[bytes]
+) -> bytes | None:
+    """
+    Recomputes the root of a tree of `size` leaves from one leaf hash and its audit path (RFC 9162, 2.1.3.2).
+
+    Returns:
+        bytes | None: The root hash, or None if the path does not fit the index and size.
+    """
+    if not 0 <= index < size:
+        return None
+    fn, sn = index, size - 1
+    root = leaf
+    for sibling in path:
+        if sn == 0:
+            return None
+        if fn & 1 or fn == sn:
+            root = _node_hash(sibling, root)
+            while not fn & 1 and fn:
+                fn >>= 1
+                sn >>= 1
+        else:
+            root = _node_hash(root, sibling)
+        fn >>= 1
+        sn >>= 1
+    return root if sn == 0 else None
+
+
+def chain_hash(
+    previous_chain_hash: bytes,
+    batch_id: int,
+    first_event_id: int,
+    last_event_id: int,
+    event_count: int,
+    root: bytes,
+) -> bytes:
+    """
+    Returns the chain hash of a batch, committing to the chain before it, its position and extent, and its Merkle
+    root. Changing, adding or removing any sealed event or batch changes every chain hash from that batch on.
+    """
+    header = BATCH_HEADER.pack(batch_id, first_event_id, last_event_id, event_count)
+    return hashlib.sha256(CHAIN_PREFIX + previous_chain_hash + header + root).digest()
+
+
+def verify_inclusion_proof(proof: dict) -> bool:
+    """
+    Verifies an inclusion proof as returned by `GET /event/{event_id}/proof`: the event hashes to the leaf, the leaf
+    and audit path lead to the batch's Merkle root, and the root and the previous chain hash lead to the batch's
+    chain hash. Compare the chain hash with one recorded independently (`GET /integrity/head` at some later time,
+    then verified forward) to trust it.
+
+    Parameters:
+        proof (dict): The proof, hashes hex encoded.
+
+    Returns:
+        bool: True if the proof is consistent.
+    """
+    event = proof["event"]
+    event_data = event["event_data"]
+    row = (
+        event["id"],
+        event["event_type"],
+        event["timestamp_utc"],
+        event["customer_id"],
+        None if event_data is None else event_data.encode(),
+        event["event_uuid"],
+    )
+    batch = proof["batch"]
+    root = root_from_inclusion_path(
+        leaf_hash(row),
+        proof["leaf_index"],
+        batch["event_count"],
+        [bytes.fromhex(sibling) for sibling in proof["audit_path"]],
+    )
+    return (
+        root is not None
+        and root.hex() == batch["merkle_root"]
+        and chain_hash(
+            bytes.fromhex(batch["previous_chain_hash"]),
+            batch["batch_id"],
+            batch["first_event_id"],
+            batch["last_event_id"],
+            batch["event_count"],
+            root,
+        ).hex()
+        == batch["chain_hash"]
+    )
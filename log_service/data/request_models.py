@@ -1,4 +1,12 @@
-from pydantic import BaseModel, field_validator
+from uuid import UUID
+
+from pydantic import BaseModel, Field, field_validator
+
+# event types are stored, indexed and spilled as is, so their length is bounded at ingest
+MAX_EVENT_TYPE_LENGTH = 255
+# ids and timestamps are stored as SQLite integers, signed 64-bit
+INT64_MIN = -(2**63)
+INT64_MAX = 2**63 - 1
 
 
 class CreateEventModel(BaseModel):
@@ -10,21 +18,25 @@ class CreateEventModel(BaseModel):
     that 'event_data' is not empty.
 
     Attributes:
-        event_type (str): Specifies the type of the event (e.g., 'login', 'purchase').
+        event_type (str): Specifies the type of the event (e.g., 'login', 'purchase'), at most
+            MAX_EVENT_TYPE_LENGTH characters.
         timestamp_utc (int | None, optional): Represents the Unix timestamp in UTC when the event occurred.
             Defaults to None, which signifies that the timestamp is to be determined at the time of processing.
-        customer_id (int): The identifier of the customer associated with the event.
+        customer_id (int): The identifier of the customer associated with the event, a signed 64-bit integer.
         event_data (dict): A dictionary containing additional details about the event. Must not be empty.
+        event_uuid (UUID | None, optional): A client generated id of the event. Sending an event again with the same
+            id, e.g. when retrying after a timeout, stores it only once.
 
     Methods:
         event_data_not_empty(cls, event_data): A class method used as a validator to ensure 'event_data' is not empty.
 
     """
 
-    event_type: str
-    timestamp_utc: int | None = None
-    customer_id: int
+    event_type: str = Field(max_length=MAX_EVENT_TYPE_LENGTH)
+    timestamp_utc: int | None = Field(default=None, ge=INT64_MIN, le=INT64_MAX)
+    customer_id: int = Field(ge=INT64_MIN, le=INT64_MAX)
     event_data: dict
+    event_uuid: UUID | None = None
 
     @field_validator("event_data")
     def event_data_not_empty(cls, event_data: dict) -> dict:
@@ -43,3 +55,30 @@ class CreateEventModel(BaseModel):
         if len(event_data) == 0:
             raise ValueError("event_data must contain at least one field")
         return event_data
+
+
+class EventQueryModel(BaseModel):
+    """
+    A Pydantic model of one query of a batch of event queries (`POST /event/query`), with the query parameters of
+    `GET /event`.
+
+    Attributes:
+        event_id (int | list[int] | None, optional): The id, or the ids, of the events.
+        event_type (str | list[str] | None, optional): The type, or the types, of the events.
+        customer_id (int | list[int] | None, optional): The customer, or the customers, of the events.
+        timestamp_start_utc (int | None, optional): The earliest timestamp of the events.
+        timestamp_end_utc (int | None, optional): The latest timestamp of the events.
+        offset (int): The offset of the page. Defaults to 0.
+        limit (int | None, optional): The size of the page, see `EventRequestDTO`.
+        fields (list[str] | None, optional): The fields returned per event, all if None.
+
+    """
+
+    event_id: int | list[int] | None = None
+    event_type: str | list[str] | None = None
+    customer_id: int | list[int] | None = None
+    timestamp_start_utc: int | None = None
+    timestamp_end_utc: int | None = None
+    offset: int = Field(default=0, ge=0)
+    limit: int | None = None
+    fields: list[str] | None = None
@@ -0,0 +1,387 @@
+import logging
+import re
+import sqlite3
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from threading import RLock
+from typing import Iterable
+
+import numpy as np
+
+from log_service.config import LogServiceConfig
+from log_service.db_accessors.read_executor import get_read_connection
+
+logger = logging.getLogger(__name__)
+
+ANALYTICS_FETCH_SIZE = 10_000
+# columns are loaded and cached in fixed time chunks, a window is assembled from the chunks it overlaps
+ANALYTICS_CHUNK_SECONDS = 3600
+ANALYTICS_CACHE_MAX_BYTES = 256 * 1024 * 1024
+# only chunks that ended at least this long ago are cached, recent chunks still receive most writes
+CHUNK_CACHE_GRACE_SECONDS = 300
+MAX_ANALYTICS_ROWS = 5_000_000
+
+VALUE_FIELD_PATTERN = re.compile(r"^[A-Za-z0-9_]+(\.[A-Za-z0-9_]+)*$")
+
+
+@dataclass
+class EventColumns:
+    """
+    Columnar view of the events of a time window, one NumPy array per column.
+
+    Attributes:
+        ids (np.ndarray): int64 event ids.
+        timestamps (np.ndarray): int64 Unix timestamps (UTC).
+        customer_ids (np.ndarray): int64 customer ids.
+        event_type_codes (np.ndarray): int64 codes indexing into `event_types`.
+        event_types (np.ndarray): The distinct event types, sorted; `event_types[code]` is the event type.
+        values (np.ndarray | None): float64 values of the requested numeric `event_data` field,
+            NaN where the field is missing or not numeric. None if no field was requested.
+    """
+
+    ids: np.ndarray
+    timestamps: np.ndarray
+    customer_ids: np.ndarray
+    event_type_codes: np.ndarray
+    event_types: np.ndarray
+    values: np.ndarray | None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def nbytes(self) -> int:
+        arrays = [
+            self.ids,
+            self.timestamps,
+            self.customer_ids,
+            self.event_type_codes,
+            self.event_types,
+        ]
+        if self.values is not None:
+            arrays.append(self.values)
+        return sum(array.nbytes for array in arrays)
+
+    def select(self, mask: np.ndarray) -> "EventColumns":
+        return EventColumns(
+            ids=self.ids[mask],
+            timestamps=self.timestamps[mask],
+            customer_ids=self.customer_ids[mask],
+            event_type_codes=self.event_type_codes[mask],
+            event_types=self.event_types,
+            values=self.values[mask] if self.values is not None else None,
+        )
+
+    @classmethod
+    def concatenate(
+        cls, chunks: list["EventColumns"], has_values: bool
+    ) -> "EventColumns":
+        """Concatenates chunks, remapping every chunk's event type codes onto the union of their event types."""
+        event_types = np.unique(
+            np.concatenate(
+                [chunk.event_types for chunk in chunks] + [np.array([], dtype=str)]
+            )
+        )
+        return cls(
+            ids=np.concatenate([chunk.ids for chunk in chunks] + [_EMPTY_INT]),
+            timestamps=np.concatenate(
+                [chunk.timestamps for chunk in chunks] + [_EMPTY_INT]
+            ),
+            customer_ids=np.concatenate(
+                [chunk.customer_ids for chunk in chunks] + [_EMPTY_INT]
+            ),
+            event_type_codes=np.concatenate(
+                [
+                    np.searchsorted(event_types, chunk.event_types)[
+                        chunk.event_type_codes
+                    ]
+                    for chunk in chunks
+                ]
+                + [_EMPTY_INT]
+            ),
+            event_types=event_types,
+            values=np.concatenate(
+                [chunk.values for chunk in chunks if chunk.values is not None]
+                + [np.array([], dtype=np.float64)]
+            )
+            if has_values
+            else None,
+        )
+
+
+_EMPTY_INT = np.array([], dtype=np.int64)
+
+
+class AnalyticsChunkCache:
+    """
+    Implements a thread-safe singleton LRU cache of loaded column chunks, bounded by ANALYTICS_CACHE_MAX_BYTES.
+
+    Chunks are not immutable: clients may send events with past timestamps (late events, backfills). The QueueConsumer
+    therefore calls `invalidate_timestamps` for every committed batch, which drops the cached chunks the batch lands in
+    and bumps the cache generation. A chunk whose load started before a generation bump is not cached, so a load that
+    raced with a commit cannot leave a stale chunk behind.
+
+    Attributes:
+        _instance (AnalyticsChunkCache, optional): Class variable to hold the singleton instance.
+        _lock (RLock): A reentrant lock guarding the singleton instance and the cache.
+        generation (int): Bumped whenever a commit lands in a cacheable chunk.
+        size_bytes (int): The total size of the cached chunks.
+
+    Raises:
+        Exception: If an attempt is made to directly instantiate the class instead of using the `get_instance` method.
+    """
+
+    _instance = None
+    _lock: RLock = RLock()
+
+    def __init__(self) -> None:
+        if AnalyticsChunkCache._instance:
+            raise Exception("This class is a singleton!")
+        self._chunks: OrderedDict[tuple[int, str | None], EventColumns] = OrderedDict()
+        self.generation = 0
+        self.size_bytes = 0
+        AnalyticsChunkCache._instance = self
+
+    @classmethod
+    def get_instance(cls) -> "AnalyticsChunkCache":
+        """
+        Retrieves the singleton instance of the AnalyticsChunkCache class, creating it if it does not already exist.
+
+        Returns:
+            AnalyticsChunkCache: The singleton instance of the class.
+        """
+        if not cls._instance:
+            with cls._lock:
+                if not cls._instance:
+                    cls._instance = AnalyticsChunkCache()
+        return cls._instance
+
+    def get(self, chunk_start_utc: int, value_field: str | None) -> EventColumns | None:
+        with self._lock:
+            columns = self._chunks.get((chunk_start_utc, value_field))
+            if columns is not None:
+                self._chunks.move_to_end((chunk_start_utc, value_field))
+            return columns
+
+    def put(
+        self,
+        chunk_start_utc: int,
+        value_field: str | None,
+        columns: EventColumns,
+        generation: int,
+    ) -> None:
+        """Caches a chunk, unless the cache was invalidated after the load started at `generation`."""
+        with self._lock:
+            if (
+                self.generation != generation
+                or columns.nbytes > ANALYTICS_CACHE_MAX_BYTES
+            ):
+                return
+            key = (chunk_start_utc, value_field)
+            previous = self._chunks.pop(key, None)
+            if previous is not None:
+                self.size_bytes -= previous.nbytes
+            self._chunks[key] = columns
+            self.size_bytes += columns.nbytes
+            while self.size_bytes > ANALYTICS_CACHE_MAX_BYTES:
+                _, evicted = self._chunks.popitem(last=False)
+                self.size_bytes -= evicted.nbytes
+
+    def invalidate_timestamps(self, timestamps_utc: Iterable[int]) -> None:
+        """
+        Drops the cached chunks containing any of the timestamps, e.g. of a newly committed batch.
+        Timestamps of chunks too recent to be cached are ignored, which is the common case.
+
+        Parameters:
+            timestamps_utc (Iterable[int]): Event timestamps.
+        """
+        cacheable_before = int(time.time()) - CHUNK_CACHE_GRACE_SECONDS
+        chunk_starts = {
+            timestamp - timestamp % ANALYTICS_CHUNK_SECONDS
+            for timestamp in timestamps_utc
+        }
+        chunk_starts = {
+            start
+            for start in chunk_starts
+            if start + ANALYTICS_CHUNK_SECONDS <= cacheable_before
+        }
+        if not chunk_starts:
+            return
+        with self._lock:
+            self.generation += 1
+            for key in [key for key in self._chunks if key[0] in chunk_starts]:
+                self.size_bytes -= self._chunks.pop(key).nbytes
+
+
+class EventAnalyticsAccessor:
+    """
+    Loads the columns of the events table for a time window into NumPy arrays for vectorized analytics.
+
+    The window is split into ANALYTICS_CHUNK_SECONDS chunks. Each chunk is read in bulk with `fetchmany` into arrays
+    preallocated from a COUNT, using short statements only, so no read transaction blocks the consumer's commits.
+    Chunks that ended more than CHUNK_CACHE_GRACE_SECONDS ago are kept in the AnalyticsChunkCache, so shifted or
+    overlapping windows reuse them; the consumer invalidates the chunks its commits land in.
+
+    Attributes:
+        config (LogServiceConfig): A configuration instance for accessing database settings.
+        chunk_cache (AnalyticsChunkCache): The shared cache of loaded chunks.
+    """
+
+    def __init__(self) -> None:
+        self.config = LogServiceConfig.get_instance()
+        self.chunk_cache = AnalyticsChunkCache.get_instance()
+
+    def load_columns(
+        self,
+        timestamp_start_utc: int,
+        timestamp_end_utc: int,
+        value_field: str | None = None,
+    ) -> EventColumns:
+        """
+        Returns the columns of all events with timestamp_utc within [timestamp_start_utc, timestamp_end_utc].
+
+        Parameters:
+            timestamp_start_utc (int): Inclusive start of the window.
+            timestamp_end_utc (int): Inclusive end of the window.
+            value_field (str | None): Dotted path of a numeric `event_data` field to load, e.g. "amount"
+                or "admin_data.permission_level".
+
+        Returns:
+            EventColumns: The loaded columns.
+
+        Raises:
+            ValueError: If value_field is not a valid dotted field path, or the window holds more than
+                MAX_ANALYTICS_ROWS events.
+            sqlite3.Error: If an error occurs during the database query execution.
+        """
+        if value_field is not None and not VALUE_FIELD_PATTERN.match(value_field):
+            raise ValueError(f"Invalid event_data field: {value_field}")
+
+        first_chunk = (
+            timestamp_start_utc - timestamp_start_utc % ANALYTICS_CHUNK_SECONDS
+        )
+        chunk_starts = range(
+            first_chunk, timestamp_end_utc + 1, ANALYTICS_CHUNK_SECONDS
+        )
+        cacheable_before = int(time.time()) - CHUNK_CACHE_GRACE_SECONDS
+
+        # reads on the read executor use its pooled connection, reads from anywhere else get a fresh one
+        conn = get_read_connection()
+        close_connection = conn is None
+        if conn is None:
+            conn = sqlite3.connect(self.config.get_db_url())
+        try:
+            generation = self.chunk_cache.generation
+            chunks: dict[int, EventColumns] = {}
+            missing: list[int] = []
+            row_count = 0
+            for chunk_start_utc in chunk_starts:
+                cached = self.chunk_cache.get(chunk_start_utc, value_field)
+                if cached is not None:
+                    chunks[chunk_start_utc] = cached
+                    row_count += len(cached)
+                else:
+                    missing.append(chunk_start_utc)
+                    row_count += self._count_chunk(conn, chunk_start_utc)
+                if row_count > MAX_ANALYTICS_ROWS:
+                    raise ValueError(
+                        f"The window holds more than {MAX_ANALYTICS_ROWS} events, please narrow it."
+                    )
+
+            for chunk_start_utc in missing:
+                columns = self._load_chunk(conn, chunk_start_utc, value_field)
+                chunks[chunk_start_utc] = columns
+                if chunk_start_utc + ANALYTICS_CHUNK_SECONDS <= cacheable_before:
+                    self.chunk_cache.put(
+                        chunk_start_utc, value_field, columns, generation
+                    )
+
+        except sqlite3.Error as e:
+            logger.error(f"Error while loading analytics columns: {e}")
+            raise
+
+        finally:
+            if close_connection:
+                conn.close()
+
+        columns = EventColumns.concatenate(
+            [chunks[start] for start in chunk_starts],
+            has_values=value_field is not None,
+        )
+        # the first and last chunks may extend beyond the window
+        return columns.select(
+            (columns.timestamps >= timestamp_start_utc)
+            & (columns.timestamps <= timestamp_end_utc)
+        )
+
+    @staticmethod
+    def _count_chunk(conn: sqlite3.Connection, chunk_start_utc: int) -> int:
+        return conn.execute(
+            "SELECT COUNT(1) FROM Events WHERE timestamp_utc >= ? AND timestamp_utc < ?",
+            (chunk_start_utc, chunk_start_utc + ANALYTICS_CHUNK_SECONDS),
+        ).fetchone()[0]
+
+    def _load_chunk(
+        self,
+        conn: sqlite3.Connection,
+        chunk_start_utc: int,
+        value_field: str | None,
+    ) -> EventColumns:
+        value_sql = "NULL"
+        params: list = [chunk_start_utc, chunk_start_utc + ANALYTICS_CHUNK_SECONDS]
+        if value_field is not None:
+            # only numeric values are kept, anything else becomes NULL and ends up as NaN
+            value_sql = (
+                "CASE WHEN json_type(CAST(event_data AS TEXT), ?) IN ('integer', 'real') "
+                "THEN json_extract(CAST(event_data AS TEXT), ?) END"
+            )
+            path = f"$.{value_field}"
+            params = [path, path] + params
+
+        sql = (
+            f"SELECT id, timestamp_utc, customer_id, event_type, {value_sql} "
+            "FROM Events WHERE timestamp_utc >= ? AND timestamp_utc < ?"
+        )
+
+        capacity = self._count_chunk(conn, chunk_start_utc)
+        ids = np.empty(capacity, dtype=np.int64)
+        timestamps = np.empty(capacity, dtype=np.int64)
+        customer_ids = np.empty(capacity, dtype=np.int64)
+        event_types = np.empty(capacity, dtype=object)
+        values = np.empty(capacity, dtype=np.float64)
+
+        cursor = conn.execute(sql, params)
+        position = 0
+        while True:
+            rows = cursor.fetchmany(ANALYTICS_FETCH_SIZE)
+            if not rows:
+                break
+            end = position + len(rows)
+            if end > capacity:
+                # rows committed between the COUNT and the SELECT
+                capacity = max(end, capacity * 2)
+                ids, timestamps, customer_ids, event_types, values = (
+                    np.resize(array, capacity)
+                    for array in (ids, timestamps, customer_ids, event_types, values)
+                )
+            id_col, ts_col, customer_col, type_col, value_col = zip(*rows)
+            ids[position:end] = id_col
+            timestamps[position:end] = ts_col
+            customer_ids[position:end] = customer_col
+            event_types[position:end] = type_col
+            # None becomes NaN when converted to float64
+            values[position:end] = np.array(value_col, dtype=np.float64)
+            position = end
+
+        distinct_types, type_codes = np.unique(
+            event_types[:position].astype(str), return_inverse=True
+        )
+        return EventColumns(
+            ids=ids[:position],
+            timestamps=timestamps[:position],
+            customer_ids=customer_ids[:position],
+            event_type_codes=type_codes.astype(np.int64),
+            event_types=distinct_types,
+            values=values[:position] if value_field is not None else None,
+        )
@@ -0,0 +1,475 @@
+import gzip
+import heapq
+import logging
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from operator import itemgetter
+from typing import IO, Callable, Iterable, Iterator
+from uuid import UUID
+
+import orjson
+
+from log_service.data.request_models import INT64_MAX, INT64_MIN, MAX_EVENT_TYPE_LENGTH
+from log_service.db_accessors.db_schema import create_schema
+from log_service.db_accessors.integrity_db_accessor import IntegrityDatabaseAccessor
+from log_service.db_accessors.sketch_db_accessor import SketchDatabaseAccessor
+from log_service.processors.event_sketches import (
+    DISTINCT_CUSTOMERS_SKETCH,
+    SKETCH_BUCKET_SECONDS,
+    EventSketchStore,
+    SketchBucket,
+)
+
+logger = logging.getLogger(__name__)
+
+# rows inserted per transaction
+BULK_LOAD_BATCH_ROWS = 100_000
+# rows sorted in memory at a time, larger inputs are sorted in runs on disk and merged
+SORT_BUFFER_ROWS = 1_000_000
+# secondary indexes are dropped and rebuilt when a load adds at least this fraction of the rows already stored
+INDEX_REBUILD_RATIO = 0.2
+BULK_LOAD_CACHE_KIB = 1024 * 1024
+PROGRESS_INTERVAL_SECONDS = 5
+MAX_LOGGED_INVALID_LINES = 10
+
+# events whose event_uuid is stored already are skipped, like the consumer skips them, so a load can be re-run
+INSERT_EVENTS_SQL = """INSERT INTO Events (customer_id, event_type, timestamp_utc, event_data, event_uuid)
+                       VALUES (?, ?, ?, ?, ?)
+                       ON CONFLICT (event_uuid) WHERE event_uuid IS NOT NULL DO NOTHING"""
+
+# (timestamp_utc, customer_id, event_type, event_data, event_uuid)
+LoadRow = tuple[int, int, str, str, str | None]
+# rows are sorted by timestamp only, stable sorts and merges keep the input order of equal timestamps
+SORT_KEY = itemgetter(0)
+
+
+def _is_int64(value: object) -> bool:
+    return (
+        isinstance(value, int)
+        and not isinstance(value, bool)
+        and INT64_MIN <= value <= INT64_MAX
+    )
+
+
+@dataclass
+class BulkLoadReport:
+    """
+    The outcome of a bulk load.
+
+    Attributes:
+        rows_loaded (int): Events inserted.
+        rows_skipped (int): Input lines skipped as invalid.
+        rows_duplicate (int): Events skipped because their event_uuid is stored already.
+        seconds (float): Total duration, sorting and index rebuild included.
+        rows_per_second (float): rows_loaded / seconds.
+        indexes_rebuilt (list[str]): The secondary indexes dropped for the load and rebuilt after it.
+    """
+
+    rows_loaded: int
+    rows_skipped: int
+    rows_duplicate: int
+    seconds: float
+    rows_per_second: float
+    indexes_rebuilt: list[str]
+
+
+class InvalidEventLine(ValueError):
+    """Raised for an input line that is not a valid event, see `EventBulkLoader.parse_line`."""
+
+
+class EventBulkLoader:
+    """
+    Streams events from NDJSON files straight into the Events table, for backfills and migrations that would
+    flood the ingest queue through POST /event.
+
+    Every line is an event object like the body of POST /event. Lines are validated like the API does, pre-sorted by
+    timestamp (an external merge sort, so inputs larger than memory sort in bounded memory) so inserts append to the
+    timestamp index instead of touching random pages of it, and inserted with large executemany transactions.
+    Events with an event_uuid that is stored already are skipped, so re-running a load or loading overlapping
+    backfills stores every event once. The inserted events are added to the approximate sketches
+    (see `EventSketchStore`), bucket by bucket as the sorted input moves past them.
+
+    The load connection trades durability for speed: `synchronous=OFF`, a large page cache and in-memory temp
+    storage, and optionally no rollback journal at all. A crash mid load can then corrupt the database, so loads
+    are meant to run offline, on a copy or before the service starts. For loads that add a large part of the table,
+    the non-unique secondary indexes are dropped and rebuilt once at the end, which is much faster than maintaining
+    them row by row; should the load die before the rebuild, the service's startup schema creation recreates them.
+
+    Attributes:
+        db_path (str): The database to load into, created with the service schema if needed.
+        batch_rows (int): Rows inserted per transaction.
+        sort_buffer_rows (int): Rows sorted in memory at a time.
+        journal_off (bool): Load without a rollback journal, the fastest and least safe mode.
+        rebuild_indexes (bool | None): Drop and rebuild secondary indexes, None to decide by INDEX_REBUILD_RATIO.
+        strict (bool): Abort on the first invalid line instead of skipping it.
+        progress (Callable | None): Called with (rows_loaded, rows_per_second) every PROGRESS_INTERVAL_SECONDS.
+        sketch_buckets (dict[int, SketchBucket]): The sketch buckets of the loaded events not saved yet.
+
+    Usage:
+        loader = EventBulkLoader(db_path)
+        report = loader.load(["events-2023.ndjson.gz"])
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        batch_rows: int = BULK_LOAD_BATCH_ROWS,
+        sort_buffer_rows: int = SORT_BUFFER_ROWS,
+        journal_off: bool = False,
+        rebuild_indexes: bool | None = None,
+        strict: bool = False,
+        progress: Callable[[int, float], None] | None = None,
+    ) -> None:
+        self.db_path = db_path
+        self.batch_rows = batch_rows
+        self.sort_buffer_rows = sort_buffer_rows
+        self.journal_off = journal_off
+        self.rebuild_indexes = rebuild_indexes
+        self.strict = strict
+        self.progress = progress
+        self.rows_skipped = 0
+        self.rows_duplicate = 0
+        self.sketch_buckets: dict[int, SketchBucket] = {}
+        self.sketch_accessor = SketchDatabaseAccessor()
+
+    def load(
+        self,
+        paths: list[str],
+        presorted: bool = False,
+        expected_rows: int | None = None,
+    ) -> BulkLoadReport:
+        """
+        Loads the events of the NDJSON files, "-" reading stdin. Files ending in .gz are decompressed.
+
+        Parameters:
+            paths (list[str]): The input files.
+            presorted (bool): The input is already ordered by timestamp, skip sorting.
+            expected_rows (int | None): The approximate number of rows to load, to decide on an index rebuild
+                before the input is read. Sorted inputs are counted while sorting.
+
+        Returns:
+            BulkLoadReport: The number of rows loaded and skipped, and the throughput.
+
+        Raises:
+            InvalidEventLine: If `strict` and a line is not a valid event.
+            sqlite3.Error: If the load fails. Rows of committed batches stay loaded.
+        """
+        started_at = time.perf_counter()
+        self.rows_skipped = 0
+        self.rows_duplicate = 0
+        self.sketch_buckets = {}
+        with tempfile.TemporaryDirectory(prefix="bulk-load-") as sort_dir:
+            rows = self._parse(paths)
+            if not presorted:
+                rows, sorted_rows = self._sort(rows, sort_dir)
+                expected_rows = expected_rows or sorted_rows
+
+            conn = sqlite3.connect(self.db_path, isolation_level=None)
+            try:
+                create_schema(conn)
+                rows_loaded, indexes_rebuilt = self._load_rows(
+                    conn, rows, expected_rows
+                )
+            finally:
+                conn.close()
+
+        seconds = time.perf_counter() - started_at
+        return BulkLoadReport(
+            rows_loaded=rows_loaded,
+            rows_skipped=self.rows_skipped,
+            rows_duplicate=self.rows_duplicate,
+            seconds=round(seconds, 3),
+            rows_per_second=round(rows_loaded / seconds, 1) if seconds else 0.0,
+            indexes_rebuilt=indexes_rebuilt,
+        )
+
+    @staticmethod
+    def parse_line(line: bytes, default_timestamp_utc: int) -> LoadRow:
+        """
+        Parses an NDJSON line into a row, validating it like POST /event does.
+
+        Parameters:
+            line (bytes): The JSON object of the event.
+            default_timestamp_utc (int): The timestamp of events without one.
+
+        Returns:
+            LoadRow: The (timestamp_utc, customer_id, event_type, event_data, event_uuid) row, event_data JSON
+            encoded.
+
+        Raises:
+            InvalidEventLine: If the line is not a valid event.
+        """
+        try:
+            event = orjson.loads(line)
+        except orjson.JSONDecodeError as e:
+            raise InvalidEventLine(f"not valid JSON: {e}")
+        if not isinstance(event, dict):
+            raise InvalidEventLine("not a JSON object")
+
+        event_type = event.get("event_type")
+        customer_id = event.get("customer_id")
+        event_data = event.get("event_data")
+        timestamp_utc = event.get("timestamp_utc")
+        event_uuid = event.get("event_uuid")
+        if not isinstance(event_type, str) or len(event_type) > MAX_EVENT_TYPE_LENGTH:
+            raise InvalidEventLine(
+                f"event_type must be a string of at most {MAX_EVENT_TYPE_LENGTH} characters"
+            )
+        if not _is_int64(customer_id):
+            raise InvalidEventLine("customer_id must be a 64-bit integer")
+        if not isinstance(event_data, dict) or not event_data:
+            raise InvalidEventLine("event_data must be a non empty object")
+        if timestamp_utc is None:
+            timestamp_utc = default_timestamp_utc
+        elif not _is_int64(timestamp_utc):
+            raise InvalidEventLine("timestamp_utc must be a 64-bit integer")
+        if event_uuid is not None:
+            try:
+                # stored in the canonical form, like the API stores it
+                event_uuid = str(UUID(event_uuid))
+            except (TypeError, ValueError, AttributeError):
+                raise InvalidEventLine("event_uuid must be a UUID")
+        try:
+            encoded_event_data = orjson.dumps(event_data).decode()
+        except orjson.JSONEncodeError as e:
+            raise InvalidEventLine(f"event_data cannot be stored: {e}")
+        return timestamp_utc, customer_id, event_type, encoded_event_data, event_uuid
+
+    def _parse(self, paths: list[str]) -> Iterator[LoadRow]:
+        default_timestamp_utc = int(datetime.utcnow().timestamp())
+        for path in paths:
+            with self._open(path) as f:
+                for line_number, line in enumerate(f, start=1):
+                    if not line.strip():
+                        continue
+                    try:
+                        yield self.parse_line(line, default_timestamp_utc)
+                    except InvalidEventLine as e:
+                        if self.strict:
+                            raise InvalidEventLine(f"{path}:{line_number}: {e}")
+                        self.rows_skipped += 1
+                        if self.rows_skipped <= MAX_LOGGED_INVALID_LINES:
+                            logger.warning(f"Skipping {path}:{line_number}: {e}")
+
+    @staticmethod
+    def _open(path: str) -> IO[bytes]:
+        if path == "-":
+            return os.fdopen(os.dup(sys.stdin.fileno()), "rb")
+        if path.endswith(".gz"):
+            return gzip.open(path, "rb")
+        return open(path, "rb")
+
+    def _sort(
+        self, rows: Iterator[LoadRow], sort_dir: str
+    ) -> tuple[Iterator[LoadRow], int]:
+        """
+        Sorts rows by timestamp in bounded memory: runs of sort_buffer_rows rows are sorted in memory and spilled
+        to files, then merged. An input that fits in one run never touches the disk.
+
+        Returns:
+            tuple[Iterator[LoadRow], int]: The sorted rows and their number.
+        """
+        run_paths = []
+        total_rows = 0
+        while True:
+            run = []
+            for row in rows:
+                run.append(row)
+                if len(run) == self.sort_buffer_rows:
+                    break
+            total_rows += len(run)
+            run.sort(key=SORT_KEY)
+            if len(run) < self.sort_buffer_rows and not run_paths:
+                return iter(run), total_rows
+            if run:
+                run_paths.append(self._write_run(run, sort_dir, len(run_paths)))
+            if len(run) < self.sort_buffer_rows:
+                break
+        logger.info(f"Merging {len(run_paths)} sorted runs of {total_rows} rows")
+        runs = [self._read_run(path) for path in run_paths]
+        return heapq.merge(*runs, key=SORT_KEY), total_rows
+
+    @staticmethod
+    def _write_run(run: list[LoadRow], sort_dir: str, index: int) -> str:
+        path = os.path.join(sort_dir, f"run-{index}.ndjson")
+        with open(path, "wb") as f:
+            f.writelines(orjson.dumps(row) + b"\n" for row in run)
+        return path
+
+    @staticmethod
+    def _read_run(path: str) -> Iterator[LoadRow]:
+        with open(path, "rb") as f:
+            for line in f:
+                yield tuple(orjson.loads(line))  # type: ignore[misc]
+
+    def _load_rows(
+        self,
+        conn: sqlite3.Connection,
+        rows: Iterable[LoadRow],
+        expected_rows: int | None,
+    ) -> tuple[int, list[str]]:
+        indexes = self._droppable_indexes(conn)
+        if self.rebuild_indexes is None:
+            stored_rows = conn.execute("SELECT MAX(id) FROM Events").fetchone()[0] or 0
+            rebuild = (
+                bool(expected_rows)
+                and expected_rows >= INDEX_REBUILD_RATIO * stored_rows
+            )
+        else:
+            rebuild = self.rebuild_indexes
+        if not rebuild:
+            indexes = []
+
+        conn.execute("PRAGMA synchronous=OFF")
+        conn.execute(f"PRAGMA cache_size=-{BULK_LOAD_CACHE_KIB}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        if self.journal_off:
+            conn.execute("PRAGMA journal_mode=OFF")
+
+        try:
+            for name, _ in indexes:
+                conn.execute(f'DROP INDEX IF EXISTS "{name}"')
+            rows_loaded = self._insert(conn, rows)
+        finally:
+            if indexes:
+                logger.info(
+                    f"Rebuilding indexes {', '.join(name for name, _ in indexes)}"
+                )
+            for _, sql in indexes:
+                conn.execute(sql)
+            if self.journal_off:
+                conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA optimize")
+        return rows_loaded, [name for name, _ in indexes]
+
+    @staticmethod
+    def _droppable_indexes(conn: sqlite3.Connection) -> list[tuple[str, str]]:
+        # unique indexes enforce constraints, dropping them could let duplicates in
+        return [
+            (name, sql)
+            for name, sql in conn.execute(
+                "SELECT name, sql FROM sqlite_master "
+                "WHERE type = 'index' AND tbl_name = 'Events' AND sql IS NOT NULL"
+            )
+            if not sql.upper().startswith("CREATE UNIQUE")
+        ]
+
+    def _insert(self, conn: sqlite3.Connection, rows: Iterable[LoadRow]) -> int:
+        rows_loaded = 0
+        started_at = last_progress_at = time.perf_counter()
+        batch: list[tuple[int, str, int, bytes, str | None]] = []
+        for timestamp_utc, customer_id, event_type, event_data, event_uuid in rows:
+            # stored as bytes, like the consumer stores it
+            batch.append(
+                (
+                    customer_id,
+                    event_type,
+                    timestamp_utc,
+                    event_data.encode(),
+                    event_uuid,
+                )
+            )
+            if len(batch) < self.batch_rows:
+                continue
+            rows_loaded += self._insert_batch(conn, batch)
+            batch = []
+            now = time.perf_counter()
+            if now - last_progress_at >= PROGRESS_INTERVAL_SECONDS:
+                last_progress_at = now
+                self._report_progress(rows_loaded, rows_loaded / (now - started_at))
+        if batch:
+            rows_loaded += self._insert_batch(conn, batch)
+        self._save_sketches(conn, list(self.sketch_buckets))
+        return rows_loaded
+
+    def _insert_batch(
+        self,
+        conn: sqlite3.Connection,
+        batch: list[tuple[int, str, int, bytes, str | None]],
+    ) -> int:
+        conn.execute("BEGIN")
+        try:
+            # new ids are above every stored id, so the rows above it are the ones inserted, duplicates not
+            max_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM Events").fetchone()[
+                0
+            ]
+            cursor = conn.executemany(INSERT_EVENTS_SQL, batch)
+            inserted = cursor.execute(
+                "SELECT id, event_type, timestamp_utc, customer_id FROM Events WHERE id > ? ORDER BY id",
+                (max_id,),
+            ).fetchall()
+            if inserted:
+                # sealed in batches no larger than the consumer's, so proofs stay cheap
+                IntegrityDatabaseAccessor.seal_batch(
+                    cursor, len(inserted), inserted[-1][0]
+                )
+            conn.execute("COMMIT")
+        except sqlite3.Error:
+            conn.execute("ROLLBACK")
+            raise
+        self.rows_duplicate += len(batch) - len(inserted)
+        self._add_to_sketches(conn, inserted)
+        return len(inserted)
+
+    def _add_to_sketches(
+        self, conn: sqlite3.Connection, inserted: list[tuple[int, str, int, int]]
+    ) -> None:
+        """
+        Adds inserted rows to the sketch buckets of their timestamps, continuing from the persisted state of each
+        bucket. The input is sorted by timestamp, so the buckets before the newest one are complete and saved.
+        """
+        events_by_bucket: dict[int, list[tuple[str, int]]] = {}
+        for _, event_type, timestamp_utc, customer_id in inserted:
+            events_by_bucket.setdefault(
+                EventSketchStore.bucket_start(timestamp_utc), []
+            ).append((event_type, customer_id))
+        for bucket_start_utc, events in events_by_bucket.items():
+            bucket = self.sketch_buckets.get(bucket_start_utc)
+            if bucket is None:
+                rows = self.sketch_accessor.load_sketches(
+                    bucket_start_utc,
+                    bucket_start_utc + SKETCH_BUCKET_SECONDS,
+                    conn=conn,
+                ).get(bucket_start_utc, [])
+                bucket = self.sketch_buckets[bucket_start_utc] = SketchBucket.from_rows(
+                    bucket_start_utc, rows
+                )
+            bucket.add(events)
+        if self.sketch_buckets:
+            newest = max(self.sketch_buckets)
+            self._save_sketches(
+                conn, [start for start in self.sketch_buckets if start < newest]
+            )
+
+    def _save_sketches(
+        self, conn: sqlite3.Connection, bucket_starts: list[int]
+    ) -> None:
+        rows = []
+        deleted_keys = []
+        for bucket_start_utc in bucket_starts:
+            bucket = self.sketch_buckets.pop(bucket_start_utc)
+            dirty_keys, evicted_keys, overflow_dirty = bucket.take_dirty()
+            rows.extend(bucket.to_rows(dirty_keys, overflow=overflow_dirty))
+            deleted_keys.extend(
+                (bucket_start_utc, DISTINCT_CUSTOMERS_SKETCH, key)
+                for key in evicted_keys
+                if key not in bucket.customer_sketches
+            )
+        if not rows:
+            return
+        conn.execute("BEGIN")
+        if not self.sketch_accessor.save_sketches(
+            rows, conn=conn, deleted_keys=deleted_keys
+        ):
+            raise sqlite3.Error("The sketches of the loaded events could not be saved")
+
+    def _report_progress(self, rows_loaded: int, rows_per_second: float) -> None:
+        if self.progress is not None:
+            self.progress(rows_loaded, rows_per_second)
+        else:
+            logger.info(f"Loaded {rows_loaded} rows, {rows_per_second:.0f} rows/s")
@@ -0,0 +1,87 @@
+import sqlite3
+import logging
+
+logger = logging.getLogger(__name__)
+
+EVENTS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS Events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    event_type VARCHAR NOT NULL,
+    timestamp_utc INT NOT NULL,
+    customer_id INT NOT NULL,
+    event_data JSON,
+    event_uuid VARCHAR
+);
+
+"""
+
+# covering indexes: each filter leads one of them followed by the page order, and together with the rowid every
+# index holds all columns but event_data, so pages projected without event_data are read from the index alone
+EVENT_INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_event_type_timestamp ON Events(event_type, timestamp_utc, customer_id);
+CREATE INDEX IF NOT EXISTS idx_customer_timestamp ON Events(customer_id, timestamp_utc, event_type);
+CREATE INDEX IF NOT EXISTS idx_timestamp_covering ON Events(timestamp_utc, event_type, customer_id);
+"""
+# single column indexes of earlier versions, prefixes of the covering indexes above
+SUPERSEDED_EVENT_INDEXES = ("idx_event_type", "idx_timestamp_utc", "idx_customer_id")
+
+# partial, so the events sent without an id cost nothing in the index
+EVENT_UUID_INDEX = """
+CREATE UNIQUE INDEX IF NOT EXISTS idx_event_uuid ON Events(event_uuid) WHERE event_uuid IS NOT NULL;
+"""
+
+# the hash chain sealing the events, one row per committed batch, see IntegrityDatabaseAccessor
+EVENT_BATCHES_SCHEMA = """
+CREATE TABLE IF NOT EXISTS EventBatches (
+    batch_id INTEGER PRIMARY KEY,
+    first_event_id INT NOT NULL,
+    last_event_id INT NOT NULL,
+    event_count INT NOT NULL,
+    merkle_root BLOB NOT NULL,
+    previous_chain_hash BLOB NOT NULL,
+    chain_hash BLOB NOT NULL,
+    sealed_at_utc INT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_event_batches_last_event_id ON EventBatches(last_event_id);
+"""
+
+EVENT_SKETCHES_SCHEMA = """
+CREATE TABLE IF NOT EXISTS EventSketches (
+    bucket_start_utc INT NOT NULL,
+    sketch_type VARCHAR NOT NULL,
+    sketch_key VARCHAR NOT NULL,
+    sketch_data BLOB NOT NULL,
+    PRIMARY KEY (bucket_start_utc, sketch_type, sketch_key)
+);
+"""
+
+
+def create_schema(conn: sqlite3.Connection) -> None:
+    """
+    Creates the service tables and indexes that do not exist yet. Safe to run on every startup.
+
+    The database is switched to WAL journaling, so long reads (exports, analytics) and the consumer's
+    commits do not block each other. Events tables created before event ids were supported get the
+    event_uuid column added, and the single column indexes of earlier versions are replaced by the covering
+    indexes, which takes a while on the first start with a large existing table.
+
+    Parameters:
+        conn (sqlite3.Connection): The connection to create the schema with.
+
+    Raises:
+        sqlite3.Error: If an error occurs while creating the schema.
+    """
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(EVENTS_SCHEMA + EVENT_BATCHES_SCHEMA + EVENT_SKETCHES_SCHEMA)
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(Events)")}
+        if "event_uuid" not in columns:
+            conn.execute("ALTER TABLE Events ADD COLUMN event_uuid VARCHAR")
+        conn.executescript(EVENT_UUID_INDEX + EVENT_INDEXES)
+        for name in SUPERSEDED_EVENT_INDEXES:
+            conn.execute(f"DROP INDEX IF EXISTS {name}")
+        conn.commit()
+    except sqlite3.Error as e:
+        logger.error(f"Error while creating the database schema: {e}")
+        raise
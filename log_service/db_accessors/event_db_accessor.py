@@ -1,16 +1,36 @@
 import sqlite3
+import time
+from contextlib import contextmanager
 
-from typing import Any
+from typing import Any, Callable, Iterator
 
 import orjson
 
 from log_service.config import LogServiceConfig
-from log_service.data.event_dto import EventRequestDTO
+from log_service.data.event_dto import EVENT_FIELDS, EventRequestDTO
+from log_service.db_accessors.integrity_db_accessor import IntegrityDatabaseAccessor
+from log_service.db_accessors.read_executor import get_read_connection
+from log_service.monitoring.metrics import MetricsRegistry
+from log_service.monitoring.tracing import traced
 from sqlite3 import Connection
 import logging
 
 logger = logging.getLogger(__name__)
 
+READ_QUERY_SECONDS = MetricsRegistry.get_instance().histogram(
+    "log_service_read_query_seconds",
+    "Latency of event page queries, by the filters they use.",
+    label_names=("filters",),
+)
+
+EXPORT_FETCH_SIZE = 1000
+# the columns of the event responses, event_uuid is only used to drop duplicates on insert
+EVENT_COLUMNS = "id, event_type, timestamp_utc, customer_id, event_data"
+# only conflicts on event_uuid are ignored, any other constraint still fails the batch
+INSERT_EVENT_SQL = """INSERT INTO Events (customer_id, event_type, timestamp_utc, event_data, event_uuid)
+                       VALUES (?, ?, ?, ?, ?)
+                       ON CONFLICT (event_uuid) WHERE event_uuid IS NOT NULL DO NOTHING"""
+
 
 class EventDatabaseAccessor:
 
@@ -45,49 +65,271 @@ class EventDatabaseAccessor:
         Raises:
             sqlite3.Error: If an error occurs during the database query execution.
         """
-        filters = "WHERE true"
+        event_rows, total_count = self._get_page(
+            get_event_dto, self.event_columns(get_event_dto.fields), sqlite3.Row
+        )
+        fields = get_event_dto.fields or EVENT_FIELDS
+        events = []
+
+        # parse the event_data from json to dict and populate response items
+        for item in event_rows:
+            item = {field: item[field] for field in fields}
+            if "event_data" in item:
+                item["event_data"] = (
+                    orjson.loads(item["event_data"]) if item["event_data"] else {}
+                )
+            events.append(item)
+
+        return events, total_count
+
+    def get_event_rows(self, get_event_dto: EventRequestDTO) -> tuple[list[tuple], int]:
+        """
+        Retrieves a page of events like `get_events`, but as plain (id, event_type, timestamp_utc, customer_id,
+        event_data) tuples with `event_data` as stored, for responses that splice it in without decoding. Fields
+        not in the projection of the DTO are None.
+
+        Parameters:
+            get_event_dto (EventRequestDTO): The DTO containing filter criteria for the events query.
+
+        Returns:
+            tuple[list[tuple], int]: The event rows and the total count of records matching the criteria.
+
+        Raises:
+            sqlite3.Error: If an error occurs during the database query execution.
+        """
+        return self._get_page(
+            get_event_dto, self.event_columns(get_event_dto.fields), None
+        )
+
+    @contextmanager
+    def read_snapshot(self) -> Iterator[None]:
+        """
+        Runs the reads made in it in one read transaction of the pooled connection of the current read executor
+        thread, so they all see the same committed events, e.g. the counts of a batch of queries add up. Outside
+        of the read executor every read has its own connection, and the reads are not grouped.
+        """
+        conn = get_read_connection()
+        if conn is None or conn.in_transaction:
+            yield
+            return
+        # deferred, the snapshot is taken by the first read and released by the rollback, nothing is written
+        conn.execute("BEGIN")
+        try:
+            yield
+        finally:
+            conn.rollback()
+
+    @staticmethod
+    def event_columns(fields: tuple[str, ...] | None) -> str:
+        """
+        Returns the select list of a page projected to `fields`, None for all of them. Columns left out are
+        selected as NULL, so rows keep their shape, and are never read: without event_data, the covering indexes
+        answer the query alone.
+        """
+        if fields is None:
+            return EVENT_COLUMNS
+        return ", ".join(
+            field if field in fields else f"NULL AS {field}" for field in EVENT_FIELDS
+        )
+
+    def _get_page(
+        self,
+        get_event_dto: EventRequestDTO,
+        columns: str,
+        row_factory: Callable | None,
+    ) -> tuple[list, int]:
+        sql, count_sql, params = self.build_page_sql(get_event_dto, columns)
+        started_at = time.perf_counter()
+        try:
+            return self.get_events_from_db(
+                sql=sql, count_sql=count_sql, params=params, row_factory=row_factory
+            )
+        finally:
+            READ_QUERY_SECONDS.labels(self.filter_shape(get_event_dto)).observe(
+                time.perf_counter() - started_at
+            )
+
+    @staticmethod
+    def filter_shape(get_event_dto: EventRequestDTO) -> str:
+        """
+        Returns the names of the filters set on an EventRequestDTO, e.g. "customer_id+event_type", or "none".
+        Filters matching several values are suffixed with "[]". Queries of the same shape use the same index, so
+        their latencies are comparable.
+        """
+        filters = [
+            f"{name}[]" if isinstance(getattr(get_event_dto, name), tuple) else name
+            for name in (
+                "event_id",
+                "event_type",
+                "customer_id",
+                "timestamp_start_utc",
+                "timestamp_end_utc",
+            )
+            if getattr(get_event_dto, name)
+        ]
+        return "+".join(filters) or "none"
+
+    @classmethod
+    def build_page_sql(
+        cls, get_event_dto: EventRequestDTO, columns: str
+    ) -> tuple[str, str, list]:
+        """
+        Builds the page query and the count query for the filter criteria and pagination of an EventRequestDTO.
 
-        if get_event_dto.event_id:
-            filters += f" AND id = '{get_event_dto.event_id}'"
+        Parameters:
+            get_event_dto (EventRequestDTO): The DTO containing filter criteria for the events query.
+            columns (str): The columns to select.
 
-        if get_event_dto.event_type:
-            filters += f" AND event_type = '{get_event_dto.event_type}'"
+        Returns:
+            tuple[str, str, list]: The page query, the count query and the parameters of both.
+        """
+        filters, params = cls.build_filters(get_event_dto)
+        base_sql = f"FROM EVENTS {filters} ORDER BY timestamp_utc"
+        count_sql = f"SELECT COUNT(1) {base_sql};"
 
-        if get_event_dto.customer_id:
-            filters += f" AND customer_id = {get_event_dto.customer_id}"
+        # the DTO bounds the limit by the max_page_size setting
+        sql = f"SELECT {columns} {base_sql} LIMIT {int(get_event_dto.limit)}"
+        sql += f" OFFSET {get_event_dto.offset or 0}"
+        return sql, count_sql, params
+
+    @staticmethod
+    def build_filters(get_event_dto: EventRequestDTO) -> tuple[str, list]:
+        """
+        Builds the WHERE clause for the filter criteria of an EventRequestDTO.
+
+        Parameters:
+            get_event_dto (EventRequestDTO): The DTO containing filter criteria for the events query.
+
+        Returns:
+            tuple[str, list]: The WHERE clause, with `?` placeholders, and its parameters.
+        """
+        filters = "WHERE true"
+        params: list = []
+
+        for name, column in (
+            ("event_id", "id"),
+            ("event_type", "event_type"),
+            ("customer_id", "customer_id"),
+        ):
+            values = get_event_dto.filter_values(name)
+            if not values:
+                continue
+            if len(values) == 1:
+                filters += f" AND {column} = ?"
+            else:
+                filters += f" AND {column} IN ({', '.join('?' * len(values))})"
+            params.extend(values)
 
         if get_event_dto.timestamp_start_utc:
-            filters += f" AND timestamp_utc >= {get_event_dto.timestamp_start_utc}"
+            filters += " AND timestamp_utc >= ?"
+            params.append(get_event_dto.timestamp_start_utc)
 
         if get_event_dto.timestamp_end_utc:
-            filters += f" AND timestamp_utc <= {get_event_dto.timestamp_end_utc}"
+            filters += " AND timestamp_utc <= ?"
+            params.append(get_event_dto.timestamp_end_utc)
+
+        return filters, params
+
+    def iter_event_rows(
+        self, get_event_dto: EventRequestDTO, batch_size: int = EXPORT_FETCH_SIZE
+    ) -> Iterator[list[tuple]]:
+        """
+        Streams all events matching the filter criteria of the EventRequestDTO, ordered by (timestamp, id).
+        The offset and limit of the DTO are ignored. `event_data` is returned as stored, without decoding.
 
-        base_sql = f"SELECT * FROM EVENTS {filters}"
+        Rows are paged by keyset, `(timestamp_utc, id) > (last_timestamp, last_id)`, and every batch is its own
+        short read. No read transaction stays open between batches, so a long export never blocks the consumer's
+        commits, and every page is an index range scan instead of an OFFSET scan.
 
-        base_sql += " ORDER BY timestamp_utc"
-        count_sql = f'{base_sql.replace("*", "COUNT(1)")};'
+        The connection is opened with check_same_thread=False, as streaming responses advance the generator from
+        whichever read executor thread is free; it is still only ever used by one thread at a time.
 
-        sql = (
-            base_sql
-            + f" LIMIT {get_event_dto.limit if get_event_dto.limit and get_event_dto.limit <= 100 else 100}"
+        Parameters:
+            get_event_dto (EventRequestDTO): The DTO containing filter criteria for the events query.
+            batch_size (int): The number of rows fetched and yielded at a time.
+
+        Yields:
+            list[tuple]: Batches of (id, event_type, timestamp_utc, customer_id, event_data) rows.
+
+        Raises:
+            sqlite3.Error: If an error occurs during the database query execution.
+        """
+        filters, params = self.build_filters(get_event_dto)
+        select_sql = f"SELECT {EVENT_COLUMNS} FROM Events"
+        first_page_sql = f"{select_sql} {filters} ORDER BY timestamp_utc, id LIMIT ?"
+        next_page_sql = (
+            f"{select_sql} {filters} AND (timestamp_utc, id) > (?, ?) "
+            "ORDER BY timestamp_utc, id LIMIT ?"
         )
-        sql += f" OFFSET {get_event_dto.offset or 0}"
 
-        event_rows, total_count = self.get_events_from_db(sql=sql, count_sql=count_sql)
-        events = []
+        conn = sqlite3.connect(self.config.get_db_url(), check_same_thread=False)
+        try:
+            rows = conn.execute(first_page_sql, [*params, batch_size]).fetchall()
+            while rows:
+                yield rows
+                if len(rows) < batch_size:
+                    break
+                last_id, _, last_timestamp_utc = rows[-1][:3]
+                rows = conn.execute(
+                    next_page_sql, [*params, last_timestamp_utc, last_id, batch_size]
+                ).fetchall()
 
-        # parse the event_data from json to dict and populate response items
-        for item in event_rows:
-            item = dict(item)
-            item["event_data"] = (
-                orjson.loads(item["event_data"]) if item["event_data"] else {}
-            )
-            events.append(item)
+        except sqlite3.Error as e:
+            logger.error(f"Error while exporting events: {e}")
+            raise
 
-        return events, total_count
+        finally:
+            conn.close()
+
+    def get_event_rows_after(
+        self, get_event_dto: EventRequestDTO, after_id: int, limit: int
+    ) -> list[tuple]:
+        """
+        Returns the events stored after `after_id` that match the filters of an EventRequestDTO, in id (commit)
+        order, e.g. to backfill a change feed subscriber. Pages are read by keyset on the id, so reading a long
+        backlog page by page is an index range scan per page.
+
+        Parameters:
+            get_event_dto (EventRequestDTO): The DTO containing filter criteria for the events query.
+            after_id (int): Only events with a larger id are returned.
+            limit (int): The most events returned.
+
+        Returns:
+            list[tuple]: (id, event_type, timestamp_utc, customer_id, event_data) rows.
 
+        Raises:
+            sqlite3.Error: If an error occurs during the database query execution.
+        """
+        filters, params = self.build_filters(get_event_dto)
+        sql = f"SELECT {EVENT_COLUMNS} FROM Events {filters} AND id > ? ORDER BY id LIMIT ?"
+        return self._read(sql, [*params, after_id, limit])
+
+    def get_last_event_id(self) -> int:
+        """Returns the id of the newest stored event, 0 if there is none."""
+        return self._read("SELECT COALESCE(MAX(id), 0) FROM Events", [])[0][0]
+
+    def _read(self, sql: str, params: list) -> list[tuple]:
+        conn = get_read_connection()
+        close_connection = conn is None
+        if conn is None:
+            conn = sqlite3.connect(self.config.get_db_url())
+        try:
+            return conn.execute(sql, params).fetchall()
+        except sqlite3.Error as e:
+            logger.error(f"Error while getting events: {e}")
+            raise
+        finally:
+            if close_connection:
+                conn.close()
+
+    @traced("sqlite")
     def get_events_from_db(
-        self, sql: str, count_sql: str, conn: Connection | None = None
+        self,
+        sql: str,
+        count_sql: str,
+        conn: Connection | None = None,
+        params: list | None = None,
+        row_factory: Callable | None = sqlite3.Row,
     ) -> tuple[list, int]:
         """
         Executes the provided SQL query and count query to fetch event records and their total count from the database.
@@ -95,7 +337,10 @@ class EventDatabaseAccessor:
         Parameters:
             sql (str): The SQL query to fetch event records.
             count_sql (str): The SQL query to count the total number of event records matching the criteria.
-            conn (Connection | None): An optional existing database connection. If None, a new connection is established.
+            conn (Connection | None): An optional existing database connection. If None, the connection of the
+                current read executor thread is used, or a new connection is established and closed afterwards.
+            params (list | None): Parameters for the `?` placeholders of both queries.
+            row_factory (Callable | None): The row factory of the event rows, None for plain tuples.
 
         Returns:
             tuple[list[Row | None], int]: A tuple containing a list of event rows (as sqlite3.Row) and the total count of records matching the criteria.
@@ -103,20 +348,22 @@ class EventDatabaseAccessor:
         Raises:
             sqlite3.Error: If an error occurs during database operation.
         """
-        # todo: implement the code for connection pooling to enable re-using connections
-        # todo connection pooling does not come with SQlite3 like other production grade databases
-
+        # connections are pooled by the read executor threads, reads from anywhere else get a fresh connection
+        close_connection = False
+        if conn is None:
+            conn = get_read_connection()
         if conn is None:
             conn = sqlite3.connect(self.config.get_db_url())
+            close_connection = True
 
         try:
-            conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
-            cursor.execute(count_sql)
+            cursor.execute(count_sql, params or [])
             total_count = list(cursor.fetchone())[0]
-            cursor.execute(sql)
+            # set on the cursor, a pooled connection is shared with reads expecting plain tuples
+            cursor.row_factory = row_factory
+            cursor.execute(sql, params or [])
             event_rows = cursor.fetchall()
-            conn.close()
             return event_rows, total_count
 
         except sqlite3.Error as e:
@@ -124,18 +371,26 @@ class EventDatabaseAccessor:
             raise
 
         finally:
-            conn.close()
+            if close_connection:
+                conn.close()
 
     def save_events_to_db(
         self,
-        insert_data: list[tuple[int, str, int, Any]],
+        insert_data: list[
+            tuple[int, str, int, Any] | tuple[int, str, int, Any, str | None]
+        ],
         conn: Connection | None = None,
     ) -> bool:
         """
         Inserts new event records into the database.
 
+        An event whose event_uuid is stored already is skipped, so retried events are stored once. Skipping is
+        decided by the unique index on event_uuid within the insert, not by a prior read. The inserted records are
+        sealed in the hash chain in the same transaction, see `IntegrityDatabaseAccessor.seal_batch`.
+
         Parameters:
-            insert_data (list[tuple]): A list of tuples, each representing the data for one event record to be inserted.
+            insert_data (list[tuple]): A list of (customer_id, event_type, timestamp_utc, event_data) tuples, each
+                representing the data for one event record to be inserted, optionally followed by its event_uuid.
             conn (Connection | None): An optional existing database connection. If None, a new connection is established.
 
         Returns:
@@ -148,16 +403,126 @@ class EventDatabaseAccessor:
             conn = sqlite3.connect(self.config.get_db_url())
         try:
             c = conn.cursor()
-            sql = """INSERT INTO Events (customer_id, event_type, timestamp_utc, event_data)
-                       VALUES (?, ?, ?, ?)"""
-
-            c.executemany(sql, insert_data)
+            changes_before = conn.total_changes
+            c.executemany(
+                INSERT_EVENT_SQL,
+                (row if len(row) == 5 else (*row, None) for row in insert_data),
+            )
+            IntegrityDatabaseAccessor.seal_batch(
+                c,
+                conn.total_changes - changes_before,
+                c.execute("SELECT last_insert_rowid()").fetchone()[0],
+            )
             conn.commit()
             return True
 
         except sqlite3.Error as error:  # todo catch specific errors and handle as appropriate
             # roll back transaction if any error occurs and return the events back to the queue for retry
-            logger.error("Error while inserting data into sqlite", str(error))
+            logger.error(f"Error while inserting data into sqlite: {error}")
             conn.rollback()
             # return false so as to return failed events back to the queue to be retried
             return False
+
+    def save_events_returning_ids(
+        self,
+        insert_data: list[tuple[int, str, int, Any, str | None]],
+        conn: Connection,
+    ) -> list[int] | None:
+        """
+        Inserts new event records like `save_events_to_db`, in one transaction, and returns the id of every record.
+
+        Without duplicates the records of one transaction get consecutive ids, so the ids follow from the last
+        inserted id and the number of inserted rows without reading anything back. Only if records were skipped as
+        duplicates, which may leave gaps in the ids, are the inserted rows (the newest ones, the consumer being the
+        only writer) read back to tell which, and the skipped records looked up by event_uuid: they get the id of
+        the stored record, which may have been inserted by an earlier record of the same batch.
+
+        Parameters:
+            insert_data (list[tuple]): (customer_id, event_type, timestamp_utc, event_data, event_uuid) tuples.
+            conn (Connection): The database connection.
+
+        Returns:
+            list[int] | None: The ids, in the order of `insert_data`, or None if the insert failed.
+        """
+        try:
+            c = conn.cursor()
+            changes_before = conn.total_changes
+            c.executemany(INSERT_EVENT_SQL, insert_data)
+            inserted = conn.total_changes - changes_before
+            last_id = c.execute("SELECT last_insert_rowid()").fetchone()[0]
+            if inserted == len(insert_data):
+                ids = list(range(last_id - inserted + 1, last_id + 1))
+            else:
+                ids = self._match_inserted_ids(insert_data, inserted, last_id, c)
+            IntegrityDatabaseAccessor.seal_batch(c, inserted, last_id)
+            conn.commit()
+            return ids
+
+        except sqlite3.Error as error:
+            logger.error(f"Error while inserting data into sqlite: {error}")
+            conn.rollback()
+            return None
+
+    @staticmethod
+    def _match_inserted_ids(
+        insert_data: list[tuple[int, str, int, Any, str | None]],
+        inserted: int,
+        last_id: int,
+        cursor: sqlite3.Cursor,
+    ) -> list[int]:
+        # inserted rows keep the order of insert_data, only records with an event_uuid can be missing
+        inserted_rows = iter(
+            cursor.execute(
+                "SELECT id, event_uuid FROM Events WHERE id <= ? ORDER BY id DESC LIMIT ?",
+                (last_id, inserted),
+            ).fetchall()[::-1]
+        )
+        next_row = next(inserted_rows, None)
+        ids = []
+        for row in insert_data:
+            if next_row is not None and next_row[1] == row[4]:
+                ids.append(next_row[0])
+                next_row = next(inserted_rows, None)
+            else:
+                ids.append(
+                    cursor.execute(
+                        "SELECT id FROM Events WHERE event_uuid = ?", (row[4],)
+                    ).fetchone()[0]
+                )
+        return ids
+
+    def get_stored_event_uuids(
+        self, event_uuids: list[str], conn: Connection | None = None
+    ) -> set[str]:
+        """
+        Returns which of the given event ids are stored, with one lookup in the unique event_uuid index each.
+
+        Parameters:
+            event_uuids (list[str]): The event ids to look up.
+            conn (Connection | None): An optional existing database connection. If None, a new connection is
+                established and closed afterwards.
+
+        Returns:
+            set[str]: The stored event ids.
+
+        Raises:
+            sqlite3.Error: If an error occurs during the lookup.
+        """
+        close_connection = conn is None
+        if conn is None:
+            conn = sqlite3.connect(self.config.get_db_url())
+        try:
+            stored = set()
+            # chunked below SQLite's default limit of bound parameters
+            for start in range(0, len(event_uuids), 500):
+                chunk = event_uuids[start : start + 500]
+                rows = conn.execute(
+                    "SELECT event_uuid FROM Events INDEXED BY idx_event_uuid "
+                    f"WHERE event_uuid IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                )
+                stored.update(row[0] for row in rows)
+            return stored
+        finally:
+            if close_connection:
+                conn.close()
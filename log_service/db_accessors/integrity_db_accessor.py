@@ -0,0 +1,211 @@
+import logging
+import sqlite3
+import time
+from sqlite3 import Connection, Cursor
+
+from log_service.config import LogServiceConfig
+from log_service.data.merkle import (
+    GENESIS_CHAIN_HASH,
+    chain_hash,
+    leaf_hash,
+    merkle_root,
+)
+from log_service.db_accessors.read_executor import get_read_connection
+from log_service.monitoring.metrics import MetricsRegistry
+
+logger = logging.getLogger(__name__)
+
+# the columns every leaf hash is computed over, see `canonical_event_bytes`
+SEALED_EVENT_COLUMNS = (
+    "id, event_type, timestamp_utc, customer_id, event_data, event_uuid"
+)
+BATCH_COLUMNS = (
+    "batch_id, first_event_id, last_event_id, event_count, merkle_root, "
+    "previous_chain_hash, chain_hash, sealed_at_utc"
+)
+
+# the most events sealed under one Merkle root, the largest batch the queue consumer commits (its DRAIN_CHUNK_SIZE);
+# a proof reads and hashes the whole batch of its event, so larger transactions are sealed as several batches
+MAX_SEALED_BATCH_EVENTS = 1000
+
+BATCHES_SEALED = MetricsRegistry.get_instance().counter(
+    "log_service_batches_sealed_total",
+    "Committed batches of events sealed with a Merkle root in the hash chain.",
+)
+
+
+class IntegrityDatabaseAccessor:
+    """
+    Provides access to the EventBatches table, the hash chain sealing the stored events against tampering.
+
+    Every transaction inserting events seals them in the same transaction (`seal_batch`): the inserted rows, the
+    newest ones, are read back as stored and hashed into a Merkle root, which is chained to the chain hash of the
+    previous batch. The hashing runs on the writer, the queue consumer or the bulk loader, never on a request.
+
+    Attributes:
+        config (LogServiceConfig): A configuration instance for accessing database settings.
+    """
+
+    def __init__(self) -> None:
+        self.config = LogServiceConfig.get_instance()
+
+    @staticmethod
+    def seal_batch(cursor: Cursor, inserted: int, last_id: int) -> int | None:
+        """
+        Seals the events a transaction inserted, to be called in that transaction after the inserts, so the batch
+        is committed with its events or not at all. The write lock of the transaction keeps other writers out, so
+        the inserted rows are the `inserted` rows up to `last_id`. More than MAX_SEALED_BATCH_EVENTS rows, e.g. of
+        a bulk load, are sealed as consecutive batches of at most that many rows.
+
+        Parameters:
+            cursor (Cursor): A cursor of the inserting transaction.
+            inserted (int): The number of inserted rows.
+            last_id (int): The id of the last inserted row.
+
+        Returns:
+            int | None: The id of the (last) batch, None if nothing was inserted.
+
+        Raises:
+            sqlite3.Error: If the batch cannot be stored, the transaction must then be rolled back.
+        """
+        if inserted <= 0:
+            return None
+        rows = cursor.execute(
+            f"SELECT {SEALED_EVENT_COLUMNS} FROM Events WHERE id <= ? ORDER BY id DESC LIMIT ?",
+            (last_id, inserted),
+        ).fetchall()[::-1]
+        batch_id = None
+        for start in range(0, len(rows), MAX_SEALED_BATCH_EVENTS):
+            batch_id = IntegrityDatabaseAccessor._seal_rows(
+                cursor, rows[start : start + MAX_SEALED_BATCH_EVENTS]
+            )
+        return batch_id
+
+    @staticmethod
+    def _seal_rows(cursor: Cursor, rows: list[tuple]) -> int:
+        previous = cursor.execute(
+            "SELECT batch_id, chain_hash FROM EventBatches ORDER BY batch_id DESC LIMIT 1"
+        ).fetchone()
+        batch_id, previous_chain_hash = (
+            (previous[0] + 1, previous[1]) if previous else (1, GENESIS_CHAIN_HASH)
+        )
+        root = merkle_root([leaf_hash(row) for row in rows])
+        first_event_id, last_id = rows[0][0], rows[-1][0]
+        cursor.execute(
+            f"INSERT INTO EventBatches ({BATCH_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                batch_id,
+                first_event_id,
+                last_id,
+                len(rows),
+                root,
+                previous_chain_hash,
+                chain_hash(
+                    previous_chain_hash,
+                    batch_id,
+                    first_event_id,
+                    last_id,
+                    len(rows),
+                    root,
+                ),
+                int(time.time()),
+            ),
+        )
+        BATCHES_SEALED.inc()
+        return batch_id
+
+    def get_batch_of_event(
+        self, event_id: int, conn: Connection | None = None
+    ) -> tuple | None:
+        """
+        Returns the batch sealing an event, as a row of BATCH_COLUMNS, or None if the event is not sealed, e.g.
+        stored before batches were sealed, or does not exist.
+        """
+        rows = self._read(
+            f"SELECT {BATCH_COLUMNS} FROM EventBatches WHERE last_event_id >= ? "
+            "ORDER BY last_event_id LIMIT 1",
+            [event_id],
+            conn,
+        )
+        if not rows or rows[0][1] > event_id:
+            return None
+        return rows[0]
+
+    def get_batches(
+        self,
+        after_batch_id: int,
+        limit: int,
+        last_event_id: int | None = None,
+        conn: Connection | None = None,
+    ) -> list[tuple]:
+        """
+        Returns up to `limit` batches after a batch, in chain order, as rows of BATCH_COLUMNS.
+
+        Parameters:
+            after_batch_id (int): The batch to start after, 0 for the first batch.
+            limit (int): The most batches returned.
+            last_event_id (int | None): Only batches starting at or before this event, if set.
+            conn (Connection | None): An optional existing database connection.
+        """
+        sql = f"SELECT {BATCH_COLUMNS} FROM EventBatches WHERE batch_id > ?"
+        params: list = [after_batch_id]
+        if last_event_id is not None:
+            sql += " AND first_event_id <= ?"
+            params.append(last_event_id)
+        return self._read(sql + " ORDER BY batch_id LIMIT ?", [*params, limit], conn)
+
+    def get_previous_batch(
+        self, first_event_id: int, conn: Connection | None = None
+    ) -> tuple | None:
+        """Returns the last batch sealing events before an event id, as a row of BATCH_COLUMNS, or None."""
+        rows = self._read(
+            f"SELECT {BATCH_COLUMNS} FROM EventBatches WHERE last_event_id < ? "
+            "ORDER BY last_event_id DESC LIMIT 1",
+            [first_event_id],
+            conn,
+        )
+        return rows[0] if rows else None
+
+    def get_head(self, conn: Connection | None = None) -> tuple | None:
+        """Returns the newest batch, the head of the chain, as a row of BATCH_COLUMNS, or None."""
+        rows = self._read(
+            f"SELECT {BATCH_COLUMNS} FROM EventBatches ORDER BY batch_id DESC LIMIT 1",
+            [],
+            conn,
+        )
+        return rows[0] if rows else None
+
+    def get_sealed_rows(
+        self, first_event_id: int, last_event_id: int, conn: Connection | None = None
+    ) -> list[tuple]:
+        """Returns the stored rows of an id range as hashed by `seal_batch`, in id order."""
+        return self._read(
+            f"SELECT {SEALED_EVENT_COLUMNS} FROM Events WHERE id BETWEEN ? AND ? ORDER BY id",
+            [first_event_id, last_event_id],
+            conn,
+        )
+
+    def count_events(
+        self, first_event_id: int, last_event_id: int, conn: Connection | None = None
+    ) -> int:
+        """Returns how many events are stored in an id range, from the primary key alone."""
+        return self._read(
+            "SELECT COUNT(1) FROM Events WHERE id BETWEEN ? AND ?",
+            [first_event_id, last_event_id],
+            conn,
+        )[0][0]
+
+    def _read(self, sql: str, params: list, conn: Connection | None) -> list[tuple]:
+        if conn is None:
+            conn = get_read_connection()
+        close_connection = conn is None
+        if conn is None:
+            conn = sqlite3.connect(self.config.get_db_url())
+        try:
+            return conn.execute(sql, params).fetchall()
+        except sqlite3.Error as e:
+            logger.error(f"Error while reading event batches: {e}")
+            raise
+        finally:
+            if close_connection:
+                conn.close()
@@ -0,0 +1,297 @@
+import asyncio
+import contextvars
+import logging
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from sqlite3 import Connection
+from threading import Lock, RLock
+from typing import Any, AsyncIterator, Callable, Iterator, TypeVar
+
+from fastapi import HTTPException
+
+from log_service.config import LogServiceConfig
+from log_service.monitoring.metrics import MetricsRegistry
+from log_service.monitoring.tracing import record
+
+logger = logging.getLogger(__name__)
+
+READ_CONNECTION_COUNT = 4
+# requests allowed to wait for a free read connection before new ones are shed
+READ_QUEUE_LIMIT = 64
+OVERLOAD_RETRY_AFTER_SECONDS = 1
+
+T = TypeVar("T")
+
+metrics = MetricsRegistry.get_instance()
+READ_WAIT_SECONDS = metrics.histogram(
+    "log_service_read_wait_seconds",
+    "Time reads waited for a free read connection.",
+)
+
+_thread_local = threading.local()
+
+
+def get_read_connection() -> Connection | None:
+    """
+    Returns the database connection owned by the current read executor thread.
+
+    Returns:
+        Connection | None: The connection, or None when not called from a read executor thread.
+    """
+    return getattr(_thread_local, "conn", None)
+
+
+class DatabaseReadExecutor:
+    """
+    Implements a thread-safe singleton bounded executor for blocking SQLite reads, so they never run on the
+    asyncio event loop.
+
+    Reads run on a dedicated pool of READ_CONNECTION_COUNT threads, each holding its own long-lived read connection
+    (see `get_read_connection`). Admission is bounded by READ_CONNECTION_COUNT + READ_QUEUE_LIMIT reads in flight,
+    so at most READ_QUEUE_LIMIT reads wait behind busy threads; beyond that requests are rejected with a 503 right
+    away, so a burst of slow queries can neither stall the event loop (and with it ingest) nor build up an unbounded
+    backlog.
+
+    The thread pool is created on first use and torn down, connections included, by `shutdown`, so the executor
+    can be started again in the same process.
+
+    Attributes:
+        _instance (DatabaseReadExecutor, optional): Class variable to hold the singleton instance.
+        _lock (RLock): A reentrant lock to ensure thread-safe creation of the singleton instance and its pool.
+        config (LogServiceConfig): Configuration instance for accessing database settings.
+        in_flight (int): Reads admitted and not finished yet, running or waiting for a free thread.
+        running (int): Reads currently running.
+        completed (int): Reads finished since startup.
+        rejected (int): Reads shed because the queue was full.
+        total_wait_seconds (float): Total time reads spent queued.
+        max_wait_seconds (float): Longest time a read spent queued.
+
+    Usage:
+        read_executor = DatabaseReadExecutor.get_instance()
+        result = await read_executor.run(event_controller.get_event, request_dto)
+
+        chunks = await read_executor.iterate(event_controller.export_events(request_dto))
+
+    Raises:
+        Exception: If an attempt is made to directly instantiate the class instead of using the `get_instance` method.
+    """
+
+    _instance = None
+    _lock: RLock = RLock()
+
+    def __init__(self) -> None:
+        if DatabaseReadExecutor._instance:
+            raise Exception("This class is a singleton!")
+        self.config = LogServiceConfig.get_instance()
+        self._executor: ThreadPoolExecutor | None = None
+        self._connections: list[Connection] = []
+        self._stats_lock = Lock()
+        self.in_flight = 0
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self._register_metrics()
+        DatabaseReadExecutor._instance = self
+
+    @classmethod
+    def get_instance(cls) -> "DatabaseReadExecutor":
+        """
+        Retrieves the singleton instance of the DatabaseReadExecutor class, creating it if it does not already exist.
+
+        Returns:
+            DatabaseReadExecutor: The singleton instance of the class.
+        """
+        if not cls._instance:
+            with cls._lock:
+                if not cls._instance:
+                    cls._instance = DatabaseReadExecutor()
+        return cls._instance
+
+    async def run(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """
+        Runs a blocking read on the executor and awaits its result without blocking the event loop.
+        Context variables of the caller are visible to the read.
+
+        Parameters:
+            func (Callable): The blocking function to run.
+            *args, **kwargs: Arguments for func.
+
+        Returns:
+            The result of func.
+
+        Raises:
+            HTTPException: 503 error if the executor is saturated.
+        """
+        return await self._submit(func, args, kwargs, shed=True)
+
+    async def iterate(self, iterator: Iterator[T]) -> AsyncIterator[T]:
+        """
+        Advances a blocking iterator on the executor, one read per item, e.g. to stream an export page by page.
+
+        The first item is read right away and admitted like any read, so an overloaded executor rejects the stream
+        with a 503 before a response is started. The remaining items of an admitted stream are never shed.
+
+        Parameters:
+            iterator (Iterator): The blocking iterator.
+
+        Returns:
+            AsyncIterator: The items of the iterator.
+
+        Raises:
+            HTTPException: 503 error if the executor is saturated.
+        """
+        done = object()
+        first = await self._submit(next, (iterator, done), {}, shed=True)
+        return self._iterate_admitted(iterator, first, done)
+
+    async def _iterate_admitted(
+        self, iterator: Iterator[T], first: Any, done: object
+    ) -> AsyncIterator[T]:
+        try:
+            item = first
+            while item is not done:
+                yield item
+                item = await self._submit(next, (iterator, done), {}, shed=False)
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                try:
+                    # releases the iterator's resources (e.g. its connection) if the stream was abandoned
+                    close()
+                except ValueError:
+                    # still advancing on a read thread after a cancellation, it is released once collected
+                    pass
+
+    async def _submit(
+        self, func: Callable[..., T], args: tuple, kwargs: dict, shed: bool
+    ) -> T:
+        with self._stats_lock:
+            if shed and self.in_flight >= READ_CONNECTION_COUNT + READ_QUEUE_LIMIT:
+                self.rejected += 1
+                logger.warning(
+                    f"Read executor saturated, rejecting read. in flight: {self.in_flight}, running: {self.running}"
+                )
+                raise HTTPException(
+                    status_code=503,
+                    detail="Too many concurrent queries, please try again shortly.",
+                    headers={"Retry-After": str(OVERLOAD_RETRY_AFTER_SECONDS)},
+                )
+            self.in_flight += 1
+
+        try:
+            context = contextvars.copy_context()
+            future = self._get_executor().submit(
+                self._run_read, time.perf_counter(), context, func, args, kwargs
+            )
+        except BaseException:
+            with self._stats_lock:
+                self.in_flight -= 1
+            raise
+        # runs for finished and cancelled reads alike, a read cancelled before it started never reaches _run_read
+        future.add_done_callback(self._on_read_done)
+        return await asyncio.wrap_future(future)
+
+    def stats(self) -> dict:
+        """
+        Returns the queueing metrics of the executor.
+
+        Returns:
+            dict: Pool size, queue limit, and the current and cumulative read counters.
+        """
+        with self._stats_lock:
+            return {
+                "connections": READ_CONNECTION_COUNT,
+                "queue_limit": READ_QUEUE_LIMIT,
+                "in_flight": self.in_flight,
+                "queued": self.in_flight - self.running,
+                "running": self.running,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "total_wait_seconds": self.total_wait_seconds,
+                "max_wait_seconds": self.max_wait_seconds,
+            }
+
+    def shutdown(self) -> None:
+        """
+        Waits for the running reads, cancels the queued ones and closes the read connections.
+        A later `run` starts a new pool.
+        """
+        with self._lock:
+            executor, self._executor = self._executor, None
+            connections, self._connections = self._connections, []
+        if executor is None:
+            return
+        executor.shutdown(wait=True, cancel_futures=True)
+        for conn in connections:
+            conn.close()
+
+    def _register_metrics(self) -> None:
+        # evaluated at scrape time from the counters the executor keeps anyway
+        metrics.gauge(
+            "log_service_read_connections", "Pooled read connections."
+        ).set_function(lambda: READ_CONNECTION_COUNT)
+        metrics.gauge(
+            "log_service_read_in_flight", "Reads admitted and not finished yet."
+        ).set_function(lambda: self.in_flight)
+        metrics.gauge(
+            "log_service_read_queued", "Reads waiting for a free read connection."
+        ).set_function(lambda: self.in_flight - self.running)
+        metrics.gauge(
+            "log_service_read_running", "Reads currently running."
+        ).set_function(lambda: self.running)
+        metrics.counter(
+            "log_service_reads_completed_total", "Reads finished."
+        ).set_function(lambda: self.completed)
+        metrics.counter(
+            "log_service_reads_rejected_total",
+            "Reads rejected with a 503 because the executor was saturated.",
+        ).set_function(lambda: self.rejected)
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # every pool gets its own connection list, so a restart never closes the connections of a newer pool
+                self._connections = []
+                self._executor = ThreadPoolExecutor(
+                    max_workers=READ_CONNECTION_COUNT,
+                    thread_name_prefix="db-read",
+                    initializer=self._open_connection,
+                    initargs=(self._connections,),
+                )
+            return self._executor
+
+    def _run_read(
+        self,
+        submitted_at: float,
+        context: contextvars.Context,
+        func: Callable[..., T],
+        args: tuple,
+        kwargs: dict,
+    ) -> T:
+        wait_seconds = time.perf_counter() - submitted_at
+        READ_WAIT_SECONDS.observe(wait_seconds)
+        context.run(record, "read_wait", wait_seconds)
+        with self._stats_lock:
+            self.running += 1
+            self.total_wait_seconds += wait_seconds
+            self.max_wait_seconds = max(self.max_wait_seconds, wait_seconds)
+        try:
+            return context.run(func, *args, **kwargs)
+        finally:
+            with self._stats_lock:
+                self.running -= 1
+                self.completed += 1
+
+    def _on_read_done(self, future: Future) -> None:
+        with self._stats_lock:
+            self.in_flight -= 1
+
+    def _open_connection(self, connections: list[Connection]) -> None:
+        # check_same_thread=False only so `shutdown` can close the connection, it is used by its own thread only
+        conn = sqlite3.connect(self.config.get_db_url(), check_same_thread=False)
+        connections.append(conn)
+        _thread_local.conn = conn
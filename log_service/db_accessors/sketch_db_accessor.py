@@ -0,0 +1,121 @@
+import logging
+import sqlite3
+from sqlite3 import Connection
+
+from log_service.config import LogServiceConfig
+
+logger = logging.getLogger(__name__)
+
+
+class SketchDatabaseAccessor:
+    """
+    Provides access to the EventSketches table, where the per time bucket approximate sketches are persisted.
+
+    Attributes:
+        config (LogServiceConfig): A configuration instance for accessing database settings.
+    """
+
+    def __init__(self) -> None:
+        self.config = LogServiceConfig.get_instance()
+
+    def save_sketches(
+        self,
+        rows: list[tuple[int, str, str, bytes]],
+        conn: Connection | None = None,
+        deleted_keys: list[tuple[int, str, str]] | None = None,
+    ) -> bool:
+        """
+        Inserts or replaces sketches, and deletes the ones no longer kept, in a single transaction.
+
+        Parameters:
+            rows (list[tuple[int, str, str, bytes]]): (bucket_start_utc, sketch_type, sketch_key, sketch_data) rows.
+            deleted_keys (list[tuple[int, str, str]] | None): (bucket_start_utc, sketch_type, sketch_key) of sketches
+                to delete.
+            conn (Connection | None): An optional existing database connection. If None, a new connection is established.
+
+        Returns:
+            bool: True if the sketches were saved, False otherwise.
+        """
+        close_connection = conn is None
+        if conn is None:
+            conn = sqlite3.connect(self.config.get_db_url())
+        try:
+            conn.executemany(
+                """INSERT INTO EventSketches (bucket_start_utc, sketch_type, sketch_key, sketch_data)
+                   VALUES (?, ?, ?, ?)
+                   ON CONFLICT (bucket_start_utc, sketch_type, sketch_key)
+                   DO UPDATE SET sketch_data = excluded.sketch_data""",
+                rows,
+            )
+            if deleted_keys:
+                conn.executemany(
+                    """DELETE FROM EventSketches
+                       WHERE bucket_start_utc = ? AND sketch_type = ? AND sketch_key = ?""",
+                    deleted_keys,
+                )
+            conn.commit()
+            return True
+
+        except sqlite3.Error as e:
+            logger.error(f"Error while saving sketches: {e}")
+            conn.rollback()
+            return False
+
+        finally:
+            if close_connection:
+                conn.close()
+
+    def load_sketches(
+        self,
+        bucket_start_utc: int,
+        bucket_end_utc: int,
+        exclude_buckets: list[int] | None = None,
+        sketch_keys: list[tuple[str, str]] | None = None,
+        conn: Connection | None = None,
+    ) -> dict[int, list[tuple[str, str, bytes]]]:
+        """
+        Loads the persisted sketches of the buckets starting within [bucket_start_utc, bucket_end_utc).
+
+        Parameters:
+            bucket_start_utc (int): Inclusive start of the bucket range.
+            bucket_end_utc (int): Exclusive end of the bucket range.
+            exclude_buckets (list[int] | None): Buckets to skip, e.g. the ones already held in memory.
+            sketch_keys (list[tuple[str, str]] | None): Only load these (sketch_type, sketch_key) sketches, all if None.
+            conn (Connection | None): An optional existing database connection. If None, a new connection is established.
+
+        Returns:
+            dict[int, list[tuple[str, str, bytes]]]: (sketch_type, sketch_key, sketch_data) rows per bucket start.
+
+        Raises:
+            sqlite3.Error: If an error occurs during the database query execution.
+        """
+        sql = """SELECT bucket_start_utc, sketch_type, sketch_key, sketch_data FROM EventSketches
+                 WHERE bucket_start_utc >= ? AND bucket_start_utc < ?"""
+        params: list = [bucket_start_utc, bucket_end_utc]
+        if exclude_buckets:
+            sql += f" AND bucket_start_utc NOT IN ({', '.join('?' * len(exclude_buckets))})"
+            params.extend(exclude_buckets)
+        if sketch_keys:
+            sql += f" AND (sketch_type, sketch_key) IN (VALUES {', '.join(['(?, ?)'] * len(sketch_keys))})"
+            params.extend(value for sketch_key in sketch_keys for value in sketch_key)
+
+        close_connection = conn is None
+        if conn is None:
+            conn = sqlite3.connect(self.config.get_db_url())
+        try:
+            sketches: dict[int, list[tuple[str, str, bytes]]] = {}
+            for bucket, sketch_type, sketch_key, sketch_data in conn.execute(
+                sql, params
+            ):
+                sketches.setdefault(bucket, []).append(
+                    (sketch_type, sketch_key, sketch_data)
+                )
+            return sketches
+
+        except sqlite3.Error as e:
+            logger.error(f"Error while loading sketches: {e}")
+            raise
+
+        finally:
+            if close_connection:
+                conn.close()
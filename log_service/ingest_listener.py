@@ -0,0 +1,292 @@
+import asyncio
+import logging
+import os
+import struct
+from threading import RLock
+
+import orjson
+from fastapi import HTTPException
+from pydantic import TypeAdapter, ValidationError
+
+from log_service.config import LogServiceConfig
+from log_service.controllers.auth_controller import AuthController
+from log_service.controllers.event_controller import EventController
+from log_service.data.request_models import CreateEventModel
+from log_service.monitoring.metrics import MetricsRegistry
+
+logger = logging.getLogger(__name__)
+
+FRAME_HEADER = struct.Struct(">I")
+# frames larger than this end the connection, a batch of MAX_BATCH_EVENTS events is far smaller
+MAX_FRAME_BYTES = 16 * 1024 * 1024
+HANDSHAKE_TIMEOUT_SECONDS = 10.0
+# accepted frames are acknowledged together, once the client pauses this long or this many frames are unacknowledged
+ACK_DELAY_SECONDS = 0.005
+ACK_MAX_FRAMES = 64
+# connections stop reading frames while the ingest queue holds this many events, so TCP pushes back on the agents
+FLOW_CONTROL_QUEUE_DEPTH = 200_000
+FLOW_CONTROL_POLL_SECONDS = 0.01
+
+metrics = MetricsRegistry.get_instance()
+INGEST_LISTENER_CONNECTIONS = metrics.gauge(
+    "log_service_ingest_listener_connections", "Open framed ingest connections."
+)
+INGEST_LISTENER_FRAMES = metrics.counter(
+    "log_service_ingest_listener_frames_total",
+    "Event frames received by the framed ingest listener, by status of their response.",
+    label_names=("status",),
+)
+INGEST_LISTENER_PAUSES = metrics.counter(
+    "log_service_ingest_listener_pauses_total",
+    "Times a framed ingest connection stopped reading because the ingest queue was full.",
+)
+
+EVENT_BATCH = TypeAdapter(list[CreateEventModel])
+
+
+class IngestListener:
+    """
+    Implements a singleton asyncio server taking event batches from co-located agents over a Unix domain socket or
+    a local TCP port, without the HTTP, JSON request model and per request token costs of `POST /event/batch`.
+
+    Both directions exchange frames: a 4-byte big-endian payload length, then an orjson payload.
+
+    - The client opens with a handshake frame `{"token": "<access token>"}`. The token is validated once, a
+      connection outliving it stays open. The server answers `{"status": 200}`, or an error status and closes.
+    - Every following client frame is a JSON array of events, in the schema of `POST /event/batch`, numbered 1, 2, ...
+      in the order sent. A frame is admitted like a batch request (rate limits, sampling, duplicate event_uuids) and
+      queued on the QueueProducer, all or nothing.
+    - Accepted frames are acknowledged together with `{"ack": n}`, covering every frame up to n that was not
+      rejected. A rejected frame is answered at once with `{"seq": n, "status": ..., "detail": ...}`, with the
+      status and detail `POST /event/batch` would answer, plus `"retry_after"` seconds for a 429. Acks are sent
+      once the client pauses for ACK_DELAY_SECONDS or ACK_MAX_FRAMES frames are unacknowledged.
+
+    A connection stops reading frames while the ingest queue holds FLOW_CONTROL_QUEUE_DEPTH events or more, so the
+    socket buffers fill up and agents block on sending instead of the queue growing without bound.
+
+    Attributes:
+        _instance (IngestListener, optional): Class variable to hold the singleton instance.
+        _lock (RLock): A reentrant lock to ensure thread-safe creation of the singleton instance.
+        event_controller (EventController): Admits and queues the received events.
+        servers (list[asyncio.Server]): The listening servers, empty while stopped.
+        connections (set[asyncio.Task]): The tasks serving the open connections.
+
+    Methods:
+        get_instance(): Returns the singleton instance of the IngestListener class.
+        start(): Starts listening on the configured socket path and port, if any.
+        stop(): Stops listening and closes the open connections.
+
+    Usage:
+        listener = IngestListener.get_instance()
+        await listener.start()
+        ...
+        await listener.stop()
+
+    Raises:
+        Exception: If an attempt is made to directly instantiate the class instead of using the `get_instance` method.
+    """
+
+    _instance = None
+    _lock: RLock = RLock()
+
+    def __init__(self) -> None:
+        if IngestListener._instance:
+            raise Exception("This class is a singleton!")
+        self.event_controller = EventController()
+        self.servers: list[asyncio.Server] = []
+        self.connections: set[asyncio.Task] = set()
+        self._socket_path: str | None = None
+        INGEST_LISTENER_CONNECTIONS.set_function(lambda: len(self.connections))
+        IngestListener._instance = self
+
+    @classmethod
+    def get_instance(cls) -> "IngestListener":
+        """
+        Retrieves the singleton instance of the IngestListener class, creating it if it does not already exist.
+
+        Returns:
+            IngestListener: The singleton instance of the class.
+        """
+        if not cls._instance:
+            with cls._lock:
+                if not cls._instance:
+                    cls._instance = IngestListener()
+        return cls._instance
+
+    async def start(self) -> None:
+        """Starts listening on the configured Unix socket path and local TCP port, nothing if neither is set."""
+        if self.servers:
+            return
+        socket_path, port = LogServiceConfig.get_ingest_listener_address()
+        if socket_path:
+            self.servers.append(
+                await asyncio.start_unix_server(
+                    self._serve, path=socket_path, limit=MAX_FRAME_BYTES
+                )
+            )
+            self._socket_path = socket_path
+            logger.info(f"Ingest listener accepting connections on {socket_path}")
+        if port is not None:
+            self.servers.append(
+                await asyncio.start_server(
+                    self._serve, host="127.0.0.1", port=port, limit=MAX_FRAME_BYTES
+                )
+            )
+            logger.info(f"Ingest listener accepting connections on 127.0.0.1:{port}")
+
+    async def stop(self) -> None:
+        """
+        Stops accepting connections and closes the open ones, acknowledging the frames they queued. Frames still
+        in flight are not acknowledged, their agents send them again.
+        """
+        for server in self.servers:
+            server.close()
+        for connection in list(self.connections):
+            connection.cancel()
+        await asyncio.gather(*self.connections, return_exceptions=True)
+        for server in self.servers:
+            await server.wait_closed()
+        self.servers.clear()
+        if self._socket_path and os.path.exists(self._socket_path):
+            os.remove(self._socket_path)
+        self._socket_path = None
+
+    async def _serve(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        connection = asyncio.current_task()
+        self.connections.add(connection)
+        received = acked = 0
+        try:
+            if not await self._handshake(reader, writer):
+                return
+            while True:
+                if len(self.event_controller.queue_processor.event_queue) >= (
+                    FLOW_CONTROL_QUEUE_DEPTH
+                ):
+                    acked = await self._ack(writer, received, acked)
+                    await self._wait_for_queue_capacity()
+                try:
+                    if received == acked:
+                        header = await reader.readexactly(FRAME_HEADER.size)
+                    else:
+                        header = await asyncio.wait_for(
+                            reader.readexactly(FRAME_HEADER.size), ACK_DELAY_SECONDS
+                        )
+                except asyncio.TimeoutError:
+                    acked = await self._ack(writer, received, acked)
+                    continue
+                (length,) = FRAME_HEADER.unpack(header)
+                if length > MAX_FRAME_BYTES:
+                    await self._ack(writer, received, acked)
+                    await self._send(
+                        writer,
+                        {
+                            "seq": received + 1,
+                            "status": 413,
+                            "detail": f"Frames must not exceed {MAX_FRAME_BYTES} bytes.",
+                        },
+                    )
+                    return
+                payload = await reader.readexactly(length)
+                received += 1
+
+                error = self._ingest(payload)
+                INGEST_LISTENER_FRAMES.labels(error["status"] if error else 200).inc()
+                if error:
+                    await self._ack(writer, received - 1, acked)
+                    await self._send(writer, {"seq": received, **error})
+                    acked = received
+                elif received - acked >= ACK_MAX_FRAMES:
+                    acked = await self._ack(writer, received, acked)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            # the client closed the connection, the frames it sent last are acknowledged below if it still reads
+            pass
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.error(f"Serving an ingest connection failed: {e}", exc_info=True)
+        finally:
+            if received > acked and not writer.is_closing():
+                writer.write(self._frame({"ack": received}))
+            writer.close()
+            self.connections.discard(connection)
+
+    async def _handshake(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> bool:
+        try:
+            (length,) = FRAME_HEADER.unpack(
+                await asyncio.wait_for(
+                    reader.readexactly(FRAME_HEADER.size), HANDSHAKE_TIMEOUT_SECONDS
+                )
+            )
+            if length > MAX_FRAME_BYTES:
+                raise ValueError("handshake frame too large")
+            handshake = orjson.loads(
+                await asyncio.wait_for(
+                    reader.readexactly(length), HANDSHAKE_TIMEOUT_SECONDS
+                )
+            )
+            token = handshake.get("token")
+            if not isinstance(token, str):
+                raise ValueError("handshake without a token")
+        except (asyncio.TimeoutError, ValueError, AttributeError):
+            await self._send(
+                writer, {"status": 400, "detail": "Expected a handshake frame."}
+            )
+            return False
+
+        try:
+            AuthController.validate_token(token)
+        except HTTPException as e:
+            await self._send(writer, {"status": e.status_code, "detail": e.detail})
+            return False
+        await self._send(writer, {"status": 200})
+        return True
+
+    def _ingest(self, payload: bytes) -> dict | None:
+        """Queues the events of a frame, returning the error response if the frame is rejected."""
+        try:
+            events = EVENT_BATCH.validate_json(payload)
+            self.event_controller.create_events(events)
+        except ValidationError as e:
+            return {
+                "status": 422,
+                "detail": e.errors(include_url=False, include_context=False),
+            }
+        except HTTPException as e:
+            error = {"status": e.status_code, "detail": e.detail}
+            if e.headers and "Retry-After" in e.headers:
+                error["retry_after"] = int(e.headers["Retry-After"])
+            return error
+        except Exception as e:
+            logger.error(f"Queuing an event frame failed: {e}", exc_info=True)
+            return {
+                "status": 500,
+                "detail": "Failed to process events, Something went wrong. Please try again",
+            }
+        return None
+
+    async def _wait_for_queue_capacity(self) -> None:
+        INGEST_LISTENER_PAUSES.inc()
+        event_queue = self.event_controller.queue_processor.event_queue
+        while len(event_queue) >= FLOW_CONTROL_QUEUE_DEPTH:
+            await asyncio.sleep(FLOW_CONTROL_POLL_SECONDS)
+
+    async def _ack(
+        self, writer: asyncio.StreamWriter, received: int, acked: int
+    ) -> int:
+        """Acknowledges the frames up to `received`, if any are unacknowledged, and returns the new ack."""
+        if received > acked:
+            await self._send(writer, {"ack": received})
+        return max(received, acked)
+
+    async def _send(self, writer: asyncio.StreamWriter, message: dict) -> None:
+        writer.write(self._frame(message))
+        await writer.drain()
+
+    @staticmethod
+    def _frame(message: dict) -> bytes:
+        payload = orjson.dumps(message)
+        return FRAME_HEADER.pack(len(payload)) + payload
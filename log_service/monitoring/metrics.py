@@ -0,0 +1,301 @@
+import math
+from bisect import bisect_left
+from threading import Lock, RLock
+from typing import Any, Callable, Iterable, TypeVar
+
+LATENCY_BUCKETS_SECONDS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+M = TypeVar("M", bound="_Metric")
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(label_names: tuple[str, ...], label_values: tuple[str, ...]) -> str:
+    if not label_names:
+        return ""
+    pairs = ",".join(
+        f'{name}="{_escape(value)}"' for name, value in zip(label_names, label_values)
+    )
+    return "{" + pairs + "}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+class _Metric:
+    """
+    A metric family: one child per combination of label values. Children are created once under the family lock,
+    updates only take the lock of their child, so unrelated metrics never contend.
+
+    A family can instead be backed by a function evaluated at scrape time (`set_function`), for values that
+    already exist elsewhere (e.g. a queue length), which costs nothing on the hot path.
+    """
+
+    metric_type = ""
+
+    def __init__(
+        self, name: str, documentation: str, label_names: Iterable[str] = ()
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._children: dict[tuple[str, ...], Any] = {}
+        self._children_lock = Lock()
+        self._lock = Lock()
+        self._function: Callable[[], float] | None = None
+
+    def labels(self: M, *label_values: object) -> M:
+        """Returns the child of the given label values, in the order of the label names."""
+        key = tuple(str(value) for value in label_values)
+        child = self._children.get(key)
+        if child is None:
+            with self._children_lock:
+                child = self._children.get(key)
+                if child is None:
+                    child = self._new_child()
+                    self._children[key] = child
+        return child
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        self._function = function
+
+    def _new_child(self: M) -> M:
+        return type(self)(self.name, self.documentation)
+
+    def _samples(self) -> Iterable[tuple[str, str, float]]:
+        """Yields (name suffix, extra labels, value) samples of an unlabeled metric."""
+        raise NotImplementedError
+
+    def render(self) -> list[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.metric_type}",
+        ]
+        if self._function is not None:
+            lines.append(f"{self.name} {_format_value(self._function())}")
+            return lines
+
+        if self.label_names:
+            children = sorted(self._children.items())
+        else:
+            children = [((), self)]
+        for label_values, child in children:
+            labels = _format_labels(self.label_names, label_values)
+            for suffix, extra_labels, value in child._samples():
+                if extra_labels:
+                    labels_with_extra = (
+                        labels[:-1] + "," + extra_labels + "}"
+                        if labels
+                        else "{" + extra_labels + "}"
+                    )
+                else:
+                    labels_with_extra = labels
+                lines.append(
+                    f"{self.name}{suffix}{labels_with_extra} {_format_value(value)}"
+                )
+        return lines
+
+
+class Counter(_Metric):
+    """A monotonically increasing count, e.g. of committed events; rates are derived from it at query time."""
+
+    metric_type = "counter"
+
+    def __init__(
+        self, name: str, documentation: str, label_names: Iterable[str] = ()
+    ) -> None:
+        super().__init__(name, documentation, label_names)
+        self.value = 0.0
+
+    def inc(self, amount: float = 1) -> None:
+        with self._lock:
+            self.value += amount
+
+    def _samples(self) -> Iterable[tuple[str, str, float]]:
+        # children of a labeled gauge may be backed by a function too, e.g. one per queue lane
+        yield "", "", self._function() if self._function is not None else self.value
+
+
+class Gauge(_Metric):
+    """A value that goes up and down, e.g. the number of queued bytes."""
+
+    metric_type = "gauge"
+
+    def __init__(
+        self, name: str, documentation: str, label_names: Iterable[str] = ()
+    ) -> None:
+        super().__init__(name, documentation, label_names)
+        self.value = 0.0
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def inc(self, amount: float = 1) -> None:
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        self.inc(-amount)
+
+    def _samples(self) -> Iterable[tuple[str, str, float]]:
+        # children of a labeled gauge may be backed by a function too, e.g. one per queue lane
+        yield "", "", self._function() if self._function is not None else self.value
+
+
+class Histogram(_Metric):
+    """
+    Counts observations (e.g. latencies) into cumulative buckets with fixed upper bounds, plus their sum and count.
+    """
+
+    metric_type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        label_names: Iterable[str] = (),
+        buckets: Iterable[float] = LATENCY_BUCKETS_SECONDS,
+    ) -> None:
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets))
+        self.bucket_counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        # bucket i counts the observations <= buckets[i], the last one the rest (+Inf)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.bucket_counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def _new_child(self) -> "Histogram":
+        return Histogram(self.name, self.documentation, buckets=self.buckets)
+
+    def _samples(self) -> Iterable[tuple[str, str, float]]:
+        with self._lock:
+            bucket_counts = list(self.bucket_counts)
+            total, count = self.sum, self.count
+        cumulative = 0
+        for upper_bound, bucket_count in zip(self.buckets + (math.inf,), bucket_counts):
+            cumulative += bucket_count
+            yield "_bucket", f'le="{_format_value(upper_bound)}"', cumulative
+        yield "_sum", "", total
+        yield "_count", "", count
+
+
+class MetricsRegistry:
+    """
+    Implements a thread-safe singleton registry of the service metrics, rendered in the Prometheus text format
+    by the /metrics endpoint.
+
+    Metrics are registered once, typically at module import, and updated without touching the registry. The
+    `counter`, `gauge` and `histogram` methods return the already registered metric of a name, so a module can be
+    reloaded (or a singleton re-created in tests) without duplicating series.
+
+    Attributes:
+        _instance (MetricsRegistry, optional): Class variable to hold the singleton instance.
+        _lock (RLock): A reentrant lock guarding the singleton instance and the registered metrics.
+        metrics (dict[str, _Metric]): The registered metrics by name.
+
+    Usage:
+        metrics = MetricsRegistry.get_instance()
+        events_committed = metrics.counter("log_service_events_committed_total", "Events committed.")
+        events_committed.inc(len(events))
+
+    Raises:
+        Exception: If an attempt is made to directly instantiate the class instead of using the `get_instance` method.
+    """
+
+    _instance = None
+    _lock: RLock = RLock()
+
+    def __init__(self) -> None:
+        if MetricsRegistry._instance:
+            raise Exception("This class is a singleton!")
+        self.metrics: dict[str, _Metric] = {}
+        MetricsRegistry._instance = self
+
+    @classmethod
+    def get_instance(cls) -> "MetricsRegistry":
+        """
+        Retrieves the singleton instance of the MetricsRegistry class, creating it if it does not already exist.
+
+        Returns:
+            MetricsRegistry: The singleton instance of the class.
+        """
+        if not cls._instance:
+            with cls._lock:
+                if not cls._instance:
+                    cls._instance = MetricsRegistry()
+        return cls._instance
+
+    def counter(
+        self, name: str, documentation: str, label_names: Iterable[str] = ()
+    ) -> Counter:
+        return self._register(Counter(name, documentation, label_names))
+
+    def gauge(
+        self, name: str, documentation: str, label_names: Iterable[str] = ()
+    ) -> Gauge:
+        return self._register(Gauge(name, documentation, label_names))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        label_names: Iterable[str] = (),
+        buckets: Iterable[float] = LATENCY_BUCKETS_SECONDS,
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, label_names, buckets))
+
+    def render(self) -> str:
+        """
+        Renders all registered metrics in the Prometheus text exposition format.
+
+        Returns:
+            str: The exposition, served with CONTENT_TYPE.
+        """
+        with self._lock:
+            metrics = list(self.metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def _register(self, metric: M) -> M:
+        with self._lock:
+            registered = self.metrics.get(metric.name)
+            if registered is not None:
+                if type(registered) is not type(metric):
+                    raise ValueError(
+                        f"Metric {metric.name} is already registered as a {registered.metric_type}"
+                    )
+                return registered  # type: ignore[return-value]
+            self.metrics[metric.name] = metric
+            return metric
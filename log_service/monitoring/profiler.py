@@ -0,0 +1,104 @@
+import sys
+import threading
+import time
+from collections import Counter
+from threading import Lock
+
+MAX_PROFILE_SECONDS = 30
+MIN_SAMPLE_INTERVAL_SECONDS = 0.001
+PROFILE_REPORT_SIZE = 50
+
+
+class ProfilerBusyError(Exception):
+    """Raised when a profile is requested while another one is running."""
+
+
+class StackSampler:
+    """
+    A sampling profiler for the live process: it records the stacks of all other threads every `interval_seconds`
+    for `duration_seconds` and aggregates them.
+
+    Unlike cProfile it does not instrument function calls, so the profiled process runs at full speed apart from the
+    sampling thread itself, and it sees every thread (event loop, threadpools, read executor, queue consumer). Only
+    one profile runs at a time.
+
+    Attributes:
+        duration_seconds (float): How long to sample, capped to MAX_PROFILE_SECONDS.
+        interval_seconds (float): Time between samples, at least MIN_SAMPLE_INTERVAL_SECONDS.
+    """
+
+    _running_lock = Lock()
+
+    def __init__(self, duration_seconds: float, interval_seconds: float) -> None:
+        self.duration_seconds = min(max(duration_seconds, 0.0), MAX_PROFILE_SECONDS)
+        self.interval_seconds = max(interval_seconds, MIN_SAMPLE_INTERVAL_SECONDS)
+
+    def run(self) -> dict:
+        """
+        Samples the process and returns the aggregated report.
+
+        Returns:
+            dict: The number of samples, the functions with the most samples on top of the stack (self) and anywhere in
+            it (total), and the most frequent stacks in folded format ("outer;...;inner"), as used by flame graph tools.
+
+        Raises:
+            ProfilerBusyError: If another profile is running.
+        """
+        if not self._running_lock.acquire(blocking=False):
+            raise ProfilerBusyError("A profile is already running.")
+        try:
+            return self._sample()
+        finally:
+            self._running_lock.release()
+
+    def _sample(self) -> dict:
+        own_thread_id = threading.get_ident()
+        stacks: Counter[tuple[str, ...]] = Counter()
+        samples = 0
+        started_at = time.perf_counter()
+        deadline = started_at + self.duration_seconds
+
+        while time.perf_counter() < deadline:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_thread_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(
+                        f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})"
+                    )
+                    frame = frame.f_back
+                stacks[tuple(reversed(stack))] += 1
+            samples += 1
+            time.sleep(self.interval_seconds)
+
+        self_samples: Counter[str] = Counter()
+        total_samples: Counter[str] = Counter()
+        for stack, count in stacks.items():
+            self_samples[stack[-1]] += count
+            # a recursive function counts once per stack
+            for function in set(stack):
+                total_samples[function] += count
+
+        return {
+            "duration_seconds": round(time.perf_counter() - started_at, 3),
+            "interval_seconds": self.interval_seconds,
+            "samples": samples,
+            "top_functions": [
+                {
+                    "function": function,
+                    "self_samples": count,
+                    "total_samples": total_samples[function],
+                }
+                for function, count in self_samples.most_common(PROFILE_REPORT_SIZE)
+            ],
+            "top_total_functions": [
+                {"function": function, "total_samples": count}
+                for function, count in total_samples.most_common(PROFILE_REPORT_SIZE)
+            ],
+            "stacks": [
+                {"stack": ";".join(stack), "samples": count}
+                for stack, count in stacks.most_common(PROFILE_REPORT_SIZE)
+            ],
+        }
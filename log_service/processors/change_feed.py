@@ -0,0 +1,193 @@
+import asyncio
+from collections import deque
+from threading import RLock
+
+from log_service.monitoring.metrics import MetricsRegistry
+
+# committed events buffered for a subscriber that has not read them yet, beyond that it is too slow to follow
+SUBSCRIBER_BUFFER_SIZE = 10_000
+
+metrics = MetricsRegistry.get_instance()
+CHANGE_FEED_SUBSCRIBERS = metrics.gauge(
+    "log_service_change_feed_subscribers", "Open change feed subscriptions."
+)
+CHANGE_FEED_OVERFLOWS = metrics.counter(
+    "log_service_change_feed_overflows_total",
+    "Times a subscriber fell more than SUBSCRIBER_BUFFER_SIZE events behind.",
+)
+
+
+class ChangeFeedSubscription:
+    """
+    The committed events of one subscriber that it has not read yet, matching its filters, as (id, event_type,
+    timestamp_utc, customer_id, event_data) rows in commit order.
+
+    Rows are pushed by the consumer thread and read on the event loop of the subscriber. The buffer holds at most
+    SUBSCRIBER_BUFFER_SIZE rows: a push beyond that drops the buffer and marks the subscription `overflowed`, and
+    later pushes are ignored until `resume`, so a stalled subscriber costs bounded memory and never slows down the
+    consumer. The events it missed are committed, so they can be read back from the database.
+
+    Attributes:
+        event_type (str | None): Only events of this type are pushed, if set.
+        customer_id (int | None): Only events of this customer are pushed, if set.
+        overflowed (bool): Set once the subscriber fell behind by more than the buffer.
+        closed (bool): Set once no more rows will be pushed.
+    """
+
+    def __init__(
+        self,
+        event_type: str | None,
+        customer_id: int | None,
+        loop: asyncio.AbstractEventLoop,
+        buffer_size: int = SUBSCRIBER_BUFFER_SIZE,
+    ):
+        self.event_type = event_type
+        self.customer_id = customer_id
+        self.buffer_size = buffer_size
+        self.overflowed = False
+        self.closed = False
+        self._rows: deque[tuple] = deque()
+        self._loop = loop
+        self._wakeup = asyncio.Event()
+
+    def matches(self, row: tuple) -> bool:
+        return (not self.event_type or row[1] == self.event_type) and (
+            not self.customer_id or row[3] == self.customer_id
+        )
+
+    def push(self, rows: list[tuple]) -> None:
+        if self.closed or self.overflowed:
+            return
+        matching = [row for row in rows if self.matches(row)]
+        if not matching:
+            return
+        if len(self._rows) + len(matching) > self.buffer_size:
+            self.overflowed = True
+            self._rows.clear()
+            CHANGE_FEED_OVERFLOWS.inc()
+        else:
+            self._rows.extend(matching)
+        self._wake()
+
+    def resume(self) -> None:
+        """Starts buffering again after an overflow, the missed events have to be read from the database."""
+        self.overflowed = False
+
+    def close(self) -> None:
+        self.closed = True
+        self._wake()
+
+    async def next_rows(self, timeout: float) -> list[tuple]:
+        """
+        Waits up to `timeout` seconds for rows and returns the buffered ones, or none if the subscription
+        overflowed or was closed meanwhile.
+        """
+        if not self._rows and not self.closed and not self.overflowed:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        self._wakeup.clear()
+        rows = []
+        # deque pops are atomic, the consumer thread may push meanwhile
+        while self._rows:
+            rows.append(self._rows.popleft())
+        return rows
+
+    def _wake(self) -> None:
+        try:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+        except RuntimeError:
+            # the subscriber's event loop is closed, it is not listening anymore
+            self.closed = True
+
+
+class ChangeFeedHub:
+    """
+    Implements a thread-safe singleton fanning out committed events to change feed subscribers, e.g. the
+    `GET /event/stream` server-sent event streams.
+
+    The QueueConsumer publishes every committed batch with the ids of its events, and the hub pushes the matching
+    rows to every subscription. Publishing only touches in-memory buffers, a subscriber never blocks the consumer,
+    and the consumer only pays for returning ids while someone is subscribed (see `has_subscribers`).
+
+    Rows of retried events stored before (see `EventDatabaseAccessor.save_events_returning_ids`) are published
+    with the id of the stored event, subscribers skip ids they are past.
+
+    Attributes:
+        _instance (ChangeFeedHub, optional): Class variable to hold the singleton instance.
+        _lock (RLock): A reentrant lock guarding the singleton instance and the subscriptions.
+        subscriptions (set[ChangeFeedSubscription]): The open subscriptions.
+
+    Methods:
+        get_instance(): Returns the singleton instance of the ChangeFeedHub class.
+        subscribe(event_type, customer_id): Opens a subscription, to be called on the subscriber's event loop.
+        unsubscribe(subscription): Closes a subscription.
+        publish(rows): Pushes committed event rows to the subscriptions.
+        close(): Closes all subscriptions, e.g. on shutdown.
+
+    Raises:
+        Exception: If an attempt is made to directly instantiate the class instead of using the `get_instance` method.
+    """
+
+    _instance = None
+    _lock: RLock = RLock()
+
+    def __init__(self) -> None:
+        if ChangeFeedHub._instance:
+            raise Exception("This class is a singleton!")
+        self.subscriptions: set[ChangeFeedSubscription] = set()
+        CHANGE_FEED_SUBSCRIBERS.set_function(lambda: len(self.subscriptions))
+        ChangeFeedHub._instance = self
+
+    @classmethod
+    def get_instance(cls) -> "ChangeFeedHub":
+        """
+        Retrieves the singleton instance of the ChangeFeedHub class, creating it if it does not already exist.
+
+        Returns:
+            ChangeFeedHub: The singleton instance of the class.
+        """
+        if not cls._instance:
+            with cls._lock:
+                if not cls._instance:
+                    cls._instance = ChangeFeedHub()
+        return cls._instance
+
+    @property
+    def has_subscribers(self) -> bool:
+        return bool(self.subscriptions)
+
+    def subscribe(
+        self, event_type: str | None = None, customer_id: int | None = None
+    ) -> ChangeFeedSubscription:
+        subscription = ChangeFeedSubscription(
+            event_type, customer_id, asyncio.get_running_loop()
+        )
+        with self._lock:
+            self.subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: ChangeFeedSubscription) -> None:
+        with self._lock:
+            self.subscriptions.discard(subscription)
+        subscription.close()
+
+    def publish(self, rows: list[tuple]) -> None:
+        """
+        Pushes committed event rows to the subscriptions they match.
+
+        Parameters:
+            rows (list[tuple]): (id, event_type, timestamp_utc, customer_id, event_data) rows, in commit order.
+        """
+        with self._lock:
+            subscriptions = list(self.subscriptions)
+        for subscription in subscriptions:
+            subscription.push(rows)
+
+    def close(self) -> None:
+        with self._lock:
+            subscriptions = list(self.subscriptions)
+            self.subscriptions.clear()
+        for subscription in subscriptions:
+            subscription.close()
@@ -0,0 +1,245 @@
+import hashlib
+import logging
+import math
+import sqlite3
+import time
+from threading import RLock
+
+import numpy as np
+
+from log_service.config import LogServiceConfig
+from log_service.data.event_dto import EventQueueDTO
+from log_service.db_accessors.event_db_accessor import EventDatabaseAccessor
+from log_service.monitoring.metrics import MetricsRegistry
+
+logger = logging.getLogger(__name__)
+
+DEDUP_WINDOW_SECONDS = 3600
+# event ids per generation, ~1.2 MB of bits at the error rate below
+DEDUP_BLOOM_CAPACITY = 1_000_000
+DEDUP_BLOOM_ERROR_RATE = 0.01
+DEDUP_BLOOM_GENERATIONS = 2
+
+metrics = MetricsRegistry.get_instance()
+DUPLICATE_EVENTS = metrics.counter(
+    "log_service_duplicate_events_total",
+    "Events dropped at ingest because their event_uuid was received before.",
+)
+DEDUP_INDEX_PROBES = metrics.counter(
+    "log_service_dedup_index_probes_total",
+    "Event ids the Bloom filter could not rule out, looked up in the event_uuid index.",
+)
+
+
+class BloomFilter:
+    """
+    Bloom filter over string keys. `might_contain` never misses an added key, and reports a key that was not added
+    with probability `error_rate` once `capacity` keys are added.
+
+    The bit positions of a key come from double hashing one 128-bit blake2b digest, so every key is hashed once
+    however many bits it sets.
+    """
+
+    def __init__(
+        self,
+        capacity: int = DEDUP_BLOOM_CAPACITY,
+        error_rate: float = DEDUP_BLOOM_ERROR_RATE,
+    ):
+        self.capacity = capacity
+        self.bit_count = max(
+            64, int(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        )
+        self.hash_count = max(1, round(self.bit_count / capacity * math.log(2)))
+        self.bits = np.zeros((self.bit_count + 7) // 8, dtype=np.uint8)
+        self.count = 0
+
+    def _positions(self, keys: list[str]) -> np.ndarray:
+        """Returns a (len(keys), hash_count) array with the bit positions of every key."""
+        digests = np.frombuffer(
+            b"".join(
+                hashlib.blake2b(key.encode(), digest_size=16).digest() for key in keys
+            ),
+            dtype=np.uint64,
+        ).reshape(-1, 2)
+        with np.errstate(over="ignore"):
+            positions = digests[:, :1] + digests[:, 1:] * np.arange(
+                self.hash_count, dtype=np.uint64
+            )
+        return (positions % np.uint64(self.bit_count)).astype(np.int64)
+
+    def add(self, keys: list[str]) -> None:
+        if not keys:
+            return
+        positions = self._positions(keys).ravel()
+        np.bitwise_or.at(
+            self.bits, positions >> 3, (1 << (positions & 7)).astype(np.uint8)
+        )
+        self.count += len(keys)
+
+    def might_contain(self, keys: list[str]) -> np.ndarray:
+        if not keys:
+            return np.zeros(0, dtype=bool)
+        positions = self._positions(keys)
+        is_set = (self.bits[positions >> 3] >> (positions & 7)) & 1
+        return is_set.all(axis=1)
+
+
+class RotatingBloomFilter:
+    """
+    Bloom filter over the keys added in the last DEDUP_WINDOW_SECONDS, bounded in memory however long it runs.
+
+    Keys are added to the newest of DEDUP_BLOOM_GENERATIONS filters, and looked up in all of them. A new generation
+    starts when the newest one is DEDUP_WINDOW_SECONDS old or holds its capacity, dropping the oldest, so a key is
+    remembered for at least one window and the error rate stays bounded under any ingest rate.
+    """
+
+    def __init__(
+        self,
+        window_seconds: float = DEDUP_WINDOW_SECONDS,
+        capacity: int = DEDUP_BLOOM_CAPACITY,
+        error_rate: float = DEDUP_BLOOM_ERROR_RATE,
+        generations: int = DEDUP_BLOOM_GENERATIONS,
+    ):
+        self.window_seconds = window_seconds
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.max_generations = generations
+        self.generations: list[BloomFilter] = [BloomFilter(capacity, error_rate)]
+        self.generation_started_at = time.monotonic()
+
+    def rotate_if_due(self) -> None:
+        newest = self.generations[0]
+        if (
+            time.monotonic() - self.generation_started_at < self.window_seconds
+            and newest.count < newest.capacity
+        ):
+            return
+        self.generations.insert(0, BloomFilter(self.capacity, self.error_rate))
+        del self.generations[self.max_generations :]
+        self.generation_started_at = time.monotonic()
+
+    def add(self, keys: list[str]) -> None:
+        self.rotate_if_due()
+        self.generations[0].add(keys)
+
+    def might_contain(self, keys: list[str]) -> np.ndarray:
+        self.rotate_if_due()
+        result = np.zeros(len(keys), dtype=bool)
+        for generation in self.generations:
+            result |= generation.might_contain(keys)
+        return result
+
+
+class EventDeduplicator:
+    """
+    Implements a thread-safe singleton that drops events whose client supplied event_uuid was received before,
+    so clients can retry on timeouts without duplicating audit events.
+
+    A RotatingBloomFilter of the recently received event ids sits in front of the database: an id it rules out,
+    the common case, is new without any database lookup. Only the ids the filter cannot rule out (retries, and
+    about DEDUP_BLOOM_ERROR_RATE of new ids) are looked up in the unique event_uuid index. The index is the source
+    of truth: a duplicate still queued, or older than the filter's window, is dropped by the insert itself (see
+    `EventDatabaseAccessor.save_events_to_db`).
+
+    Attributes:
+        _instance (EventDeduplicator, optional): Class variable to hold the singleton instance.
+        _lock (RLock): A reentrant lock guarding the singleton instance, the filter and the connection.
+        config (LogServiceConfig): Configuration instance for accessing the database.
+        database_accessor (EventDatabaseAccessor): Accessor used to look up probable duplicates.
+        recent_event_uuids (RotatingBloomFilter): The event ids received in the last window.
+        conn (sqlite3.Connection | None): The connection of the lookups, opened on the first probable duplicate.
+
+    Methods:
+        get_instance(): Returns the singleton instance of the EventDeduplicator class.
+        drop_duplicates(events: list[EventQueueDTO]): Returns the events that were not received before.
+
+    Raises:
+        Exception: If an attempt is made to directly instantiate the class instead of using the `get_instance` method.
+    """
+
+    _instance = None
+    _lock: RLock = RLock()
+
+    def __init__(self) -> None:
+        if EventDeduplicator._instance:
+            raise Exception("This class is a singleton!")
+        self.config = LogServiceConfig.get_instance()
+        self.database_accessor = EventDatabaseAccessor()
+        self.recent_event_uuids = RotatingBloomFilter()
+        self.conn: sqlite3.Connection | None = None
+        EventDeduplicator._instance = self
+
+    @classmethod
+    def get_instance(cls) -> "EventDeduplicator":
+        """
+        Retrieves the singleton instance of the EventDeduplicator class, creating it if it does not already exist.
+
+        Returns:
+            EventDeduplicator: The singleton instance of the class.
+        """
+        if not cls._instance:
+            with cls._lock:
+                if not cls._instance:
+                    cls._instance = EventDeduplicator()
+        return cls._instance
+
+    def drop_duplicates(self, events: list[EventQueueDTO]) -> list[EventQueueDTO]:
+        """
+        Returns the events that were not received before, in order. Events without an event_uuid are always kept,
+        and of several events with the same event_uuid in `events` only the first is kept.
+
+        Parameters:
+            events (list[EventQueueDTO]): The received events.
+
+        Returns:
+            list[EventQueueDTO]: The events to enqueue.
+        """
+        event_uuids = [
+            event.event_uuid for event in events if event.event_uuid is not None
+        ]
+        if not event_uuids:
+            return events
+
+        with self._lock:
+            might_be_seen = self.recent_event_uuids.might_contain(event_uuids)
+            probable_duplicates = [
+                event_uuid
+                for event_uuid, is_probable in zip(event_uuids, might_be_seen)
+                if is_probable
+            ]
+            stored = self._stored_event_uuids(probable_duplicates)
+
+            kept = []
+            kept_event_uuids = set()
+            for event in events:
+                if event.event_uuid is None:
+                    kept.append(event)
+                elif (
+                    event.event_uuid not in stored
+                    and event.event_uuid not in kept_event_uuids
+                ):
+                    kept.append(event)
+                    kept_event_uuids.add(event.event_uuid)
+            self.recent_event_uuids.add(list(kept_event_uuids))
+
+        if len(kept) < len(events):
+            DUPLICATE_EVENTS.inc(len(events) - len(kept))
+        return kept
+
+    def _stored_event_uuids(self, event_uuids: list[str]) -> set[str]:
+        if not event_uuids:
+            return set()
+        DEDUP_INDEX_PROBES.inc(len(event_uuids))
+        try:
+            if self.conn is None:
+                # lookups only run under `_lock`, from whichever thread receives the events
+                self.conn = sqlite3.connect(
+                    self.config.get_db_url(), check_same_thread=False
+                )
+            return self.database_accessor.get_stored_event_uuids(
+                event_uuids, conn=self.conn
+            )
+        except sqlite3.Error as e:
+            # the unique index still drops the duplicates on insert
+            logger.warning(f"Looking up probable duplicate events failed: {e}")
+            return set()
@@ -0,0 +1,293 @@
+import logging
+from sqlite3 import Connection
+from threading import RLock
+
+from log_service.data.merkle import (
+    GENESIS_CHAIN_HASH,
+    chain_hash,
+    inclusion_path,
+    leaf_hash,
+    merkle_root,
+)
+from log_service.db_accessors.integrity_db_accessor import IntegrityDatabaseAccessor
+from log_service.monitoring.metrics import MetricsRegistry
+
+logger = logging.getLogger(__name__)
+
+# the most batches checked by one verification run, a run reads all events of its batches
+VERIFY_BATCHES_PER_RUN = 1000
+
+INTEGRITY_FAILURES = MetricsRegistry.get_instance().counter(
+    "log_service_integrity_failures_total",
+    "Sealed batches found tampered with by the integrity verifier.",
+)
+
+
+class IntegrityVerifier:
+    """
+    Implements a thread-safe singleton proving and verifying the hash chain of sealed event batches (see
+    `IntegrityDatabaseAccessor.seal_batch`).
+
+    A batch is intact if its stored events still hash to its Merkle root, its chain hash follows from the chain hash
+    of the batch before it, and no events were slipped in between the two. Verification is incremental: `verify`
+    continues from the last batch it found intact (its checkpoint), so every batch is read once, and a caller
+    holding a checkpoint of its own, e.g. an auditor, passes it instead. `verify_range` checks the batches of an id
+    range, anchored on the stored chain hash of the batch before it.
+
+    The chain proves the stored events unchanged since they were sealed relative to a trusted chain hash: record the
+    head (`get_head`) outside the database from time to time, a rewrite of the whole chain then no longer matches.
+
+    Attributes:
+        _instance (IntegrityVerifier, optional): Class variable to hold the singleton instance.
+        _lock (RLock): A reentrant lock guarding the singleton instance and the checkpoint.
+        accessor (IntegrityDatabaseAccessor): Reads the batches and the sealed events.
+        verified_batch_id (int): The last batch found intact, 0 before the first run.
+        verified_chain_hash (bytes): Its chain hash.
+
+    Methods:
+        get_instance(): Returns the singleton instance of the IntegrityVerifier class.
+        get_head(): Returns the newest batch.
+        get_inclusion_proof(event_id): Returns the O(log n) inclusion proof of a sealed event.
+        verify(after_batch_id, chain_hash_hex, max_batches): Verifies the batches after a checkpoint.
+        verify_range(start_event_id, end_event_id): Verifies the batches sealing an id range.
+
+    Raises:
+        Exception: If an attempt is made to directly instantiate the class instead of using the `get_instance` method.
+    """
+
+    _instance = None
+    _lock: RLock = RLock()
+
+    def __init__(self) -> None:
+        if IntegrityVerifier._instance:
+            raise Exception("This class is a singleton!")
+        self.accessor = IntegrityDatabaseAccessor()
+        self.verified_batch_id = 0
+        self.verified_chain_hash = GENESIS_CHAIN_HASH
+        IntegrityVerifier._instance = self
+
+    @classmethod
+    def get_instance(cls) -> "IntegrityVerifier":
+        """
+        Retrieves the singleton instance of the IntegrityVerifier class, creating it if it does not already exist.
+
+        Returns:
+            IntegrityVerifier: The singleton instance of the class.
+        """
+        if not cls._instance:
+            with cls._lock:
+                if not cls._instance:
+                    cls._instance = IntegrityVerifier()
+        return cls._instance
+
+    def get_head(self, conn: Connection | None = None) -> dict | None:
+        """Returns the newest batch, hashes hex encoded, or None if no batch was sealed yet."""
+        head = self.accessor.get_head(conn)
+        return None if head is None else self._batch_dict(head)
+
+    def get_inclusion_proof(
+        self, event_id: int, conn: Connection | None = None
+    ) -> dict | None:
+        """
+        Returns the inclusion proof of an event: the event as stored, its position in its batch and the audit path
+        from its leaf to the batch's Merkle root, and the batch. `merkle.verify_inclusion_proof` checks it.
+
+        Parameters:
+            event_id (int): The id of the event.
+            conn (Connection | None): An optional existing database connection.
+
+        Returns:
+            dict | None: The proof, hashes hex encoded, or None if the event does not exist or is not sealed.
+        """
+        batch = self.accessor.get_batch_of_event(event_id, conn)
+        if batch is None:
+            return None
+        rows = self.accessor.get_sealed_rows(batch[1], batch[2], conn)
+        index = next((i for i, row in enumerate(rows) if row[0] == event_id), None)
+        if index is None:
+            return None
+        leaves = [leaf_hash(row) for row in rows]
+        event_id, event_type, timestamp_utc, customer_id, event_data, event_uuid = rows[
+            index
+        ]
+        return {
+            "event": {
+                "id": event_id,
+                "event_type": event_type,
+                "timestamp_utc": timestamp_utc,
+                "customer_id": customer_id,
+                # as stored, the leaf hash covers the exact bytes
+                "event_data": (
+                    event_data.decode() if isinstance(event_data, bytes) else event_data
+                ),
+                "event_uuid": event_uuid,
+            },
+            "leaf_index": index,
+            "leaf_hash": leaves[index].hex(),
+            "audit_path": [sibling.hex() for sibling in inclusion_path(leaves, index)],
+            "batch": self._batch_dict(batch),
+        }
+
+    def verify(
+        self,
+        after_batch_id: int | None = None,
+        chain_hash_hex: str | None = None,
+        max_batches: int = VERIFY_BATCHES_PER_RUN,
+        conn: Connection | None = None,
+    ) -> dict:
+        """
+        Verifies up to `max_batches` batches following a checkpoint, by default the verifier's own, which advances
+        over the batches found intact.
+
+        Parameters:
+            after_batch_id (int | None): The batch to continue after, None for the verifier's checkpoint.
+            chain_hash_hex (str | None): The trusted chain hash of that batch, None to take the stored one.
+            max_batches (int): The most batches verified.
+            conn (Connection | None): An optional existing database connection.
+
+        Returns:
+            dict: The report, see `_verify_batches`.
+        """
+        with self._lock:
+            own_checkpoint = after_batch_id is None
+            if own_checkpoint:
+                after_batch_id = self.verified_batch_id
+            checkpoint = (
+                self.accessor.get_batches(after_batch_id - 1, 1, conn=conn)
+                if after_batch_id
+                else []
+            )
+            stored_chain_hash, last_event_id = (
+                (checkpoint[0][6], checkpoint[0][2])
+                if checkpoint
+                else (GENESIS_CHAIN_HASH, None)
+            )
+            if own_checkpoint:
+                expected = self.verified_chain_hash
+            elif chain_hash_hex is not None:
+                expected = bytes.fromhex(chain_hash_hex)
+            else:
+                expected = stored_chain_hash
+            batches = self.accessor.get_batches(after_batch_id, max_batches, conn=conn)
+            report = self._verify_batches(
+                batches, after_batch_id, expected, last_event_id, conn
+            )
+            report["complete"] = report["complete"] and len(batches) < max_batches
+            if own_checkpoint and report["verified_through_batch_id"]:
+                self.verified_batch_id = report["verified_through_batch_id"]
+                self.verified_chain_hash = bytes.fromhex(report["chain_hash"])
+            return report
+
+    def verify_range(
+        self,
+        start_event_id: int,
+        end_event_id: int,
+        max_batches: int = VERIFY_BATCHES_PER_RUN,
+        conn: Connection | None = None,
+    ) -> dict:
+        """
+        Verifies the batches sealing the events from `start_event_id` to `end_event_id`, the first `max_batches` of
+        them, anchored on the stored chain hash of the batch before the range.
+
+        Returns:
+            dict: The report, see `_verify_batches`.
+        """
+        previous = self.accessor.get_previous_batch(start_event_id, conn)
+        after_batch_id, expected, previous_last_event_id = (
+            (previous[0], previous[6], previous[2])
+            if previous
+            else (0, GENESIS_CHAIN_HASH, None)
+        )
+        batches = self.accessor.get_batches(
+            after_batch_id, max_batches, last_event_id=end_event_id, conn=conn
+        )
+        report = self._verify_batches(
+            batches, after_batch_id, expected, previous_last_event_id, conn
+        )
+        report["complete"] = report["complete"] and len(batches) < max_batches
+        return report
+
+    def _verify_batches(
+        self,
+        batches: list[tuple],
+        after_batch_id: int,
+        expected_chain_hash: bytes,
+        previous_last_event_id: int | None,
+        conn: Connection | None,
+    ) -> dict:
+        """
+        Verifies consecutive batches, stopping at the first one found tampered with.
+
+        Returns:
+            dict: The number of batches and events verified, the last intact batch, its last event and chain hash
+            (the checkpoint to continue from), the failures, and whether all batches were verified.
+        """
+        verified_batches = verified_events = 0
+        verified_through_event_id = previous_last_event_id
+        failures = []
+        for batch in batches:
+            problems = self._check_batch(
+                batch, after_batch_id, expected_chain_hash, previous_last_event_id, conn
+            )
+            if problems:
+                INTEGRITY_FAILURES.inc()
+                logger.error(f"Event batch {batch[0]} was tampered with: {problems}")
+                failures.append({"batch_id": batch[0], "problems": problems})
+                break
+            after_batch_id, expected_chain_hash = batch[0], batch[6]
+            previous_last_event_id = verified_through_event_id = batch[2]
+            verified_batches += 1
+            verified_events += batch[3]
+        return {
+            "verified_batches": verified_batches,
+            "verified_events": verified_events,
+            "verified_through_batch_id": after_batch_id,
+            "verified_through_event_id": verified_through_event_id,
+            "chain_hash": expected_chain_hash.hex(),
+            "failures": failures,
+            "complete": not failures,
+        }
+
+    def _check_batch(
+        self,
+        batch: tuple,
+        previous_batch_id: int,
+        previous_chain_hash: bytes,
+        previous_last_event_id: int | None,
+        conn: Connection | None,
+    ) -> list[str]:
+        batch_id, first_event_id, last_event_id, event_count, root = batch[:5]
+        problems = []
+        if batch_id != previous_batch_id + 1 or batch[5] != previous_chain_hash:
+            problems.append("the batch does not follow the previous batch")
+        if batch[6] != chain_hash(
+            batch[5], batch_id, first_event_id, last_event_id, event_count, root
+        ):
+            problems.append("the chain hash does not match the batch")
+        rows = self.accessor.get_sealed_rows(first_event_id, last_event_id, conn)
+        if len(rows) != event_count or (rows and rows[0][0] != first_event_id):
+            problems.append(f"{event_count} events were sealed, {len(rows)} are stored")
+        elif merkle_root([leaf_hash(row) for row in rows]) != root:
+            problems.append("stored events differ from the sealed events")
+        if (
+            previous_last_event_id is not None
+            and first_event_id > previous_last_event_id + 1
+            and self.accessor.count_events(
+                previous_last_event_id + 1, first_event_id - 1, conn
+            )
+        ):
+            problems.append("unsealed events were inserted before the batch")
+        return problems
+
+    @staticmethod
+    def _batch_dict(batch: tuple) -> dict:
+        return {
+            "batch_id": batch[0],
+            "first_event_id": batch[1],
+            "last_event_id": batch[2],
+            "event_count": batch[3],
+            "merkle_root": batch[4].hex(),
+            "previous_chain_hash": batch[5].hex(),
+            "chain_hash": batch[6].hex(),
+            "sealed_at_utc": batch[7],
+        }
@@ -0,0 +1,567 @@
+import hashlib
+import logging
+import math
+import time
+from collections import Counter
+from sqlite3 import Connection
+from threading import Lock, RLock
+from typing import Iterable
+
+import numpy as np
+import orjson
+
+from log_service.data.event_dto import EventQueueDTO
+from log_service.db_accessors.sketch_db_accessor import SketchDatabaseAccessor
+
+logger = logging.getLogger(__name__)
+
+SKETCH_BUCKET_SECONDS = 3600
+SKETCH_PERSIST_INTERVAL_SECONDS = 30
+MAX_SKETCH_BUCKETS_IN_MEMORY = 48
+MAX_SKETCH_QUERY_BUCKETS = 31 * 24
+
+HLL_PRECISION = 12  # 4096 registers, ~1.6% standard error
+CMS_WIDTH = 2048
+CMS_DEPTH = 4
+HEAVY_HITTER_CAPACITY = 64
+
+DISTINCT_CUSTOMERS_SKETCH = "hll_customers"
+OVERFLOW_CUSTOMERS_SKETCH = "hll_customers_overflow"
+EVENT_TYPE_COUNTS_SKETCH = "cms_event_types"
+EVENT_TYPE_HEAVY_HITTERS_SKETCH = "heavy_hitters_event_types"
+
+_UINT64_MASK = np.uint64(0xFFFFFFFFFFFFFFFF)
+
+
+def _mix64(values: np.ndarray) -> np.ndarray:
+    """splitmix64 finalizer, spreads (possibly sequential) 64-bit inputs over the whole hash space."""
+    with np.errstate(over="ignore"):
+        z = values.astype(np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return (z ^ (z >> np.uint64(31))) & _UINT64_MASK
+
+
+def _bit_length(values: np.ndarray) -> np.ndarray:
+    """Exact vectorized int.bit_length for uint64 arrays (float log2 rounds up near powers of two)."""
+    remaining = values.copy()
+    lengths = np.zeros(values.shape, dtype=np.int64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        is_large = remaining >= np.uint64(1 << shift)
+        lengths[is_large] += shift
+        remaining[is_large] >>= np.uint64(shift)
+    return lengths + (remaining > 0)
+
+
+def _hash_keys(keys: Iterable[str]) -> np.ndarray:
+    return np.array(
+        [
+            int.from_bytes(
+                hashlib.blake2b(key.encode(), digest_size=8).digest(), "little"
+            )
+            for key in keys
+        ],
+        dtype=np.uint64,
+    )
+
+
+class HyperLogLog:
+    """
+    HyperLogLog distinct counter over 64-bit integers, with linear counting for small cardinalities.
+
+    Two sketches with the same precision merge by taking the register-wise maximum, which yields the
+    sketch of the union of both inputs.
+    """
+
+    def __init__(
+        self, precision: int = HLL_PRECISION, registers: np.ndarray | None = None
+    ):
+        self.precision = precision
+        self.register_count = 1 << precision
+        self.registers = (
+            registers
+            if registers is not None
+            else np.zeros(self.register_count, dtype=np.uint8)
+        )
+
+    def add(self, values: np.ndarray) -> None:
+        hashes = _mix64(values)
+        index = (hashes >> np.uint64(64 - self.precision)).astype(np.int64)
+        remainder = hashes & np.uint64((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - _bit_length(remainder) + 1
+        np.maximum.at(self.registers, index, rank.astype(np.uint8))
+
+    def merge(self, other: "HyperLogLog") -> None:
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def estimate(self) -> float:
+        m = self.register_count
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw_estimate = (
+            alpha
+            * m
+            * m
+            / float(np.sum(np.ldexp(1.0, -self.registers.astype(np.int64))))
+        )
+        zero_registers = int(np.count_nonzero(self.registers == 0))
+        if raw_estimate <= 2.5 * m and zero_registers:
+            return m * math.log(m / zero_registers)
+        return raw_estimate
+
+    @property
+    def relative_standard_error(self) -> float:
+        return 1.04 / math.sqrt(self.register_count)
+
+    def to_bytes(self) -> bytes:
+        return self.registers.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "HyperLogLog":
+        registers = np.frombuffer(data, dtype=np.uint8).copy()
+        return cls(precision=int(math.log2(len(registers))), registers=registers)
+
+
+class CountMinSketch:
+    """
+    Count-min sketch over string keys. Estimates never undercount, and overcount by at most
+    `epsilon * total` with probability `1 - delta`. Sketches of the same shape merge by addition.
+    """
+
+    def __init__(
+        self,
+        width: int = CMS_WIDTH,
+        depth: int = CMS_DEPTH,
+        table: np.ndarray | None = None,
+    ):
+        self.width = width
+        self.depth = depth
+        self.table = (
+            table if table is not None else np.zeros((depth, width), dtype=np.int64)
+        )
+        self._row_seeds = np.arange(1, depth + 1, dtype=np.uint64)
+
+    def _columns(self, keys: Iterable[str]) -> np.ndarray:
+        """Returns a (depth, len(keys)) array with the column of every key in every row."""
+        key_hashes = _hash_keys(keys)
+        with np.errstate(over="ignore"):
+            row_hashes = _mix64(
+                key_hashes[np.newaxis, :]
+                ^ (self._row_seeds[:, np.newaxis] * np.uint64(0x9E3779B97F4A7C15))
+            )
+        return (row_hashes % np.uint64(self.width)).astype(np.int64)
+
+    def add(self, counts: dict[str, int]) -> None:
+        if not counts:
+            return
+        columns = self._columns(counts.keys())
+        rows = np.repeat(np.arange(self.depth)[:, np.newaxis], columns.shape[1], axis=1)
+        np.add.at(
+            self.table, (rows, columns), np.array(list(counts.values()), dtype=np.int64)
+        )
+
+    def estimate(self, keys: list[str]) -> np.ndarray:
+        if not keys:
+            return np.zeros(0, dtype=np.int64)
+        columns = self._columns(keys)
+        return self.table[np.arange(self.depth)[:, np.newaxis], columns].min(axis=0)
+
+    def merge(self, other: "CountMinSketch") -> None:
+        self.table += other.table
+
+    @property
+    def total(self) -> int:
+        return int(self.table[0].sum())
+
+    @property
+    def epsilon(self) -> float:
+        return math.e / self.width
+
+    @property
+    def delta(self) -> float:
+        return math.exp(-self.depth)
+
+    def to_bytes(self) -> bytes:
+        return self.table.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data: bytes, depth: int = CMS_DEPTH) -> "CountMinSketch":
+        table = np.frombuffer(data, dtype=np.int64).copy().reshape(depth, -1)
+        return cls(width=table.shape[1], depth=depth, table=table)
+
+
+class SketchBucket:
+    """
+    The sketches of one time bucket: a count-min sketch of event types with a bounded list of heavy hitter
+    candidates, and a HyperLogLog of customer ids per heavy hitter event type.
+
+    Event types are arbitrary client input, so only the HEAVY_HITTER_CAPACITY heavy hitters get their own
+    HyperLogLog; the customers of all other event types go to a single overflow HyperLogLog. A bucket therefore
+    holds at most HEAVY_HITTER_CAPACITY + 1 HyperLogLogs. An event type that drops out of the heavy hitters
+    has its HyperLogLog folded into the overflow sketch.
+    """
+
+    def __init__(self, bucket_start_utc: int) -> None:
+        self.bucket_start_utc = bucket_start_utc
+        self.customer_sketches: dict[str, HyperLogLog] = {}
+        self.overflow_customers = HyperLogLog()
+        self.event_type_counts = CountMinSketch()
+        self.heavy_hitters: dict[str, int] = {}
+        self.dirty_keys: set[str] = set()
+        self.evicted_keys: set[str] = set()
+        self.overflow_dirty = False
+        # set by `merge` if the queried event type occurred untracked in a merged bucket
+        self.event_type_untracked = False
+
+    @property
+    def is_dirty(self) -> bool:
+        return bool(self.dirty_keys or self.evicted_keys or self.overflow_dirty)
+
+    def add_events(self, events: list[EventQueueDTO]) -> None:
+        self.add((event.event_type, event.customer_id) for event in events)
+
+    def add(self, events: Iterable[tuple[str, int]]) -> None:
+        """Adds (event_type, customer_id) pairs of events, e.g. of stored rows."""
+        customers_by_type: dict[str, list[int]] = {}
+        for event_type, customer_id in events:
+            customers_by_type.setdefault(event_type, []).append(customer_id)
+
+        counts = Counter(
+            {
+                event_type: len(customer_ids)
+                for event_type, customer_ids in customers_by_type.items()
+            }
+        )
+        self.event_type_counts.add(counts)
+        self.update_heavy_hitters(list(counts))
+
+        overflow_customer_ids: list[int] = []
+        for event_type, customer_ids in customers_by_type.items():
+            if event_type not in self.heavy_hitters:
+                overflow_customer_ids.extend(customer_ids)
+                continue
+            sketch = self.customer_sketches.get(event_type)
+            if sketch is None:
+                sketch = self.customer_sketches[event_type] = HyperLogLog()
+            sketch.add(np.array(customer_ids, dtype=np.int64))
+            self.dirty_keys.add(event_type)
+
+        if overflow_customer_ids:
+            self.overflow_customers.add(np.array(overflow_customer_ids, dtype=np.int64))
+            self.overflow_dirty = True
+
+    def update_heavy_hitters(self, candidates: list[str]) -> None:
+        self._count_heavy_hitters(candidates)
+        for event_type in [
+            key for key in self.customer_sketches if key not in self.heavy_hitters
+        ]:
+            self.overflow_customers.merge(self.customer_sketches.pop(event_type))
+            self.dirty_keys.discard(event_type)
+            self.evicted_keys.add(event_type)
+            self.overflow_dirty = True
+
+    def _count_heavy_hitters(self, candidates: list[str]) -> None:
+        for key, estimate in zip(
+            candidates, self.event_type_counts.estimate(candidates).tolist()
+        ):
+            self.heavy_hitters[key] = estimate
+        if len(self.heavy_hitters) > HEAVY_HITTER_CAPACITY:
+            kept = sorted(
+                self.heavy_hitters.items(), key=lambda item: item[1], reverse=True
+            )
+            self.heavy_hitters = dict(kept[:HEAVY_HITTER_CAPACITY])
+
+    def merge(self, other: "SketchBucket", event_type: str | None = None) -> None:
+        """
+        Merges the event type counts of another bucket. The customer sketches are only merged for `event_type`,
+        so a merged bucket holds at most two HyperLogLogs however many buckets it spans. The overflow sketch
+        of a bucket is merged whenever the bucket may hold untracked customers of `event_type`, which makes
+        the union of both sketches an upper bound of its distinct customers.
+
+        Merging only trims the heavy hitter counts, it never evicts the customer sketch of `event_type`: a type
+        tracked in some of the buckets keeps its merged sketch even if it is not a heavy hitter of all of them
+        together. `event_type_untracked` is set if `event_type` occurred in a bucket without being tracked there.
+        """
+        self.event_type_counts.merge(other.event_type_counts)
+        self._count_heavy_hitters(
+            list(set(self.heavy_hitters) | set(other.heavy_hitters))
+        )
+        if event_type is None:
+            return
+
+        sketch = other.customer_sketches.get(event_type)
+        if sketch is not None:
+            if event_type in self.customer_sketches:
+                self.customer_sketches[event_type].merge(sketch)
+            else:
+                self.customer_sketches[event_type] = HyperLogLog(
+                    registers=sketch.registers.copy()
+                )
+        if other.event_type_counts.estimate([event_type])[0] > 0:
+            if sketch is None:
+                self.event_type_untracked = True
+            if np.any(other.overflow_customers.registers):
+                self.overflow_customers.merge(other.overflow_customers)
+
+    def take_dirty(self) -> tuple[set[str], set[str], bool]:
+        """Returns and clears the dirty state, see `restore_dirty`."""
+        dirty = (self.dirty_keys, self.evicted_keys, self.overflow_dirty)
+        self.dirty_keys, self.evicted_keys, self.overflow_dirty = set(), set(), False
+        return dirty
+
+    def restore_dirty(
+        self, dirty_keys: set[str], evicted_keys: set[str], overflow_dirty: bool
+    ) -> None:
+        """Marks the state returned by `take_dirty` dirty again, e.g. after a failed persist."""
+        self.dirty_keys |= dirty_keys & set(self.customer_sketches)
+        self.evicted_keys |= evicted_keys
+        self.overflow_dirty = self.overflow_dirty or overflow_dirty
+
+    def to_rows(
+        self, customer_sketch_keys: Iterable[str], overflow: bool = True
+    ) -> list[tuple[int, str, str, bytes]]:
+        rows = [
+            (
+                self.bucket_start_utc,
+                DISTINCT_CUSTOMERS_SKETCH,
+                key,
+                self.customer_sketches[key].to_bytes(),
+            )
+            for key in customer_sketch_keys
+            if key in self.customer_sketches
+        ]
+        if overflow:
+            rows.append(
+                (
+                    self.bucket_start_utc,
+                    OVERFLOW_CUSTOMERS_SKETCH,
+                    "",
+                    self.overflow_customers.to_bytes(),
+                )
+            )
+        rows.append(
+            (
+                self.bucket_start_utc,
+                EVENT_TYPE_COUNTS_SKETCH,
+                "",
+                self.event_type_counts.to_bytes(),
+            )
+        )
+        rows.append(
+            (
+                self.bucket_start_utc,
+                EVENT_TYPE_HEAVY_HITTERS_SKETCH,
+                "",
+                orjson.dumps(self.heavy_hitters),
+            )
+        )
+        return rows
+
+    @classmethod
+    def from_rows(
+        cls, bucket_start_utc: int, rows: list[tuple[str, str, bytes]]
+    ) -> "SketchBucket":
+        bucket = cls(bucket_start_utc)
+        for sketch_type, sketch_key, sketch_data in rows:
+            if sketch_type == DISTINCT_CUSTOMERS_SKETCH:
+                bucket.customer_sketches[sketch_key] = HyperLogLog.from_bytes(
+                    sketch_data
+                )
+            elif sketch_type == OVERFLOW_CUSTOMERS_SKETCH:
+                bucket.overflow_customers = HyperLogLog.from_bytes(sketch_data)
+            elif sketch_type == EVENT_TYPE_COUNTS_SKETCH:
+                bucket.event_type_counts = CountMinSketch.from_bytes(sketch_data)
+            elif sketch_type == EVENT_TYPE_HEAVY_HITTERS_SKETCH:
+                bucket.heavy_hitters = orjson.loads(sketch_data)
+        return bucket
+
+
+class EventSketchStore:
+    """
+    Implements a thread-safe singleton store of approximate per time bucket sketches, maintained by the QueueConsumer
+    for every committed batch of events.
+
+    It keeps a count-min sketch with a heavy hitters list of event types per bucket, and a HyperLogLog of distinct
+    customers per heavy hitter event type and bucket (see SketchBucket). Buckets are SKETCH_BUCKET_SECONDS wide,
+    keyed by the event timestamp, and persisted to the EventSketches table every SKETCH_PERSIST_INTERVAL_SECONDS.
+    Memory is bounded: only the most recent MAX_SKETCH_BUCKETS_IN_MEMORY buckets are kept, older ones are read
+    back from the database when queried, and a query spans at most MAX_SKETCH_QUERY_BUCKETS buckets.
+
+    Attributes:
+        _instance (EventSketchStore, optional): Class variable to hold the singleton instance.
+        _lock (RLock): A reentrant lock guarding the singleton instance and the in-memory buckets.
+        _persist_lock (Lock): Serializes persists, which write to the database outside of `_lock`.
+        buckets (dict[int, SketchBucket]): In-memory buckets keyed by bucket start time.
+        database_accessor (SketchDatabaseAccessor): Accessor used to persist and load sketches.
+        last_persist_time (float): Monotonic time of the last persist.
+
+    Raises:
+        Exception: If an attempt is made to directly instantiate the class instead of using the `get_instance` method.
+    """
+
+    _instance = None
+    _lock: RLock = RLock()
+    _persist_lock: Lock = Lock()
+
+    def __init__(self) -> None:
+        if EventSketchStore._instance:
+            raise Exception("This class is a singleton!")
+        self.buckets: dict[int, SketchBucket] = {}
+        self.database_accessor = SketchDatabaseAccessor()
+        self.last_persist_time = time.monotonic()
+        EventSketchStore._instance = self
+
+    @classmethod
+    def get_instance(cls) -> "EventSketchStore":
+        """
+        Retrieves the singleton instance of the EventSketchStore class, creating it if it does not already exist.
+
+        Returns:
+            EventSketchStore: The singleton instance of the class.
+        """
+        if not cls._instance:
+            with cls._lock:
+                if not cls._instance:
+                    cls._instance = EventSketchStore()
+        return cls._instance
+
+    @staticmethod
+    def bucket_start(timestamp_utc: int) -> int:
+        return timestamp_utc - timestamp_utc % SKETCH_BUCKET_SECONDS
+
+    def add_events(self, events: list[EventQueueDTO]) -> None:
+        """
+        Adds a committed batch of events to the sketches of their buckets.
+
+        Parameters:
+            events (list[EventQueueDTO]): The committed events.
+        """
+        events_by_bucket: dict[int, list[EventQueueDTO]] = {}
+        for event in events:
+            events_by_bucket.setdefault(
+                self.bucket_start(event.timestamp_utc), []
+            ).append(event)
+
+        with self._lock:
+            for bucket_start_utc, bucket_events in events_by_bucket.items():
+                bucket = self.buckets.get(bucket_start_utc)
+                if bucket is None:
+                    # continue from the persisted state, so a restart does not overwrite it with a partial bucket
+                    bucket = self._load_bucket(bucket_start_utc)
+                    self.buckets[bucket_start_utc] = bucket
+                bucket.add_events(bucket_events)
+
+    def persist_if_due(self, conn: Connection | None = None) -> None:
+        if time.monotonic() - self.last_persist_time >= SKETCH_PERSIST_INTERVAL_SECONDS:
+            self.persist(conn)
+
+    def persist(self, conn: Connection | None = None) -> None:
+        """
+        Writes the buckets changed since the last persist to the database and evicts the oldest buckets
+        beyond MAX_SKETCH_BUCKETS_IN_MEMORY.
+
+        The changed sketches are serialized under the store lock, the database write runs outside of it, so
+        queries and new batches are not blocked by a slow write.
+
+        Parameters:
+            conn (Connection | None): An optional existing database connection. If None, a new connection is established.
+        """
+        with self._persist_lock:
+            with self._lock:
+                rows = []
+                deleted_keys = []
+                taken = []
+                for bucket in self.buckets.values():
+                    if not bucket.is_dirty:
+                        continue
+                    dirty_keys, evicted_keys, overflow_dirty = bucket.take_dirty()
+                    rows.extend(bucket.to_rows(dirty_keys, overflow=overflow_dirty))
+                    deleted_keys.extend(
+                        (bucket.bucket_start_utc, DISTINCT_CUSTOMERS_SKETCH, key)
+                        for key in evicted_keys
+                        if key not in bucket.customer_sketches
+                    )
+                    taken.append((bucket, dirty_keys, evicted_keys, overflow_dirty))
+                self.last_persist_time = time.monotonic()
+
+            saved = not rows or self.database_accessor.save_sketches(
+                rows, conn=conn, deleted_keys=deleted_keys
+            )
+
+            with self._lock:
+                if not saved:
+                    # keep the buckets dirty so the next persist retries them
+                    for bucket, dirty_keys, evicted_keys, overflow_dirty in taken:
+                        bucket.restore_dirty(dirty_keys, evicted_keys, overflow_dirty)
+                    return
+
+                for bucket_start_utc in sorted(self.buckets)[
+                    :-MAX_SKETCH_BUCKETS_IN_MEMORY
+                ]:
+                    # a bucket changed during the write is evicted by a later persist
+                    if not self.buckets[bucket_start_utc].is_dirty:
+                        del self.buckets[bucket_start_utc]
+
+    def merged_bucket(
+        self,
+        timestamp_start_utc: int,
+        timestamp_end_utc: int,
+        event_type: str | None = None,
+    ) -> tuple[SketchBucket, int, int]:
+        """
+        Merges the sketches of all buckets overlapping [timestamp_start_utc, timestamp_end_utc].
+
+        Only the event type counts are merged, plus the customer sketches of `event_type` if given; persisted
+        buckets are loaded with just those sketches.
+
+        Returns:
+            tuple[SketchBucket, int, int]: The merged sketches and the start and (exclusive) end of the
+            covered bucket range, which is the range the answers actually apply to.
+
+        Raises:
+            ValueError: If the range spans more than MAX_SKETCH_QUERY_BUCKETS buckets.
+        """
+        first_bucket = self.bucket_start(timestamp_start_utc)
+        end_bucket = self.bucket_start(timestamp_end_utc) + SKETCH_BUCKET_SECONDS
+        if (
+            end_bucket - first_bucket
+        ) // SKETCH_BUCKET_SECONDS > MAX_SKETCH_QUERY_BUCKETS:
+            raise ValueError(
+                f"The time range must not span more than {MAX_SKETCH_QUERY_BUCKETS} sketch buckets "
+                f"of {SKETCH_BUCKET_SECONDS} seconds."
+            )
+        merged = SketchBucket(first_bucket)
+
+        with self._lock:
+            in_memory = [
+                start for start in self.buckets if first_bucket <= start < end_bucket
+            ]
+            for start in in_memory:
+                merged.merge(self.buckets[start], event_type)
+
+        if event_type is None:
+            sketch_keys = [
+                (EVENT_TYPE_COUNTS_SKETCH, ""),
+                (EVENT_TYPE_HEAVY_HITTERS_SKETCH, ""),
+            ]
+        else:
+            sketch_keys = [
+                (EVENT_TYPE_COUNTS_SKETCH, ""),
+                (DISTINCT_CUSTOMERS_SKETCH, event_type),
+                (OVERFLOW_CUSTOMERS_SKETCH, ""),
+            ]
+        persisted = self.database_accessor.load_sketches(
+            first_bucket,
+            end_bucket,
+            exclude_buckets=in_memory,
+            sketch_keys=sketch_keys,
+        )
+        for bucket_start_utc, rows in persisted.items():
+            merged.merge(SketchBucket.from_rows(bucket_start_utc, rows), event_type)
+
+        return merged, first_bucket, end_bucket
+
+    def _load_bucket(self, bucket_start_utc: int) -> SketchBucket:
+        rows = self.database_accessor.load_sketches(
+            bucket_start_utc, bucket_start_utc + SKETCH_BUCKET_SECONDS
+        ).get(bucket_start_utc, [])
+        return SketchBucket.from_rows(bucket_start_utc, rows)
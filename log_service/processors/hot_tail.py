@@ -0,0 +1,339 @@
+import logging
+import math
+import sqlite3
+import time
+from collections import deque
+from threading import RLock
+from typing import Iterable
+
+from log_service.config import LogServiceConfig
+from log_service.data.event_dto import EventQueueDTO, EventRequestDTO
+from log_service.monitoring.metrics import MetricsRegistry
+
+logger = logging.getLogger(__name__)
+
+# events dated further ahead than this are clock errors, dropping one out of the buffer caps the range it serves
+# instead of raising its start
+HOT_TAIL_MAX_CLOCK_SKEW_SECONDS = 300
+
+metrics = MetricsRegistry.get_instance()
+HOT_TAIL_EVENTS = metrics.gauge(
+    "log_service_hot_tail_events", "Recent events kept in memory, pending or stored."
+)
+HOT_TAIL_READS = metrics.counter(
+    "log_service_hot_tail_reads_total",
+    "Event queries by whether they were answered from memory (hit) or from the database (miss).",
+    label_names=("result",),
+)
+
+
+class HotTailEntry:
+    """
+    A recent event as returned by event queries, with event_data kept encoded. `event_id` is None while the
+    event is pending, i.e. queued but not committed yet.
+    """
+
+    __slots__ = (
+        "event_id",
+        "event_type",
+        "timestamp_utc",
+        "customer_id",
+        "event_data",
+        "added_at",
+        "discarded",
+    )
+
+    def __init__(self, event: EventQueueDTO, added_at: float):
+        self.event_id: int | None = None
+        self.event_type = event.event_type
+        self.timestamp_utc = event.timestamp_utc
+        self.customer_id = event.customer_id
+        self.event_data = event.serialized_event_data
+        self.added_at = added_at
+        # set for events that will not be stored as this entry, e.g. dead lettered ones
+        self.discarded = False
+
+    def row(self) -> tuple:
+        return (
+            self.event_id,
+            self.event_type,
+            self.timestamp_utc,
+            self.customer_id,
+            self.event_data,
+        )
+
+
+class HotTailBuffer:
+    """
+    Implements a thread-safe singleton keeping the most recent events in memory, so queries for the last minutes
+    of a customer or event type are answered without a database read, and see the events still queued.
+
+    Events are added when they are queued, marked with their id once committed, and kept in arrival order for at
+    most the configured number of events and seconds (see `LogServiceConfig.get_hot_tail_limits`). Besides the
+    ring of all entries, every customer and event type has a deque of its entries, so a query only scans the
+    events of its customer or event type. Evicting the oldest entry pops it from the front of all three.
+
+    The buffer answers a query only if it holds every stored or queued event of the query's time range: all events
+    dated from `covered_from_utc` up to `covered_until_utc`. On open these are set from the newest stored event,
+    and every event leaving the buffer narrows them, so events that are older than the start when received (e.g.
+    backfills) or evicted never make a query wrong, they send it to the database. Queries by id, without a start
+    time or with a range the buffer does not cover go to the database as before.
+
+    Assumes the QueueConsumer is the only writer while the buffer is open, the offline bulk loader must not run
+    next to the service.
+
+    Attributes:
+        _instance (HotTailBuffer, optional): Class variable to hold the singleton instance.
+        _lock (RLock): A reentrant lock guarding the singleton instance and the entries.
+        max_events (int): The most events kept, 0 if the buffer is disabled.
+        window_seconds (float): How long events are kept.
+        entries (deque[HotTailEntry]): All entries, oldest first.
+        customer_entries (dict[int, deque[HotTailEntry]]): The entries of every customer, oldest first.
+        event_type_entries (dict[str, deque[HotTailEntry]]): The entries of every event type, oldest first.
+        covered_from_utc (int | None): The earliest timestamp of the covered range, None while the buffer is closed.
+        covered_until_utc (float): The timestamp the covered range ends before.
+        last_event_id (int): The id of the newest stored event, ids of new events are always larger.
+
+    Methods:
+        get_instance(): Returns the singleton instance of the HotTailBuffer class.
+        open(conn): Empties the buffer and starts covering the events stored after the newest one in the database.
+        close(): Empties the buffer and stops answering queries.
+        add(events): Adds queued events.
+        mark_committed(events, event_ids): Sets the ids of committed events.
+        discard(events): Removes events that will not be stored.
+        query(request_dto): Returns a page of events like a database query, or None if the buffer cannot answer it.
+
+    Raises:
+        Exception: If an attempt is made to directly instantiate the class instead of using the `get_instance` method.
+    """
+
+    _instance = None
+    _lock: RLock = RLock()
+
+    def __init__(self) -> None:
+        if HotTailBuffer._instance:
+            raise Exception("This class is a singleton!")
+        self.max_events, self.window_seconds = LogServiceConfig.get_hot_tail_limits()
+        self.entries: deque[HotTailEntry] = deque()
+        self.customer_entries: dict[int, deque[HotTailEntry]] = {}
+        self.event_type_entries: dict[str, deque[HotTailEntry]] = {}
+        self.covered_from_utc: int | None = None
+        self.covered_until_utc = math.inf
+        self.last_event_id = 0
+        HOT_TAIL_EVENTS.set_function(lambda: len(self.entries))
+        HotTailBuffer._instance = self
+
+    @classmethod
+    def get_instance(cls) -> "HotTailBuffer":
+        """
+        Retrieves the singleton instance of the HotTailBuffer class, creating it if it does not already exist.
+
+        Returns:
+            HotTailBuffer: The singleton instance of the class.
+        """
+        if not cls._instance:
+            with cls._lock:
+                if not cls._instance:
+                    cls._instance = HotTailBuffer()
+        return cls._instance
+
+    @property
+    def is_open(self) -> bool:
+        return self.covered_from_utc is not None
+
+    def open(self, conn: sqlite3.Connection) -> None:
+        """
+        Empties the buffer and starts covering the events dated after the newest stored one. Events dated more than
+        HOT_TAIL_MAX_CLOCK_SKEW_SECONDS ahead do not count as the newest, they end the covered range instead.
+
+        Parameters:
+            conn (sqlite3.Connection): The connection to read the newest stored event with.
+        """
+        if self.max_events <= 0:
+            return
+        skew_limit = int(time.time()) + HOT_TAIL_MAX_CLOCK_SKEW_SECONDS
+        try:
+            (last_event_id,) = conn.execute("SELECT MAX(id) FROM Events").fetchone()
+            (newest,) = conn.execute(
+                "SELECT MAX(timestamp_utc) FROM Events WHERE timestamp_utc <= ?",
+                (skew_limit,),
+            ).fetchone()
+            (future,) = conn.execute(
+                "SELECT MIN(timestamp_utc) FROM Events WHERE timestamp_utc > ?",
+                (skew_limit,),
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Hot tail disabled, reading the newest event failed: {e}")
+            self.close()
+            return
+        with self._lock:
+            self._clear()
+            self.last_event_id = last_event_id or 0
+            self.covered_until_utc = math.inf if future is None else future
+            self.covered_from_utc = 0 if newest is None else newest + 1
+
+    def close(self) -> None:
+        with self._lock:
+            self._clear()
+            self.covered_from_utc = None
+
+    def add(self, events: Iterable[EventQueueDTO]) -> None:
+        """Adds queued events, except those dated outside the covered range."""
+        if self.covered_from_utc is None:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if self.covered_from_utc is None:
+                return
+            for event in events:
+                if not (
+                    self.covered_from_utc
+                    <= event.timestamp_utc
+                    < self.covered_until_utc
+                ):
+                    continue
+                entry = HotTailEntry(event, now)
+                event.hot_tail_entry = entry
+                self.entries.append(entry)
+                self.customer_entries.setdefault(event.customer_id, deque()).append(
+                    entry
+                )
+                self.event_type_entries.setdefault(event.event_type, deque()).append(
+                    entry
+                )
+            self._evict(now)
+
+    def mark_committed(self, events: list[EventQueueDTO], event_ids: list[int]) -> None:
+        """
+        Sets the ids of committed events. An event getting an id that is not newer than the last one was a
+        duplicate of a stored event (see `EventDatabaseAccessor.save_events_returning_ids`) and is discarded.
+
+        Parameters:
+            events (list[EventQueueDTO]): The events of the committed batch.
+            event_ids (list[int]): Their ids, in the same order.
+        """
+        with self._lock:
+            for event, event_id in zip(events, event_ids):
+                entry = event.hot_tail_entry
+                if event_id > self.last_event_id:
+                    self.last_event_id = event_id
+                    if entry is not None:
+                        entry.event_id = event_id
+                elif entry is not None:
+                    entry.discarded = True
+
+    def discard(self, events: Iterable[EventQueueDTO]) -> None:
+        """Removes events that will not be stored, e.g. dead lettered ones, from query results."""
+        with self._lock:
+            for event in events:
+                if event.hot_tail_entry is not None:
+                    event.hot_tail_entry.discarded = True
+
+    def query(self, request_dto: EventRequestDTO) -> tuple[list[tuple], int] | None:
+        """
+        Returns a page of the events matching the criteria of an EventRequestDTO, like
+        `EventDatabaseAccessor.get_event_rows`, if the buffer covers the time range of the query. Pending events
+        are included, with None as their id.
+
+        Parameters:
+            request_dto (EventRequestDTO): The DTO containing filter criteria for the events query.
+
+        Returns:
+            tuple[list[tuple], int] | None: The (id, event_type, timestamp_utc, customer_id, event_data) rows and
+            the total count of events matching the criteria, or None if the query must go to the database.
+        """
+        start = request_dto.timestamp_start_utc
+        end = request_dto.timestamp_end_utc
+        if self.covered_from_utc is None or request_dto.event_id or not start:
+            HOT_TAIL_READS.labels("miss").inc()
+            return None
+
+        with self._lock:
+            self._evict(time.monotonic())
+            if (
+                self.covered_from_utc is None
+                or start < self.covered_from_utc
+                or (
+                    self.covered_until_utc < math.inf
+                    and (not end or end >= self.covered_until_utc)
+                )
+            ):
+                HOT_TAIL_READS.labels("miss").inc()
+                return None
+            # copied under the lock, filtered outside of it
+            candidates = self._candidates(request_dto)
+
+        event_types = request_dto.filter_values("event_type")
+        customer_ids = request_dto.filter_values("customer_id")
+        matches = [
+            entry
+            for entry in candidates
+            if not entry.discarded
+            and start <= entry.timestamp_utc
+            and (not end or entry.timestamp_utc <= end)
+            and (event_types is None or entry.event_type in event_types)
+            and (customer_ids is None or entry.customer_id in customer_ids)
+        ]
+        # by timestamp like the database, committed events by id, pending ones in arrival order after them
+        matches.sort(
+            key=lambda entry: (
+                entry.timestamp_utc,
+                math.inf if entry.event_id is None else entry.event_id,
+            )
+        )
+        limit = request_dto.limit
+        offset = request_dto.offset or 0
+        HOT_TAIL_READS.labels("hit").inc()
+        return [entry.row() for entry in matches[offset : offset + limit]], len(matches)
+
+    def _candidates(self, request_dto: EventRequestDTO) -> list[HotTailEntry]:
+        # the entries of the filter values of the most selective filter, every entry has one value per filter
+        indexed = []
+        for name, entries_by_value in (
+            ("customer_id", self.customer_entries),
+            ("event_type", self.event_type_entries),
+        ):
+            values = request_dto.filter_values(name)
+            if values:
+                indexed.append(
+                    [entries_by_value.get(value, deque()) for value in values]
+                )
+        if not indexed:
+            return list(self.entries)
+        selected = min(indexed, key=lambda queues: sum(map(len, queues)))
+        return [entry for entries in selected for entry in entries]
+
+    def _evict(self, now: float) -> None:
+        expired_before = now - self.window_seconds
+        skew_limit = time.time() + HOT_TAIL_MAX_CLOCK_SKEW_SECONDS
+        while self.entries and (
+            len(self.entries) > self.max_events
+            or self.entries[0].added_at < expired_before
+        ):
+            entry = self.entries.popleft()
+            self._pop_indexed(self.customer_entries, entry.customer_id)
+            self._pop_indexed(self.event_type_entries, entry.event_type)
+            if entry.discarded:
+                continue
+            # the buffer no longer holds this event, its timestamp leaves the covered range
+            if entry.timestamp_utc > skew_limit:
+                self.covered_until_utc = min(
+                    self.covered_until_utc, entry.timestamp_utc
+                )
+            else:
+                self.covered_from_utc = max(
+                    self.covered_from_utc, entry.timestamp_utc + 1
+                )
+
+    @staticmethod
+    def _pop_indexed(index: dict, key) -> None:
+        entries = index[key]
+        entries.popleft()
+        if not entries:
+            del index[key]
+
+    def _clear(self) -> None:
+        self.entries.clear()
+        self.customer_entries.clear()
+        self.event_type_entries.clear()
+        self.covered_until_utc = math.inf
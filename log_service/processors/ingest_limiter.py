@@ -0,0 +1,191 @@
+import random
+import time
+from collections import Counter, OrderedDict
+from threading import RLock
+
+from log_service.config import LogServiceConfig
+from log_service.data.event_dto import EventQueueDTO
+from log_service.monitoring.metrics import MetricsRegistry
+
+# buckets of customers idle long enough to be full again are evicted, this caps the rest
+MAX_CUSTOMER_BUCKETS = 100_000
+
+metrics = MetricsRegistry.get_instance()
+EVENTS_RATE_LIMITED = metrics.counter(
+    "log_service_events_rate_limited_total",
+    "Events rejected with a 429 because their customer exceeded its ingest rate.",
+)
+EVENTS_SAMPLED_OUT = metrics.counter(
+    "log_service_events_sampled_out_total",
+    "Events of sampled event types acknowledged without being stored, by event type.",
+    label_names=("event_type",),
+)
+CUSTOMER_BUCKETS = metrics.gauge(
+    "log_service_rate_limit_buckets", "Customers with a token bucket in memory."
+)
+
+
+class TokenBucket:
+    """
+    The tokens left to a customer, refilled continuously up to the burst. A bucket may go into debt, see
+    `IngestRateLimiter.acquire`.
+    """
+
+    __slots__ = ("tokens", "updated_at")
+
+    def __init__(self, tokens: float, updated_at: float):
+        self.tokens = tokens
+        self.updated_at = updated_at
+
+    def refill(self, rate: float, burst: float, now: float) -> None:
+        self.tokens = min(burst, self.tokens + (now - self.updated_at) * rate)
+        self.updated_at = now
+
+    def full_at(self, rate: float, burst: float) -> float:
+        return self.updated_at + (burst - self.tokens) / rate
+
+
+class IngestRateLimiter:
+    """
+    Implements a thread-safe singleton shedding ingest load before it reaches the queue, so one customer with a
+    runaway integration cannot fill the queue and delay every other customer's events.
+
+    Every customer gets a token bucket refilled at the configured rate up to the configured burst, one token per
+    event. Buckets are kept in least recently used order: a bucket idle long enough to be full again is the same
+    as a new one, so such buckets are evicted from the front as other customers send events, which is O(1)
+    amortized per event and bounds memory by the customers active within one refill period (and by
+    MAX_CUSTOMER_BUCKETS beyond that).
+
+    Event types configured with a sample rate (see `LogServiceConfig.get_event_type_sample_rates`) only keep that
+    fraction of their events, for high volume diagnostic types; sampled out events cost no tokens.
+
+    The rate, burst and sample rates are runtime settings: they are read again whenever the settings were reloaded,
+    keeping the buckets, so a retuned limit applies to the next events.
+
+    Attributes:
+        _instance (IngestRateLimiter, optional): Class variable to hold the singleton instance.
+        _lock (RLock): A reentrant lock guarding the singleton instance and the buckets.
+        config (LogServiceConfig): Configuration instance for accessing the rate limit and sample rates.
+        rate (float): Events per second per customer, 0 if customers are not limited.
+        burst (float): Events a customer may send at once after being idle.
+        sample_rates (dict[str, float]): The fraction of events stored, by sampled event type.
+        settings (ServiceSettings): The settings the rate, burst and sample rates were read from.
+        buckets (OrderedDict[int, TokenBucket]): The buckets by customer id, least recently used first.
+
+    Methods:
+        get_instance(): Returns the singleton instance of the IngestRateLimiter class.
+        sample(events: list[EventQueueDTO]): Returns the events kept by the event type sampling.
+        acquire(events: list[EventQueueDTO]): Takes the tokens of the events, or returns how long to wait for them.
+
+    Raises:
+        Exception: If an attempt is made to directly instantiate the class instead of using the `get_instance` method.
+    """
+
+    _instance = None
+    _lock: RLock = RLock()
+
+    def __init__(self) -> None:
+        if IngestRateLimiter._instance:
+            raise Exception("This class is a singleton!")
+        self.config = LogServiceConfig.get_instance()
+        self.settings = None
+        self._refresh_settings()
+        self.buckets: OrderedDict[int, TokenBucket] = OrderedDict()
+        CUSTOMER_BUCKETS.set_function(lambda: len(self.buckets))
+        IngestRateLimiter._instance = self
+
+    @classmethod
+    def get_instance(cls) -> "IngestRateLimiter":
+        """
+        Retrieves the singleton instance of the IngestRateLimiter class, creating it if it does not already exist.
+
+        Returns:
+            IngestRateLimiter: The singleton instance of the class.
+        """
+        if not cls._instance:
+            with cls._lock:
+                if not cls._instance:
+                    cls._instance = IngestRateLimiter()
+        return cls._instance
+
+    def sample(self, events: list[EventQueueDTO]) -> list[EventQueueDTO]:
+        """
+        Returns the events kept by the event type sampling, in order.
+
+        Parameters:
+            events (list[EventQueueDTO]): The received events.
+
+        Returns:
+            list[EventQueueDTO]: The events to store.
+        """
+        self._refresh_settings()
+        if not self.sample_rates:
+            return events
+        kept = []
+        for event in events:
+            sample_rate = self.sample_rates.get(event.event_type)
+            if sample_rate is None or random.random() < sample_rate:
+                kept.append(event)
+            else:
+                EVENTS_SAMPLED_OUT.labels(event.event_type).inc()
+        return kept
+
+    def acquire(self, events: list[EventQueueDTO]) -> float:
+        """
+        Takes one token per event from the buckets of their customers, for all events or none of them.
+
+        A batch larger than the burst is admitted once its customer's bucket is full, leaving the bucket in debt,
+        so it is never rejected forever but still costs its customer its full size.
+
+        Parameters:
+            events (list[EventQueueDTO]): The events to admit.
+
+        Returns:
+            float: 0 if the events are admitted, otherwise the seconds until they would be.
+        """
+        self._refresh_settings()
+        if self.rate <= 0 or not events:
+            return 0.0
+        costs = Counter(event.customer_id for event in events)
+        now = time.monotonic()
+        with self._lock:
+            self._evict_idle_buckets(now)
+            buckets = {}
+            wait_seconds = 0.0
+            for customer_id, cost in costs.items():
+                bucket = self.buckets.get(customer_id)
+                if bucket is None:
+                    bucket = self.buckets[customer_id] = TokenBucket(self.burst, now)
+                else:
+                    self.buckets.move_to_end(customer_id)
+                    bucket.refill(self.rate, self.burst, now)
+                buckets[customer_id] = bucket
+                missing = min(cost, self.burst) - bucket.tokens
+                wait_seconds = max(wait_seconds, missing / self.rate)
+            if wait_seconds > 0:
+                EVENTS_RATE_LIMITED.inc(len(events))
+                return wait_seconds
+            for customer_id, cost in costs.items():
+                buckets[customer_id].tokens -= cost
+            return 0.0
+
+    def _refresh_settings(self) -> None:
+        # reloaded settings are a new object, comparing identities keeps this check free on the ingest path
+        settings = LogServiceConfig.get_settings()
+        if settings is self.settings:
+            return
+        with self._lock:
+            self.rate = settings.customer_rate_limit_per_second
+            self.burst = settings.customer_rate_limit_burst
+            self.sample_rates = dict(settings.event_type_sample_rates)
+            self.settings = settings
+
+    def _evict_idle_buckets(self, now: float) -> None:
+        while self.buckets:
+            customer_id, bucket = next(iter(self.buckets.items()))
+            if (
+                bucket.full_at(self.rate, self.burst) > now
+                and len(self.buckets) < MAX_CUSTOMER_BUCKETS
+            ):
+                return
+            del self.buckets[customer_id]
@@ -1,21 +1,86 @@
 import sqlite3
 import time
+from concurrent.futures import InvalidStateError
 from sqlite3 import Connection
 from threading import RLock
 from collections import deque
 
-import orjson
-
 from log_service.config import LogServiceConfig
 from log_service.data.event_dto import EventQueueDTO
+from log_service.db_accessors.analytics_db_accessor import AnalyticsChunkCache
 from log_service.db_accessors.event_db_accessor import EventDatabaseAccessor
-from log_service.processors.queue_producer import QueueProducer
+from log_service.processors.change_feed import ChangeFeedHub
+from log_service.processors.event_sketches import EventSketchStore
+from log_service.processors.hot_tail import HotTailBuffer
+from log_service.monitoring.metrics import MetricsRegistry
+from log_service.processors.queue_producer import (
+    QUEUE_BYTES,
+    PriorityLaneQueue,
+    QueueProducer,
+)
 import logging
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
-CHUNK_SIZE = 30
+# batch size while draining the queue for a shutdown, fewer and larger transactions commit a backlog fastest
+DRAIN_CHUNK_SIZE = 1000
+# a batch failing this often is saved event by event, to tell events that can never be saved from an outage
+MAX_SAVE_ATTEMPTS = 5
+DEAD_LETTER_QUEUE_SIZE = 10_000
+
+metrics = MetricsRegistry.get_instance()
+BATCH_SIZE = metrics.histogram(
+    "log_service_consumer_batch_size",
+    "Events per batch saved by the queue consumer.",
+    # the chunk size is a runtime setting, the buckets cover every sensible value of it
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500, 1000),
+)
+COMMIT_SECONDS = metrics.histogram(
+    "log_service_commit_seconds",
+    "Latency of saving a batch of events, by outcome.",
+    label_names=("outcome",),
+)
+EVENTS_COMMITTED = metrics.counter(
+    "log_service_events_committed_total",
+    "Events committed to the database, rate() of it gives rows per second.",
+)
+EVENTS_RETRIED = metrics.counter(
+    "log_service_events_retried_total",
+    "Events returned to the queue after a failed save.",
+)
+EVENTS_DEAD_LETTERED = metrics.counter(
+    "log_service_events_dead_lettered_total",
+    "Events moved to the dead letter queue because they could not be saved.",
+)
+
+
+class EventNotCommittedError(Exception):
+    """Fails the commit future of an event that will not be committed by this process."""
+
+
+def fail_commit_futures(events: list[EventQueueDTO], reason: str) -> None:
+    """Fails the commit futures of events whose senders wait for a commit that will not happen."""
+    for event in events:
+        _resolve_commit_future(event, exception=EventNotCommittedError(reason))
+
+
+def _resolve_commit_future(
+    event: EventQueueDTO,
+    event_id: int | None = None,
+    exception: Exception | None = None,
+) -> None:
+    future = event.commit_future
+    if future is None or future.done():
+        # done if its sender stopped waiting, e.g. after a timeout
+        return
+    try:
+        if exception is None:
+            future.set_result(event_id)
+        else:
+            future.set_exception(exception)
+    except InvalidStateError:
+        pass
 
 
 class QueueConsumer:
@@ -30,11 +95,18 @@ class QueueConsumer:
     Attributes:
         _instance (QueueConsumer, optional): Class variable to hold the singleton instance.
         _lock (RLock): A reentrant lock to ensure thread-safe operations on the singleton instance and event consumption.
-        event_queue (deque[EventQueueDTO | None]): Reference to the shared event queue from QueueProducer.
+        event_queue (PriorityLaneQueue): Reference to the shared event queue from QueueProducer, batches are taken
+            from its priority lanes by weighted fair queuing.
         config (LogServiceConfig | None): Configuration instance for accessing database settings.
         max_queue_length (int): Tracks the maximum length the event queue has reached.
         conn (Connection): Database connection used to save events.
         database_accessor (EventDatabaseAccessor): Accessor for interacting with the event database.
+        sketch_store (EventSketchStore): Approximate distinct / top-k sketches updated with every committed batch.
+        dead_letter_queue (deque[EventQueueDTO]): The latest events that could not be saved while other events
+            could, bounded by DEAD_LETTER_QUEUE_SIZE.
+        draining (bool): Set while the queue is drained for a shutdown, batches are then DRAIN_CHUNK_SIZE events.
+        hot_tail (HotTailBuffer): The recent events served from memory, committed events get their ids in it.
+        change_feed (ChangeFeedHub): Committed events are published to its subscribers.
 
     Raises:
         Exception: If an attempt is made to directly instantiate the class instead of using the `get_instance` method.
@@ -42,13 +114,16 @@ class QueueConsumer:
 
     _instance = None
     _lock: RLock = RLock()
-    event_queue: deque[EventQueueDTO]
+    event_queue: PriorityLaneQueue
     config: LogServiceConfig
     max_queue_length: int = 0
     conn: Connection
     database_accessor: EventDatabaseAccessor
+    sketch_store: EventSketchStore
+    dead_letter_queue: deque[EventQueueDTO]
     last_log_time: int
     last_consumed_time: datetime
+    draining: bool = False
 
     def __init__(self) -> None:
 
@@ -65,7 +140,12 @@ class QueueConsumer:
         self.event_queue = QueueProducer.get_instance().event_queue
         self.config = LogServiceConfig.get_instance()
         self.database_accessor = EventDatabaseAccessor()
-        self.conn = sqlite3.connect(self.config.get_db_url())
+        # the connection is used by one consumer thread at a time, but a restarted worker runs on a new thread
+        self.conn = sqlite3.connect(self.config.get_db_url(), check_same_thread=False)
+        self.sketch_store = EventSketchStore.get_instance()
+        self.hot_tail = HotTailBuffer.get_instance()
+        self.change_feed = ChangeFeedHub.get_instance()
+        self.dead_letter_queue = deque(maxlen=DEAD_LETTER_QUEUE_SIZE)
         self.last_log_time = int(datetime.now().timestamp())
         self.last_consumed_time = datetime.now()
         QueueConsumer._instance = self
@@ -91,9 +171,16 @@ class QueueConsumer:
 
         """
         Consumes events from the queue in chunks, processes them, and saves them to the database.
-        If the queue is empty, it briefly sleeps before checking again. Performance stats are logged.
+        If the queue is empty, it waits up to the `consumer_idle_wait_seconds` setting for new events. Batches are
+        at most `consumer_chunk_size` events. Performance stats are logged.
+
+        All events of a chunk are committed in one transaction, so the senders waiting for their events to be
+        committed share a commit (group commit) instead of paying one each.
         """
 
+        self._persist_sketches()
+        settings = LogServiceConfig.get_settings()
+
         queue_length = len(self.event_queue)
 
         if queue_length == 0:
@@ -101,7 +188,7 @@ class QueueConsumer:
                 f" ####### No events in queue ------------> Queue Consumer currently sleeping. Last event consumed at {self.last_consumed_time}"
             )
 
-            time.sleep(0.1)
+            self.event_queue.wait_for_events(settings.consumer_idle_wait_seconds)
             return
 
         if queue_length > self.max_queue_length:
@@ -115,63 +202,196 @@ class QueueConsumer:
             if not queue_length:
                 return
 
-            chunk_size = CHUNK_SIZE if queue_length > CHUNK_SIZE else queue_length
+            max_chunk_size = (
+                DRAIN_CHUNK_SIZE if self.draining else settings.consumer_chunk_size
+            )
+            events = self.event_queue.pop_batch(max_chunk_size)
 
-            events = []
+        QUEUE_BYTES.dec(self._event_bytes(events))
+        self._save_event(events)
 
-            for i in range(chunk_size):
-                events.append(self.event_queue.popleft())
+    def take_remaining_events(self) -> list[EventQueueDTO]:
+        """
+        Removes and returns all events still in the queue, e.g. to spill them to disk when a shutdown drain runs
+        out of time. Must not run concurrently with `consume_events`, whose failed batches go back to the queue.
 
-        self._save_event(events)
+        Returns:
+            list[EventQueueDTO]: The events, in queue order.
+        """
+        with self._lock:
+            events = [
+                event for event in self.event_queue.pop_all() if event is not None
+            ]
+        QUEUE_BYTES.dec(self._event_bytes(events))
+        return events
 
     def _save_event(self, events: list[EventQueueDTO]) -> None:
 
         """
         Saves a list of events to the database. If saving fails, events are returned to the queue for retrying.
 
+        A batch that failed MAX_SAVE_ATTEMPTS times is saved event by event. Events failing on their own while
+        others are saved can never be saved and go to the dead letter queue; if all fail, e.g. the database is
+        down, they are all retried.
+
         Parameters:
             events (list[EventQueueDTO]): The list of events to be saved.
 
         Note:
-            - Connection recycling and retry logic should be implemented for robustness.
+            - Connection recycling should be implemented for robustness.
         """
 
+        events = [event for event in events if event is not None]
+        if not events or self._save_batch(events):
+            return
+
+        for event in events:
+            event.save_attempts += 1
+        if max(event.save_attempts for event in events) < MAX_SAVE_ATTEMPTS:
+            self._requeue(events)
+            return
+
+        failed_events = [event for event in events if not self._save_batch([event])]
+        if len(failed_events) < len(events):
+            self._dead_letter(failed_events)
+        else:
+            self._requeue(failed_events)
+
+    def _save_batch(self, events: list[EventQueueDTO]) -> bool:
         insert_data = [
             (
                 event.customer_id,
                 event.event_type,
                 event.timestamp_utc,
-                orjson.dumps(event.event_data),
+                event.serialized_event_data,
+                event.event_uuid,
             )
             for event in events
-            if event is not None
         ]
 
         if (
             not self.conn
         ):  # todo recycle connection after x amount usage to avoid it being stale
-            self.conn = sqlite3.connect(self.config.get_db_url())
+            self.conn = sqlite3.connect(
+                self.config.get_db_url(), check_same_thread=False
+            )
 
-        is_successful = self.database_accessor.save_events_to_db(
-            insert_data, conn=self.conn
+        started_at = time.perf_counter()
+        # the ids are needed by the hot tail, change feed subscribers and senders waiting for the commit
+        if (
+            self.hot_tail.is_open
+            or self.change_feed.has_subscribers
+            or any(event.commit_future is not None for event in events)
+        ):
+            event_ids = self.database_accessor.save_events_returning_ids(
+                insert_data, conn=self.conn
+            )
+            is_successful = event_ids is not None
+        else:
+            event_ids = None
+            is_successful = self.database_accessor.save_events_to_db(
+                insert_data, conn=self.conn
+            )
+        COMMIT_SECONDS.labels("success" if is_successful else "failure").observe(
+            time.perf_counter() - started_at
         )
+        BATCH_SIZE.observe(len(insert_data))
+
+        if is_successful:
+            if event_ids is not None:
+                self.hot_tail.mark_committed(events, event_ids)
+                self._publish(events, event_ids)
+                for event, event_id in zip(events, event_ids):
+                    _resolve_commit_future(event, event_id)
+            EVENTS_COMMITTED.inc(len(insert_data))
+            self.last_consumed_time = datetime.now()
+            self._update_sketches(events)
+            self._invalidate_analytics_chunks(events)
+        return is_successful
 
+    def _requeue(self, events: list[EventQueueDTO]) -> None:
         #  return failed events back to the queue to be retried
-        #  todo there should be some logic surrounding events that have been retried a couple of times and still fails
-        if not is_successful:
-            with self._lock:
-                for event in events:
-                    self.event_queue.append(event)
-        else:
-            self.last_consumed_time = datetime.now()
+        with self._lock:
+            self.event_queue.extend(events)
+        EVENTS_RETRIED.inc(len(events))
+        QUEUE_BYTES.inc(self._event_bytes(events))
 
-    def _log_event_performance_stats(self, message: str | None = None) -> None:
+    def _publish(self, events: list[EventQueueDTO], event_ids: list[int]) -> None:
+        if not self.change_feed.has_subscribers:
+            return
+        self.change_feed.publish(
+            [
+                (
+                    event_id,
+                    event.event_type,
+                    event.timestamp_utc,
+                    event.customer_id,
+                    event.serialized_event_data,
+                )
+                for event, event_id in zip(events, event_ids)
+            ]
+        )
+
+    def _dead_letter(self, events: list[EventQueueDTO]) -> None:
+        for event in events:
+            logger.error(
+                f"Moving event to the dead letter queue after {event.save_attempts} failed saves. "
+                f"event_type: {event.event_type}, customer_id: {event.customer_id}, "
+                f"timestamp_utc: {event.timestamp_utc}"
+            )
+        self.dead_letter_queue.extend(events)
+        self.hot_tail.discard(events)
+        fail_commit_futures(events, "The event could not be saved")
+        EVENTS_DEAD_LETTERED.inc(len(events))
+
+    @staticmethod
+    def _event_bytes(events: list[EventQueueDTO]) -> int:
+        return sum(
+            len(event.serialized_event_data) for event in events if event is not None
+        )
+
+    def _update_sketches(self, events: list[EventQueueDTO]) -> None:
+        """
+        Adds a committed batch to the approximate sketches. Sketches are best effort, a failure here must never
+        send an already committed batch back to the queue.
+        """
+        try:
+            self.sketch_store.add_events(events)
+        except Exception as e:
+            logger.error(f"Error while updating event sketches: {e}", exc_info=True)
+
+    def _invalidate_analytics_chunks(self, events: list[EventQueueDTO]) -> None:
         """
-        Logs the current queue length and the maximum queue length observed for performance monitoring.
+        Drops the cached analytics chunks a committed batch lands in, so late and backfilled events show up in
+        analytics. Best effort like the sketches.
         """
-        performance_message = f" current queue lag: {len(self.event_queue)}, max queue lag: {self.max_queue_length} "
+        try:
+            AnalyticsChunkCache.get_instance().invalidate_timestamps(
+                event.timestamp_utc for event in events
+            )
+        except Exception as e:
+            logger.error(
+                f"Error while invalidating analytics chunks: {e}", exc_info=True
+            )
 
-        if int(datetime.now().timestamp()) > self.last_log_time + 5:
+    def _persist_sketches(self) -> None:
+        try:
+            self.sketch_store.persist_if_due(conn=self.conn)
+        except Exception as e:
+            logger.error(f"Error while persisting event sketches: {e}", exc_info=True)
+
+    def _log_event_performance_stats(self, message: str | None = None) -> None:
+        """
+        Logs the current queue length, the maximum queue length observed and the depth and lag of every priority
+        lane for performance monitoring, every `stats_log_interval_seconds`.
+        """
+        log_interval = LogServiceConfig.get_settings().stats_log_interval_seconds
+        if int(datetime.now().timestamp()) > self.last_log_time + log_interval:
+            lanes = ", ".join(
+                f"{name}: {stats['depth']} events, {stats['lag_seconds']}s behind"
+                for name, stats in self.event_queue.lane_stats().items()
+            )
+            performance_message = f" current queue lag: {len(self.event_queue)}, max queue lag: {self.max_queue_length}, lanes: {lanes} "
             if message:
                 logger.error(message + performance_message)
             else:
@@ -1,7 +1,216 @@
-from threading import RLock
+import time
+from threading import Event, Lock, RLock
 from collections import deque
+from typing import Iterable, Iterator
 
+from log_service.config import (
+    DEFAULT_PRIORITY_LANE,
+    PRIORITY_LANE_WEIGHTS,
+    LogServiceConfig,
+)
 from log_service.data.event_dto import EventQueueDTO
+from log_service.monitoring.metrics import MetricsRegistry
+from log_service.processors.hot_tail import HotTailBuffer
+
+metrics = MetricsRegistry.get_instance()
+EVENTS_ENQUEUED = metrics.counter(
+    "log_service_events_enqueued_total", "Events accepted into the ingest queue."
+)
+QUEUE_DEPTH = metrics.gauge(
+    "log_service_queue_depth", "Events waiting in the ingest queue."
+)
+QUEUE_BYTES = metrics.gauge(
+    "log_service_queue_bytes", "Encoded event_data bytes waiting in the ingest queue."
+)
+QUEUE_LANE_DEPTH = metrics.gauge(
+    "log_service_queue_lane_depth",
+    "Events waiting in a priority lane of the ingest queue.",
+    label_names=("lane",),
+)
+QUEUE_LANE_LAG = metrics.gauge(
+    "log_service_queue_lane_lag_seconds",
+    "How long the oldest event of a priority lane has been queued.",
+    label_names=("lane",),
+)
+
+
+class QueueLane:
+    """
+    The events of one priority class, in arrival order, with the scheduling credit the lane has accumulated.
+    """
+
+    def __init__(self, name: str, weight: int):
+        self.name = name
+        self.weight = weight
+        self.events: deque[EventQueueDTO] = deque()
+        self.credit = 0.0
+
+    def lag_seconds(self, now: float) -> float:
+        if not self.events or self.events[0].enqueued_at is None:
+            return 0.0
+        return now - self.events[0].enqueued_at
+
+
+class PriorityLaneQueue:
+    """
+    The ingest queue: one FIFO lane per priority class (see PRIORITY_LANE_WEIGHTS), an event's lane given by its
+    event_type. It keeps the deque interface the queue had before (len, iteration, append, extend, popleft,
+    clear), with `popleft` serving the lanes strictly by priority, and adds `pop_batch` for the consumer.
+
+    `pop_batch` shares a batch between the non-empty lanes by weighted fair queuing: every lane is credited its
+    weighted share of the batch, and takes as many events as its whole credit. Fractional shares carry over to
+    the next batch, lanes are served by credit so a lane left out of a full batch goes first in the next one, and
+    every non-empty lane gets at least one event per batch, so a low priority lane slows down under a high
+    priority backlog but never starves. Slots a lane cannot use go to the other lanes by priority.
+
+    All operations take the queue's own lock, so producers and the consumer need no other locking.
+
+    Attributes:
+        lanes (dict[str, QueueLane]): The lanes by name, highest priority first.
+        event_type_lanes (dict[str, QueueLane]): The lane of every event type that is not in the default lane.
+        default_lane (QueueLane): The lane of all other event types.
+    """
+
+    def __init__(
+        self,
+        event_type_priorities: dict[str, str],
+        lane_weights: dict[str, int] = PRIORITY_LANE_WEIGHTS,
+    ):
+        self.lanes = {
+            name: QueueLane(name, weight)
+            for name, weight in sorted(
+                lane_weights.items(), key=lambda item: item[1], reverse=True
+            )
+        }
+        self.event_type_lanes = {
+            event_type: self.lanes[lane]
+            for event_type, lane in event_type_priorities.items()
+        }
+        self.default_lane = self.lanes[DEFAULT_PRIORITY_LANE]
+        self._lock = Lock()
+        self._not_empty = Event()
+
+    def lane_of(self, event: EventQueueDTO) -> QueueLane:
+        return self.event_type_lanes.get(event.event_type, self.default_lane)
+
+    def __len__(self) -> int:
+        return sum(len(lane.events) for lane in self.lanes.values())
+
+    def __iter__(self) -> Iterator[EventQueueDTO]:
+        with self._lock:
+            events = [event for lane in self.lanes.values() for event in lane.events]
+        return iter(events)
+
+    def append(self, event: EventQueueDTO) -> None:
+        # a requeued event keeps its first enqueue time, its lag includes the failed saves
+        if event.enqueued_at is None:
+            event.enqueued_at = time.monotonic()
+        lane = self.lane_of(event)
+        with self._lock:
+            lane.events.append(event)
+        self._not_empty.set()
+
+    def extend(self, events: Iterable[EventQueueDTO]) -> None:
+        now = time.monotonic()
+        lanes = [(self.lane_of(event), event) for event in events]
+        for _, event in lanes:
+            if event.enqueued_at is None:
+                event.enqueued_at = now
+        with self._lock:
+            for lane, event in lanes:
+                lane.events.append(event)
+        self._not_empty.set()
+
+    def popleft(self) -> EventQueueDTO:
+        with self._lock:
+            for lane in self.lanes.values():
+                if lane.events:
+                    return lane.events.popleft()
+        raise IndexError("pop from an empty queue")
+
+    def wait_for_events(self, timeout: float) -> bool:
+        """
+        Blocks until events are queued or the timeout passes, so an idle consumer picks up new events at once.
+
+        Returns:
+            bool: Whether events are queued.
+        """
+        self._not_empty.clear()
+        if len(self):
+            return True
+        return self._not_empty.wait(timeout)
+
+    def pop_all(self) -> list[EventQueueDTO]:
+        """Removes and returns all events, by lane priority."""
+        with self._lock:
+            events = [event for lane in self.lanes.values() for event in lane.events]
+            for lane in self.lanes.values():
+                lane.events.clear()
+                lane.credit = 0.0
+        return events
+
+    def clear(self) -> None:
+        with self._lock:
+            for lane in self.lanes.values():
+                lane.events.clear()
+                lane.credit = 0.0
+
+    def pop_batch(self, max_events: int) -> list[EventQueueDTO]:
+        """
+        Removes and returns up to `max_events` events, shared between the lanes by weighted fair queuing.
+
+        Parameters:
+            max_events (int): The batch size.
+
+        Returns:
+            list[EventQueueDTO]: The events, in lane order and in arrival order within a lane.
+        """
+        with self._lock:
+            active = [lane for lane in self.lanes.values() if lane.events]
+            if not active:
+                return []
+            if len(active) == 1:
+                # nothing to share, e.g. no backlog of another lane
+                lane = active[0]
+                count = min(len(lane.events), max_events)
+                events = [lane.events.popleft() for _ in range(count)]
+                if not lane.events:
+                    lane.credit = 0.0
+                return events
+            total_weight = sum(lane.weight for lane in active)
+            for lane in active:
+                # capped, so a lane does not save up more than a batch while it is served as leftover
+                lane.credit = min(
+                    lane.credit + max_events * lane.weight / total_weight, max_events
+                )
+
+            taken: dict[str, list[EventQueueDTO]] = {lane.name: [] for lane in active}
+            remaining = max_events
+            for lane in sorted(active, key=lambda lane: lane.credit, reverse=True):
+                count = min(len(lane.events), max(1, int(lane.credit)), remaining)
+                taken[lane.name].extend(lane.events.popleft() for _ in range(count))
+                lane.credit -= count
+                remaining -= count
+            for lane in active:
+                while remaining and lane.events:
+                    taken[lane.name].append(lane.events.popleft())
+                    remaining -= 1
+                if not lane.events:
+                    # an idle lane does not save up credit, as in deficit round robin
+                    lane.credit = 0.0
+        return [event for lane in active for event in taken[lane.name]]
+
+    def lane_stats(self) -> dict[str, dict]:
+        """Returns the depth and the lag in seconds of every lane."""
+        now = time.monotonic()
+        with self._lock:
+            return {
+                lane.name: {
+                    "depth": len(lane.events),
+                    "lag_seconds": round(lane.lag_seconds(now), 3),
+                }
+                for lane in self.lanes.values()
+            }
 
 
 class QueueProducer:
@@ -9,8 +218,8 @@ class QueueProducer:
     Implements a thread-safe singleton queue producer for managing event queuing operations.
 
     This class is designed to enqueue events in a thread-safe manner, ensuring that events are
-    correctly appended to the queue even in a multi-threaded environment. It uses a deque (double-ended queue)
-    from the collections module to store the events, providing efficient append operations.
+    correctly appended to the queue even in a multi-threaded environment. It uses a PriorityLaneQueue, a deque
+    per priority class of event types, so critical events are committed first during a backlog.
 
     The QueueProducer class is implemented as a singleton to ensure that only one instance manages
     the event queue across the entire application.
@@ -18,12 +227,14 @@ class QueueProducer:
     Attributes:
         _instance (QueueProducer, optional): Class variable to hold the singleton instance.
         _lock (RLock): A reentrant lock to ensure thread-safe operations on the singleton instance and the event queue.
-        event_queue (deque[EventQueueDTO | None]): The event queue storing instances of EventQueueDTO.
+        event_queue (PriorityLaneQueue): The event queue storing instances of EventQueueDTO.
+        hot_tail (HotTailBuffer): The recent events served from memory, queued events are added to it.
 
     Methods:
         __init__(): Initializes a new QueueProducer instance, enforcing the singleton pattern.
         get_instance(): Returns the singleton instance of the QueueProducer class.
         enqueue_event(event: EventQueueDTO): Adds an event to the queue in a thread-safe manner.
+        enqueue_events(events: list[EventQueueDTO]): Adds a batch of events to the queue under one lock acquisition.
 
     Usage:
         # Getting the singleton instance
@@ -39,13 +250,24 @@ class QueueProducer:
 
     _instance = None
     _lock: RLock = RLock()
-    event_queue: deque[EventQueueDTO]
+    event_queue: PriorityLaneQueue
 
     def __init__(self) -> None:
         if QueueProducer._instance:
             raise Exception("This class is a singleton!")
         QueueProducer._instance = self
-        self.event_queue = deque()
+        self.event_queue = PriorityLaneQueue(
+            LogServiceConfig.get_event_type_priorities()
+        )
+        self.hot_tail = HotTailBuffer.get_instance()
+        QUEUE_DEPTH.set_function(lambda: len(self.event_queue))
+        for lane in self.event_queue.lanes.values():
+            QUEUE_LANE_DEPTH.labels(lane.name).set_function(
+                lambda lane=lane: len(lane.events)
+            )
+            QUEUE_LANE_LAG.labels(lane.name).set_function(
+                lambda lane=lane: lane.lag_seconds(time.monotonic())
+            )
 
     @classmethod
     def get_instance(cls) -> "QueueProducer":
@@ -73,6 +295,27 @@ class QueueProducer:
             bool: Always returns True to indicate the event was successfully enqueued.
         """
 
-        with self._lock:
-            self.event_queue.append(event)
+        # buffered first, so the consumer never commits an event before it has its entry
+        self.hot_tail.add((event,))
+        self.event_queue.append(event)
+        EVENTS_ENQUEUED.inc()
+        QUEUE_BYTES.inc(len(event.serialized_event_data))
+        return True
+
+    def enqueue_events(self, events: list[EventQueueDTO]) -> bool:
+        """
+        Adds a batch of events to the queue in a thread-safe manner. The batch is appended under one lock
+        acquisition, so its events stay contiguous in their lanes.
+
+        Parameters:
+            events (list[EventQueueDTO]): The events to enqueue.
+
+        Returns:
+            bool: Always returns True to indicate the events were successfully enqueued.
+        """
+
+        self.hot_tail.add(events)
+        self.event_queue.extend(events)
+        EVENTS_ENQUEUED.inc(len(events))
+        QUEUE_BYTES.inc(sum(len(event.serialized_event_data) for event in events))
         return True
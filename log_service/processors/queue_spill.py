@@ -0,0 +1,185 @@
+import glob
+import gzip
+import logging
+import os
+import struct
+import time
+from typing import Iterator
+
+from log_service.data.event_dto import EventQueueDTO
+
+logger = logging.getLogger(__name__)
+
+SPILL_FILE_MAGIC = b"LOGSPILL2"
+# timestamp_utc, customer_id, save_attempts, event_type length, event_data length, event_uuid length
+SPILL_RECORD_HEADER = struct.Struct("<qqHHIB")
+# files of the previous version have no event_uuid, they are still read on startup
+SPILL_FILE_MAGIC_V1 = b"LOGSPILL1"
+SPILL_RECORD_HEADER_V1 = struct.Struct("<qqHHI")
+# spilling runs against the shutdown deadline, so compression is kept cheap
+SPILL_COMPRESS_LEVEL = 1
+
+
+class QueueSpill:
+    """
+    Spills queued events that a shutdown could not commit in time to local files, and re-ingests them on the next
+    startup.
+
+    Files sit next to the database, named `<database name>.spill-<time in ns>`, so every database has its own
+    spills and a spill never overwrites an earlier one that was not re-ingested yet. Each file is a gzip stream of
+    the SPILL_FILE_MAGIC header followed by one binary record per event: a SPILL_RECORD_HEADER with the fixed size
+    fields, then the event type, the already JSON encoded event_data, which is written and read back without
+    being decoded or encoded again, and the event_uuid if the event has one. Files are written under a temporary name, fsynced and then renamed, so a crash
+    mid spill never leaves a truncated file to re-ingest.
+
+    Attributes:
+        db_path (str): The database the spilled events belong to.
+    """
+
+    def __init__(self, db_path: str) -> None:
+        self.db_path = db_path
+
+    def spill(self, events: list[EventQueueDTO]) -> str | None:
+        """
+        Writes events to a new spill file. An event that cannot be encoded as a spill record, e.g. with a field
+        out of range of SPILL_RECORD_HEADER, is logged and skipped, so it cannot lose the other events.
+
+        Parameters:
+            events (list[EventQueueDTO]): The events, in queue order.
+
+        Returns:
+            str | None: The path of the spill file, None if there were no events.
+
+        Raises:
+            OSError: If the file cannot be written, no file is left behind then.
+        """
+        if not events:
+            return None
+        path = f"{self.db_path}.spill-{time.time_ns()}"
+        temp_path = f"{path}.tmp"
+        try:
+            with open(temp_path, "wb") as raw_file:
+                with gzip.GzipFile(
+                    fileobj=raw_file, mode="wb", compresslevel=SPILL_COMPRESS_LEVEL
+                ) as f:
+                    f.write(SPILL_FILE_MAGIC)
+                    for event in events:
+                        try:
+                            record = self._encode_record(event)
+                        except (struct.error, OverflowError, UnicodeEncodeError) as e:
+                            logger.error(
+                                f"Skipping event of customer {event.customer_id} that cannot be spilled: {e}"
+                            )
+                            continue
+                        f.write(record)
+                raw_file.flush()
+                os.fsync(raw_file.fileno())
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return path
+
+    @staticmethod
+    def _encode_record(event: EventQueueDTO) -> bytes:
+        event_type = event.event_type.encode()
+        event_uuid = (event.event_uuid or "").encode()
+        return (
+            SPILL_RECORD_HEADER.pack(
+                event.timestamp_utc,
+                event.customer_id,
+                min(event.save_attempts, 0xFFFF),
+                len(event_type),
+                len(event.serialized_event_data),
+                len(event_uuid),
+            )
+            + event_type
+            + event.serialized_event_data
+            + event_uuid
+        )
+
+    def spill_paths(self) -> list[str]:
+        """Returns the spill files of the database, oldest first."""
+        return sorted(
+            (
+                path
+                for path in glob.glob(f"{glob.escape(self.db_path)}.spill-*")
+                if path[path.rindex("-") + 1 :].isdigit()
+            ),
+            key=lambda path: int(path[path.rindex("-") + 1 :]),
+        )
+
+    def read(self, path: str) -> list[EventQueueDTO]:
+        """
+        Reads the events of a spill file.
+
+        Raises:
+            ValueError: If the file is not a spill file or is corrupt.
+        """
+        try:
+            return list(self._read_events(path))
+        except (EOFError, OSError, struct.error, UnicodeDecodeError) as e:
+            raise ValueError(f"Corrupt spill file {path}: {e}")
+
+    def _read_events(self, path: str) -> Iterator[EventQueueDTO]:
+        with gzip.open(path, "rb") as f:
+            magic = f.read(len(SPILL_FILE_MAGIC))
+            if magic not in (SPILL_FILE_MAGIC, SPILL_FILE_MAGIC_V1):
+                raise ValueError(f"{path} is not a spill file")
+            record_header = (
+                SPILL_RECORD_HEADER
+                if magic == SPILL_FILE_MAGIC
+                else SPILL_RECORD_HEADER_V1
+            )
+            while header := f.read(record_header.size):
+                (
+                    timestamp_utc,
+                    customer_id,
+                    save_attempts,
+                    event_type_size,
+                    event_data_size,
+                    *event_uuid_size,
+                ) = record_header.unpack(header)
+                event_uuid_size = event_uuid_size[0] if event_uuid_size else 0
+                event_type = f.read(event_type_size)
+                event_data = f.read(event_data_size)
+                event_uuid = f.read(event_uuid_size)
+                if (
+                    len(event_type) + len(event_data) + len(event_uuid)
+                    < event_type_size + event_data_size + event_uuid_size
+                ):
+                    raise EOFError("truncated record")
+                yield EventQueueDTO.from_serialized(
+                    event_type.decode(),
+                    timestamp_utc,
+                    customer_id,
+                    event_data,
+                    save_attempts=save_attempts,
+                    event_uuid=event_uuid.decode() or None,
+                )
+
+    def reingest(self) -> tuple[list[EventQueueDTO], list[str]]:
+        """
+        Reads the events of all spill files of the database, oldest first. Files that cannot be read are renamed
+        with a `.corrupt` suffix and logged, so they are kept for inspection without blocking startups.
+
+        Returns:
+            tuple[list[EventQueueDTO], list[str]]: The events, and the files they were read from, to be removed with
+            `remove` once the events are queued again.
+        """
+        events: list[EventQueueDTO] = []
+        paths = []
+        for path in self.spill_paths():
+            try:
+                events.extend(self.read(path))
+                paths.append(path)
+            except ValueError as e:
+                logger.error(f"Skipping spill file: {e}")
+                os.replace(path, f"{path}.corrupt")
+        return events, paths
+
+    @staticmethod
+    def remove(paths: list[str]) -> None:
+        for path in paths:
+            os.remove(path)
@@ -0,0 +1,172 @@
+import logging
+import threading
+import time
+from threading import Event, RLock
+
+from log_service.config import LogServiceConfig
+from log_service.processors.hot_tail import HotTailBuffer
+from log_service.processors.queue_consumer import QueueConsumer, fail_commit_futures
+from log_service.processors.queue_producer import QueueProducer
+from log_service.processors.queue_spill import QueueSpill
+
+logger = logging.getLogger(__name__)
+
+
+class QueueConsumerWorker:
+    """
+    Implements a thread-safe singleton owning the background thread that runs the QueueConsumer, from startup to a
+    bounded shutdown.
+
+    `start` opens the HotTailBuffer, re-ingests the events spilled by the previous shutdown, then starts the consumer
+    thread. `stop` drains
+    the queue with the consumer switched to its largest batch size, for at most the configured drain deadline.
+    The events still queued when the deadline passes are spilled to a local file (see QueueSpill) instead of
+    holding up the shutdown, so a rolling deploy finishes in bounded time without losing queued events.
+
+    Attributes:
+        _instance (QueueConsumerWorker, optional): Class variable to hold the singleton instance.
+        _lock (RLock): A reentrant lock guarding the singleton instance and the start / stop of the thread.
+        config (LogServiceConfig): Configuration instance for accessing the database and the drain deadline.
+        thread (threading.Thread | None): The consumer thread, None when stopped.
+
+    Usage:
+        worker = QueueConsumerWorker.get_instance()
+        worker.start()
+        ...
+        worker.stop()
+
+    Raises:
+        Exception: If an attempt is made to directly instantiate the class instead of using the `get_instance` method.
+    """
+
+    _instance = None
+    _lock: RLock = RLock()
+
+    def __init__(self) -> None:
+        if QueueConsumerWorker._instance:
+            raise Exception("This class is a singleton!")
+        self.config = LogServiceConfig.get_instance()
+        self.thread: threading.Thread | None = None
+        self._draining = Event()
+        self._stopping = Event()
+        QueueConsumerWorker._instance = self
+
+    @classmethod
+    def get_instance(cls) -> "QueueConsumerWorker":
+        """
+        Retrieves the singleton instance of the QueueConsumerWorker class, creating it if it does not already exist.
+
+        Returns:
+            QueueConsumerWorker: The singleton instance of the class.
+        """
+        if not cls._instance:
+            with cls._lock:
+                if not cls._instance:
+                    cls._instance = QueueConsumerWorker()
+        return cls._instance
+
+    def start(self) -> int:
+        """
+        Re-ingests spilled events into the queue and starts the consumer thread, unless it is running already.
+
+        Returns:
+            int: The number of re-ingested events.
+        """
+        with self._lock:
+            if self.thread is not None:
+                return 0
+            # opened before re-ingesting, so the spilled events are served from memory too
+            HotTailBuffer.get_instance().open(QueueConsumer.get_instance().conn)
+            reingested = self._reingest_spills()
+            self._draining.clear()
+            self._stopping.clear()
+            self.thread = threading.Thread(
+                target=self.run, name="queue-consumer", daemon=True
+            )
+            self.thread.start()
+            return reingested
+
+    def stop(self, drain_deadline_seconds: float | None = None) -> int:
+        """
+        Drains the queue for at most `drain_deadline_seconds`, stops the consumer thread and spills the events
+        left in the queue to disk.
+
+        The batch being committed when the deadline passes is finished first, which takes at most one
+        DRAIN_CHUNK_SIZE transaction.
+
+        Parameters:
+            drain_deadline_seconds (float | None): The drain deadline, None for the configured one.
+
+        Returns:
+            int: The number of spilled events.
+        """
+        if drain_deadline_seconds is None:
+            drain_deadline_seconds = self.config.get_shutdown_drain_deadline_seconds()
+
+        with self._lock:
+            thread = self.thread
+            if thread is None:
+                return 0
+            consumer = QueueConsumer.get_instance()
+            started_at = time.perf_counter()
+            logger.info(
+                f"Draining {len(consumer.event_queue)} queued events for at most {drain_deadline_seconds}s"
+            )
+            consumer.draining = True
+            self._draining.set()
+            thread.join(timeout=drain_deadline_seconds)
+            self._stopping.set()
+            thread.join()
+            self.thread = None
+            consumer.draining = False
+
+            spilled_events = consumer.take_remaining_events()
+            spilled = len(spilled_events)
+            HotTailBuffer.get_instance().close()
+            # committed after the next start, too late for senders waiting on this process
+            fail_commit_futures(
+                spilled_events, "The service shut down before the event was committed"
+            )
+            if spilled_events:
+                try:
+                    path = QueueSpill(self.config.get_db_url()).spill(spilled_events)
+                    logger.warning(
+                        f"Drain deadline passed, spilled {spilled} queued events to {path}"
+                    )
+                except OSError as e:
+                    logger.critical(
+                        f"Failed to spill {spilled} queued events, they are lost: {e}"
+                    )
+            logger.info(
+                f"Queue consumer stopped in {time.perf_counter() - started_at:.2f}s"
+            )
+            return spilled
+
+    def run(self) -> None:
+        """
+        Consumes events until stopped, or until the queue is empty once draining started.
+        Exceptions while consuming are logged and consumption goes on.
+        """
+        queue_consumer = QueueConsumer.get_instance()
+        while not self._stopping.is_set():
+            try:
+                if self._draining.is_set() and len(queue_consumer.event_queue) == 0:
+                    break
+                queue_consumer.consume_events()
+            except Exception as e:
+                logger.error(f"Consuming events failed: {e}", exc_info=True)
+
+        # flush the sketches of the last batches, the periodic persist may not have run since
+        queue_consumer.sketch_store.persist(conn=queue_consumer.conn)
+
+    def _reingest_spills(self) -> int:
+        spill = QueueSpill(self.config.get_db_url())
+        events, paths = spill.reingest()
+        if events:
+            QueueProducer.get_instance().enqueue_events(events)
+            logger.warning(
+                f"Re-ingested {len(events)} events spilled by the previous shutdown"
+            )
+        # the events are queued again, a shutdown spills them anew if they are not committed by then
+        spill.remove(paths)
+        return len(events)
@@ -0,0 +1,382 @@
+import glob
+import gzip
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from collections import deque
+
+import httpx
+import orjson
+
+logger = logging.getLogger(__name__)
+
+# events buffered in memory, beyond that `log_event` drops events instead of blocking the caller
+MAX_QUEUED_EVENTS = 100_000
+# a batch is sent once it holds this many events, or once its oldest event waited this long
+BATCH_SIZE = 500
+LINGER_SECONDS = 0.2
+REQUEST_TIMEOUT_SECONDS = 10.0
+GZIP_LEVEL = 6
+# access tokens are requested for this long and refreshed this long before they expire
+TOKEN_VALID_MINUTES = 60
+TOKEN_REFRESH_MARGIN_SECONDS = 60.0
+# attempts of a batch while the service is unreachable or failing, with jittered exponential backoff in between
+MAX_SEND_ATTEMPTS = 5
+BACKOFF_INITIAL_SECONDS = 0.1
+BACKOFF_MAX_SECONDS = 10.0
+# how often spilled batches are offered again while no new events are sent
+SPILL_REPLAY_INTERVAL_SECONDS = 5.0
+
+
+class ServiceUnavailableError(Exception):
+    """The service could not be reached or kept failing, the batch was not stored."""
+
+
+class LogServiceClient:
+    """
+    Sends audit events to the log service from a background thread, so logging an event costs the caller one
+    append to a bounded in-memory queue.
+
+    The flusher thread sends the queued events with `POST /event/batch` over one keep-alive connection, as soon as
+    BATCH_SIZE events are queued or the oldest queued event waited `linger_seconds`. Bodies are gzipped if
+    `gzip` is set. An access token is requested from `/access-token` and cached until shortly before it expires,
+    a 401 fetches a new one.
+
+    Every event gets an event_uuid when it is logged, so a batch sent again after a timeout is stored once. A 429
+    is retried after its Retry-After, connection errors and 5xx responses up to MAX_SEND_ATTEMPTS times with
+    jittered exponential backoff. A batch that still fails is written to `spill_dir` if one is set, and sent again
+    once the service is reachable; without a spill directory it is dropped. Other 4xx responses drop the batch, a
+    client error would fail the same way again.
+
+    Attributes:
+        base_url (str): The URL of the log service.
+        batch_size (int): The most events sent per request.
+        linger_seconds (float): How long an event waits for a batch to fill up.
+        gzip (bool): Whether request bodies are gzipped.
+        spill_dir (str | None): Where batches the service did not take are written, None to drop them.
+        counts (dict[str, int]): Events sent, dropped because the queue was full, rejected by the service,
+            spilled to disk and lost.
+
+    Methods:
+        log_event(event_type, customer_id, event_data, timestamp_utc, event_uuid): Queues an event, without blocking.
+        flush(timeout): Waits until the events queued so far are sent.
+        close(timeout): Sends the queued events and stops the flusher thread.
+
+    Usage:
+        client = LogServiceClient("http://127.0.0.1:8000", spill_dir="/var/spool/audit-events")
+        client.log_event("login", customer_id=42, event_data={"ip": "10.0.0.1"})
+        ...
+        client.close()
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        max_queued_events: int = MAX_QUEUED_EVENTS,
+        batch_size: int = BATCH_SIZE,
+        linger_seconds: float = LINGER_SECONDS,
+        gzip: bool = True,
+        spill_dir: str | None = None,
+        timeout: float = REQUEST_TIMEOUT_SECONDS,
+        transport: httpx.BaseTransport | None = None,
+    ):
+        """
+        Parameters:
+            base_url (str): The URL of the log service, e.g. `http://127.0.0.1:8000`.
+            max_queued_events (int): The most events buffered in memory.
+            batch_size (int): The most events sent per request, at most the service's batch limit of 1000.
+            linger_seconds (float): How long an event waits for a batch to fill up.
+            gzip (bool): Whether request bodies are gzipped.
+            spill_dir (str | None): Where batches are written while the service is unreachable, None to drop them.
+            timeout (float): The timeout of every request in seconds.
+            transport (httpx.BaseTransport | None): The HTTP transport, e.g. `httpx.HTTPTransport(uds=...)` to
+                reach the service over a Unix socket, None for the default.
+        """
+        self.base_url = base_url
+        self.max_queued_events = max_queued_events
+        self.batch_size = batch_size
+        self.linger_seconds = linger_seconds
+        self.gzip = gzip
+        self.spill_dir = spill_dir
+        self.counts = {"sent": 0, "dropped": 0, "rejected": 0, "spilled": 0, "lost": 0}
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+
+        self._http = httpx.Client(
+            base_url=base_url, timeout=timeout, transport=transport
+        )
+        self._events: deque[tuple[float, dict]] = deque()
+        self._condition = threading.Condition()
+        # events taken from the queue and not yet sent, spilled or dropped, `flush` waits for them too
+        self._in_flight = 0
+        self._flush_waiters = 0
+        self._closing = threading.Event()
+        self._token: str | None = None
+        self._token_refresh_at = 0.0
+        # set while batches are spilled, the next batches are tried once before being spilled as well
+        self._offline = False
+        self._spills_offered_at = 0.0
+        self._thread = threading.Thread(
+            target=self._run, name="log-service-client", daemon=True
+        )
+        self._thread.start()
+
+    def log_event(
+        self,
+        event_type: str,
+        customer_id: int,
+        event_data: dict,
+        timestamp_utc: int | None = None,
+        event_uuid: str | None = None,
+    ) -> bool:
+        """
+        Queues an event for the flusher thread. Never blocks on the service: if MAX_QUEUED_EVENTS are queued, e.g.
+        while the service is unreachable and no spill directory is set, the event is dropped.
+
+        Parameters:
+            event_type (str): The type of the event.
+            customer_id (int): Identifier of the customer associated with the event.
+            event_data (dict): Additional data related to the event, must not be empty.
+            timestamp_utc (int | None): When the event occurred, now if not set.
+            event_uuid (str | None): The id of the event, a new one if not set.
+
+        Returns:
+            bool: Whether the event was queued.
+        """
+        event = {
+            "event_type": event_type,
+            "timestamp_utc": (
+                int(time.time()) if timestamp_utc is None else timestamp_utc
+            ),
+            "customer_id": customer_id,
+            "event_data": event_data,
+            "event_uuid": event_uuid or str(uuid.uuid4()),
+        }
+        with self._condition:
+            if self._closing.is_set() or len(self._events) >= self.max_queued_events:
+                self.counts["dropped"] += 1
+                return False
+            self._events.append((time.monotonic(), event))
+            # the flusher waits for the first event to start the linger time, and for a full batch
+            if len(self._events) in (1, self.batch_size):
+                self._condition.notify_all()
+        return True
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """
+        Waits until the events queued so far are sent, spilled or dropped.
+
+        Returns:
+            bool: Whether they were, False if the timeout passed first.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            # the queued events are sent without waiting for their linger time
+            self._flush_waiters += 1
+            self._condition.notify_all()
+            try:
+                while self._events or self._in_flight:
+                    remaining = (
+                        None if deadline is None else deadline - time.monotonic()
+                    )
+                    if remaining is not None and remaining <= 0:
+                        return False
+                    self._condition.wait(remaining)
+            finally:
+                self._flush_waiters -= 1
+        return True
+
+    def close(self, timeout: float | None = None) -> None:
+        """
+        Sends the queued events and stops the flusher thread. Events that cannot be sent any more are spilled
+        right away, without backing off, or dropped without a spill directory.
+
+        Parameters:
+            timeout (float | None): How long to wait for the flusher thread, None to wait until it is done.
+        """
+        with self._condition:
+            self._closing.set()
+            self._condition.notify_all()
+        self._thread.join(timeout)
+        if not self._thread.is_alive():
+            self._http.close()
+
+    def _run(self) -> None:
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            if batch:
+                try:
+                    self._send_batch(batch)
+                except Exception as e:
+                    logger.error(
+                        f"Sending {len(batch)} events failed: {e}", exc_info=True
+                    )
+                    self.counts["lost"] += len(batch)
+                with self._condition:
+                    self._in_flight = 0
+                    self._condition.notify_all()
+            # also probes the service while offline and idle
+            if self.spill_dir and (not batch or not self._offline):
+                self._offer_spills()
+
+    def _next_batch(self) -> list[dict] | None:
+        """
+        Waits for a full batch or for the oldest event to linger long enough, and takes the batch off the queue.
+        Returns an empty batch after an idle interval, None once closed and drained.
+        """
+        with self._condition:
+            while True:
+                if self._events and (
+                    len(self._events) >= self.batch_size
+                    or self._closing.is_set()
+                    or self._flush_waiters
+                    or time.monotonic() - self._events[0][0] >= self.linger_seconds
+                ):
+                    break
+                if self._closing.is_set():
+                    return None
+                if self._events:
+                    timeout = (
+                        self._events[0][0] + self.linger_seconds - time.monotonic()
+                    )
+                else:
+                    timeout = SPILL_REPLAY_INTERVAL_SECONDS
+                if not self._condition.wait(timeout) and not self._events:
+                    return []
+            count = min(len(self._events), self.batch_size)
+            self._in_flight = count
+            return [self._events.popleft()[1] for _ in range(count)]
+
+    def _send_batch(self, batch: list[dict]) -> None:
+        body = orjson.dumps(batch)
+        try:
+            if self._post(body, attempts=1 if self._offline else MAX_SEND_ATTEMPTS):
+                self.counts["sent"] += len(batch)
+            else:
+                self.counts["rejected"] += len(batch)
+        except ServiceUnavailableError as e:
+            if not self._spill(body):
+                logger.error(f"Dropping {len(batch)} events: {e}")
+                self.counts["lost"] += len(batch)
+                return
+            self.counts["spilled"] += len(batch)
+            self._offline = True
+            return
+        if self._offline:
+            # reachable again, the spilled batches are offered right away
+            self._offline = False
+            self._spills_offered_at = 0.0
+
+    def _post(self, body: bytes, attempts: int) -> bool:
+        """
+        Sends a batch body, retrying 429s, 5xx responses and connection errors.
+
+        Returns:
+            bool: True if the events were stored, False if the service rejected them.
+
+        Raises:
+            ServiceUnavailableError: If the service was unreachable or failing for all attempts.
+        """
+        headers = {"Content-Type": "application/json"}
+        if self.gzip:
+            body = gzip.compress(body, GZIP_LEVEL)
+            headers["Content-Encoding"] = "gzip"
+        failures = 0
+        refreshed_token = False
+        while True:
+            try:
+                headers["Authorization"] = f"Bearer {self._access_token()}"
+                response = self._http.post(
+                    "/event/batch", content=body, headers=headers
+                )
+            except httpx.HTTPError as e:
+                error = f"{type(e).__name__}: {e}"
+            else:
+                if response.status_code < 300:
+                    return True
+                if response.status_code == 401 and not refreshed_token:
+                    self._token = None
+                    refreshed_token = True
+                    continue
+                if response.status_code == 429:
+                    self._wait(self._retry_after(response))
+                    if self._closing.is_set():
+                        raise ServiceUnavailableError("rate limited while closing")
+                    continue
+                if response.status_code < 500:
+                    logger.error(
+                        f"The log service rejected a batch: {response.status_code} {response.text}"
+                    )
+                    return False
+                error = f"{response.status_code} {response.text}"
+
+            failures += 1
+            if failures >= attempts or self._closing.is_set():
+                raise ServiceUnavailableError(error)
+            backoff = min(BACKOFF_MAX_SECONDS, BACKOFF_INITIAL_SECONDS * 2**failures)
+            self._wait(random.uniform(backoff / 2, backoff))
+
+    def _access_token(self) -> str:
+        if self._token is None or time.monotonic() >= self._token_refresh_at:
+            response = self._http.get(
+                "/access-token", params={"valid_minutes": TOKEN_VALID_MINUTES}
+            )
+            response.raise_for_status()
+            self._token = response.json()["token"]
+            self._token_refresh_at = (
+                time.monotonic()
+                + TOKEN_VALID_MINUTES * 60
+                - TOKEN_REFRESH_MARGIN_SECONDS
+            )
+        return self._token
+
+    @staticmethod
+    def _retry_after(response: httpx.Response) -> float:
+        try:
+            return float(response.headers.get("Retry-After", 1))
+        except ValueError:
+            return 1.0
+
+    def _wait(self, seconds: float) -> None:
+        # cut short by `close`, so a closing client does not sit out a long backoff
+        self._closing.wait(seconds)
+
+    def _spill(self, body: bytes) -> bool:
+        if not self.spill_dir:
+            return False
+        path = os.path.join(self.spill_dir, f"events-{time.time_ns()}.json")
+        try:
+            with open(f"{path}.tmp", "wb") as f:
+                f.write(body)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(f"{path}.tmp", path)
+        except OSError as e:
+            logger.error(f"Spilling a batch to {self.spill_dir} failed: {e}")
+            return False
+        return True
+
+    def _offer_spills(self) -> None:
+        """Sends the spilled batches again, oldest first, until one fails."""
+        now = time.monotonic()
+        if now - self._spills_offered_at < SPILL_REPLAY_INTERVAL_SECONDS:
+            return
+        self._spills_offered_at = now
+        for path in sorted(
+            glob.glob(os.path.join(glob.escape(self.spill_dir), "events-*.json"))
+        ):
+            with open(path, "rb") as f:
+                body = f.read()
+            try:
+                stored = self._post(body, attempts=1)
+            except ServiceUnavailableError:
+                self._offline = True
+                return
+            if not stored:
+                logger.error(f"The log service rejected the spilled batch {path}")
+            os.remove(path)
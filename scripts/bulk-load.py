@@ -0,0 +1,71 @@
+"""
+Loads events from NDJSON files (one POST /event body per line, optionally gzipped, "-" for stdin) straight into the
+Events table, for backfills and migrations. Run it while the service is stopped, see EventBulkLoader.
+
+Usage:
+    python scripts/bulk-load.py [--db path/to/database.db] [--presorted] [--journal-off] events.ndjson [...]
+"""
+import argparse
+import logging
+
+from log_service.config import LogServiceConfig
+from log_service.db_accessors.bulk_loader import (
+    BULK_LOAD_BATCH_ROWS,
+    SORT_BUFFER_ROWS,
+    EventBulkLoader,
+)
+
+
+def print_progress(rows_loaded: int, rows_per_second: float) -> None:
+    print(
+        f"loaded {rows_loaded:>12,} rows  {rows_per_second:>10,.0f} rows/s", flush=True
+    )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    parser = argparse.ArgumentParser(description="Bulk loads NDJSON events.")
+    parser.add_argument("paths", nargs="+", help="NDJSON files, .gz or - for stdin.")
+    parser.add_argument("--db", default=LogServiceConfig.get_instance().get_db_url())
+    parser.add_argument("--batch-rows", type=int, default=BULK_LOAD_BATCH_ROWS)
+    parser.add_argument("--sort-buffer-rows", type=int, default=SORT_BUFFER_ROWS)
+    parser.add_argument(
+        "--presorted",
+        action="store_true",
+        help="The input is ordered by timestamp already, skip sorting.",
+    )
+    parser.add_argument(
+        "--journal-off",
+        action="store_true",
+        help="No rollback journal during the load, a crash can corrupt the database.",
+    )
+    index_group = parser.add_mutually_exclusive_group()
+    index_group.add_argument("--rebuild-indexes", action="store_true", default=None)
+    index_group.add_argument(
+        "--keep-indexes", dest="rebuild_indexes", action="store_false"
+    )
+    parser.add_argument(
+        "--strict", action="store_true", help="Abort on the first invalid line."
+    )
+    args = parser.parse_args()
+
+    loader = EventBulkLoader(
+        args.db,
+        batch_rows=args.batch_rows,
+        sort_buffer_rows=args.sort_buffer_rows,
+        journal_off=args.journal_off,
+        rebuild_indexes=args.rebuild_indexes,
+        strict=args.strict,
+        progress=print_progress,
+    )
+    report = loader.load(args.paths, presorted=args.presorted)
+    print(
+        f"Loaded {report.rows_loaded:,} rows in {report.seconds:.1f}s "
+        f"({report.rows_per_second:,.0f} rows/s), skipped {report.rows_skipped:,} invalid lines "
+        f"and {report.rows_duplicate:,} events stored already"
+        + (
+            f", rebuilt indexes {', '.join(report.indexes_rebuilt)}"
+            if report.indexes_rebuilt
+            else ""
+        )
+    )
@@ -1,15 +1,24 @@
-events_schema = """
+"""
+Creates the service schema in a SQLite database, e.g. for local tools or a manually provisioned database.
+The schema itself is defined once, in log_service.db_accessors.db_schema, which the service also runs on startup.
 
-CREATE TABLE Events (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    event_type VARCHAR NOT NULL,
-    timestamp_utc INT NOT NULL,
-    customer_id INT NOT NULL,
-    event_data JSON
-);
+Usage:
+    python scripts/db-schema.py [path/to/database.db]
+"""
+import sqlite3
+import sys
 
-CREATE INDEX idx_event_type ON Events(event_type);
-CREATE INDEX idx_timestamp_utc ON Events(timestamp_utc);
-CREATE INDEX idx_customer_id ON Events(customer_id);
+from log_service.config import LogServiceConfig
+from log_service.db_accessors.db_schema import create_schema
 
-"""
+if __name__ == "__main__":
+    db_path = (
+        sys.argv[1]
+        if len(sys.argv) > 1
+        else LogServiceConfig.get_instance().get_db_url()
+    )
+    conn = sqlite3.connect(db_path)
+    try:
+        create_schema(conn)
+    finally:
+        conn.close()
@@ -0,0 +1,131 @@
+import sqlite3
+from dataclasses import dataclass
+
+import numpy as np
+import orjson
+
+from log_service.db_accessors.db_schema import create_schema
+
+INSERT_CHUNK_SIZE = 50_000
+EVENT_STATUSES = ("ok", "failed", "pending", "cancelled")
+
+
+@dataclass
+class DatasetSpec:
+    """
+    The shape of a synthetic events dataset. Event types and customers are drawn from Zipf-like distributions,
+    rank r is picked with a weight of 1 / r ** skew, so skew 0 is uniform and higher values concentrate the events on
+    a few hot types and customers, like real audit logs.
+
+    Attributes:
+        events (int): The number of events.
+        event_types (int): The number of distinct event types.
+        customers (int): The number of distinct customers.
+        skew (float): The Zipf exponent of event types and customers.
+        days (int): The number of days the timestamps span, ending at `end_timestamp_utc`.
+        end_timestamp_utc (int): The newest timestamp, fixed so runs are reproducible.
+        seed (int): The random seed.
+    """
+
+    events: int = 200_000
+    event_types: int = 50
+    customers: int = 1000
+    skew: float = 1.1
+    days: int = 30
+    end_timestamp_utc: int = 1_700_000_000
+    seed: int = 42
+
+
+@dataclass
+class Dataset:
+    """
+    A generated dataset and the filter values benchmarks query it with.
+
+    Attributes:
+        db_path (str): The SQLite file holding the events.
+        spec (DatasetSpec): The spec it was generated from.
+        hot_event_type (str): The most frequent event type.
+        rare_event_type (str): The least frequent event type.
+        hot_customer_id (int): The most frequent customer.
+        timestamp_start_utc (int): The oldest timestamp.
+        timestamp_end_utc (int): The newest timestamp.
+    """
+
+    db_path: str
+    spec: DatasetSpec
+    hot_event_type: str
+    rare_event_type: str
+    hot_customer_id: int
+    timestamp_start_utc: int
+    timestamp_end_utc: int
+
+
+def zipf_weights(count: int, skew: float) -> np.ndarray:
+    weights = 1.0 / np.arange(1, count + 1) ** skew
+    return weights / weights.sum()
+
+
+def generate_dataset(db_path: str, spec: DatasetSpec) -> Dataset:
+    """
+    Creates the service schema in `db_path` and fills it with `spec.events` synthetic events, inserted in timestamp
+    order like the consumer does.
+
+    Parameters:
+        db_path (str): The SQLite file to create.
+        spec (DatasetSpec): The shape of the dataset.
+
+    Returns:
+        Dataset: The generated dataset.
+    """
+    rng = np.random.default_rng(spec.seed)
+    timestamp_start_utc = spec.end_timestamp_utc - spec.days * 24 * 3600
+    event_type_codes = rng.choice(
+        spec.event_types, size=spec.events, p=zipf_weights(spec.event_types, spec.skew)
+    )
+    customer_ids = 1 + rng.choice(
+        spec.customers, size=spec.events, p=zipf_weights(spec.customers, spec.skew)
+    )
+    timestamps = np.sort(
+        rng.integers(timestamp_start_utc, spec.end_timestamp_utc + 1, size=spec.events)
+    )
+    amounts = np.round(rng.lognormal(3, 1, size=spec.events), 2)
+    statuses = rng.choice(len(EVENT_STATUSES), size=spec.events)
+
+    conn = sqlite3.connect(db_path)
+    try:
+        create_schema(conn)
+        for start in range(0, spec.events, INSERT_CHUNK_SIZE):
+            end = min(start + INSERT_CHUNK_SIZE, spec.events)
+            conn.executemany(
+                "INSERT INTO Events (customer_id, event_type, timestamp_utc, event_data) VALUES (?, ?, ?, ?)",
+                (
+                    (
+                        int(customer_ids[i]),
+                        f"event{event_type_codes[i]}",
+                        int(timestamps[i]),
+                        orjson.dumps(
+                            {
+                                "amount": float(amounts[i]),
+                                "status": EVENT_STATUSES[statuses[i]],
+                                "custom_data1": f"custom {i % 10}",
+                            }
+                        ),
+                    )
+                    for i in range(start, end)
+                ),
+            )
+            conn.commit()
+        # every run starts from the same file state, not from whatever the last auto checkpoint left in the WAL
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    finally:
+        conn.close()
+
+    return Dataset(
+        db_path=db_path,
+        spec=spec,
+        hot_event_type="event0",
+        rare_event_type=f"event{spec.event_types - 1}",
+        hot_customer_id=1,
+        timestamp_start_utc=timestamp_start_utc,
+        timestamp_end_utc=spec.end_timestamp_utc,
+    )
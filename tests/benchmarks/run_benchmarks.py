@@ -0,0 +1,411 @@
+import argparse
+import asyncio
+import hashlib
+import os
+import platform
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, replace
+from typing import Callable, Iterator
+from unittest import mock
+
+import orjson
+from starlette.requests import Request
+
+from log_service.config import LogServiceConfig
+from log_service.controllers.auth_controller import AuthController, VerifiedTokenCache
+from log_service.data.event_dto import EventQueueDTO, EventRequestDTO
+from log_service.data.event_serializers import encode_events_page
+from log_service.db_accessors.analytics_db_accessor import AnalyticsChunkCache
+from log_service.db_accessors.event_db_accessor import EventDatabaseAccessor
+from log_service.db_accessors.read_executor import DatabaseReadExecutor
+from log_service.processors.event_sketches import EventSketchStore
+from log_service.processors.queue_consumer import QueueConsumer
+from log_service.processors.queue_producer import QueueProducer
+from tests.benchmarks.dataset import Dataset, DatasetSpec, generate_dataset
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baselines.json")
+# a run regresses when a benchmark is this much slower than its baseline
+REGRESSION_THRESHOLD = 0.25
+QUERY_REPEATS = 30
+# calls timed together by the micro benchmarks, single calls are too short to time reliably
+MICRO_BENCHMARK_LOOPS = 200
+DRAIN_EVENTS = 2000
+DRAIN_ROUNDS = 3
+DRAIN_BATCH_SIZES = (1, 10, 30, 100)
+PAGE_OFFSETS = (0, 1000, 10_000)
+# runs whose best results make a baseline, and extra runs a regression must reproduce in before it fails the suite
+BASELINE_RUNS = 3
+CONFIRM_RUNS = 2
+
+
+@dataclass
+class BenchmarkResult:
+    """
+    The outcome of one benchmark. Regressions are judged on `value`, the best sample: noise from other processes
+    only ever makes a sample slower, so the best one is the most reproducible.
+
+    Attributes:
+        value (float): The best measurement.
+        unit (str): The unit of the measurements.
+        higher_is_better (bool): True for throughputs, False for latencies.
+        median (float | None): The median measurement, for information.
+        p95 (float | None): The 95th percentile measurement, for information.
+    """
+
+    value: float
+    unit: str
+    higher_is_better: bool = False
+    median: float | None = None
+    p95: float | None = None
+
+    @classmethod
+    def from_seconds(
+        cls, samples: tuple[float, float, float], unit: str, scale: float
+    ) -> "BenchmarkResult":
+        best, median, p95 = (sample * scale for sample in samples)
+        return cls(best, unit, median=median, p95=p95)
+
+
+def measure(
+    func: Callable[[], object], repeats: int, loops: int = 1
+) -> tuple[float, float, float]:
+    """
+    Times `repeats` samples of `loops` calls of func, after one untimed warm up sample.
+
+    Returns:
+        tuple[float, float, float]: The best, median and 95th percentile seconds per call.
+    """
+    for _ in range(loops):
+        func()
+    samples = []
+    for _ in range(repeats):
+        started_at = time.perf_counter()
+        for _ in range(loops):
+            func()
+        samples.append((time.perf_counter() - started_at) / loops)
+    samples.sort()
+    return (
+        samples[0],
+        statistics.median(samples),
+        samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+    )
+
+
+@contextmanager
+def isolated_service(db_path: str) -> Iterator[None]:
+    """
+    Points the service at `db_path` with fresh singletons, restoring the previous singletons afterwards.
+    """
+    singletons = (
+        QueueProducer,
+        QueueConsumer,
+        EventSketchStore,
+        AnalyticsChunkCache,
+        DatabaseReadExecutor,
+        VerifiedTokenCache,
+    )
+    previous = {cls: cls._instance for cls in singletons}
+    for cls in singletons:
+        cls._instance = None
+    try:
+        with mock.patch.object(
+            LogServiceConfig, "get_db_url", staticmethod(lambda: db_path)
+        ):
+            yield
+    finally:
+        if DatabaseReadExecutor._instance is not None:
+            DatabaseReadExecutor._instance.shutdown()
+        if QueueConsumer._instance is not None:
+            QueueConsumer._instance.conn.close()
+        for cls, instance in previous.items():
+            cls._instance = instance
+
+
+def bench_queries(dataset: Dataset, repeats: int) -> dict[str, BenchmarkResult]:
+    """
+    Times `get_event_rows`, the query behind GET /event, per filter shape and, for the shapes matching many events,
+    per page depth. Runs on a read executor thread, with its pooled connection, like the service does.
+    """
+    accessor = EventDatabaseAccessor()
+    last_hour = {
+        "timestamp_start_utc": dataset.timestamp_end_utc - 3600,
+        "timestamp_end_utc": dataset.timestamp_end_utc,
+    }
+    shapes = {
+        "none": ({}, PAGE_OFFSETS),
+        "event_type_hot": ({"event_type": dataset.hot_event_type}, PAGE_OFFSETS),
+        "event_type_rare": ({"event_type": dataset.rare_event_type}, (0,)),
+        "customer_id_hot": ({"customer_id": dataset.hot_customer_id}, (0,)),
+        "time_range_1h": (last_hour, (0,)),
+        "event_type_hot+time_range_1h": (
+            {"event_type": dataset.hot_event_type, **last_hour},
+            (0,),
+        ),
+    }
+
+    results = {}
+    for shape, (filters, offsets) in shapes.items():
+        for offset in offsets:
+            request_dto = EventRequestDTO(**filters, offset=offset, limit=100)
+            samples = measure(lambda: accessor.get_event_rows(request_dto), repeats)
+            results[
+                f"get_events[{shape},offset={offset}]"
+            ] = BenchmarkResult.from_seconds(samples, "ms", 1000)
+    return results
+
+
+def bench_serialization(repeats: int) -> dict[str, BenchmarkResult]:
+    """Times encoding a full page of GET /event, the stored event_data is spliced in as is."""
+    rows, total_count = EventDatabaseAccessor().get_event_rows(
+        EventRequestDTO(limit=100)
+    )
+    samples = measure(
+        lambda: encode_events_page(rows, total_count, 0),
+        repeats,
+        loops=MICRO_BENCHMARK_LOOPS,
+    )
+    return {
+        f"serialize_page[rows={len(rows)}]": BenchmarkResult.from_seconds(
+            samples, "us", 1e6
+        )
+    }
+
+
+def bench_auth(repeats: int) -> dict[str, BenchmarkResult]:
+    """Times validating an access token, already verified (cached) and verified from scratch (uncached)."""
+    token = AuthController.generate_access_token(valid_minutes=60)["token"]
+    request = Request(
+        {"type": "http", "headers": [(b"authorization", f"Bearer {token}".encode())]}
+    )
+    token_digest = hashlib.sha256(token.encode()).digest()
+
+    def validate_uncached() -> None:
+        VerifiedTokenCache.get_instance().discard(token_digest)
+        AuthController.validate_access_token(request)
+
+    results = {}
+    for name, func in (
+        ("auth[cached]", lambda: AuthController.validate_access_token(request)),
+        ("auth[uncached]", validate_uncached),
+    ):
+        samples = measure(func, repeats, loops=MICRO_BENCHMARK_LOOPS)
+        results[name] = BenchmarkResult.from_seconds(samples, "us", 1e6)
+    return results
+
+
+def bench_consumer_drain(
+    dataset: Dataset, drain_events: int
+) -> dict[str, BenchmarkResult]:
+    """
+    Measures how fast the queue consumer drains a backlog of `drain_events` events into the dataset, per batch
+    size, as the best of DRAIN_ROUNDS backlogs. Batches are committed, sketched and invalidated exactly as in the
+    service.
+    """
+    producer = QueueProducer.get_instance()
+    consumer = QueueConsumer.get_instance()
+    results = {}
+    for batch_size in DRAIN_BATCH_SIZES:
+        rates = []
+        for _ in range(DRAIN_ROUNDS):
+            for i in range(drain_events):
+                producer.enqueue_event(
+                    EventQueueDTO(
+                        event_type=f"event{i % dataset.spec.event_types}",
+                        timestamp_utc=dataset.timestamp_end_utc - i % 3600,
+                        customer_id=1 + i % dataset.spec.customers,
+                        event_data={"amount": i, "status": "ok"},
+                    )
+                )
+            settings = replace(
+                LogServiceConfig.get_settings(), consumer_chunk_size=batch_size
+            )
+            with mock.patch.object(LogServiceConfig, "_settings", settings):
+                started_at = time.perf_counter()
+                while producer.event_queue:
+                    consumer.consume_events()
+                rates.append(drain_events / (time.perf_counter() - started_at))
+        rates.sort(reverse=True)
+        results[f"consumer_drain[batch={batch_size}]"] = BenchmarkResult(
+            rates[0],
+            "events/s",
+            higher_is_better=True,
+            median=statistics.median(rates),
+        )
+    return results
+
+
+def run_suite(
+    spec: DatasetSpec,
+    repeats: int = QUERY_REPEATS,
+    drain_events: int = DRAIN_EVENTS,
+) -> dict:
+    """
+    Generates a dataset in a temp dir and runs every benchmark against it in process.
+
+    Parameters:
+        spec (DatasetSpec): The dataset to generate.
+        repeats (int): Timed samples per latency benchmark.
+        drain_events (int): Events drained per consumer batch size.
+
+    Returns:
+        dict: The dataset spec, the environment and the results by benchmark name, as stored in baselines.
+    """
+    with tempfile.TemporaryDirectory() as work_dir:
+        dataset = generate_dataset(os.path.join(work_dir, "benchmark.db"), spec)
+        results: dict[str, BenchmarkResult] = {}
+        with isolated_service(dataset.db_path):
+            read_executor = DatabaseReadExecutor.get_instance()
+            results.update(
+                asyncio.run(read_executor.run(bench_queries, dataset, repeats))
+            )
+            results.update(bench_serialization(repeats))
+            results.update(bench_auth(repeats))
+            # last, as it grows the dataset
+            results.update(bench_consumer_drain(dataset, drain_events))
+
+    return {
+        "dataset": asdict(spec),
+        "environment": {
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "machine": platform.machine(),
+        },
+        "results": {name: asdict(result) for name, result in results.items()},
+    }
+
+
+def best_of(run: dict, other_run: dict) -> dict:
+    """
+    Merges two runs of the same suite, keeping the best result of every benchmark. Slow phases of a shared machine
+    last for seconds, so the best of several runs is far more reproducible than any single run.
+    """
+    results = dict(run["results"])
+    for name, result in other_run["results"].items():
+        best = results.get(name)
+        if (
+            best is None
+            or (result["higher_is_better"] and result["value"] > best["value"])
+            or (not result["higher_is_better"] and result["value"] < best["value"])
+        ):
+            results[name] = result
+    return {**run, "results": results}
+
+
+def compare_results(
+    run: dict, baseline: dict, threshold: float = REGRESSION_THRESHOLD
+) -> list[str]:
+    """
+    Compares a run with a baseline. Benchmarks missing from the baseline are not compared.
+
+    Parameters:
+        run (dict): The run, see `run_suite`.
+        baseline (dict): The baseline, a previous run.
+        threshold (float): The relative slowdown tolerated, 0.25 tolerates 25% slower.
+
+    Returns:
+        list[str]: A description of every regression, empty if there is none.
+    """
+    regressions = []
+    for name, result in run["results"].items():
+        baseline_result = baseline["results"].get(name)
+        if baseline_result is None:
+            continue
+        value, baseline_value = result["value"], baseline_result["value"]
+        if result["higher_is_better"]:
+            regressed = value < baseline_value / (1 + threshold)
+        else:
+            regressed = value > baseline_value * (1 + threshold)
+        if regressed:
+            regressions.append(
+                f"{name}: {value:.3f} {result['unit']} vs baseline {baseline_value:.3f} {result['unit']}"
+            )
+    return regressions
+
+
+def print_results(run: dict, baseline: dict | None) -> None:
+    baseline_results = baseline["results"] if baseline else {}
+    for name, result in run["results"].items():
+        line = f"{name:<48} {result['value']:>12.3f} {result['unit']:<8}"
+        baseline_result = baseline_results.get(name)
+        if baseline_result:
+            change = result["value"] / baseline_result["value"] - 1
+            line += f" baseline {baseline_result['value']:>12.3f} ({change:+.1%})"
+        print(line)
+
+
+def main(argv: list[str] | None = None) -> int:
+    defaults = DatasetSpec()
+    parser = argparse.ArgumentParser(
+        description="Runs the offline benchmarks and compares them with the stored baseline."
+    )
+    parser.add_argument("--events", type=int, default=defaults.events)
+    parser.add_argument("--event-types", type=int, default=defaults.event_types)
+    parser.add_argument("--customers", type=int, default=defaults.customers)
+    parser.add_argument("--skew", type=float, default=defaults.skew)
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    parser.add_argument("--repeats", type=int, default=QUERY_REPEATS)
+    parser.add_argument("--drain-events", type=int, default=DRAIN_EVENTS)
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument(
+        "--update-baseline",
+        action="store_true",
+        help="Store this run as the new baseline instead of comparing with it.",
+    )
+    args = parser.parse_args(argv)
+
+    spec = DatasetSpec(
+        events=args.events,
+        event_types=args.event_types,
+        customers=args.customers,
+        skew=args.skew,
+        seed=args.seed,
+    )
+
+    def run() -> dict:
+        return run_suite(spec, repeats=args.repeats, drain_events=args.drain_events)
+
+    if args.update_baseline:
+        best_run = run()
+        for _ in range(BASELINE_RUNS - 1):
+            best_run = best_of(best_run, run())
+        print_results(best_run, None)
+        with open(args.baseline, "wb") as f:
+            f.write(orjson.dumps(best_run, option=orjson.OPT_INDENT_2) + b"\n")
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "rb") as f:
+            baseline = orjson.loads(f.read())
+    if baseline is not None and baseline["dataset"] != asdict(spec):
+        print("The baseline was recorded on a different dataset, not comparing.")
+        baseline = None
+
+    best_run = run()
+    if baseline is None:
+        print_results(best_run, None)
+        return 0
+
+    regressions = compare_results(best_run, baseline, args.threshold)
+    for _ in range(CONFIRM_RUNS):
+        if not regressions:
+            break
+        print(f"{len(regressions)} possible regressions, confirming with another run")
+        best_run = best_of(best_run, run())
+        regressions = compare_results(best_run, baseline, args.threshold)
+
+    print_results(best_run, baseline)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
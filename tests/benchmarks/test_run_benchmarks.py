@@ -0,0 +1,47 @@
+from tests.benchmarks.dataset import DatasetSpec
+from tests.benchmarks.run_benchmarks import best_of, compare_results, run_suite
+
+
+def make_run(**values: tuple[float, bool]) -> dict:
+    return {
+        "results": {
+            name: {"value": value, "unit": "ms", "higher_is_better": higher_is_better}
+            for name, (value, higher_is_better) in values.items()
+        }
+    }
+
+
+def test_compare_results_flags_slower_latencies_and_lower_throughputs():
+    baseline = make_run(latency=(10.0, False), rate=(1000.0, True), new=(1.0, False))
+    run = make_run(latency=(13.0, False), rate=(700.0, True), other=(5.0, False))
+
+    regressions = compare_results(run, baseline, threshold=0.25)
+
+    assert [regression.split(":")[0] for regression in regressions] == [
+        "latency",
+        "rate",
+    ]
+    assert compare_results(run, baseline, threshold=0.5) == []
+
+
+def test_best_of_keeps_the_best_result_of_each_benchmark():
+    run = make_run(latency=(10.0, False), rate=(1000.0, True))
+    other_run = make_run(latency=(8.0, False), rate=(900.0, True))
+
+    best_run = best_of(run, other_run)
+
+    assert best_run["results"]["latency"]["value"] == 8.0
+    assert best_run["results"]["rate"]["value"] == 1000.0
+
+
+def test_suite_runs_on_a_small_dataset():
+    spec = DatasetSpec(events=2000, event_types=5, customers=20)
+
+    run = run_suite(spec, repeats=2, drain_events=50)
+
+    assert run["dataset"]["events"] == 2000
+    results = run["results"]
+    assert "get_events[event_type_hot,offset=1000]" in results
+    assert "auth[uncached]" in results
+    assert results["consumer_drain[batch=30]"]["higher_is_better"]
+    assert all(result["value"] > 0 for result in results.values())
@@ -0,0 +1,35 @@
+import sqlite3
+
+import pytest
+
+from log_service.config import LogServiceConfig
+from log_service.db_accessors.analytics_db_accessor import AnalyticsChunkCache
+from log_service.db_accessors.db_schema import create_schema
+
+
+@pytest.fixture(autouse=True)
+def fresh_settings():
+    """Loads the settings anew in every test, so settings set in the environment by one test do not leak."""
+    LogServiceConfig._settings = None
+    yield
+    LogServiceConfig._settings = None
+
+
+@pytest.fixture
+def temp_db(tmp_path, mocker):
+    """
+    Creates an empty events database in a temp dir and points the service config at it.
+    The analytics chunk cache is reset, so no chunks of another test's database leak in.
+    """
+    AnalyticsChunkCache._instance = None
+    db_path = str(tmp_path / "SQLite-test.db")
+    conn = sqlite3.connect(db_path)
+    create_schema(conn)
+    conn.close()
+
+    mock_config = mocker.Mock()
+    mock_config.get_db_url.return_value = db_path
+    mocker.patch(
+        "log_service.config.LogServiceConfig.get_instance", return_value=mock_config
+    )
+    return db_path
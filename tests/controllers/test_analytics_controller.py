@@ -0,0 +1,111 @@
+import numpy as np
+import pytest
+from fastapi import HTTPException
+
+from log_service.controllers.analytics_controller import AnalyticsController
+from log_service.data.analytics_dto import (
+    MAX_ANALYTICS_WINDOW_SECONDS,
+    AnalyticsRequestDTO,
+)
+from log_service.db_accessors.analytics_db_accessor import EventColumns
+
+
+@pytest.fixture
+def columns():
+    return EventColumns(
+        ids=np.arange(6, dtype=np.int64),
+        timestamps=np.full(6, 100, dtype=np.int64),
+        customer_ids=np.array([1, 1, 1, 2, 2, 3], dtype=np.int64),
+        event_type_codes=np.array([1, 1, 1, 1, 0, 0], dtype=np.int64),
+        event_types=np.array(["login", "purchase"]),
+        values=np.array([1.0, 2.0, 3.0, 10.0, np.nan, np.nan]),
+    )
+
+
+def test_aggregate_quantiles_by_customer(columns):
+    request_dto = AnalyticsRequestDTO(
+        timestamp_start_utc=0,
+        timestamp_end_utc=200,
+        group_by="customer_id",
+        value_field="amount",
+        quantiles=[0.5, 1.0],
+    )
+    response = AnalyticsController.aggregate(columns, request_dto)
+
+    assert response["event_count"] == 6
+    groups = {group["group"]: group for group in response["groups"]}
+    assert groups[1]["count"] == 3
+    assert groups[1]["quantiles"] == {"0.5": 2.0, "1.0": 3.0}
+    assert groups[1]["mean"] == 2.0
+    assert groups[2]["value_count"] == 1
+    assert groups[2]["min"] == groups[2]["max"] == 10.0
+    # customer 3 has no numeric values
+    assert groups[3]["value_count"] == 0
+    assert groups[3]["quantiles"] == {"0.5": None, "1.0": None}
+    assert groups[3]["mean"] is None
+
+
+def test_aggregate_matches_numpy_quantile():
+    rng = np.random.default_rng(7)
+    values = rng.normal(size=1_000)
+    groups = rng.integers(0, 5, size=1_000)
+    columns = EventColumns(
+        ids=np.arange(1_000, dtype=np.int64),
+        timestamps=np.zeros(1_000, dtype=np.int64),
+        customer_ids=groups.astype(np.int64),
+        event_type_codes=np.zeros(1_000, dtype=np.int64),
+        event_types=np.array(["login"]),
+        values=values,
+    )
+    request_dto = AnalyticsRequestDTO(
+        timestamp_start_utc=0,
+        timestamp_end_utc=1,
+        group_by="customer_id",
+        value_field="amount",
+        quantiles=[0.1, 0.5, 0.99],
+    )
+    response = AnalyticsController.aggregate(columns, request_dto)
+
+    for group in response["groups"]:
+        group_values = values[groups == group["group"]]
+        for q, result in group["quantiles"].items():
+            assert result == pytest.approx(np.quantile(group_values, float(q)))
+
+
+def test_aggregate_histogram_with_filter(columns):
+    request_dto = AnalyticsRequestDTO(
+        timestamp_start_utc=0,
+        timestamp_end_utc=200,
+        event_type="purchase",
+        value_field="amount",
+        histogram_edges=[0, 2, 10],
+    )
+    response = AnalyticsController.aggregate(columns, request_dto)
+
+    assert response["event_count"] == 4
+    assert response["histogram_edges"] == [0, 2, 10]
+    # 10 falls in the last bucket, which is closed on the right
+    assert response["groups"][0]["histogram"] == [1, 3]
+
+
+def test_aggregate_unknown_event_type(columns):
+    request_dto = AnalyticsRequestDTO(
+        timestamp_start_utc=0, timestamp_end_utc=200, event_type="unknown"
+    )
+    response = AnalyticsController.aggregate(columns, request_dto)
+    assert response["event_count"] == 0
+
+
+def test_analytics_request_requires_value_field_for_quantiles():
+    with pytest.raises(HTTPException) as exc:
+        AnalyticsRequestDTO(timestamp_start_utc=0, timestamp_end_utc=1, quantiles=[0.5])
+    assert exc.value.status_code == 400
+
+
+def test_analytics_request_rejects_too_long_windows():
+    with pytest.raises(HTTPException) as exc:
+        AnalyticsRequestDTO(
+            timestamp_start_utc=0,
+            timestamp_end_utc=MAX_ANALYTICS_WINDOW_SECONDS + 1,
+        )
+    assert exc.value.status_code == 400
@@ -1,13 +1,17 @@
+import time
+
 import pytest
 from fastapi import HTTPException
 from datetime import datetime, timedelta
 import jwt
 
+from log_service.controllers import auth_controller
 from log_service.controllers.auth_controller import (
     JWT_SECRET_KEY,
     JWT_ALGORITHM,
     AuthController,
     AllOWED_ACCESS_KEY,
+    VerifiedTokenCache,
 )
 
 
@@ -27,6 +31,22 @@ def mock_request(mocker):
     return mocker.MagicMock()
 
 
+@pytest.fixture(autouse=True)
+def token_cache():
+    VerifiedTokenCache._instance = None
+    yield VerifiedTokenCache.get_instance()
+    VerifiedTokenCache._instance = None
+
+
+def valid_token(minutes=5):
+    return generate_jwt(
+        {
+            "key": AllOWED_ACCESS_KEY,
+            "exp": datetime.utcnow() + timedelta(minutes=minutes),
+        }
+    )
+
+
 # Test cases
 
 
@@ -115,3 +135,43 @@ def test_generate_access_token_unhandled_exception(mocker):
         AuthController.generate_access_token(valid_minutes)
     assert exc.value.status_code == 500
     assert exc.value.detail == "Something went wrong, please try again."
+
+
+def test_validate_access_token_verifies_reused_token_once(mocker, mock_request):
+    mock_request.headers.get.return_value = f"Bearer {valid_token()}"
+    decode = mocker.spy(jwt, "decode")
+
+    AuthController.validate_access_token(mock_request)
+    AuthController.validate_access_token(mock_request)
+
+    assert decode.call_count == 1
+
+
+def test_validate_access_token_cached_token_expires(mocker, mock_request):
+    mock_request.headers.get.return_value = f"Bearer {valid_token(minutes=1)}"
+    AuthController.validate_access_token(mock_request)
+
+    mocker.patch("time.time", return_value=time.time() + 120)
+    with pytest.raises(HTTPException) as exc:
+        AuthController.validate_access_token(mock_request)
+    assert exc.value.detail == "Token expired."
+
+
+def test_validate_access_token_cache_flushed_on_key_change(mocker, mock_request):
+    mock_request.headers.get.return_value = f"Bearer {valid_token()}"
+    AuthController.validate_access_token(mock_request)
+
+    # the token was signed with the old key, so it must be verified again and rejected
+    mocker.patch.object(auth_controller, "JWT_SECRET_KEY", "rotated_secret_key")
+    with pytest.raises(HTTPException) as exc:
+        AuthController.validate_access_token(mock_request)
+    assert exc.value.detail == "Invalid token."
+
+
+def test_verified_token_cache_is_bounded(mocker, token_cache):
+    mocker.patch.object(auth_controller, "VERIFIED_TOKEN_CACHE_SIZE", 2)
+    for digest in (b"a", b"b", b"c"):
+        token_cache.add(digest, 1.0)
+
+    assert token_cache.get_expiration(b"a") is None
+    assert token_cache.get_expiration(b"c") == 1.0
@@ -1,7 +1,17 @@
+import asyncio
+import gzip
+import sqlite3
+
+import orjson
 import pytest
 from fastapi import HTTPException
-from log_service.controllers.event_controller import EventController
+from log_service.controllers import event_controller as event_controller_module
+from log_service.controllers.event_controller import MAX_BATCH_EVENTS, EventController
 from log_service.data.event_dto import EventRequestDTO
+from log_service.data.request_models import CreateEventModel
+from log_service.db_accessors.event_db_accessor import EventDatabaseAccessor
+from log_service.db_accessors.read_executor import DatabaseReadExecutor
+from log_service.processors.queue_consumer import EventNotCommittedError
 
 
 @pytest.fixture
@@ -18,6 +28,12 @@ def event_controller(mocker):
         "log_service.controllers.event_controller.QueueProducer.get_instance",
         return_value=mocker.Mock(),
     )
+    mocker.patch(
+        "log_service.controllers.event_controller.IngestRateLimiter.get_instance",
+        return_value=mocker.Mock(
+            sample=lambda events: events, acquire=mocker.Mock(return_value=0.0)
+        ),
+    )
     return EventController()
 
 
@@ -36,6 +52,13 @@ def test_create_event_failure(mocker, event_controller):
     assert excinfo.value.status_code == 500
 
 
+def test_create_event_rejects_unserializable_event_data(event_controller):
+    with pytest.raises(HTTPException) as exc:
+        event_controller.create_event("type", 1234567890, 1, {"amount": 2**70})
+    assert exc.value.status_code == 400
+    event_controller.queue_processor.enqueue_event.assert_not_called()
+
+
 def test_get_event_success(mocker, event_controller):
     return_value = (
         [
@@ -56,3 +79,380 @@ def test_get_event_success(mocker, event_controller):
     response = event_controller.get_event(request_dto)
     assert "events" in response
     assert response["total_count"] == 1
+
+
+@pytest.mark.parametrize(
+    "fields",
+    [None, ("id", "timestamp_utc"), ("event_data",), ("customer_id", "event_data")],
+)
+def test_get_event_json_matches_get_event(temp_db, event_controller, fields):
+    event_controller.database_accessor = EventDatabaseAccessor()
+    event_controller.database_accessor.config.get_db_url.return_value = temp_db
+    conn = sqlite3.connect(temp_db)
+    event_controller.database_accessor.save_events_to_db(
+        insert_data=[
+            (1, "login", 20, orjson.dumps({"nested": {"key": [1, 2.5, "x"]}})),
+            (2, "logout", 10, None),
+        ],
+        conn=conn,
+    )
+    conn.close()
+    request_dto = EventRequestDTO(offset=0, limit=10, fields=fields)
+
+    body = event_controller.get_event_json(request_dto)
+
+    assert orjson.loads(body) == event_controller.get_event(request_dto)
+    assert [set(event) for event in orjson.loads(body)["events"]] == [
+        set(
+            fields or ("id", "event_type", "timestamp_utc", "customer_id", "event_data")
+        )
+    ] * 2
+
+
+def test_get_events_batch_json_runs_every_query_in_one_snapshot(
+    temp_db, event_controller
+):
+    event_controller.database_accessor = EventDatabaseAccessor()
+    event_controller.database_accessor.config.get_db_url.return_value = temp_db
+    conn = sqlite3.connect(temp_db)
+    event_controller.database_accessor.save_events_to_db(
+        insert_data=[(i % 3, "login", i, orjson.dumps({"i": i})) for i in range(9)],
+        conn=conn,
+    )
+    conn.close()
+    request_dtos = [
+        EventRequestDTO(customer_id=[1, 2]),
+        EventRequestDTO(event_id=[1, 4], fields=("id",)),
+    ]
+
+    async def run_batch():
+        DatabaseReadExecutor._instance = None
+        executor = DatabaseReadExecutor.get_instance()
+        try:
+            return await executor.run(
+                event_controller.get_events_batch_json, request_dtos=request_dtos
+            )
+        finally:
+            executor.shutdown()
+            DatabaseReadExecutor._instance = None
+
+    body = orjson.loads(asyncio.run(run_batch()))
+
+    assert body == {
+        "results": [
+            orjson.loads(event_controller.get_event_json(request_dto))
+            for request_dto in request_dtos
+        ]
+    }
+    assert body["results"][0]["total_count"] == 6
+    assert body["results"][1]["events"] == [{"id": 1}, {"id": 4}]
+    with pytest.raises(HTTPException) as exc:
+        event_controller.get_events_batch_json([])
+    assert exc.value.status_code == 400
+
+
+def test_unknown_fields_are_rejected():
+    with pytest.raises(HTTPException) as exc:
+        EventRequestDTO(fields=("id", "payload"))
+    assert exc.value.status_code == 400
+
+
+def test_export_events_streams_ndjson(mocker, event_controller):
+    rows = [
+        (1, "type", 10, 1, b'{"key":"value"}'),
+        (2, "type", 11, 1, None),
+    ]
+    mocker.patch.object(
+        event_controller.database_accessor,
+        "iter_event_rows",
+        return_value=iter([rows[:1], rows[1:]]),
+    )
+
+    body = b"".join(event_controller.export_events(EventRequestDTO()))
+
+    lines = [orjson.loads(line) for line in body.splitlines()]
+    assert lines == [
+        {
+            "id": 1,
+            "event_type": "type",
+            "timestamp_utc": 10,
+            "customer_id": 1,
+            "event_data": {"key": "value"},
+        },
+        {
+            "id": 2,
+            "event_type": "type",
+            "timestamp_utc": 11,
+            "customer_id": 1,
+            "event_data": {},
+        },
+    ]
+
+
+def test_export_events_gzip(mocker, event_controller):
+    rows = [(i, "type", i, 1, b'{"key":"value"}') for i in range(100)]
+    mocker.patch.object(
+        event_controller.database_accessor,
+        "iter_event_rows",
+        return_value=iter([rows]),
+    )
+
+    body = b"".join(event_controller.export_events(EventRequestDTO(), gzip=True))
+
+    assert len(gzip.decompress(body).splitlines()) == 100
+
+
+def test_create_events_enqueues_the_whole_batch(event_controller):
+    events = [
+        CreateEventModel(event_type="login", customer_id=1, event_data={"a": 1}),
+        CreateEventModel(
+            event_type="logout", timestamp_utc=20, customer_id=2, event_data={"b": 2}
+        ),
+    ]
+
+    response = event_controller.create_events(events)
+
+    assert response == "2 events received and queued successfully"
+    (queued,), _ = event_controller.queue_processor.enqueue_events.call_args
+    assert [event.event_type for event in queued] == ["login", "logout"]
+    assert queued[1].timestamp_utc == 20
+
+
+def test_create_events_skips_events_received_before(mocker, event_controller):
+    event_uuid = "6f1c1f51-8bde-4a53-9f0e-4f1b4ee5a9a2"
+    events = [
+        CreateEventModel(
+            event_type="login",
+            customer_id=1,
+            event_data={"a": 1},
+            event_uuid=event_uuid,
+        ),
+        CreateEventModel(event_type="logout", customer_id=2, event_data={"b": 2}),
+    ]
+    mocker.patch.object(
+        event_controller.deduplicator,
+        "drop_duplicates",
+        side_effect=lambda queue_events: queue_events[1:],
+    )
+
+    response = event_controller.create_events(events)
+
+    assert response == "1 events received and queued successfully, 1 already received"
+    (dedup_events,), _ = event_controller.deduplicator.drop_duplicates.call_args
+    assert dedup_events[0].event_uuid == event_uuid
+    (queued,), _ = event_controller.queue_processor.enqueue_events.call_args
+    assert [event.event_type for event in queued] == ["logout"]
+
+
+def test_create_event_acknowledges_an_event_received_before(mocker, event_controller):
+    mocker.patch.object(
+        event_controller.deduplicator, "drop_duplicates", return_value=[]
+    )
+
+    response = event_controller.create_event("type", 1, 1, {"a": 1}, "uuid-1")
+
+    assert response == "Event already received"
+    event_controller.queue_processor.enqueue_event.assert_not_called()
+
+
+def test_create_event_rejects_customers_over_their_rate(event_controller):
+    event_controller.rate_limiter.acquire.return_value = 0.2
+
+    with pytest.raises(HTTPException) as exc:
+        event_controller.create_event("type", 1, 1, {"a": 1})
+
+    assert exc.value.status_code == 429
+    assert exc.value.headers == {"Retry-After": "1"}
+    event_controller.queue_processor.enqueue_event.assert_not_called()
+
+
+def test_create_events_reports_sampled_out_events(event_controller):
+    event_controller.rate_limiter.sample = lambda events: events[:1]
+    events = [
+        CreateEventModel(event_type="debug", customer_id=1, event_data={"a": i})
+        for i in range(3)
+    ]
+
+    response = event_controller.create_events(events)
+
+    assert response == "1 events received and queued successfully, 2 sampled out"
+
+
+def test_create_events_rejects_the_batch_if_any_event_is_invalid(event_controller):
+    events = [
+        CreateEventModel(event_type="login", customer_id=1, event_data={"a": 1}),
+        CreateEventModel(event_type="login", customer_id=1, event_data={"a": 2**70}),
+    ]
+
+    with pytest.raises(HTTPException) as exc:
+        event_controller.create_events(events)
+    assert exc.value.status_code == 400
+    assert "event 1" in exc.value.detail
+    event_controller.queue_processor.enqueue_events.assert_not_called()
+
+
+def test_create_events_rejects_empty_and_oversized_batches(event_controller):
+    event = CreateEventModel(event_type="login", customer_id=1, event_data={"a": 1})
+    for events in ([], [event] * (MAX_BATCH_EVENTS + 1)):
+        with pytest.raises(HTTPException) as exc:
+            event_controller.create_events(events)
+        assert exc.value.status_code == 400
+
+
+def test_create_event_committed_returns_the_id_once_committed(event_controller):
+    def commit(events):
+        for event_id, event in enumerate(events, start=41):
+            event.commit_future.set_result(event_id)
+        return True
+
+    event_controller.queue_processor.enqueue_events.side_effect = commit
+
+    response = asyncio.run(
+        event_controller.create_event_committed("login", 1, 1, {"a": 1})
+    )
+
+    assert response == {"detail": "Event committed", "id": 41}
+
+
+def test_create_events_committed_reports_sampled_out_events(event_controller):
+    event_controller.rate_limiter.sample = lambda events: events[1:]
+
+    def commit(events):
+        for event in events:
+            event.commit_future.set_result(7)
+        return True
+
+    event_controller.queue_processor.enqueue_events.side_effect = commit
+    events = [
+        CreateEventModel(event_type="debug", customer_id=1, event_data={"a": i})
+        for i in range(3)
+    ]
+
+    response = asyncio.run(event_controller.create_events_committed(events))
+
+    assert response == {
+        "detail": "2 events committed, 1 sampled out",
+        "ids": [None, 7, 7],
+    }
+    (queued,) = event_controller.queue_processor.enqueue_events.call_args.args
+    assert len(queued) == 2
+
+
+def test_create_event_committed_maps_failed_commits_to_503(event_controller):
+    def fail(events):
+        events[0].commit_future.set_exception(EventNotCommittedError("shut down"))
+        return True
+
+    event_controller.queue_processor.enqueue_events.side_effect = fail
+
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(event_controller.create_event_committed("login", 1, 1, {"a": 1}))
+    assert exc.value.status_code == 503
+
+
+def test_create_event_committed_times_out_with_504(mocker, event_controller):
+    mocker.patch.object(event_controller_module, "COMMIT_WAIT_TIMEOUT_SECONDS", 0.01)
+    event_controller.queue_processor.enqueue_events.return_value = True
+
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(event_controller.create_event_committed("login", 1, 1, {"a": 1}))
+    assert exc.value.status_code == 504
+
+
+def test_get_event_json_answers_recent_queries_from_the_hot_tail(
+    mocker, event_controller
+):
+    mocker.patch.object(
+        event_controller.hot_tail,
+        "query",
+        return_value=([(None, "login", 100, 1, b'{"a":1}')], 1),
+    )
+    request_dto = EventRequestDTO(customer_id=1, timestamp_start_utc=100)
+
+    body = orjson.loads(event_controller.get_event_json(request_dto))
+
+    assert body["events"] == [
+        {
+            "id": None,
+            "event_type": "login",
+            "timestamp_utc": 100,
+            "customer_id": 1,
+            "pending": True,
+            "event_data": {"a": 1},
+        }
+    ]
+    assert event_controller.get_event(request_dto)["events"] == body["events"]
+    event_controller.database_accessor.get_event_rows.assert_not_called()
+
+    request_dto = EventRequestDTO(customer_id=1, fields=("id", "timestamp_utc"))
+    body = orjson.loads(event_controller.get_event_json(request_dto))
+
+    assert body["events"] == [{"id": None, "timestamp_utc": 100, "pending": True}]
+    assert event_controller.get_event(request_dto)["events"] == body["events"]
+
+
+def sse_ids(message):
+    return [
+        int(line[4:])
+        for line in message.decode().splitlines()
+        if line.startswith("id: ")
+    ]
+
+
+def test_stream_events_backfills_then_follows_committed_events(
+    mocker, event_controller
+):
+    async def run(func, *args, **kwargs):
+        return func(*args, **kwargs)
+
+    mocker.patch.object(event_controller, "read_executor", mocker.Mock(run=run))
+    rows = [(event_id, "login", 100, 1, b'{"a":1}') for event_id in range(6, 10)]
+    event_controller.database_accessor.get_event_rows_after.return_value = rows[:2]
+
+    async def follow():
+        stream = await event_controller.stream_events(
+            EventRequestDTO(customer_id=1), after_id=5
+        )
+        backfilled = await anext(stream)
+        event_controller.change_feed.publish(
+            [rows[1], rows[2], (8, "login", 100, 2, b"{}"), rows[3], rows[1]]
+        )
+        followed = await anext(stream)
+        await stream.aclose()
+        return backfilled, followed
+
+    backfilled, followed = asyncio.run(follow())
+
+    assert sse_ids(backfilled) == [6, 7]
+    assert sse_ids(followed) == [8, 9]
+    assert b'data: {"id":8,"event_type":"login"' in followed
+    assert not event_controller.change_feed.has_subscribers
+    args = event_controller.database_accessor.get_event_rows_after.call_args.args
+    assert args[1:] == (5, event_controller_module.CHANGE_FEED_BACKFILL_PAGE_SIZE)
+
+
+def test_stream_events_disconnects_slow_subscribers(mocker, event_controller):
+    async def run(func, *args, **kwargs):
+        return func(*args, **kwargs)
+
+    mocker.patch.object(event_controller, "read_executor", mocker.Mock(run=run))
+    mocker.patch.object(event_controller_module, "CHANGE_FEED_KEEPALIVE_SECONDS", 0.01)
+    event_controller.database_accessor.get_last_event_id.return_value = 3
+    event_controller.database_accessor.get_event_rows_after.return_value = []
+
+    async def follow():
+        stream = await event_controller.stream_events(EventRequestDTO())
+        keepalive = await anext(stream)
+        (subscription,) = event_controller.change_feed.subscriptions
+        subscription.buffer_size = 1
+        event_controller.change_feed.publish(
+            [(4, "login", 100, 1, b"{}"), (5, "login", 100, 1, b"{}")]
+        )
+        return [keepalive] + [message async for message in stream]
+
+    keepalive, error = asyncio.run(follow())
+
+    assert keepalive == b": keepalive\n\n"
+    assert error.startswith(b"event: error\n")
+    assert orjson.loads(error.split(b"data: ")[1])["last_event_id"] == 3
+    assert not event_controller.change_feed.has_subscribers
@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+
+from log_service.processors.change_feed import ChangeFeedHub
+
+
+@pytest.fixture
+def hub():
+    ChangeFeedHub._instance = None
+    yield ChangeFeedHub.get_instance()
+    ChangeFeedHub._instance = None
+
+
+def row(event_id, event_type="login", customer_id=1):
+    return (event_id, event_type, 100, customer_id, b'{"a":1}')
+
+
+def test_subscribers_get_the_committed_events_matching_their_filters(hub):
+    async def follow():
+        by_customer = hub.subscribe(customer_id=1)
+        by_type = hub.subscribe(event_type="logout")
+        hub.publish([row(1), row(2, "logout", 2), row(3, customer_id=2)])
+        return await by_customer.next_rows(1), await by_type.next_rows(1)
+
+    by_customer, by_type = asyncio.run(follow())
+
+    assert by_customer == [row(1)]
+    assert by_type == [row(2, "logout", 2)]
+
+
+def test_published_rows_wake_a_waiting_subscriber_from_another_thread(hub):
+    async def follow():
+        subscription = hub.subscribe()
+        loop = asyncio.get_running_loop()
+        loop.run_in_executor(None, hub.publish, [row(1)])
+        return await subscription.next_rows(5)
+
+    assert asyncio.run(follow()) == [row(1)]
+
+
+def test_a_subscriber_falling_behind_overflows_until_resumed(hub):
+    async def follow():
+        subscription = hub.subscribe()
+        subscription.buffer_size = 2
+        hub.publish([row(1), row(2)])
+        hub.publish([row(3)])
+        overflowed = subscription.overflowed, await subscription.next_rows(1)
+        hub.publish([row(4)])
+        subscription.resume()
+        hub.publish([row(5)])
+        return overflowed, await subscription.next_rows(1)
+
+    (overflowed, dropped), resumed = asyncio.run(follow())
+
+    assert overflowed
+    assert dropped == []
+    assert resumed == [row(5)]
+
+
+def test_unsubscribed_and_closed_subscriptions_get_no_rows(hub):
+    async def follow():
+        unsubscribed = hub.subscribe()
+        closed = hub.subscribe()
+        hub.unsubscribe(unsubscribed)
+        hub.close()
+        hub.publish([row(1)])
+        return unsubscribed, closed
+
+    unsubscribed, closed = asyncio.run(follow())
+
+    assert not hub.has_subscribers
+    assert unsubscribed.closed and closed.closed
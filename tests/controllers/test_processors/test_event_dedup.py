@@ -0,0 +1,100 @@
+import sqlite3
+import uuid
+
+import pytest
+
+from log_service.data.event_dto import EventQueueDTO
+from log_service.db_accessors.event_db_accessor import EventDatabaseAccessor
+from log_service.processors.event_dedup import (
+    BloomFilter,
+    EventDeduplicator,
+    RotatingBloomFilter,
+)
+
+
+@pytest.fixture
+def deduplicator(temp_db):
+    EventDeduplicator._instance = None
+    yield EventDeduplicator.get_instance()
+    EventDeduplicator._instance = None
+
+
+def make_event(event_uuid=None):
+    return EventQueueDTO("login", 10, 1, {"a": 1}, event_uuid)
+
+
+def store(db_path, events):
+    conn = sqlite3.connect(db_path)
+    EventDatabaseAccessor().save_events_to_db(
+        [
+            (e.customer_id, e.event_type, e.timestamp_utc, e.serialized_event_data)
+            + (e.event_uuid,)
+            for e in events
+        ],
+        conn=conn,
+    )
+    conn.close()
+
+
+def test_bloom_filter_has_no_false_negatives_and_a_bounded_error_rate():
+    bloom = BloomFilter(capacity=20_000, error_rate=0.01)
+    added = [str(uuid.uuid4()) for _ in range(20_000)]
+    bloom.add(added)
+
+    assert bloom.might_contain(added).all()
+    others = [str(uuid.uuid4()) for _ in range(20_000)]
+    assert bloom.might_contain(others).mean() < 0.02
+
+
+def test_rotating_bloom_filter_forgets_keys_after_two_windows(mocker):
+    now = mocker.patch("log_service.processors.event_dedup.time.monotonic")
+    now.return_value = 0
+    bloom = RotatingBloomFilter(window_seconds=10, capacity=1000)
+    bloom.add(["a"])
+
+    now.return_value = 15
+    bloom.add(["b"])
+    assert bloom.might_contain(["a", "b"]).tolist() == [True, True]
+
+    now.return_value = 30
+    assert bloom.might_contain(["a", "b"]).tolist() == [False, True]
+
+
+def test_rotating_bloom_filter_rotates_when_a_generation_is_full():
+    bloom = RotatingBloomFilter(capacity=10, generations=2)
+    bloom.add([str(i) for i in range(10)])
+    bloom.add(["new"])
+
+    assert len(bloom.generations) == 2
+    assert bloom.generations[0].count == 1
+
+
+def test_drop_duplicates_keeps_new_events_without_database_lookups(
+    mocker, deduplicator
+):
+    lookup = mocker.spy(deduplicator.database_accessor, "get_stored_event_uuids")
+    events = [make_event(str(uuid.uuid4())) for _ in range(100)] + [make_event()]
+
+    assert deduplicator.drop_duplicates(events) == events
+    lookup.assert_not_called()
+
+
+def test_drop_duplicates_drops_stored_and_repeated_events(deduplicator, temp_db):
+    stored = make_event(str(uuid.uuid4()))
+    deduplicator.drop_duplicates([stored])
+    store(temp_db, [stored])
+    new = make_event(str(uuid.uuid4()))
+
+    kept = deduplicator.drop_duplicates(
+        [make_event(stored.event_uuid), new, make_event(new.event_uuid), make_event()]
+    )
+
+    assert [e.event_uuid for e in kept] == [new.event_uuid, None]
+
+
+def test_drop_duplicates_keeps_probable_duplicates_not_stored_yet(deduplicator):
+    event_uuid = str(uuid.uuid4())
+    deduplicator.drop_duplicates([make_event(event_uuid)])
+
+    # still queued: kept here, the unique index drops it on insert
+    assert len(deduplicator.drop_duplicates([make_event(event_uuid)])) == 1
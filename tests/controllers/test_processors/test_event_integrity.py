@@ -0,0 +1,188 @@
+import sqlite3
+
+import orjson
+import pytest
+
+from log_service.data.merkle import verify_inclusion_proof
+from log_service.db_accessors import integrity_db_accessor
+from log_service.db_accessors.bulk_loader import EventBulkLoader
+from log_service.db_accessors.event_db_accessor import EventDatabaseAccessor
+from log_service.processors.event_integrity import IntegrityVerifier
+
+
+@pytest.fixture
+def verifier(temp_db):
+    IntegrityVerifier._instance = None
+    yield IntegrityVerifier.get_instance()
+    IntegrityVerifier._instance = None
+
+
+def save_batches(db_path, batch_sizes):
+    conn = sqlite3.connect(db_path)
+    accessor = EventDatabaseAccessor()
+    event_number = 0
+    for size in batch_sizes:
+        events = []
+        for _ in range(size):
+            event_number += 1
+            events.append(
+                (
+                    event_number % 3,
+                    f"event_type_{event_number % 2}",
+                    1700000000 + event_number,
+                    orjson.dumps({"n": event_number}),
+                    f"uuid-{event_number}",
+                )
+            )
+        assert accessor.save_events_to_db(insert_data=events, conn=conn)
+    return conn
+
+
+def test_every_saved_event_is_sealed_and_provable(temp_db, verifier):
+    conn = save_batches(temp_db, [5, 1, 8])
+
+    head = verifier.get_head(conn)
+    assert head["batch_id"] == 3
+    assert (head["first_event_id"], head["last_event_id"]) == (7, 14)
+    for event_id in range(1, 15):
+        proof = verifier.get_inclusion_proof(event_id, conn)
+        assert proof["event"]["id"] == event_id
+        assert verify_inclusion_proof(proof)
+    assert verifier.get_inclusion_proof(15, conn) is None
+
+
+def test_proof_of_a_changed_event_does_not_verify(temp_db, verifier):
+    conn = save_batches(temp_db, [6])
+    proof = verifier.get_inclusion_proof(3, conn)
+
+    proof["event"]["event_data"] = '{"n":4}'
+
+    assert not verify_inclusion_proof(proof)
+
+
+def test_verify_checks_new_batches_once_from_its_checkpoint(temp_db, verifier):
+    conn = save_batches(temp_db, [4, 4])
+
+    report = verifier.verify(conn=conn)
+    assert report["verified_batches"] == 2
+    assert report["verified_events"] == 8
+    assert report["complete"] and not report["failures"]
+
+    EventDatabaseAccessor().save_events_to_db(
+        insert_data=[(1, "late", 1800000000, b"{}", "late-uuid")], conn=conn
+    )
+    report = verifier.verify(conn=conn)
+    assert report["verified_batches"] == 1
+    assert report["verified_through_batch_id"] == 3
+    assert report["chain_hash"] == verifier.get_head(conn)["chain_hash"]
+    assert verifier.verify(conn=conn)["verified_batches"] == 0
+
+
+@pytest.mark.parametrize(
+    "tamper, failed_batch_id",
+    [
+        ("UPDATE Events SET event_data = '{\"n\":99}' WHERE id = 6", 2),
+        ("UPDATE Events SET customer_id = 9 WHERE id = 5", 2),
+        ("DELETE FROM Events WHERE id = 7", 2),
+        ("UPDATE EventBatches SET merkle_root = zeroblob(32) WHERE batch_id = 2", 2),
+        # the batch after a removed batch no longer follows its predecessor
+        ("DELETE FROM EventBatches WHERE batch_id = 2", 3),
+    ],
+)
+def test_verify_detects_tampering(temp_db, verifier, tamper, failed_batch_id):
+    conn = save_batches(temp_db, [4, 4, 4])
+    conn.execute(tamper)
+    conn.commit()
+
+    report = verifier.verify(conn=conn)
+
+    assert report["failures"][0]["batch_id"] == failed_batch_id
+    assert report["verified_through_batch_id"] == 1
+    assert not report["complete"]
+    assert verifier.verified_batch_id == 1
+
+
+def test_verify_detects_events_inserted_between_batches(temp_db, verifier):
+    conn = save_batches(temp_db, [3])
+    conn.execute("UPDATE sqlite_sequence SET seq = seq + 5 WHERE name = 'Events'")
+    conn.commit()
+    EventDatabaseAccessor().save_events_to_db(
+        insert_data=[(1, "later", 1800000000, b"{}", "later-uuid")], conn=conn
+    )
+    conn.execute(
+        "INSERT INTO Events (id, customer_id, event_type, timestamp_utc, event_data) "
+        "VALUES (5, 1, 'forged', 1700000000, '{}')"
+    )
+    conn.commit()
+
+    report = verifier.verify(conn=conn)
+
+    assert report["failures"] == [
+        {
+            "batch_id": 2,
+            "problems": ["unsealed events were inserted before the batch"],
+        }
+    ]
+
+
+def test_verify_against_a_trusted_chain_hash(temp_db, verifier):
+    conn = save_batches(temp_db, [2, 2, 2])
+    first = verifier.verify(max_batches=1, conn=conn)
+    assert not first["complete"]
+
+    # the whole chain rewritten from batch 2 on still fails against a chain hash recorded before
+    conn.execute(
+        "UPDATE EventBatches SET previous_chain_hash = zeroblob(32) WHERE batch_id = 2"
+    )
+    conn.commit()
+    report = verifier.verify(
+        after_batch_id=1, chain_hash_hex=first["chain_hash"], conn=conn
+    )
+
+    assert report["failures"][0]["batch_id"] == 2
+
+
+def test_verify_range_checks_only_the_batches_of_the_range(temp_db, verifier):
+    conn = save_batches(temp_db, [3, 3, 3, 3])
+    conn.execute("UPDATE Events SET event_type = 'x' WHERE id = 1")
+    conn.commit()
+
+    report = verifier.verify_range(5, 9, conn=conn)
+
+    assert report["verified_batches"] == 2
+    assert report["verified_through_event_id"] == 9
+    assert report["complete"]
+    assert verifier.verify_range(1, 9, conn=conn)["failures"][0]["batch_id"] == 1
+
+
+def test_bulk_loads_are_sealed_in_batches_of_bounded_size(
+    temp_db, verifier, tmp_path, mocker
+):
+    mocker.patch.object(integrity_db_accessor, "MAX_SEALED_BATCH_EVENTS", 4)
+    path = tmp_path / "events.ndjson"
+    path.write_bytes(
+        b"".join(
+            orjson.dumps(
+                {
+                    "event_type": "login",
+                    "customer_id": 1,
+                    "timestamp_utc": t,
+                    "event_data": {"t": t},
+                }
+            )
+            + b"\n"
+            for t in range(10)
+        )
+    )
+
+    EventBulkLoader(temp_db).load([str(path)])
+
+    conn = sqlite3.connect(temp_db)
+    batches = conn.execute(
+        "SELECT first_event_id, last_event_id, event_count FROM EventBatches ORDER BY batch_id"
+    ).fetchall()
+    assert batches == [(1, 4, 4), (5, 8, 4), (9, 10, 2)]
+    assert verifier.verify(conn=conn)["verified_events"] == 10
+    proof = verifier.get_inclusion_proof(6, conn)
+    assert len(proof["audit_path"]) == 2
+    assert verify_inclusion_proof(proof)
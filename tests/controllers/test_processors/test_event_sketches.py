@@ -0,0 +1,210 @@
+import threading
+
+import numpy as np
+import pytest
+from fastapi import HTTPException
+
+from log_service.controllers.sketch_controller import SketchController
+from log_service.data.event_dto import EventQueueDTO
+from log_service.processors import event_sketches
+from log_service.processors.event_sketches import (
+    CountMinSketch,
+    EventSketchStore,
+    HyperLogLog,
+    SketchBucket,
+)
+
+
+@pytest.fixture
+def sketch_store(temp_db):
+    EventSketchStore._instance = None
+    yield EventSketchStore.get_instance()
+    EventSketchStore._instance = None
+
+
+def make_event(event_type, customer_id, timestamp_utc=3600):
+    return EventQueueDTO(event_type, timestamp_utc, customer_id, {"key": "value"})
+
+
+def test_hyperloglog_estimate_and_merge():
+    first, second = HyperLogLog(), HyperLogLog()
+    first.add(np.arange(0, 30_000, dtype=np.int64))
+    second.add(np.arange(20_000, 50_000, dtype=np.int64))
+    assert first.estimate() == pytest.approx(30_000, rel=0.05)
+
+    first.merge(second)
+    assert first.estimate() == pytest.approx(50_000, rel=0.05)
+
+
+def test_hyperloglog_small_cardinality_and_duplicates():
+    sketch = HyperLogLog()
+    sketch.add(np.array([1, 2, 3, 3, 3, 2], dtype=np.int64))
+    assert round(sketch.estimate()) == 3
+
+    restored = HyperLogLog.from_bytes(sketch.to_bytes())
+    assert round(restored.estimate()) == 3
+
+
+def test_count_min_sketch_never_undercounts():
+    sketch = CountMinSketch(width=16, depth=3)
+    counts = {f"event_{i}": i + 1 for i in range(50)}
+    sketch.add(counts)
+    estimates = sketch.estimate(list(counts))
+    assert all(estimates >= np.array(list(counts.values())))
+    assert sketch.total == sum(counts.values())
+
+
+def test_store_persists_and_reloads_buckets(sketch_store):
+    sketch_store.add_events(
+        [make_event("login", customer_id) for customer_id in range(100)]
+    )
+    sketch_store.persist()
+
+    # a restarted store must continue from the persisted state
+    EventSketchStore._instance = None
+    restarted = EventSketchStore.get_instance()
+    restarted.add_events([make_event("login", 1_000)])
+    merged, bucket_start, bucket_end = restarted.merged_bucket(3600, 3700, "login")
+
+    assert (bucket_start, bucket_end) == (3600, 7200)
+    assert merged.customer_sketches["login"].estimate() == pytest.approx(101, rel=0.05)
+    assert merged.event_type_counts.estimate(["login"])[0] == 101
+
+
+def test_store_evicts_old_buckets_but_still_answers(sketch_store, mocker):
+    mocker.patch.object(event_sketches, "MAX_SKETCH_BUCKETS_IN_MEMORY", 1)
+    sketch_store.add_events([make_event("login", 1, timestamp_utc=0)])
+    sketch_store.add_events([make_event("login", 2, timestamp_utc=3600)])
+    sketch_store.persist()
+
+    assert list(sketch_store.buckets) == [3600]
+    merged, _, _ = sketch_store.merged_bucket(0, 3600, "login")
+    assert round(merged.customer_sketches["login"].estimate()) == 2
+
+
+def test_sketch_controller_top_event_types(sketch_store):
+    events = (
+        [make_event("login", i) for i in range(30)]
+        + [make_event("purchase", i) for i in range(20)]
+        + [make_event("logout", 1)]
+    )
+    sketch_store.add_events(events)
+
+    response = SketchController().get_top_event_types(3600, 3600, k=2)
+    assert [item["event_type"] for item in response["event_types"]] == [
+        "login",
+        "purchase",
+    ]
+    assert response["total_events"] == 51
+
+    distinct = SketchController().get_distinct_customers("purchase", 3600, 3600)
+    assert distinct["distinct_customers"] == 20
+    assert distinct["lower_bound_95"] <= 20 <= distinct["upper_bound_95"]
+    assert distinct["fully_tracked"]
+
+
+def test_bucket_tracks_heavy_hitters_only(mocker):
+    mocker.patch.object(event_sketches, "HEAVY_HITTER_CAPACITY", 2)
+    bucket = SketchBucket(0)
+    bucket.add_events(
+        [make_event("login", i) for i in range(30)]
+        + [make_event("purchase", i) for i in range(20)]
+    )
+    bucket.add_events([make_event(f"rare_{i}", 1_000 + i) for i in range(50)])
+
+    assert set(bucket.customer_sketches) == {"login", "purchase"}
+    assert round(bucket.overflow_customers.estimate()) == 50
+
+    # an event type dropping out of the heavy hitters is folded into the overflow sketch
+    bucket.add_events([make_event("logout", i) for i in range(40)])
+    assert set(bucket.customer_sketches) == {"logout", "login"}
+    assert bucket.evicted_keys == {"purchase"}
+    assert bucket.overflow_customers.estimate() == pytest.approx(70, rel=0.05)
+
+
+def test_distinct_customers_of_untracked_event_type(sketch_store, mocker):
+    mocker.patch.object(event_sketches, "HEAVY_HITTER_CAPACITY", 1)
+    sketch_store.add_events(
+        [make_event("login", i) for i in range(30)] + [make_event("rare", 100)]
+    )
+
+    distinct = SketchController().get_distinct_customers("rare", 3600, 3600)
+    assert distinct["distinct_customers"] == 0
+    assert not distinct["fully_tracked"]
+    assert distinct["upper_bound_95"] >= 1
+
+
+def test_distinct_customers_across_buckets_with_many_event_types(sketch_store):
+    # tracked in the first bucket, but not among the heavy hitters of both buckets together
+    sketch_store.add_events([make_event("checkout", i, 3600) for i in range(40)])
+    sketch_store.add_events(
+        [
+            make_event(f"busy_{n}", i, 7200)
+            for n in range(event_sketches.HEAVY_HITTER_CAPACITY + 6)
+            for i in range(50)
+        ]
+    )
+
+    distinct = SketchController().get_distinct_customers("checkout", 3600, 7200)
+    assert distinct["distinct_customers"] == 40
+    assert distinct["fully_tracked"]
+
+    # untracked in the second bucket, counted in the upper bound only
+    sketch_store.add_events([make_event("checkout", 100 + i, 7200) for i in range(5)])
+    distinct = SketchController().get_distinct_customers("checkout", 3600, 7200)
+    assert distinct["distinct_customers"] == 40
+    assert not distinct["fully_tracked"]
+    assert distinct["upper_bound_95"] >= 45
+
+
+def test_persist_deletes_evicted_customer_sketches(sketch_store, mocker):
+    mocker.patch.object(event_sketches, "HEAVY_HITTER_CAPACITY", 1)
+    sketch_store.add_events([make_event("login", i) for i in range(5)])
+    sketch_store.persist()
+    sketch_store.add_events([make_event("purchase", i) for i in range(10)])
+    sketch_store.persist()
+
+    rows = sketch_store.database_accessor.load_sketches(3600, 7200)[3600]
+    customer_keys = {
+        key for sketch_type, key, _ in rows if sketch_type == "hll_customers"
+    }
+    assert customer_keys == {"purchase"}
+
+
+def test_persist_writes_outside_the_store_lock(sketch_store, mocker):
+    sketch_store.add_events([make_event("login", 1)])
+    save_sketches = sketch_store.database_accessor.save_sketches
+    query_done = threading.Event()
+
+    def save_while_querying(*args, **kwargs):
+        thread = threading.Thread(
+            target=lambda: (sketch_store.merged_bucket(3600, 3600), query_done.set())
+        )
+        thread.start()
+        thread.join(timeout=5)
+        return save_sketches(*args, **kwargs)
+
+    mocker.patch.object(
+        sketch_store.database_accessor, "save_sketches", side_effect=save_while_querying
+    )
+    sketch_store.persist()
+
+    assert query_done.is_set()
+    assert not sketch_store.buckets[3600].is_dirty
+
+
+def test_failed_persist_keeps_buckets_dirty(sketch_store, mocker):
+    sketch_store.add_events([make_event("login", 1)])
+    mocker.patch.object(
+        sketch_store.database_accessor, "save_sketches", return_value=False
+    )
+    sketch_store.persist()
+
+    assert sketch_store.buckets[3600].dirty_keys == {"login"}
+
+
+def test_sketch_query_range_is_capped(sketch_store):
+    end = event_sketches.MAX_SKETCH_QUERY_BUCKETS * event_sketches.SKETCH_BUCKET_SECONDS
+    with pytest.raises(HTTPException) as exc:
+        SketchController().get_top_event_types(0, end, k=1)
+    assert exc.value.status_code == 400
@@ -0,0 +1,145 @@
+import sqlite3
+import time
+
+import pytest
+
+from log_service.data.event_dto import EventQueueDTO, EventRequestDTO
+from log_service.db_accessors.event_db_accessor import EventDatabaseAccessor
+from log_service.processors import hot_tail as hot_tail_module
+from log_service.processors.hot_tail import HotTailBuffer
+
+
+@pytest.fixture
+def conn(temp_db):
+    conn = sqlite3.connect(temp_db)
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def hot_tail(conn):
+    HotTailBuffer._instance = None
+    hot_tail = HotTailBuffer.get_instance()
+    hot_tail.open(conn)
+    yield hot_tail
+    HotTailBuffer._instance = None
+
+
+def commit(hot_tail, conn, events):
+    event_ids = EventDatabaseAccessor().save_events_returning_ids(
+        [
+            (e.customer_id, e.event_type, e.timestamp_utc, e.serialized_event_data)
+            + (e.event_uuid,)
+            for e in events
+        ],
+        conn=conn,
+    )
+    hot_tail.mark_committed(events, event_ids)
+    return event_ids
+
+
+def test_queries_see_pending_events_and_their_ids_once_committed(hot_tail, conn):
+    events = [EventQueueDTO("login", 100 + i, i % 2, {"i": i}) for i in range(4)]
+    hot_tail.add(events)
+    request_dto = EventRequestDTO(customer_id=1, timestamp_start_utc=100)
+
+    rows, count = hot_tail.query(request_dto)
+    assert count == 2
+    assert rows == [
+        (None, "login", 101, 1, b'{"i":1}'),
+        (None, "login", 103, 1, b'{"i":3}'),
+    ]
+
+    commit(hot_tail, conn, events[:2])
+
+    rows, _ = hot_tail.query(request_dto)
+    assert [row[0] for row in rows] == [2, None]
+    assert rows[:1] == EventDatabaseAccessor().get_event_rows(request_dto)[0]
+
+
+def test_multi_value_queries_match_like_the_database(hot_tail, conn):
+    events = [
+        EventQueueDTO(f"type{i % 3}", 100 + i, i % 4, {"i": i}) for i in range(24)
+    ]
+    hot_tail.add(events)
+    commit(hot_tail, conn, events)
+    request_dto = EventRequestDTO(
+        customer_id=[1, 3, 7], event_type=["type0", "type2"], timestamp_start_utc=100
+    )
+
+    rows, count = hot_tail.query(request_dto)
+
+    assert count == 8
+    assert {(row[1], row[3]) for row in rows} == {
+        ("type0", 3),
+        ("type2", 1),
+        ("type0", 1),
+        ("type2", 3),
+    }
+    assert (rows, count) == EventDatabaseAccessor().get_event_rows(request_dto)
+
+
+def test_queries_the_buffer_does_not_cover_go_to_the_database(hot_tail, conn):
+    commit(hot_tail, conn, [EventQueueDTO("login", 500, 1, {"a": 1})])
+    hot_tail.open(conn)
+    hot_tail.add([EventQueueDTO("login", 100, 1, {"a": 1})])
+
+    assert hot_tail.query(EventRequestDTO(timestamp_start_utc=500)) is None
+    assert hot_tail.query(EventRequestDTO(customer_id=1)) is None
+    assert hot_tail.query(EventRequestDTO(event_id=1, timestamp_start_utc=501)) is None
+    # the backfilled event is older than the covered range and not buffered
+    assert hot_tail.query(EventRequestDTO(timestamp_start_utc=501)) == ([], 0)
+
+
+def test_evicted_events_raise_the_start_of_the_covered_range(mocker, hot_tail):
+    mocker.patch.object(hot_tail, "max_events", 2)
+    hot_tail.add([EventQueueDTO("login", 100 + i, 1, {"i": i}) for i in range(3)])
+
+    assert hot_tail.covered_from_utc == 101
+    assert hot_tail.query(EventRequestDTO(timestamp_start_utc=100)) is None
+    _, count = hot_tail.query(EventRequestDTO(timestamp_start_utc=101))
+    assert count == 2
+    assert list(hot_tail.customer_entries[1]) == list(hot_tail.entries)
+
+
+def test_evicted_events_dated_in_the_future_end_the_covered_range(mocker, hot_tail):
+    mocker.patch.object(hot_tail, "max_events", 1)
+    future = int(time.time()) + 10 * hot_tail_module.HOT_TAIL_MAX_CLOCK_SKEW_SECONDS
+    hot_tail.add([EventQueueDTO("login", future, 1, {"a": 1})])
+    hot_tail.add([EventQueueDTO("login", 100, 1, {"a": 1})])
+
+    assert hot_tail.covered_until_utc == future
+    assert hot_tail.query(EventRequestDTO(timestamp_start_utc=100)) is None
+    _, count = hot_tail.query(
+        EventRequestDTO(timestamp_start_utc=100, timestamp_end_utc=future - 1)
+    )
+    assert count == 1
+
+
+def test_events_that_are_not_stored_leave_the_results(hot_tail, conn):
+    retried = EventQueueDTO("login", 100, 1, {"a": 1}, "uuid-1")
+    dead_lettered = EventQueueDTO("login", 100, 1, {"a": 2})
+    events = [EventQueueDTO("login", 100, 1, {"a": 1}, "uuid-1"), retried]
+    hot_tail.add(events + [dead_lettered])
+
+    commit(hot_tail, conn, events)
+    hot_tail.discard([dead_lettered])
+
+    rows, count = hot_tail.query(EventRequestDTO(timestamp_start_utc=100))
+    assert count == 1
+    assert rows[0][0] == 1
+
+
+def test_a_disabled_buffer_stays_closed(mocker, conn):
+    HotTailBuffer._instance = None
+    mocker.patch(
+        "log_service.processors.hot_tail.LogServiceConfig.get_hot_tail_limits",
+        return_value=(0, 300.0),
+    )
+    hot_tail = HotTailBuffer.get_instance()
+    hot_tail.open(conn)
+    hot_tail.add([EventQueueDTO("login", 100, 1, {"a": 1})])
+
+    assert not hot_tail.is_open
+    assert hot_tail.query(EventRequestDTO(timestamp_start_utc=100)) is None
+    HotTailBuffer._instance = None
@@ -0,0 +1,102 @@
+import pytest
+
+from log_service.config import LogServiceConfig
+from log_service.data.event_dto import EventQueueDTO
+from log_service.processors import ingest_limiter
+from log_service.processors.ingest_limiter import IngestRateLimiter
+
+
+@pytest.fixture
+def now(mocker):
+    return mocker.patch(
+        "log_service.processors.ingest_limiter.time.monotonic", return_value=100.0
+    )
+
+
+@pytest.fixture
+def make_limiter(monkeypatch):
+    def make_limiter(rate="10", burst="20", sample_rates=""):
+        monkeypatch.setenv("LOG_SERVICE_CUSTOMER_RATE_LIMIT_PER_SECOND", rate)
+        monkeypatch.setenv("LOG_SERVICE_CUSTOMER_RATE_LIMIT_BURST", burst)
+        monkeypatch.setenv("LOG_SERVICE_EVENT_TYPE_SAMPLE_RATES", sample_rates)
+        LogServiceConfig.load_settings()
+        IngestRateLimiter._instance = None
+        return IngestRateLimiter.get_instance()
+
+    yield make_limiter
+    IngestRateLimiter._instance = None
+
+
+def events(customer_id, count, event_type="login"):
+    return [EventQueueDTO(event_type, 1, customer_id, {"i": i}) for i in range(count)]
+
+
+def test_acquire_allows_the_burst_then_the_rate(now, make_limiter):
+    limiter = make_limiter()
+
+    assert limiter.acquire(events(1, 20)) == 0
+    assert limiter.acquire(events(1, 1)) == pytest.approx(0.1)
+    # other customers are not affected
+    assert limiter.acquire(events(2, 20)) == 0
+
+    now.return_value = 100.5
+    assert limiter.acquire(events(1, 5)) == 0
+    assert limiter.acquire(events(1, 1)) > 0
+
+
+def test_acquire_admits_a_batch_for_all_customers_or_none(now, make_limiter):
+    limiter = make_limiter()
+    limiter.acquire(events(2, 20))
+
+    assert limiter.acquire(events(1, 5) + events(2, 5)) == pytest.approx(0.5)
+
+    assert limiter.buckets[1].tokens == 20
+
+
+def test_acquire_admits_batches_larger_than_the_burst_into_debt(now, make_limiter):
+    limiter = make_limiter()
+
+    assert limiter.acquire(events(1, 30)) == 0
+    assert limiter.acquire(events(1, 1)) == pytest.approx(1.1)
+
+
+def test_idle_buckets_are_evicted_once_full(now, make_limiter, monkeypatch):
+    limiter = make_limiter()
+    limiter.acquire(events(1, 10))
+    now.return_value = 101.0
+    limiter.acquire(events(2, 10))
+
+    # customer 1 is full again at 101, customer 2 at 102
+    now.return_value = 101.5
+    limiter.acquire(events(3, 1))
+    assert list(limiter.buckets) == [2, 3]
+
+    monkeypatch.setattr(ingest_limiter, "MAX_CUSTOMER_BUCKETS", 2)
+    limiter.acquire(events(4, 1))
+    assert list(limiter.buckets) == [3, 4]
+
+
+def test_rate_zero_disables_the_limit(now, make_limiter):
+    limiter = make_limiter(rate="0")
+
+    assert limiter.acquire(events(1, 10_000)) == 0
+    assert not limiter.buckets
+
+
+def test_sample_keeps_a_fraction_of_sampled_event_types(make_limiter, mocker):
+    limiter = make_limiter(sample_rates="debug=0.25, heartbeat=0")
+    mocker.patch(
+        "log_service.processors.ingest_limiter.random.random",
+        side_effect=[0.1, 0.5, 0.9, 0.2, 0.0, 0.5],
+    )
+    received = events(1, 4, "debug") + events(1, 2, "heartbeat") + events(1, 2, "login")
+
+    kept = limiter.sample(received)
+
+    assert [event.event_type for event in kept] == ["debug", "debug", "login", "login"]
+
+
+def test_malformed_sample_rates_are_rejected(make_limiter):
+    for sample_rates in ("debug", "debug=2", "=0.5"):
+        with pytest.raises(ValueError):
+            make_limiter(sample_rates=sample_rates)
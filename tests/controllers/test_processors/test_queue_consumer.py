@@ -1,6 +1,10 @@
+from concurrent.futures import Future
+
 import pytest
 
+from log_service.config import LogServiceConfig
 from log_service.data.event_dto import EventQueueDTO
+from log_service.processors import queue_consumer
 from log_service.processors.queue_consumer import QueueConsumer
 
 
@@ -20,9 +24,12 @@ def test_singleton_pattern(setup_queue_consumer):
 
 def test_consume_events_empty_queue(mocker, setup_queue_consumer):
     consumer = setup_queue_consumer
-    mock_sleep = mocker.patch("time.sleep")
+    consumer.event_queue.clear()
+    mock_wait = mocker.patch.object(consumer.event_queue, "wait_for_events")
     consumer.consume_events()
-    mock_sleep.assert_called_once()
+    mock_wait.assert_called_once_with(
+        LogServiceConfig.get_settings().consumer_idle_wait_seconds
+    )
 
 
 def test_consume_events_with_data(setup_queue_consumer, mocker):
@@ -92,3 +99,74 @@ def test_multiple_consumers_instance_raise_exception(mocker):
     _ = QueueConsumer()
     with pytest.raises(Exception):
         _ = QueueConsumer()
+
+
+def test_save_event_dead_letters_events_failing_alone(mocker, setup_queue_consumer):
+    consumer = setup_queue_consumer
+    consumer.event_queue.clear()
+    events = [
+        EventQueueDTO("test", 123456789, customer_id, {"key": "value"})
+        for customer_id in (1, 2)
+    ]
+    for event in events:
+        event.save_attempts = queue_consumer.MAX_SAVE_ATTEMPTS - 1
+
+    # the batch fails, saved one by one only the first event can be stored
+    consumer.database_accessor = mocker.Mock()
+    consumer.database_accessor.save_events_to_db.side_effect = [False, True, False]
+    mocker.patch.object(consumer, "_update_sketches")
+    mocker.patch.object(consumer, "_invalidate_analytics_chunks")
+    dead_lettered = queue_consumer.EVENTS_DEAD_LETTERED.value
+
+    consumer._save_event(events)
+
+    assert list(consumer.dead_letter_queue) == [events[1]]
+    assert len(consumer.event_queue) == 0
+    assert queue_consumer.EVENTS_DEAD_LETTERED.value == dead_lettered + 1
+
+
+def test_dead_lettered_events_fail_their_commit_futures(mocker, setup_queue_consumer):
+    consumer = setup_queue_consumer
+    consumer.event_queue.clear()
+    events = [
+        EventQueueDTO("test", 123456789, customer_id, {"key": "value"})
+        for customer_id in (1, 2)
+    ]
+    for event in events:
+        event.save_attempts = queue_consumer.MAX_SAVE_ATTEMPTS - 1
+        event.commit_future = Future()
+    consumer.database_accessor = mocker.Mock()
+    consumer.database_accessor.save_events_returning_ids.side_effect = [
+        None,
+        [5],
+        None,
+    ]
+    mocker.patch.object(consumer, "_update_sketches")
+    mocker.patch.object(consumer, "_invalidate_analytics_chunks")
+
+    consumer._save_event(events)
+
+    assert events[0].commit_future.result(timeout=0) == 5
+    with pytest.raises(queue_consumer.EventNotCommittedError):
+        events[1].commit_future.result(timeout=0)
+
+
+def test_save_event_keeps_retrying_when_nothing_can_be_saved(
+    mocker, setup_queue_consumer
+):
+    consumer = setup_queue_consumer
+    consumer.event_queue.clear()
+    events = [
+        EventQueueDTO("test", 123456789, customer_id, {"key": "value"})
+        for customer_id in (1, 2)
+    ]
+    for event in events:
+        event.save_attempts = queue_consumer.MAX_SAVE_ATTEMPTS - 1
+    consumer.database_accessor = mocker.Mock()
+    consumer.database_accessor.save_events_to_db.return_value = False
+
+    consumer._save_event(events)
+
+    # e.g. the database is down, no event is given up on
+    assert list(consumer.event_queue) == events
+    assert not consumer.dead_letter_queue
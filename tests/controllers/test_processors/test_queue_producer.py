@@ -0,0 +1,95 @@
+from collections import Counter
+
+import pytest
+
+from log_service.config import LogServiceConfig
+from log_service.data.event_dto import EventQueueDTO
+from log_service.processors.queue_producer import PriorityLaneQueue
+
+PRIORITIES = {"login": "critical", "telemetry": "bulk"}
+
+
+def events(event_type, count):
+    return [EventQueueDTO(event_type, 1, 1, {"i": i}) for i in range(count)]
+
+
+def test_events_go_to_the_lane_of_their_event_type():
+    queue = PriorityLaneQueue(PRIORITIES)
+    queue.extend(events("telemetry", 1) + events("purchase", 1))
+    queue.append(events("login", 1)[0])
+
+    assert len(queue) == 3
+    assert [event.event_type for event in queue] == ["login", "purchase", "telemetry"]
+    assert queue.popleft().event_type == "login"
+    assert {name: stats["depth"] for name, stats in queue.lane_stats().items()} == {
+        "critical": 0,
+        "default": 1,
+        "bulk": 1,
+    }
+
+
+def test_pop_batch_shares_a_backlog_by_lane_weight():
+    queue = PriorityLaneQueue(PRIORITIES)
+    queue.extend(events("telemetry", 1000) + events("purchase", 1000))
+    queue.extend(events("login", 1000))
+
+    batch = queue.pop_batch(30)
+
+    assert Counter(event.event_type for event in batch) == {
+        "login": 18,
+        "purchase": 9,
+        "telemetry": 3,
+    }
+    # in lane order, and in arrival order within a lane
+    assert [event.event_data["i"] for event in batch[:3]] == [0, 1, 2]
+    assert batch[0].event_type == "login" and batch[-1].event_type == "telemetry"
+
+
+def test_pop_batch_never_starves_a_lane():
+    queue = PriorityLaneQueue(PRIORITIES)
+    queue.extend(events("login", 100) + events("telemetry", 100))
+
+    served = Counter(queue.pop_batch(1)[0].event_type for _ in range(14))
+
+    assert served == {"login": 12, "telemetry": 2}
+
+
+def test_pop_batch_gives_unused_slots_to_the_other_lanes():
+    queue = PriorityLaneQueue(PRIORITIES)
+    queue.extend(events("login", 2) + events("telemetry", 100))
+
+    batch = queue.pop_batch(30)
+
+    assert Counter(event.event_type for event in batch) == {
+        "login": 2,
+        "telemetry": 28,
+    }
+    assert queue.pop_batch(30) and len(queue) == 42
+
+
+def test_requeued_events_keep_their_enqueue_time(mocker):
+    now = mocker.patch(
+        "log_service.processors.queue_producer.time.monotonic", return_value=10.0
+    )
+    queue = PriorityLaneQueue(PRIORITIES)
+    queue.extend(events("login", 1))
+    now.return_value = 12.5
+
+    queue.append(queue.pop_batch(1)[0])
+
+    assert queue.lane_stats()["critical"] == {"depth": 1, "lag_seconds": 2.5}
+
+
+def test_event_type_priorities_are_validated(monkeypatch):
+    monkeypatch.setenv(
+        "LOG_SERVICE_EVENT_TYPE_PRIORITIES", "login=critical, debug=bulk"
+    )
+    LogServiceConfig.load_settings()
+    assert LogServiceConfig.get_event_type_priorities() == {
+        "login": "critical",
+        "debug": "bulk",
+    }
+
+    monkeypatch.setenv("LOG_SERVICE_EVENT_TYPE_PRIORITIES", "login=urgent")
+    with pytest.raises(ValueError):
+        LogServiceConfig.load_settings()
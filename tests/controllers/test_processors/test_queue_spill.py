@@ -0,0 +1,81 @@
+import gzip
+import os
+
+import pytest
+
+from log_service.data.event_dto import EventQueueDTO
+from log_service.processors.queue_spill import QueueSpill
+
+
+def make_events():
+    first = EventQueueDTO("login", 10, 1, {"user": "ü", "nested": {"a": [1, 2]}})
+    first.save_attempts = 3
+    return [first, EventQueueDTO("logout", 20, 2**40, {"b": None}, "uuid-1")]
+
+
+def test_spill_and_reingest_round_trip(tmp_path):
+    spill = QueueSpill(str(tmp_path / "SQLite-test.db"))
+    events = make_events()
+
+    first_path = spill.spill(events[:1])
+    second_path = spill.spill(events[1:])
+
+    assert spill.spill([]) is None
+    assert spill.spill_paths() == [first_path, second_path]
+    reingested, paths = spill.reingest()
+    assert paths == [first_path, second_path]
+    assert [
+        (e.event_type, e.timestamp_utc, e.customer_id, e.event_data, e.save_attempts)
+        + (e.event_uuid,)
+        for e in reingested
+    ] == [
+        (e.event_type, e.timestamp_utc, e.customer_id, e.event_data, e.save_attempts)
+        + (e.event_uuid,)
+        for e in events
+    ]
+    assert reingested[0].serialized_event_data == events[0].serialized_event_data
+
+    spill.remove(paths)
+    assert spill.spill_paths() == []
+
+
+def test_corrupt_spill_files_are_set_aside(tmp_path):
+    spill = QueueSpill(str(tmp_path / "SQLite-test.db"))
+    good_path = spill.spill(make_events())
+    truncated_path = spill.spill(make_events())
+    with gzip.open(truncated_path, "rb") as f:
+        content = f.read()
+    with gzip.open(truncated_path, "wb") as f:
+        f.write(content[:-3])
+
+    with pytest.raises(ValueError):
+        spill.read(truncated_path)
+    events, paths = spill.reingest()
+
+    assert paths == [good_path]
+    assert len(events) == 2
+    assert os.path.exists(f"{truncated_path}.corrupt")
+
+
+def test_events_that_cannot_be_spilled_are_skipped(tmp_path):
+    spill = QueueSpill(str(tmp_path / "SQLite-test.db"))
+    events = [
+        EventQueueDTO("x" * 70_000, 10, 1, {"a": 1}),
+        EventQueueDTO("login", 20, 2**64, {"a": 2}),
+        *make_events(),
+    ]
+
+    path = spill.spill(events)
+
+    assert [event.event_type for event in spill.read(path)] == ["login", "logout"]
+    assert os.listdir(tmp_path) == [os.path.basename(path)]
+
+
+def test_failed_spill_leaves_no_file(tmp_path, mocker):
+    spill = QueueSpill(str(tmp_path / "SQLite-test.db"))
+    mocker.patch("os.fsync", side_effect=OSError("disk full"))
+
+    with pytest.raises(OSError):
+        spill.spill(make_events())
+
+    assert os.listdir(tmp_path) == []
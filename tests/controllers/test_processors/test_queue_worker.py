@@ -0,0 +1,148 @@
+import asyncio
+import sqlite3
+from concurrent.futures import Future
+
+import pytest
+
+from log_service.data.event_dto import EventQueueDTO
+from log_service.data.event_dto import EventRequestDTO
+from log_service.processors.change_feed import ChangeFeedHub
+from log_service.processors.event_sketches import EventSketchStore
+from log_service.processors.hot_tail import HotTailBuffer
+from log_service.processors.queue_consumer import (
+    EventNotCommittedError,
+    QueueConsumer,
+)
+from log_service.processors.queue_producer import QueueProducer
+from log_service.processors.queue_spill import QueueSpill
+from log_service.processors.queue_worker import QueueConsumerWorker
+
+
+@pytest.fixture
+def worker(temp_db):
+    for cls in (
+        ChangeFeedHub,
+        HotTailBuffer,
+        QueueProducer,
+        QueueConsumer,
+        EventSketchStore,
+        QueueConsumerWorker,
+    ):
+        cls._instance = None
+    worker = QueueConsumerWorker.get_instance()
+    yield worker
+    worker.stop(drain_deadline_seconds=0)
+
+
+def stored_count(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute("SELECT COUNT(1) FROM Events").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def enqueue(count):
+    QueueProducer.get_instance().enqueue_events(
+        [EventQueueDTO("login", 100 + i, i, {"i": i}) for i in range(count)]
+    )
+
+
+def test_stop_drains_the_queue_within_the_deadline(worker, temp_db):
+    worker.start()
+    enqueue(2500)
+
+    assert worker.stop(drain_deadline_seconds=10) == 0
+
+    assert stored_count(temp_db) == 2500
+    assert QueueSpill(temp_db).spill_paths() == []
+
+
+def test_events_left_after_the_deadline_are_spilled_and_reingested(
+    mocker, worker, temp_db
+):
+    consumer = QueueConsumer.get_instance()
+    # the database is down, every batch goes back to the queue
+    save = mocker.patch.object(
+        consumer.database_accessor, "save_events_returning_ids", return_value=None
+    )
+    worker.start()
+    enqueue(50)
+
+    assert worker.stop(drain_deadline_seconds=0.2) == 50
+    assert len(consumer.event_queue) == 0
+    assert len(QueueSpill(temp_db).spill_paths()) == 1
+
+    save.stop()
+    mocker.stopall()
+    assert worker.start() == 50
+    assert QueueSpill(temp_db).spill_paths() == []
+    assert worker.stop(drain_deadline_seconds=10) == 0
+    assert stored_count(temp_db) == 50
+
+
+def test_commit_futures_resolve_with_the_ids_of_committed_events(worker, temp_db):
+    events = [EventQueueDTO("login", 100 + i, i, {"i": i}) for i in range(3)]
+    for event in events:
+        event.commit_future = Future()
+    worker.start()
+    QueueProducer.get_instance().enqueue_events(events)
+
+    event_ids = [event.commit_future.result(timeout=10) for event in events]
+
+    conn = sqlite3.connect(temp_db)
+    stored = dict(conn.execute("SELECT id, customer_id FROM Events").fetchall())
+    conn.close()
+    assert [stored[event_id] for event_id in event_ids] == [0, 1, 2]
+
+
+def test_commit_futures_of_spilled_events_fail(mocker, worker, temp_db):
+    consumer = QueueConsumer.get_instance()
+    mocker.patch.object(
+        consumer.database_accessor, "save_events_returning_ids", return_value=None
+    )
+    event = EventQueueDTO("login", 100, 1, {})
+    event.commit_future = Future()
+    worker.start()
+    QueueProducer.get_instance().enqueue_event(event)
+
+    assert worker.stop(drain_deadline_seconds=0.2) == 1
+
+    with pytest.raises(EventNotCommittedError):
+        event.commit_future.result(timeout=0)
+
+
+def test_recent_events_are_served_from_memory_once_committed(worker, temp_db):
+    worker.start()
+    enqueue(50)
+    request_dto = EventRequestDTO(customer_id=7, timestamp_start_utc=100)
+
+    rows, count = HotTailBuffer.get_instance().query(request_dto)
+    assert count == 1
+    worker.stop(drain_deadline_seconds=10)
+
+    worker.start()
+    assert HotTailBuffer.get_instance().query(request_dto) is None
+    enqueue(1)
+    # stored events are older than the covered range after a restart
+    assert HotTailBuffer.get_instance().query(request_dto) is None
+
+
+def test_committed_events_are_published_to_change_feed_subscribers(worker, temp_db):
+    async def follow():
+        subscription = ChangeFeedHub.get_instance().subscribe(customer_id=3)
+        worker.start()
+        enqueue(10)
+        rows = []
+        while not rows:
+            rows = await subscription.next_rows(5)
+        return rows
+
+    (row,) = asyncio.run(follow())
+
+    assert row[1:] == ("login", 103, 3, b'{"i":3}')
+    conn = sqlite3.connect(temp_db)
+    assert conn.execute(
+        "SELECT customer_id FROM Events WHERE id = ?", (row[0],)
+    ).fetchone() == (3,)
+    conn.close()
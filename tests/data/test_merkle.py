@@ -0,0 +1,65 @@
+import hashlib
+
+from log_service.data.merkle import (
+    inclusion_path,
+    leaf_hash,
+    merkle_root,
+    root_from_inclusion_path,
+)
+
+
+def make_leaves(count):
+    return [
+        leaf_hash((i, "login", 1700000000 + i, 7, b'{"n": %d}' % i, None))
+        for i in range(1, count + 1)
+    ]
+
+
+def test_merkle_root_follows_rfc_6962():
+    a, b, c = make_leaves(3)
+
+    def node(left, right):
+        return hashlib.sha256(b"\x01" + left + right).digest()
+
+    assert merkle_root([]) == hashlib.sha256(b"").digest()
+    assert merkle_root([a]) == a
+    assert merkle_root([a, b]) == node(a, b)
+    # the left subtree is the largest power of two smaller than the size
+    assert merkle_root([a, b, c]) == node(node(a, b), c)
+
+
+def test_every_inclusion_path_leads_to_the_root():
+    for size in range(1, 34):
+        leaves = make_leaves(size)
+        root = merkle_root(leaves)
+        for index in range(size):
+            path = inclusion_path(leaves, index)
+            assert len(path) <= (size - 1).bit_length()
+            assert root_from_inclusion_path(leaves[index], index, size, path) == root
+
+
+def test_inclusion_path_does_not_prove_another_leaf_or_position():
+    leaves = make_leaves(11)
+    root = merkle_root(leaves)
+    path = inclusion_path(leaves, 4)
+
+    assert root_from_inclusion_path(leaves[5], 4, 11, path) != root
+    assert root_from_inclusion_path(leaves[4], 5, 11, path) != root
+    assert root_from_inclusion_path(leaves[4], 4, 11, path[:-1]) is None
+    assert root_from_inclusion_path(leaves[4], 11, 11, path) is None
+
+
+def test_leaf_hash_covers_every_column():
+    row = (1, "login", 1700000000, 7, b'{"a": 1}', "uuid-1")
+    changed = [
+        (2, "login", 1700000000, 7, b'{"a": 1}', "uuid-1"),
+        (1, "logout", 1700000000, 7, b'{"a": 1}', "uuid-1"),
+        (1, "login", 1700000001, 7, b'{"a": 1}', "uuid-1"),
+        (1, "login", 1700000000, 8, b'{"a": 1}', "uuid-1"),
+        (1, "login", 1700000000, 7, b'{"a":1}', "uuid-1"),
+        (1, "login", 1700000000, 7, b'{"a": 1}', None),
+        (1, "login", 1700000000, 7, None, "uuid-1"),
+    ]
+    assert all(leaf_hash(other) != leaf_hash(row) for other in changed)
+    # stored as text or as a blob, the same bytes hash the same
+    assert leaf_hash((*row[:4], row[4].decode(), row[5])) == leaf_hash(row)
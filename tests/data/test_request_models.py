@@ -1,7 +1,7 @@
 import pytest
 from pydantic import ValidationError
 
-from log_service.data.request_models import CreateEventModel
+from log_service.data.request_models import MAX_EVENT_TYPE_LENGTH, CreateEventModel
 
 
 def test_create_event_model_with_valid_data():
@@ -41,3 +41,27 @@ def test_create_event_model_with_empty_event_data():
             event_data={},
         )
     assert "event_data must contain at least one field" in str(exc_info.value)
+
+
+def test_create_event_model_with_invalid_event_uuid():
+    with pytest.raises(ValidationError):
+        CreateEventModel(
+            event_type="test_event",
+            customer_id=1,
+            event_data={"key": "value"},
+            event_uuid="not-a-uuid",
+        )
+
+
+@pytest.mark.parametrize(
+    "field, value",
+    [
+        ("event_type", "x" * (MAX_EVENT_TYPE_LENGTH + 1)),
+        ("customer_id", 2**63),
+        ("timestamp_utc", -(2**63) - 1),
+    ],
+)
+def test_create_event_model_rejects_values_out_of_range(field, value):
+    event = {"event_type": "test_event", "customer_id": 1, "event_data": {"k": "v"}}
+    with pytest.raises(ValidationError):
+        CreateEventModel(**{**event, field: value})
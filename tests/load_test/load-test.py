@@ -1,88 +1,511 @@
-import datetime
+import argparse
+import asyncio
+import itertools
+import math
 import random
+import time
+import uuid
+from collections import Counter
+from dataclasses import dataclass, field
 
-import requests
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import httpx
 import orjson
-from requests.adapters import HTTPAdapter
-
-# Updating the connection pool size
-connection_session = requests.Session()
-adapter = HTTPAdapter(pool_connections=10, pool_maxsize=20)
-connection_session.mount("http://", adapter)
-
-NUMBER_OF_REQUESTS = 100_000
-NUMBER_OF_THREADS = 16
-
-
-def send_http_request(session, token):
-    url = "http://127.0.0.1:8000/event"
-    timeout = 5
-    payload = {
-        "event_type": f"event{random.choice([x for x in range(10)])}",
-        "customer_id": random.choice([x for x in range(10)]),
-        "event_data": {
-            "custom_data1": f"custom {random.choice([x for x in range(10)])}"
-        },
-    }
-    headers = {"Content-Type": "application/json", "AUTHORIZATION": f"Bearer {token}"}
 
-    # Use the session to send the request
-    response = session.post(
-        url, data=orjson.dumps(payload), headers=headers, timeout=timeout
-    )
-    return response.status_code == 200
+DEFAULT_BASE_URL = "http://127.0.0.1:8000"
+DEFAULT_RATE = 500
+DEFAULT_DURATION_SECONDS = 60
+DEFAULT_MIX = "write=70,read=25,batch=5"
+DEFAULT_BATCH_SIZE = 50
+DEFAULT_CONNECTIONS = 100
+# arrivals beyond this many requests in flight are dropped and reported, so a stalled server cannot exhaust memory
+MAX_IN_FLIGHT = 10_000
+REQUEST_TIMEOUT_SECONDS = 10
+# payloads and read queries are prepared before the run, so generating them never delays arrivals
+PAYLOAD_POOL_SIZE = 10_000
+DEFAULT_PAYLOAD_MEAN_BYTES = 300
+DEFAULT_PAYLOAD_SIGMA = 1.0
+EVENT_TYPES = 20
+CUSTOMERS = 1000
+LAG_PROBE_EVENT_TYPE = "load_test_lag_probe"
+LAG_PROBE_CUSTOMER_ID = 999_999_999
+LAG_PROBE_INTERVAL_SECONDS = 1.0
+LAG_PROBE_POLL_SECONDS = 0.02
+LAG_PROBE_TIMEOUT_SECONDS = 60
+# the width of every histogram bucket is below 1 / 2**HISTOGRAM_PRECISION_BITS of its value
+HISTOGRAM_PRECISION_BITS = 7
+REPORTED_PERCENTILES = (0.5, 0.9, 0.99, 0.999)
+OPERATIONS = ("write", "read", "batch")
 
 
-def get_access_token(session):
-    url = "http://127.0.0.1:8000/access-token?valid_minutes=1800"
-    timeout = 5
+class LatencyHistogram:
+    """
+    Records latencies into log-linear buckets, like HdrHistogram: values are kept to HISTOGRAM_PRECISION_BITS
+    significant bits (under 1% error) from microseconds to minutes, in memory bounded by the value range instead
+    of the number of samples, so a long run at a high rate keeps exact-enough p99.9s.
+    """
 
-    headers = {"Content-Type": "application/json"}
+    def __init__(self) -> None:
+        self.counts: Counter[int] = Counter()
+        self.count = 0
+        self.max_us = 0
 
-    # Use the session to send the request
-    try:
-        response = session.get(url, headers=headers, timeout=timeout)
-        if response.status_code != 200:
-            raise Exception(
-                f"Failed to get access token. code :{response.status_code}, Reason: {response.text}"
-            )
-        print(response.json())
-        return response.json()["token"]
-    except Exception as e:
-        print(f" ERORR-----------------> Failed to get access token: {str(e)}")
-        print(
-            " ----------------------------------------->    ARE YOU SURE YOU HAVE STARTED THE APP?"
+    def record(self, seconds: float) -> None:
+        value = max(1, int(seconds * 1_000_000))
+        shift = max(0, value.bit_length() - HISTOGRAM_PRECISION_BITS)
+        # the highest value of the bucket, so percentiles are never under-reported
+        self.counts[((value >> shift) << shift) + (1 << shift) - 1] += 1
+        self.count += 1
+        self.max_us = max(self.max_us, value)
+
+    def percentile(self, quantile: float) -> float:
+        """Returns the latency in seconds at or below which `quantile` of the recorded values are."""
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(quantile * self.count))
+        seen = 0
+        for value in sorted(self.counts):
+            seen += self.counts[value]
+            if seen >= rank:
+                return min(value, self.max_us) / 1_000_000
+        return self.max_us / 1_000_000
+
+
+@dataclass
+class OperationStats:
+    latency: LatencyHistogram = field(default_factory=LatencyHistogram)
+    succeeded: int = 0
+    errors: Counter = field(default_factory=Counter)
+    dropped: int = 0
+
+
+class Workload:
+    """
+    The requests of a run: a weighted mix of operations and pools of pre-encoded payloads and read queries.
+
+    Event data sizes follow a log-normal distribution around `payload_mean_bytes`, or are replayed from an NDJSON
+    file. A replayed line holding event_type, customer_id and event_data is sent as is, any other JSON object is sent
+    as the event_data of a generated event, so real payload shapes and sizes can be replayed from any JSON log.
+    """
+
+    def __init__(
+        self,
+        mix: dict[str, float],
+        batch_size: int,
+        payload_mean_bytes: int,
+        payload_sigma: float,
+        replay_path: str | None,
+        rng: random.Random,
+    ) -> None:
+        self.operations = list(mix)
+        self.weights = list(mix.values())
+        self.batch_size = batch_size
+        self.rng = rng
+        event_type_weights = [1 / rank for rank in range(1, EVENT_TYPES + 1)]
+        self.event_types = rng.choices(
+            [f"event{i}" for i in range(EVENT_TYPES)],
+            weights=event_type_weights,
+            k=PAYLOAD_POOL_SIZE,
         )
+        if replay_path:
+            self.events = self._replayed_events(replay_path)
+        else:
+            self.events = self._generated_events(payload_mean_bytes, payload_sigma)
+        self.event_bodies = [orjson.dumps(event) for event in self.events]
+        self.read_queries = [self._read_query() for _ in range(PAYLOAD_POOL_SIZE)]
+        self._event_bodies = itertools.cycle(self.event_bodies)
+        self._read_queries = itertools.cycle(self.read_queries)
 
+    def next_operation(self) -> str:
+        return self.rng.choices(self.operations, weights=self.weights)[0]
 
-if __name__ == "__main__":
+    def next_event_body(self) -> bytes:
+        return next(self._event_bodies)
 
-    print(
-        "################################################################ Running LOAD TEST"
-    )
-    token = get_access_token(connection_session)
-    if not token:
-        exit()
-    start_time = datetime.datetime.now()
-
-    with ThreadPoolExecutor(max_workers=NUMBER_OF_THREADS) as executor:  #
-        futures = [
-            executor.submit(send_http_request, connection_session, token)
-            for _ in range(NUMBER_OF_REQUESTS)
+    def next_batch_body(self) -> bytes:
+        return (
+            b"["
+            + b",".join(next(self._event_bodies) for _ in range(self.batch_size))
+            + b"]"
+        )
+
+    def next_read_query(self) -> dict:
+        return next(self._read_queries)
+
+    def _generated_events(self, mean_bytes: int, sigma: float) -> list[dict]:
+        # mu of a log-normal distribution whose mean is mean_bytes
+        mu = math.log(max(mean_bytes, 1)) - sigma**2 / 2
+        return [
+            {
+                "event_type": event_type,
+                "customer_id": self.rng.randint(1, CUSTOMERS),
+                "event_data": {
+                    "source": "load_test",
+                    "padding": "x" * int(self.rng.lognormvariate(mu, sigma)),
+                },
+            }
+            for event_type in self.event_types
         ]
 
-    success_count = 0
-    for future in as_completed(futures):
-        if future.result():
-            success_count += 1
+    def _replayed_events(self, replay_path: str) -> list[dict]:
+        events = []
+        with open(replay_path, "rb") as f:
+            for line in f:
+                if len(events) == PAYLOAD_POOL_SIZE:
+                    break
+                if not line.strip():
+                    continue
+                record = orjson.loads(line)
+                if {"event_type", "customer_id", "event_data"} <= record.keys():
+                    events.append(
+                        {
+                            "event_type": record["event_type"],
+                            "customer_id": record["customer_id"],
+                            "event_data": record["event_data"],
+                        }
+                    )
+                else:
+                    events.append(
+                        {
+                            "event_type": self.event_types[len(events)],
+                            "customer_id": self.rng.randint(1, CUSTOMERS),
+                            "event_data": record,
+                        }
+                    )
+        if not events:
+            raise ValueError(f"No events to replay in {replay_path}")
+        return events
+
+    def _read_query(self) -> dict:
+        shape = self.rng.randrange(3)
+        if shape == 0:
+            return {"customer_id": self.rng.randint(1, CUSTOMERS)}
+        if shape == 1:
+            return {"event_type": self.rng.choice(self.event_types)}
+        # the last minute, resolved when the query is sent
+        return {"timestamp_start_utc": -60}
+
+
+class LoadTest:
+    """
+    An open-loop load generator: requests are started at a fixed arrival rate whether or not earlier ones have
+    finished, like independent users do, and every latency is measured from the time the request was due, not from
+    the time it was sent. A closed-loop test (N threads sending back to back) stops sending while the server stalls,
+    and so never records the latency of the requests that would have arrived meanwhile (coordinated omission).
+
+    A lag prober posts a marked event every LAG_PROBE_INTERVAL_SECONDS and polls GET /event until it is returned,
+    measuring the ingest-to-queryable lag of the consumer under the same load.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        workload: Workload,
+        rate: float,
+        duration_seconds: float,
+        connections: int,
+        poisson: bool,
+        probe_lag: bool,
+    ) -> None:
+        self.base_url = base_url
+        self.workload = workload
+        self.rate = rate
+        self.duration_seconds = duration_seconds
+        self.connections = connections
+        self.poisson = poisson
+        self.probe_lag = probe_lag
+        self.stats = {operation: OperationStats() for operation in OPERATIONS}
+        self.ingest_lag = LatencyHistogram()
+        self.lag_probes_lost = 0
+        self.max_send_delay = 0.0
+        self.in_flight = 0
+        self.elapsed_seconds = 0.0
+        self.headers: dict[str, str] = {}
+
+    async def run(self) -> None:
+        limits = httpx.Limits(
+            max_connections=self.connections,
+            max_keepalive_connections=self.connections,
+        )
+        async with httpx.AsyncClient(
+            base_url=self.base_url, limits=limits, timeout=REQUEST_TIMEOUT_SECONDS
+        ) as client:
+            response = await client.get("/access-token", params={"valid_minutes": 600})
+            response.raise_for_status()
+            self.headers = {
+                "Authorization": f"Bearer {response.json()['token']}",
+                "Content-Type": "application/json",
+            }
+
+            tasks: set[asyncio.Task] = set()
+            prober = (
+                asyncio.create_task(self._probe_lag(client, tasks))
+                if self.probe_lag
+                else None
+            )
+            started_at = time.perf_counter()
+            await self._send_arrivals(client, tasks, started_at)
+            if prober is not None:
+                prober.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self.elapsed_seconds = time.perf_counter() - started_at
+
+    async def _send_arrivals(
+        self, client: httpx.AsyncClient, tasks: set[asyncio.Task], started_at: float
+    ) -> None:
+        due_at = started_at
+        deadline = started_at + self.duration_seconds
+        while True:
+            due_at += (
+                self.workload.rng.expovariate(self.rate)
+                if self.poisson
+                else 1 / self.rate
+            )
+            if due_at >= deadline:
+                return
+            delay = due_at - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            else:
+                self.max_send_delay = max(self.max_send_delay, -delay)
+
+            operation = self.workload.next_operation()
+            if self.in_flight >= MAX_IN_FLIGHT:
+                self.stats[operation].dropped += 1
+                continue
+            self._start(tasks, self._send(client, operation, due_at))
+
+    def _start(self, tasks: set[asyncio.Task], coroutine) -> None:
+        task = asyncio.create_task(coroutine)
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    async def _send(
+        self, client: httpx.AsyncClient, operation: str, due_at: float
+    ) -> None:
+        stats = self.stats[operation]
+        self.in_flight += 1
+        try:
+            if operation == "write":
+                response = await client.post(
+                    "/event",
+                    content=self.workload.next_event_body(),
+                    headers=self.headers,
+                )
+            elif operation == "batch":
+                response = await client.post(
+                    "/event/batch",
+                    content=self.workload.next_batch_body(),
+                    headers=self.headers,
+                )
+            else:
+                params = dict(self.workload.next_read_query())
+                if params.get("timestamp_start_utc", 0) < 0:
+                    params["timestamp_start_utc"] += int(time.time())
+                response = await client.get(
+                    "/event", params=params, headers=self.headers
+                )
+            if response.status_code == 200:
+                stats.succeeded += 1
+            else:
+                stats.errors[str(response.status_code)] += 1
+        except httpx.HTTPError as e:
+            stats.errors[type(e).__name__] += 1
+        finally:
+            self.in_flight -= 1
+            # latency from the time the request was due, including any time spent waiting for the generator
+            stats.latency.record(time.perf_counter() - due_at)
+
+    async def _probe_lag(
+        self, client: httpx.AsyncClient, tasks: set[asyncio.Task]
+    ) -> None:
+        while True:
+            self._start(tasks, self._measure_ingest_lag(client))
+            await asyncio.sleep(LAG_PROBE_INTERVAL_SECONDS)
 
-    total_seconds = (datetime.datetime.now() - start_time).total_seconds()
+    async def _measure_ingest_lag(self, client: httpx.AsyncClient) -> None:
+        marker = uuid.uuid4().hex
+        timestamp_utc = int(time.time())
+        started_at = time.perf_counter()
+        try:
+            response = await client.post(
+                "/event",
+                content=orjson.dumps(
+                    {
+                        "event_type": LAG_PROBE_EVENT_TYPE,
+                        "customer_id": LAG_PROBE_CUSTOMER_ID,
+                        "timestamp_utc": timestamp_utc,
+                        "event_data": {"marker": marker},
+                    }
+                ),
+                headers=self.headers,
+            )
+            response.raise_for_status()
+            while time.perf_counter() - started_at < LAG_PROBE_TIMEOUT_SECONDS:
+                response = await client.get(
+                    "/event",
+                    params={
+                        "event_type": LAG_PROBE_EVENT_TYPE,
+                        "customer_id": LAG_PROBE_CUSTOMER_ID,
+                        "timestamp_start_utc": timestamp_utc,
+                        "timestamp_end_utc": timestamp_utc,
+                    },
+                    headers=self.headers,
+                )
+                if response.status_code == 200 and any(
+                    event["event_data"].get("marker") == marker
+                    for event in response.json()["events"]
+                ):
+                    self.ingest_lag.record(time.perf_counter() - started_at)
+                    return
+                await asyncio.sleep(LAG_PROBE_POLL_SECONDS)
+        except httpx.HTTPError:
+            pass
+        self.lag_probes_lost += 1
+
+    def report(self) -> dict:
+        operations = {}
+        for operation, stats in self.stats.items():
+            completed = stats.latency.count
+            if not completed and not stats.dropped:
+                continue
+            operations[operation] = {
+                "completed": completed,
+                "succeeded": stats.succeeded,
+                "errors": dict(stats.errors),
+                "dropped": stats.dropped,
+                "throughput_per_second": round(completed / self.elapsed_seconds, 1),
+                "latency_ms": latency_summary(stats.latency),
+            }
+        return {
+            "target_rate": self.rate,
+            "elapsed_seconds": round(self.elapsed_seconds, 2),
+            "max_send_delay_ms": round(self.max_send_delay * 1000, 2),
+            "operations": operations,
+            "ingest_lag_ms": {
+                **latency_summary(self.ingest_lag),
+                "probes": self.ingest_lag.count,
+                "lost": self.lag_probes_lost,
+            },
+        }
+
+
+def latency_summary(histogram: LatencyHistogram) -> dict:
+    summary = {
+        f"p{str(quantile * 100).rstrip('0').rstrip('.')}": round(
+            histogram.percentile(quantile) * 1000, 3
+        )
+        for quantile in REPORTED_PERCENTILES
+    }
+    summary["max"] = round(histogram.max_us / 1000, 3)
+    return summary
+
+
+def parse_mix(mix: str) -> dict[str, float]:
+    weights = {}
+    for part in mix.split(","):
+        operation, _, weight = part.partition("=")
+        if operation not in OPERATIONS:
+            raise argparse.ArgumentTypeError(
+                f"Unknown operation {operation!r}, expected one of {', '.join(OPERATIONS)}"
+            )
+        weights[operation] = float(weight)
+    if not any(weights.values()):
+        raise argparse.ArgumentTypeError("The mix needs at least one positive weight")
+    return weights
 
+
+def print_report(report: dict) -> None:
     print(
-        "############################################################## --------------------- > LOAD TEST FINISHED"
+        f"target rate: {report['target_rate']}/s, elapsed: {report['elapsed_seconds']}s, "
+        f"max send delay: {report['max_send_delay_ms']}ms"
     )
+    for operation, stats in report["operations"].items():
+        latency = ", ".join(
+            f"{name} {value}ms" for name, value in stats["latency_ms"].items()
+        )
+        print(
+            f"{operation:>6}: {stats['completed']} completed ({stats['throughput_per_second']}/s), "
+            f"{stats['succeeded']} ok, errors {stats['errors']}, {stats['dropped']} dropped | {latency}"
+        )
+    lag = report["ingest_lag_ms"]
+    if lag["probes"] or lag["lost"]:
+        print(
+            f"ingest-to-queryable lag: p50 {lag['p50']}ms, p99 {lag['p99']}ms, max {lag['max']}ms "
+            f"({lag['probes']} probes, {lag['lost']} lost)"
+        )
+    if report["max_send_delay_ms"] > 10:
+        print(
+            "WARNING: the generator fell behind its schedule, the client machine may be the bottleneck. "
+            "Latencies still include the delay."
+        )
 
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Open-loop load test of a running log service."
+    )
+    parser.add_argument("--base-url", default=DEFAULT_BASE_URL)
+    parser.add_argument(
+        "--rate", type=float, default=DEFAULT_RATE, help="Requests started per second."
+    )
+    parser.add_argument("--duration", type=float, default=DEFAULT_DURATION_SECONDS)
+    parser.add_argument(
+        "--mix",
+        type=parse_mix,
+        default=parse_mix(DEFAULT_MIX),
+        help=f"Weights of the operations, default {DEFAULT_MIX}.",
+    )
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--connections", type=int, default=DEFAULT_CONNECTIONS)
+    parser.add_argument(
+        "--poisson",
+        action="store_true",
+        help="Exponentially distributed gaps between arrivals instead of a fixed interval.",
+    )
+    parser.add_argument(
+        "--payload-mean-bytes", type=int, default=DEFAULT_PAYLOAD_MEAN_BYTES
+    )
+    parser.add_argument("--payload-sigma", type=float, default=DEFAULT_PAYLOAD_SIGMA)
+    parser.add_argument("--replay", help="NDJSON file of events or payloads to send.")
+    parser.add_argument("--no-lag-probe", action="store_true")
+    parser.add_argument("--json-output", help="Also write the report to this file.")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    workload = Workload(
+        mix=args.mix,
+        batch_size=args.batch_size,
+        payload_mean_bytes=args.payload_mean_bytes,
+        payload_sigma=args.payload_sigma,
+        replay_path=args.replay,
+        rng=random.Random(args.seed),
+    )
+    load_test = LoadTest(
+        base_url=args.base_url,
+        workload=workload,
+        rate=args.rate,
+        duration_seconds=args.duration,
+        connections=args.connections,
+        poisson=args.poisson,
+        probe_lag=not args.no_lag_probe,
+    )
     print(
-        f"Successful Requests: {success_count}, ----------------------> {int(success_count / total_seconds)} Requests/second"
+        f"Running an open-loop load test: {args.rate}/s for {args.duration}s against {args.base_url}"
     )
+    try:
+        asyncio.run(load_test.run())
+    except httpx.HTTPError as e:
+        print(
+            f"Failed to get an access token ({e}). ARE YOU SURE YOU HAVE STARTED THE APP?"
+        )
+        return
+
+    report = load_test.report()
+    print_report(report)
+    if args.json_output:
+        with open(args.json_output, "wb") as f:
+            f.write(orjson.dumps(report, option=orjson.OPT_INDENT_2))
+
+
+if __name__ == "__main__":
+    main()
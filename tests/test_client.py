@@ -0,0 +1,115 @@
+import gzip
+import os
+
+import httpx
+import orjson
+import pytest
+
+from log_service_client import client as client_module
+from log_service_client.client import LogServiceClient
+
+
+class FakeService:
+    """Answers the client's requests with the queued statuses, then with 200, and records the stored batches."""
+
+    def __init__(self, statuses: list = ()):
+        self.statuses = list(statuses)
+        self.batches: list[list[dict]] = []
+        self.tokens_issued = 0
+        self.authorizations: list[str] = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/access-token":
+            self.tokens_issued += 1
+            return httpx.Response(200, json={"token": f"token-{self.tokens_issued}"})
+        self.authorizations.append(request.headers["Authorization"])
+        status = self.statuses.pop(0) if self.statuses else 200
+        if isinstance(status, Exception):
+            raise status
+        if status != 200:
+            return httpx.Response(status, headers={"Retry-After": "0"})
+        body = request.content
+        if request.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        self.batches.append(orjson.loads(body))
+        return httpx.Response(200, json="ok")
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(mocker):
+    mocker.patch.object(client_module, "BACKOFF_INITIAL_SECONDS", 0.001)
+
+
+def make_client(service: FakeService, **kwargs) -> LogServiceClient:
+    return LogServiceClient(
+        "http://log-service", transport=httpx.MockTransport(service), **kwargs
+    )
+
+
+def test_events_are_sent_in_gzipped_batches_with_a_cached_token():
+    service = FakeService()
+    client = make_client(service, batch_size=2, gzip=True)
+    for n in range(5):
+        assert client.log_event("login", customer_id=1, event_data={"n": n})
+    client.close()
+
+    assert [len(batch) for batch in service.batches] == [2, 2, 1]
+    events = [event for batch in service.batches for event in batch]
+    assert [event["event_data"]["n"] for event in events] == [0, 1, 2, 3, 4]
+    assert all(event["event_uuid"] and event["timestamp_utc"] for event in events)
+    assert service.tokens_issued == 1
+    assert client.counts["sent"] == 5
+
+
+def test_rate_limited_and_failing_batches_are_retried():
+    service = FakeService([429, 503, httpx.ConnectError("refused")])
+    client = make_client(service)
+    client.log_event("login", customer_id=1, event_data={"n": 1})
+    assert client.flush(timeout=5)
+    client.close()
+
+    assert len(service.batches) == 1
+    assert client.counts["sent"] == 1
+
+
+def test_an_expired_token_is_refreshed():
+    service = FakeService([401])
+    client = make_client(service)
+    client.log_event("login", customer_id=1, event_data={"n": 1})
+    client.close()
+
+    assert service.authorizations == ["Bearer token-1", "Bearer token-2"]
+    assert len(service.batches) == 1
+
+
+def test_batches_are_spilled_while_the_service_is_unreachable(tmp_path, mocker):
+    mocker.patch.object(client_module, "SPILL_REPLAY_INTERVAL_SECONDS", 0.01)
+    refused = httpx.ConnectError("refused")
+    service = FakeService([refused] * client_module.MAX_SEND_ATTEMPTS)
+    client = make_client(service, spill_dir=str(tmp_path))
+    client.log_event("login", customer_id=1, event_data={"n": 1})
+    client.flush(timeout=5)
+    spilled = os.listdir(tmp_path)
+
+    client.log_event("login", customer_id=1, event_data={"n": 2})
+    client.flush(timeout=5)
+    client.close()
+
+    assert len(spilled) == 1
+    assert client.counts["spilled"] == 1
+    assert sorted(batch[0]["event_data"]["n"] for batch in service.batches) == [1, 2]
+    assert os.listdir(tmp_path) == []
+
+
+def test_events_beyond_the_queue_bound_are_dropped():
+    client = make_client(
+        FakeService(), max_queued_events=2, batch_size=10, linger_seconds=60
+    )
+    queued = [
+        client.log_event("login", customer_id=1, event_data={"n": n}) for n in range(3)
+    ]
+    client.close()
+
+    assert queued == [True, True, False]
+    assert client.counts["dropped"] == 1
+    assert client.counts["sent"] == 2
@@ -0,0 +1,153 @@
+import asyncio
+import gzip
+import zlib
+
+import httpx
+import pytest
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+from log_service.compression import (
+    RequestDecompressionMiddleware,
+    ResponseCompressionMiddleware,
+    negotiate_coding,
+)
+
+BIG_PAGE = {"events": [{"event_type": "login", "customer_id": n} for n in range(200)]}
+
+
+async def echo(request: Request) -> Response:
+    body = await request.body()
+    return JSONResponse(
+        {"size": len(body), "content_length": request.headers["content-length"]}
+    )
+
+
+async def page(request: Request) -> Response:
+    return JSONResponse(BIG_PAGE if request.query_params.get("big") else {"a": 1})
+
+
+async def export(request: Request) -> Response:
+    chunks = (b'{"n": %d}\n' % n * 50 for n in range(10))
+    headers = {"Content-Encoding": "gzip"} if request.query_params.get("gzip") else {}
+    if headers:
+        chunks = iter([gzip.compress(b"".join(chunks))])
+    return StreamingResponse(chunks, media_type="application/x-ndjson", headers=headers)
+
+
+async def stream(request: Request) -> Response:
+    return StreamingResponse(
+        iter([b"data: 1\n\n" * 500]), media_type="text/event-stream"
+    )
+
+
+def make_app(max_body_bytes: int = 1024 * 1024):
+    app = Starlette(
+        routes=[
+            Route("/echo", echo, methods=["POST"]),
+            Route("/page", page),
+            Route("/export", export),
+            Route("/stream", stream),
+        ]
+    )
+    app.add_middleware(ResponseCompressionMiddleware, level=6, minimum_bytes=500)
+    app.add_middleware(RequestDecompressionMiddleware, max_body_bytes=max_body_bytes)
+    return app
+
+
+def request(method: str, url: str, app=None, **kwargs) -> httpx.Response:
+    async def send():
+        transport = httpx.ASGITransport(app=app or make_app())
+        async with httpx.AsyncClient(transport=transport, base_url="http://t") as c:
+            return await c.request(method, url, **kwargs)
+
+    return asyncio.run(send())
+
+
+@pytest.mark.parametrize(
+    "coding, compress",
+    [("gzip", gzip.compress), ("deflate", zlib.compress)],
+)
+def test_compressed_request_bodies_are_decompressed(coding, compress):
+    body = b'{"event_type": "login"}' * 1000
+    response = request(
+        "POST", "/echo", content=compress(body), headers={"Content-Encoding": coding}
+    )
+
+    assert response.json() == {"size": len(body), "content_length": str(len(body))}
+
+
+def test_a_body_decompressing_beyond_the_limit_is_rejected():
+    bomb = gzip.compress(b"\0" * 10_000_000)
+    response = request(
+        "POST",
+        "/echo",
+        app=make_app(max_body_bytes=1_000_000),
+        content=bomb,
+        headers={"Content-Encoding": "gzip"},
+    )
+
+    assert len(bomb) < 20_000
+    assert response.status_code == 413
+
+
+@pytest.mark.parametrize(
+    "coding, body, status_code",
+    [
+        ("gzip", b"not gzip", 400),
+        ("gzip", gzip.compress(b"{}" * 100)[:20], 400),
+        ("br", b"{}", 415),
+    ],
+)
+def test_invalid_compressed_bodies_are_rejected(coding, body, status_code):
+    response = request(
+        "POST", "/echo", content=body, headers={"Content-Encoding": coding}
+    )
+
+    assert response.status_code == status_code
+
+
+def test_large_responses_are_compressed_with_the_accepted_coding():
+    gzipped = request("GET", "/page?big=1", headers={"Accept-Encoding": "gzip"})
+    deflated = request(
+        "GET", "/page?big=1", headers={"Accept-Encoding": "gzip;q=0, deflate"}
+    )
+    small = request("GET", "/page", headers={"Accept-Encoding": "gzip"})
+    plain = request("GET", "/page?big=1", headers={"Accept-Encoding": "identity"})
+
+    assert gzipped.headers["content-encoding"] == "gzip"
+    assert gzipped.headers["vary"] == "Accept-Encoding"
+    assert gzipped.json() == BIG_PAGE
+    assert int(gzipped.headers["content-length"]) < len(plain.content) / 5
+    assert deflated.headers["content-encoding"] == "deflate"
+    assert deflated.json() == BIG_PAGE
+    assert "content-encoding" not in small.headers
+    assert "content-encoding" not in plain.headers
+
+
+def test_streamed_responses_are_compressed_unless_encoded_or_event_streams():
+    exported = request("GET", "/export", headers={"Accept-Encoding": "gzip"})
+    pre_encoded = request("GET", "/export?gzip=1", headers={"Accept-Encoding": "gzip"})
+    streamed = request("GET", "/stream", headers={"Accept-Encoding": "gzip"})
+
+    assert exported.headers["content-encoding"] == "gzip"
+    assert exported.text.count("\n") == 500
+    assert pre_encoded.text.count("\n") == 500
+    assert "content-encoding" not in streamed.headers
+
+
+@pytest.mark.parametrize(
+    "accept_encoding, coding",
+    [
+        ("", None),
+        ("gzip, deflate, br", "gzip"),
+        ("deflate;q=1, gzip;q=0.5", "deflate"),
+        ("*", "gzip"),
+        ("*;q=0", None),
+        ("br", None),
+    ],
+)
+def test_negotiate_coding(accept_encoding, coding):
+    assert negotiate_coding(accept_encoding) == coding
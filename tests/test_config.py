@@ -2,6 +2,7 @@ import os
 import pytest
 
 from log_service.config import LogServiceConfig
+from log_service.data.event_dto import EventRequestDTO
 
 
 @pytest.fixture
@@ -37,3 +38,72 @@ def test_get_db_url_is_correct(mocker, reset_log_service_config_singleton):
     mocker.patch.dict(os.environ, {"TEST_MODE": "False"})
     expected_path = os.path.join(os.getcwd(), "databases", "SQLite-main.db")
     assert LogServiceConfig.get_instance().get_db_url() == expected_path
+
+
+def test_settings_are_read_from_the_config_file_and_the_environment(
+    tmp_path, monkeypatch
+):
+    config_file = tmp_path / "log-service.json"
+    config_file.write_text(
+        '{"consumer_chunk_size": 200, "max_page_size": 500,'
+        ' "event_type_sample_rates": {"heartbeat": 0.1}}'
+    )
+    monkeypatch.setenv("LOG_SERVICE_CONFIG_FILE", str(config_file))
+    monkeypatch.setenv("LOG_SERVICE_MAX_PAGE_SIZE", "250")
+    monkeypatch.setenv("LOG_SERVICE_INGEST_PORT", "9100")
+
+    settings = LogServiceConfig.load_settings()
+
+    assert settings.consumer_chunk_size == 200
+    assert settings.max_page_size == 250
+    assert settings.event_type_sample_rates == {"heartbeat": 0.1}
+    assert settings.ingest_port == 9100
+    assert settings.ingest_socket_path is None
+    assert EventRequestDTO(limit=1000).limit == 250
+
+
+@pytest.mark.parametrize(
+    "name, value",
+    [
+        ("LOG_SERVICE_CONSUMER_CHUNK_SIZE", "0"),
+        ("LOG_SERVICE_CONSUMER_CHUNK_SIZE", "many"),
+        ("LOG_SERVICE_EVENT_TYPE_SAMPLE_RATES", "heartbeat=2"),
+        ("LOG_SERVICE_RESPONSE_COMPRESSION_LEVEL", "10"),
+        ("LOG_SERVICE_INGEST_PORT", "70000"),
+    ],
+)
+def test_invalid_settings_are_rejected(monkeypatch, name, value):
+    monkeypatch.setenv(name, value)
+
+    with pytest.raises(ValueError):
+        LogServiceConfig.load_settings()
+
+
+def test_a_config_file_with_unknown_settings_is_rejected(tmp_path, monkeypatch):
+    config_file = tmp_path / "log-service.json"
+    config_file.write_text('{"consumer_chunk_sise": 200}')
+    monkeypatch.setenv("LOG_SERVICE_CONFIG_FILE", str(config_file))
+
+    with pytest.raises(ValueError, match="consumer_chunk_sise"):
+        LogServiceConfig.load_settings()
+
+
+def test_reload_applies_only_the_reloadable_settings(monkeypatch):
+    settings = LogServiceConfig.load_settings()
+    monkeypatch.setenv("LOG_SERVICE_CONSUMER_CHUNK_SIZE", "100")
+    monkeypatch.setenv("LOG_SERVICE_HOT_TAIL_MAX_EVENTS", "10")
+
+    result = LogServiceConfig.reload_settings()
+
+    assert result == {
+        "applied": {"consumer_chunk_size": 100},
+        "restart_required": ["hot_tail_max_events"],
+    }
+    reloaded = LogServiceConfig.get_settings()
+    assert reloaded.consumer_chunk_size == 100
+    assert reloaded.hot_tail_max_events == settings.hot_tail_max_events
+
+    monkeypatch.setenv("LOG_SERVICE_CONSUMER_CHUNK_SIZE", "-1")
+    with pytest.raises(ValueError):
+        LogServiceConfig.reload_settings()
+    assert LogServiceConfig.get_settings() is reloaded
@@ -0,0 +1,161 @@
+import sqlite3
+
+import numpy as np
+import orjson
+import pytest
+
+from log_service.db_accessors import analytics_db_accessor
+from log_service.db_accessors.analytics_db_accessor import (
+    EventAnalyticsAccessor,
+    EventColumns,
+)
+
+
+def seed_events(db_path, events):
+    conn = sqlite3.connect(db_path)
+    conn.executemany(
+        "INSERT INTO Events (customer_id, event_type, timestamp_utc, event_data) VALUES (?, ?, ?, ?)",
+        [
+            (customer_id, event_type, timestamp, orjson.dumps(data))
+            for customer_id, event_type, timestamp, data in events
+        ],
+    )
+    conn.commit()
+    conn.close()
+
+
+def test_load_columns(temp_db, mocker):
+    mocker.patch.object(analytics_db_accessor, "ANALYTICS_FETCH_SIZE", 2)
+    seed_events(
+        temp_db,
+        [
+            (1, "purchase", 100, {"amount": 10}),
+            (2, "purchase", 110, {"amount": 20.5}),
+            (1, "login", 120, {"amount": "not a number"}),
+            (3, "login", 130, {"other": 1}),
+            (3, "login", 500, {"amount": 99}),
+        ],
+    )
+
+    columns = EventAnalyticsAccessor().load_columns(100, 200, "amount")
+
+    assert len(columns) == 4
+    assert columns.event_types.tolist() == ["login", "purchase"]
+    assert columns.event_types[columns.event_type_codes].tolist() == [
+        "purchase",
+        "purchase",
+        "login",
+        "login",
+    ]
+    assert columns.customer_ids.tolist() == [1, 2, 1, 3]
+    np.testing.assert_array_equal(columns.values, [10, 20.5, np.nan, np.nan])
+
+
+def test_load_columns_without_value_field(temp_db):
+    seed_events(temp_db, [(1, "purchase", 100, {"amount": 10})])
+    columns = EventAnalyticsAccessor().load_columns(0, 200)
+    assert len(columns) == 1
+    assert columns.values is None
+
+
+def test_load_columns_invalid_value_field(temp_db):
+    with pytest.raises(ValueError):
+        EventAnalyticsAccessor().load_columns(0, 200, "amount') OR 1=1 --")
+
+
+@pytest.fixture
+def chunk_cache():
+    analytics_db_accessor.AnalyticsChunkCache._instance = None
+    return analytics_db_accessor.AnalyticsChunkCache.get_instance()
+
+
+def test_load_columns_assembles_window_from_chunks(temp_db, chunk_cache, mocker):
+    mocker.patch.object(analytics_db_accessor, "ANALYTICS_CHUNK_SECONDS", 100)
+    seed_events(
+        temp_db,
+        [
+            (1, "purchase", 50, {}),
+            (2, "login", 150, {}),
+            (3, "logout", 250, {}),
+        ],
+    )
+
+    columns = EventAnalyticsAccessor().load_columns(50, 250)
+
+    assert columns.customer_ids.tolist() == [1, 2, 3]
+    assert columns.event_types.tolist() == ["login", "logout", "purchase"]
+    assert columns.event_types[columns.event_type_codes].tolist() == [
+        "purchase",
+        "login",
+        "logout",
+    ]
+
+
+def test_load_columns_reuses_past_chunks_only(temp_db, chunk_cache, mocker):
+    mocker.patch.object(analytics_db_accessor, "ANALYTICS_CHUNK_SECONDS", 100)
+    mocker.patch("time.time", return_value=10_000)
+    accessor = EventAnalyticsAccessor()
+    spy = mocker.spy(accessor, "_load_chunk")
+
+    accessor.load_columns(0, 199)
+    # a shifted window only loads the chunk it does not share
+    accessor.load_columns(150, 299)
+    assert spy.call_count == 3
+
+    # chunks within the grace period are still written to, so they are reloaded on every call
+    accessor.load_columns(9_900, 10_000)
+    accessor.load_columns(9_900, 10_000)
+    assert spy.call_count == 7
+
+
+def test_invalidate_timestamps_drops_stale_chunks(temp_db, chunk_cache, mocker):
+    mocker.patch("time.time", return_value=100_000)
+    accessor = EventAnalyticsAccessor()
+    seed_events(temp_db, [(1, "purchase", 100, {})])
+    assert len(accessor.load_columns(0, 200)) == 1
+
+    # a late event committed into an already cached chunk
+    seed_events(temp_db, [(2, "purchase", 150, {})])
+    chunk_cache.invalidate_timestamps([150])
+
+    assert len(accessor.load_columns(0, 200)) == 2
+
+
+def test_chunk_cache_rejects_chunks_loaded_before_invalidation(chunk_cache, mocker):
+    mocker.patch("time.time", return_value=100_000)
+    columns = EventColumns.concatenate([], has_values=False)
+    generation = chunk_cache.generation
+
+    chunk_cache.invalidate_timestamps([0])
+    chunk_cache.put(0, None, columns, generation)
+
+    assert chunk_cache.get(0, None) is None
+
+
+def test_chunk_cache_is_bounded_by_bytes(chunk_cache, mocker):
+    columns = EventColumns(
+        ids=np.arange(10, dtype=np.int64),
+        timestamps=np.arange(10, dtype=np.int64),
+        customer_ids=np.arange(10, dtype=np.int64),
+        event_type_codes=np.zeros(10, dtype=np.int64),
+        event_types=np.array(["a"]),
+        values=None,
+    )
+    mocker.patch.object(
+        analytics_db_accessor, "ANALYTICS_CACHE_MAX_BYTES", columns.nbytes * 2
+    )
+
+    for chunk_start in (0, 3600, 7200):
+        chunk_cache.put(chunk_start, None, columns, chunk_cache.generation)
+
+    assert chunk_cache.get(0, None) is None
+    assert chunk_cache.get(7200, None) is columns
+    assert chunk_cache.size_bytes == columns.nbytes * 2
+
+
+def test_load_columns_rejects_too_many_rows(temp_db, chunk_cache, mocker):
+    mocker.patch.object(analytics_db_accessor, "MAX_ANALYTICS_ROWS", 1)
+    seed_events(temp_db, [(1, "purchase", 100, {}), (2, "purchase", 110, {})])
+
+    with pytest.raises(ValueError):
+        EventAnalyticsAccessor().load_columns(0, 200)
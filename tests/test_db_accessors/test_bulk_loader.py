@@ -0,0 +1,157 @@
+import gzip
+import sqlite3
+
+import orjson
+import pytest
+
+from log_service.controllers.sketch_controller import SketchController
+from log_service.db_accessors.bulk_loader import EventBulkLoader, InvalidEventLine
+from log_service.processors.event_sketches import EventSketchStore
+
+
+def write_ndjson(path, events, compress=False):
+    lines = b"".join(
+        event if isinstance(event, bytes) else orjson.dumps(event) + b"\n"
+        for event in events
+    )
+    with (gzip.open if compress else open)(path, "wb") as f:
+        f.write(lines)
+    return str(path)
+
+
+def stored_events(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute(
+            "SELECT customer_id, event_type, timestamp_utc, event_data FROM Events ORDER BY id"
+        ).fetchall()
+    finally:
+        conn.close()
+
+
+def index_names(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return {
+            name
+            for (name,) in conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL"
+            )
+        }
+    finally:
+        conn.close()
+
+
+def make_event(timestamp_utc, customer_id=1):
+    return {
+        "event_type": "login",
+        "customer_id": customer_id,
+        "timestamp_utc": timestamp_utc,
+        "event_data": {"n": timestamp_utc},
+    }
+
+
+def test_load_sorts_by_timestamp_across_runs_and_files(temp_db, tmp_path):
+    first = write_ndjson(tmp_path / "a.ndjson", [make_event(t) for t in (50, 10, 40)])
+    second = write_ndjson(
+        tmp_path / "b.ndjson.gz",
+        [make_event(t, customer_id=2) for t in (30, 20, 10)],
+        compress=True,
+    )
+
+    report = EventBulkLoader(temp_db, batch_rows=2, sort_buffer_rows=2).load(
+        [first, second]
+    )
+
+    assert report.rows_loaded == 6
+    rows = stored_events(temp_db)
+    assert [row[2] for row in rows] == [10, 10, 20, 30, 40, 50]
+    # equal timestamps keep their input order
+    assert [row[0] for row in rows[:2]] == [1, 2]
+    assert orjson.loads(rows[0][3]) == {"n": 10}
+
+
+def test_load_rebuilds_indexes_for_large_loads(temp_db, tmp_path):
+    indexes = index_names(temp_db)
+    path = write_ndjson(tmp_path / "events.ndjson", [make_event(t) for t in range(10)])
+
+    report = EventBulkLoader(temp_db).load([path])
+
+    # the unique event_uuid index enforces a constraint, it is kept during the load, as are other tables' indexes
+    assert set(report.indexes_rebuilt) == indexes - {
+        "idx_event_uuid",
+        "idx_event_batches_last_event_id",
+    }
+    assert index_names(temp_db) == indexes
+
+    report = EventBulkLoader(temp_db).load(
+        [write_ndjson(tmp_path / "one.ndjson", [make_event(99)])]
+    )
+    assert report.indexes_rebuilt == []
+    assert len(stored_events(temp_db)) == 11
+
+
+def test_load_skips_invalid_lines(temp_db, tmp_path):
+    path = write_ndjson(
+        tmp_path / "events.ndjson",
+        [
+            make_event(1),
+            b"not json\n",
+            {"event_type": "login", "customer_id": "1", "event_data": {"a": 1}},
+            {"event_type": "login", "customer_id": 1, "event_data": {}},
+            {"event_type": "login", "customer_id": 1, "event_data": {"a": 1}},
+        ],
+    )
+
+    report = EventBulkLoader(temp_db).load([path], presorted=True)
+
+    assert (report.rows_loaded, report.rows_skipped) == (2, 3)
+
+    with pytest.raises(InvalidEventLine, match="events.ndjson:2"):
+        EventBulkLoader(temp_db, strict=True).load([path])
+
+
+def test_rerunning_a_load_skips_events_stored_already(temp_db, tmp_path):
+    events = [
+        {**make_event(t), "event_uuid": f"00000000-0000-0000-0000-{t:012d}"}
+        for t in range(1, 6)
+    ]
+    path = write_ndjson(tmp_path / "events.ndjson", events)
+    EventBulkLoader(temp_db).load([path])
+
+    overlapping = write_ndjson(
+        tmp_path / "more.ndjson",
+        events[3:]
+        + [make_event(6), {**events[0], "event_uuid": events[0]["event_uuid"].upper()}],
+    )
+    report = EventBulkLoader(temp_db, batch_rows=2).load([overlapping])
+
+    assert (report.rows_loaded, report.rows_duplicate) == (1, 3)
+    assert [row[2] for row in stored_events(temp_db)] == [1, 2, 3, 4, 5, 6]
+
+
+def test_loaded_events_are_added_to_the_sketches(temp_db, tmp_path):
+    EventSketchStore._instance = None
+    path = write_ndjson(
+        tmp_path / "events.ndjson",
+        [make_event(3600 + i, customer_id=i % 7) for i in range(20)]
+        + [make_event(7200 + i, customer_id=100 + i) for i in range(3)],
+    )
+
+    EventBulkLoader(temp_db, batch_rows=5).load([path])
+    EventBulkLoader(temp_db).load(
+        [write_ndjson(tmp_path / "later.ndjson", [make_event(3700, customer_id=50)])]
+    )
+
+    controller = SketchController()
+    assert (
+        controller.get_distinct_customers("login", 3600, 3600)["distinct_customers"]
+        == 8
+    )
+    assert (
+        controller.get_distinct_customers("login", 3600, 7200)["distinct_customers"]
+        == 11
+    )
+    top = controller.get_top_event_types(3600, 7200, k=1)
+    assert top["total_events"] == 24
+    EventSketchStore._instance = None
@@ -1,3 +1,4 @@
+import asyncio
 import os
 import random
 import sqlite3
@@ -8,10 +9,13 @@ import pytest
 from log_service.config import DB_DIRECTORY_PATH
 
 from log_service.data.event_dto import EventRequestDTO
+from log_service.db_accessors.db_schema import create_schema
 from log_service.db_accessors.event_db_accessor import EventDatabaseAccessor
+from log_service.db_accessors.read_executor import DatabaseReadExecutor
 
 TEST_DB_PATH = os.path.join(os.getcwd(), DB_DIRECTORY_PATH, "SQLite-test.db")
 CONN = sqlite3.connect(TEST_DB_PATH)
+create_schema(CONN)
 
 
 @pytest.fixture
@@ -134,3 +138,232 @@ def test_get_events_with_event_type_filter(mock_config):
     assert count == 1
     assert len(events) == 1
     assert events[0]["event_type"] == event_type
+
+
+def test_iter_event_rows_streams_all_matching_rows(temp_db):
+    conn = sqlite3.connect(temp_db)
+    events = [
+        (100, "event_type_1", 30, orjson.dumps({"key": 1})),
+        (200, "event_type_1", 10, orjson.dumps({"key": 2})),
+        (100, "event_type_1", 20, None),
+        (100, "event_type_2", 40, orjson.dumps({"key": 4})),
+    ]
+    EventDatabaseAccessor().save_events_to_db(insert_data=events, conn=conn)
+    conn.close()
+
+    batches = list(
+        EventDatabaseAccessor().iter_event_rows(
+            EventRequestDTO(customer_id=100, event_type="event_type_1", limit=1),
+            batch_size=1,
+        )
+    )
+
+    assert [len(batch) for batch in batches] == [1, 1]
+    rows = [row for batch in batches for row in batch]
+    assert [row[2] for row in rows] == [20, 30]
+    # event_data is passed through as stored
+    assert rows[1][4] == orjson.dumps({"key": 1})
+
+
+def test_build_filters_uses_parameters():
+    filters, params = EventDatabaseAccessor.build_filters(
+        EventRequestDTO(event_type="x' OR '1'='1", timestamp_start_utc=5)
+    )
+    assert filters == "WHERE true AND event_type = ? AND timestamp_utc >= ?"
+    assert params == ["x' OR '1'='1", 5]
+
+
+@pytest.mark.parametrize(
+    "filters, index",
+    [
+        ({"customer_id": 100}, "idx_customer_timestamp"),
+        ({"event_type": "event_type_1"}, "idx_event_type_timestamp"),
+        ({"timestamp_start_utc": 10}, "idx_timestamp_covering"),
+        ({}, "idx_timestamp_covering"),
+    ],
+)
+def test_pages_without_event_data_are_read_from_covering_indexes(
+    temp_db, filters, index
+):
+    request_dto = EventRequestDTO(**filters, fields=("id", "timestamp_utc"))
+    sql, _, params = EventDatabaseAccessor.build_page_sql(
+        request_dto, EventDatabaseAccessor.event_columns(request_dto.fields)
+    )
+    conn = sqlite3.connect(temp_db)
+    plan = " ".join(row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params))
+    conn.close()
+
+    assert f"COVERING INDEX {index}" in plan
+    assert "TEMP B-TREE" not in plan
+
+
+def test_get_event_rows_returns_projected_fields_as_none(temp_db):
+    conn = sqlite3.connect(temp_db)
+    EventDatabaseAccessor().save_events_to_db(
+        insert_data=[(100, "event_type_1", 30, orjson.dumps({"key": 1}))], conn=conn
+    )
+    conn.close()
+
+    rows, count = EventDatabaseAccessor().get_event_rows(
+        EventRequestDTO(fields=("timestamp_utc", "id"))
+    )
+
+    assert count == 1
+    assert rows == [(1, None, 30, None, None)]
+
+
+def test_build_filters_matches_several_values_with_in():
+    request_dto = EventRequestDTO(
+        event_id=[3, 1, 3], event_type=["login"], customer_id=(5, 6)
+    )
+    filters, params = EventDatabaseAccessor.build_filters(request_dto)
+
+    assert request_dto.event_type == "login"
+    assert filters == (
+        "WHERE true AND id IN (?, ?) AND event_type = ? AND customer_id IN (?, ?)"
+    )
+    assert params == [3, 1, "login", 5, 6]
+    assert (
+        EventDatabaseAccessor.filter_shape(request_dto)
+        == "event_id[]+event_type+customer_id[]"
+    )
+
+
+def test_reads_in_a_read_snapshot_do_not_see_later_commits(temp_db):
+    accessor = EventDatabaseAccessor()
+
+    def read_twice():
+        with accessor.read_snapshot():
+            _, before = accessor.get_event_rows(EventRequestDTO())
+            conn = sqlite3.connect(temp_db)
+            accessor.save_events_to_db(
+                insert_data=[(1, "login", 1, orjson.dumps({"a": 1}))], conn=conn
+            )
+            conn.close()
+            _, after = accessor.get_event_rows(EventRequestDTO())
+        return before, after, accessor.get_event_rows(EventRequestDTO())[1]
+
+    async def run():
+        DatabaseReadExecutor._instance = None
+        executor = DatabaseReadExecutor.get_instance()
+        try:
+            return await executor.run(read_twice)
+        finally:
+            executor.shutdown()
+            DatabaseReadExecutor._instance = None
+
+    assert asyncio.run(run()) == (0, 0, 1)
+
+
+def test_iter_event_rows_does_not_block_commits(temp_db):
+    conn = sqlite3.connect(temp_db)
+    events = [
+        (100, "event_type_1", timestamp, orjson.dumps({"key": timestamp}))
+        for timestamp in range(5)
+    ]
+    EventDatabaseAccessor().save_events_to_db(insert_data=events, conn=conn)
+
+    export = EventDatabaseAccessor().iter_event_rows(EventRequestDTO(), batch_size=2)
+    first_batch = next(export)
+
+    # a commit while the export is half read must not wait for the export to finish
+    writer = sqlite3.connect(temp_db, timeout=0.1)
+    assert EventDatabaseAccessor().save_events_to_db(
+        insert_data=[(100, "event_type_1", 10, orjson.dumps({"key": 10}))],
+        conn=writer,
+    )
+    writer.close()
+    conn.close()
+
+    rows = first_batch + [row for batch in export for row in batch]
+    assert [row[2] for row in rows] == [0, 1, 2, 3, 4, 10]
+
+
+def test_save_events_to_db_stores_an_event_uuid_once(temp_db):
+    conn = sqlite3.connect(temp_db)
+    accessor = EventDatabaseAccessor()
+    event = (100, "event_type_1", 10, orjson.dumps({"key": 1}), "uuid-1")
+
+    assert accessor.save_events_to_db(insert_data=[event, event], conn=conn)
+    assert accessor.save_events_to_db(
+        insert_data=[event, (100, "event_type_1", 10, None, None)], conn=conn
+    )
+
+    assert conn.execute("SELECT COUNT(1) FROM Events").fetchone()[0] == 2
+    assert accessor.get_stored_event_uuids(["uuid-1", "uuid-2"], conn=conn) == {
+        "uuid-1"
+    }
+    conn.close()
+
+
+def test_save_events_returning_ids_returns_the_stored_id_of_duplicates(temp_db):
+    conn = sqlite3.connect(temp_db)
+    accessor = EventDatabaseAccessor()
+    event = (100, "event_type_1", 10, orjson.dumps({"key": 1}), "uuid-1")
+
+    first_ids = accessor.save_events_returning_ids(
+        insert_data=[event, (100, "event_type_2", 10, None, None)], conn=conn
+    )
+    retried_ids = accessor.save_events_returning_ids(insert_data=[event], conn=conn)
+
+    assert len(set(first_ids)) == 2
+    assert retried_ids == first_ids[:1]
+    assert conn.execute("SELECT COUNT(1) FROM Events").fetchone()[0] == 2
+
+    # skipped duplicates in between new events, and a duplicate of an event of the same batch
+    batch = [
+        (100, "event_type_3", 10, None, "uuid-2"),
+        event,
+        (100, "event_type_3", 10, None, None),
+        (100, "event_type_3", 10, None, "uuid-2"),
+        (100, "event_type_3", 10, None, "uuid-3"),
+    ]
+    batch_ids = accessor.save_events_returning_ids(insert_data=batch, conn=conn)
+    inserted_ids = [row[0] for row in conn.execute("SELECT id FROM Events ORDER BY id")]
+    assert batch_ids == [
+        inserted_ids[2],
+        first_ids[0],
+        inserted_ids[3],
+        inserted_ids[2],
+        inserted_ids[4],
+    ]
+    conn.close()
+
+
+def test_create_schema_adds_the_event_uuid_column_to_old_tables(tmp_path):
+    conn = sqlite3.connect(tmp_path / "old.db")
+    conn.execute(
+        "CREATE TABLE Events (id INTEGER PRIMARY KEY AUTOINCREMENT, event_type VARCHAR NOT NULL, "
+        "timestamp_utc INT NOT NULL, customer_id INT NOT NULL, event_data JSON)"
+    )
+    conn.execute("CREATE INDEX idx_customer_id ON Events(customer_id)")
+    conn.execute("INSERT INTO Events VALUES (1, 'login', 10, 100, NULL)")
+
+    create_schema(conn)
+    create_schema(conn)
+
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(Events)")]
+    assert columns[-1] == "event_uuid"
+    assert conn.execute("SELECT event_uuid FROM Events").fetchall() == [(None,)]
+    indexes = {row[1] for row in conn.execute("PRAGMA index_list(Events)")}
+    assert "idx_customer_id" not in indexes
+    assert "idx_customer_timestamp" in indexes
+    conn.close()
+
+
+def test_get_event_rows_after_pages_by_id(temp_db):
+    conn = sqlite3.connect(temp_db)
+    accessor = EventDatabaseAccessor()
+    accessor.save_events_to_db(
+        insert_data=[(i % 2, "login", 100 - i, None) for i in range(6)], conn=conn
+    )
+    conn.close()
+    request_dto = EventRequestDTO(customer_id=1)
+
+    first_page = accessor.get_event_rows_after(request_dto, after_id=0, limit=2)
+    second_page = accessor.get_event_rows_after(
+        request_dto, after_id=first_page[-1][0], limit=2
+    )
+
+    assert [row[0] for row in first_page + second_page] == [2, 4, 6]
+    assert accessor.get_last_event_id() == 6
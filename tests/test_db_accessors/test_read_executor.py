@@ -0,0 +1,89 @@
+import asyncio
+import sqlite3
+import threading
+
+import pytest
+from fastapi import HTTPException
+
+from log_service.db_accessors import read_executor as read_executor_module
+from log_service.db_accessors.read_executor import (
+    DatabaseReadExecutor,
+    get_read_connection,
+)
+
+
+@pytest.fixture
+def read_executor(temp_db):
+    DatabaseReadExecutor._instance = None
+    executor = DatabaseReadExecutor.get_instance()
+    yield executor
+    executor.shutdown()
+    DatabaseReadExecutor._instance = None
+
+
+def test_run_uses_pooled_connection(read_executor):
+    def read():
+        conn = get_read_connection()
+        return conn, conn.execute("SELECT COUNT(1) FROM Events").fetchone()[0]
+
+    conn, count = asyncio.run(read_executor.run(read))
+
+    assert count == 0
+    assert conn is not None
+    assert get_read_connection() is None
+    assert read_executor.stats()["completed"] == 1
+
+
+def test_run_rejects_reads_when_saturated(read_executor, mocker):
+    mocker.patch.object(read_executor_module, "READ_QUEUE_LIMIT", 1)
+    release = threading.Event()
+
+    async def saturate():
+        # occupy every connection, then fill the queue
+        running = [
+            asyncio.ensure_future(read_executor.run(release.wait))
+            for _ in range(read_executor_module.READ_CONNECTION_COUNT + 1)
+        ]
+        try:
+            await asyncio.sleep(0.05)
+            assert read_executor.stats()["queued"] == 1
+            with pytest.raises(HTTPException) as exc:
+                await read_executor.run(lambda: None)
+        finally:
+            release.set()
+            await asyncio.gather(*running)
+        return exc.value
+
+    error = asyncio.run(saturate())
+
+    assert error.status_code == 503
+    assert error.headers["Retry-After"] == "1"
+    stats = read_executor.stats()
+    assert stats["rejected"] == 1
+    assert stats["in_flight"] == 0
+    assert stats["completed"] == read_executor_module.READ_CONNECTION_COUNT + 1
+
+
+def test_iterate_reads_every_item_on_the_executor(read_executor):
+    def pages():
+        for page in range(3):
+            yield page, threading.current_thread().name
+
+    async def collect():
+        return [item async for item in await read_executor.iterate(pages())]
+
+    items = asyncio.run(collect())
+
+    assert [page for page, _ in items] == [0, 1, 2]
+    assert all(thread.startswith("db-read") for _, thread in items)
+
+
+def test_shutdown_closes_connections_and_allows_restart(read_executor):
+    conn = asyncio.run(read_executor.run(get_read_connection))
+    read_executor.shutdown()
+
+    with pytest.raises(sqlite3.ProgrammingError):
+        conn.execute("SELECT 1")
+
+    # a later startup in the same process gets a new pool
+    assert asyncio.run(read_executor.run(lambda: 1)) == 1
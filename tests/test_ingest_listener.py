@@ -0,0 +1,139 @@
+import asyncio
+import os
+import uuid
+
+import orjson
+import pytest
+
+from log_service import ingest_listener as ingest_listener_module
+from log_service.controllers.auth_controller import AuthController
+from log_service.ingest_listener import FRAME_HEADER, IngestListener
+from log_service.processors.event_dedup import EventDeduplicator
+from log_service.processors.hot_tail import HotTailBuffer
+from log_service.processors.queue_producer import QueueProducer
+
+
+@pytest.fixture
+def socket_path(temp_db, tmp_path, mocker):
+    for cls in (HotTailBuffer, QueueProducer, EventDeduplicator, IngestListener):
+        cls._instance = None
+    mocker.patch(
+        "log_service.controllers.event_controller.IngestRateLimiter.get_instance",
+        return_value=mocker.Mock(
+            sample=lambda events: events, acquire=mocker.Mock(return_value=0.0)
+        ),
+    )
+    path = str(tmp_path / "ingest.sock")
+    mocker.patch.dict(os.environ, {"LOG_SERVICE_INGEST_SOCKET_PATH": path})
+    yield path
+    for cls in (HotTailBuffer, QueueProducer, EventDeduplicator, IngestListener):
+        cls._instance = None
+
+
+def frame(message) -> bytes:
+    payload = orjson.dumps(message)
+    return FRAME_HEADER.pack(len(payload)) + payload
+
+
+async def read_frame(reader: asyncio.StreamReader):
+    (length,) = FRAME_HEADER.unpack(await reader.readexactly(FRAME_HEADER.size))
+    return orjson.loads(await reader.readexactly(length))
+
+
+def events(count: int, customer_id: int = 1) -> list[dict]:
+    return [
+        {
+            "event_type": "login",
+            "customer_id": customer_id,
+            "event_data": {"n": n},
+            "event_uuid": str(uuid.uuid4()),
+        }
+        for n in range(count)
+    ]
+
+
+def serve(socket_path: str, client) -> object:
+    """Runs `client(reader, writer)` against a started listener and returns its result."""
+
+    async def run():
+        listener = IngestListener.get_instance()
+        await listener.start()
+        try:
+            reader, writer = await asyncio.open_unix_connection(socket_path)
+            try:
+                return await client(reader, writer)
+            finally:
+                writer.close()
+        finally:
+            await listener.stop()
+
+    return asyncio.run(run())
+
+
+def token() -> str:
+    return AuthController.generate_access_token(valid_minutes=5)["token"]
+
+
+def test_frames_are_queued_and_acknowledged_together(socket_path):
+    async def client(reader, writer):
+        writer.write(frame({"token": token()}))
+        handshake = await read_frame(reader)
+        writer.write(frame(events(3)) + frame(events(2)))
+        return handshake, await read_frame(reader)
+
+    handshake, ack = serve(socket_path, client)
+
+    assert handshake == {"status": 200}
+    assert ack == {"ack": 2}
+    assert len(QueueProducer.get_instance().event_queue) == 5
+    assert not os.path.exists(socket_path)
+
+
+def test_a_connection_with_an_invalid_token_is_closed(socket_path):
+    async def client(reader, writer):
+        writer.write(frame({"token": "invalid"}))
+        response = await read_frame(reader)
+        return response, await reader.read()
+
+    response, rest = serve(socket_path, client)
+
+    assert response["status"] == 401
+    assert rest == b""
+
+
+def test_a_rejected_frame_is_answered_and_the_next_ones_still_queued(socket_path):
+    async def client(reader, writer):
+        writer.write(frame({"token": token()}))
+        await read_frame(reader)
+        writer.write(frame(events(1)) + frame([{"event_type": "login"}]))
+        writer.write(frame(events(1)))
+        return [await read_frame(reader) for _ in range(3)]
+
+    ack, error, next_ack = serve(socket_path, client)
+
+    assert ack == {"ack": 1}
+    assert error["seq"] == 2 and error["status"] == 422
+    assert next_ack == {"ack": 3}
+    assert len(QueueProducer.get_instance().event_queue) == 2
+
+
+def test_a_full_queue_stops_reading_frames_until_it_drains(socket_path, mocker):
+    mocker.patch.object(ingest_listener_module, "FLOW_CONTROL_QUEUE_DEPTH", 2)
+    event_queue = QueueProducer.get_instance().event_queue
+
+    async def client(reader, writer):
+        writer.write(frame({"token": token()}))
+        await read_frame(reader)
+        writer.write(frame(events(2)) + frame(events(1)))
+        first_ack = await read_frame(reader)
+        await asyncio.sleep(0.1)
+        paused_depth = len(event_queue)
+        event_queue.clear()
+        return first_ack, paused_depth, await read_frame(reader)
+
+    first_ack, paused_depth, second_ack = serve(socket_path, client)
+
+    assert first_ack == {"ack": 1}
+    assert paused_depth == 2
+    assert second_ack == {"ack": 2}
+    assert len(event_queue) == 1
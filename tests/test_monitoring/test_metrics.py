@@ -0,0 +1,70 @@
+import pytest
+
+from log_service.monitoring.metrics import MetricsRegistry
+
+
+@pytest.fixture
+def registry():
+    # the service metrics are registered at import, the previous registry is restored afterwards
+    previous = MetricsRegistry.get_instance()
+    MetricsRegistry._instance = None
+    yield MetricsRegistry.get_instance()
+    MetricsRegistry._instance = previous
+
+
+def test_render_counter_and_gauge(registry):
+    counter = registry.counter("events_total", "Events.", label_names=("outcome",))
+    counter.labels("success").inc(3)
+    counter.labels("failure").inc()
+    registry.gauge("queue_depth", "Queue depth.").set_function(lambda: 7)
+
+    assert registry.render().splitlines() == [
+        "# HELP events_total Events.",
+        "# TYPE events_total counter",
+        'events_total{outcome="failure"} 1',
+        'events_total{outcome="success"} 3',
+        "# HELP queue_depth Queue depth.",
+        "# TYPE queue_depth gauge",
+        "queue_depth 7",
+    ]
+
+
+def test_render_histogram_buckets_are_cumulative(registry):
+    histogram = registry.histogram(
+        "latency_seconds", "Latency.", label_names=("filters",), buckets=(0.1, 1)
+    )
+    for value in (0.05, 0.1, 0.5, 3):
+        histogram.labels("none").observe(value)
+
+    lines = registry.render().splitlines()
+    assert lines[2:] == [
+        'latency_seconds_bucket{filters="none",le="0.1"} 2',
+        'latency_seconds_bucket{filters="none",le="1"} 3',
+        'latency_seconds_bucket{filters="none",le="+Inf"} 4',
+        'latency_seconds_sum{filters="none"} 3.65',
+        'latency_seconds_count{filters="none"} 4',
+    ]
+
+
+def test_register_returns_existing_metric(registry):
+    counter = registry.counter("events_total", "Events.")
+    assert registry.counter("events_total", "Events.") is counter
+
+    with pytest.raises(ValueError):
+        registry.gauge("events_total", "Events.")
+
+
+def test_label_values_are_escaped(registry):
+    registry.counter("events_total", "Events.", label_names=("type",)).labels(
+        'a "quoted"\nvalue'
+    ).inc()
+    assert 'events_total{type="a \\"quoted\\"\\nvalue"} 1' in registry.render()
+
+
+def test_labeled_gauge_children_can_be_backed_by_functions(registry):
+    gauge = registry.gauge("lane_depth", "Lane depth.", label_names=("lane",))
+    gauge.labels("critical").set_function(lambda: 3)
+    gauge.labels("bulk").set(5)
+
+    assert 'lane_depth{lane="critical"} 3' in registry.render()
+    assert 'lane_depth{lane="bulk"} 5' in registry.render()
@@ -0,0 +1,41 @@
+import threading
+
+import pytest
+
+from log_service.monitoring.profiler import ProfilerBusyError, StackSampler
+
+
+def busy_loop(stop: threading.Event) -> None:
+    while not stop.is_set():
+        sum(range(1000))
+
+
+def test_profile_finds_busy_function():
+    stop = threading.Event()
+    thread = threading.Thread(target=busy_loop, args=(stop,))
+    thread.start()
+    try:
+        report = StackSampler(duration_seconds=0.2, interval_seconds=0.005).run()
+    finally:
+        stop.set()
+        thread.join()
+
+    assert report["samples"] > 0
+    total_functions = [entry["function"] for entry in report["top_total_functions"]]
+    assert any(function.startswith("busy_loop ") for function in total_functions)
+    assert any("busy_loop" in entry["stack"] for entry in report["stacks"])
+
+
+def test_profile_duration_and_interval_are_bounded():
+    sampler = StackSampler(duration_seconds=3600, interval_seconds=0)
+    assert sampler.duration_seconds == 30
+    assert sampler.interval_seconds == 0.001
+
+
+def test_only_one_profile_runs_at_a_time():
+    StackSampler._running_lock.acquire()
+    try:
+        with pytest.raises(ProfilerBusyError):
+            StackSampler(duration_seconds=0.01, interval_seconds=0.001).run()
+    finally:
+        StackSampler._running_lock.release()
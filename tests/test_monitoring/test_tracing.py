@@ -0,0 +1,66 @@
+import time
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from log_service.monitoring.tracing import (
+    ServerTimingMiddleware,
+    format_server_timing,
+    span,
+    traced,
+)
+
+
+@traced("db")
+def slow_query() -> str:
+    time.sleep(0.01)
+    return "rows"
+
+
+def create_app(sample_rate: float) -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(ServerTimingMiddleware, sample_rate=sample_rate)
+
+    @app.get("/sync")
+    def sync_endpoint() -> dict:
+        with span("auth"):
+            pass
+        return {"rows": [slow_query(), slow_query()]}
+
+    return app
+
+
+def test_spans_are_noop_outside_sampled_requests():
+    assert slow_query() == "rows"
+    with span("auth"):
+        pass
+
+
+def test_format_server_timing():
+    header = format_server_timing({"db": [0.0125, 2]}, 0.02)
+    assert header == 'db;dur=12.500;desc="2 calls", total;dur=20.000'
+
+
+def test_sampled_request_returns_stage_breakdown():
+    client = TestClient(create_app(sample_rate=1))
+
+    response = client.get("/sync")
+
+    assert response.status_code == 200
+    metrics = {
+        metric.split(";")[0]: metric
+        for metric in response.headers["server-timing"].split(", ")
+    }
+    assert set(metrics) == {"auth", "db", "total"}
+    # the endpoint runs on the threadpool, in a copy of the request context
+    assert 'desc="2 calls"' in metrics["db"]
+    assert float(metrics["db"].split("dur=")[1].split(";")[0]) >= 20
+
+
+def test_unsampled_request_has_no_header_unless_asked():
+    client = TestClient(create_app(sample_rate=0))
+
+    assert "server-timing" not in client.get("/sync").headers
+    assert (
+        "server-timing" in client.get("/sync", headers={"X-Server-Timing": "1"}).headers
+    )